@@ -12,6 +12,7 @@ require('dotenv').config();
 // Import utilities and middleware
 const connectDB = require('./config/database');
 const errorHandler = require('./middleware/errorHandler');
+const { auth } = require('./middleware/auth');
 const { requestLogger, errorLogger, system } = require('./utils/logger');
 const { handleUploadError } = require('./utils/fileUpload');
 
@@ -22,6 +23,7 @@ const patientRoutes = require('./routes/patients');
 const testRoutes = require('./routes/tests');
 const resultRoutes = require('./routes/results');
 const reportRoutes = require('./routes/reports');
+const syncRoutes = require('./routes/sync');
 
 const app = express();
 
@@ -143,6 +145,7 @@ app.use('/api/patients', patientRoutes);
 app.use('/api/tests', testRoutes);
 app.use('/api/results', resultRoutes);
 app.use('/api/reports', reportRoutes);
+app.use('/api/sync', auth, syncRoutes);
 
 // Catch 404 and forward to error handler
 app.all('*', (req, res, next) => {
@@ -0,0 +1,121 @@
+const { validationResult } = require('express-validator');
+const Counter = require('../models/Counter');
+const SyncChange = require('../models/SyncChange');
+const SyncRecord = require('../models/SyncRecord');
+
+const SEQUENCE = 'sync';
+
+const conflict = (change, record) => ({
+  seq: change.seq,
+  status: 'conflict',
+  serverSeq: record.serverSeq,
+  record: record.deleted ? null : record.data
+});
+
+// @desc    Apply a kiosk's unsent changes, oldest first
+// @route   POST /api/sync/push
+// @access  Private
+exports.pushChanges = async (req, res) => {
+  try {
+    const errors = validationResult(req);
+    if (!errors.isEmpty()) {
+      return res.status(400).json({
+        success: false,
+        message: 'Validation errors',
+        errors: errors.array()
+      });
+    }
+
+    const { siteId, changes } = req.body;
+    const results = [];
+
+    for (const change of changes) {
+      const key = { collectionName: change.collection, recordId: String(change.id) };
+      const data = change.op === 'delete' ? null : change.data;
+
+      // The record changed centrally since the copy the kiosk edited
+      const current = await SyncRecord.findOne(key);
+      if (current && current.serverSeq > change.baseSeq) {
+        results.push(conflict(change, current));
+        continue;
+      }
+
+      const serverSeq = await Counter.next(SEQUENCE);
+      try {
+        // Only replaces the copy the change was based on; a newer one makes the upsert a duplicate
+        await SyncRecord.findOneAndUpdate(
+          { ...key, serverSeq: { $lte: change.baseSeq } },
+          { data, deleted: change.op === 'delete', serverSeq },
+          { upsert: true }
+        );
+      } catch (error) {
+        if (error.code !== 11000) {
+          throw error;
+        }
+        results.push(conflict(change, await SyncRecord.findOne(key)));
+        continue;
+      }
+
+      await SyncChange.create({ serverSeq, ...key, op: change.op, data, site: siteId });
+      results.push({ seq: change.seq, status: 'applied', serverSeq });
+    }
+
+    res.status(200).json({
+      success: true,
+      data: { results }
+    });
+  } catch (error) {
+    console.error('Sync push error:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Server error'
+    });
+  }
+};
+
+// @desc    Central changes after a sequence number, other than the site's own
+// @route   GET /api/sync/changes
+// @access  Private
+exports.getChanges = async (req, res) => {
+  try {
+    const errors = validationResult(req);
+    if (!errors.isEmpty()) {
+      return res.status(400).json({
+        success: false,
+        message: 'Validation errors',
+        errors: errors.array()
+      });
+    }
+
+    const since = parseInt(req.query.since) || 0;
+    const limit = parseInt(req.query.limit) || 500;
+
+    const changes = await SyncChange.find({
+      serverSeq: { $gt: since },
+      site: { $ne: req.query.siteId }
+    })
+      .sort({ serverSeq: 1 })
+      .limit(limit)
+      .lean();
+
+    res.status(200).json({
+      success: true,
+      data: {
+        changes: changes.map(change => ({
+          serverSeq: change.serverSeq,
+          collection: change.collectionName,
+          id: change.recordId,
+          op: change.op,
+          data: change.data
+        })),
+        lastSeq: await Counter.current(SEQUENCE)
+      }
+    });
+  } catch (error) {
+    console.error('Sync changes error:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Server error'
+    });
+  }
+};
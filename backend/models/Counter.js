@@ -0,0 +1,29 @@
+const mongoose = require('mongoose');
+
+// Named monotonic sequences, e.g. the sync change log's serverSeq
+const counterSchema = new mongoose.Schema({
+  _id: {
+    type: String,
+    required: true
+  },
+  seq: {
+    type: Number,
+    default: 0
+  }
+});
+
+counterSchema.statics.next = async function(name) {
+  const counter = await this.findOneAndUpdate(
+    { _id: name },
+    { $inc: { seq: 1 } },
+    { new: true, upsert: true }
+  );
+  return counter.seq;
+};
+
+counterSchema.statics.current = async function(name) {
+  const counter = await this.findById(name);
+  return counter ? counter.seq : 0;
+};
+
+module.exports = mongoose.model('Counter', counterSchema);
@@ -0,0 +1,35 @@
+const mongoose = require('mongoose');
+
+// Central change log read by kiosks; serverSeq orders every change
+const syncChangeSchema = new mongoose.Schema({
+  serverSeq: {
+    type: Number,
+    required: true,
+    unique: true
+  },
+  collectionName: {
+    type: String,
+    required: true
+  },
+  recordId: {
+    type: String,
+    required: true
+  },
+  op: {
+    type: String,
+    enum: ['upsert', 'delete'],
+    required: true
+  },
+  data: {
+    type: mongoose.Schema.Types.Mixed,
+    default: null
+  },
+  site: {
+    type: String,
+    default: 'CENTRAL'
+  }
+}, {
+  timestamps: true
+});
+
+module.exports = mongoose.model('SyncChange', syncChangeSchema);
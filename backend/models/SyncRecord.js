@@ -0,0 +1,31 @@
+const mongoose = require('mongoose');
+
+// Current central copy of each synced record and the change that last wrote it
+const syncRecordSchema = new mongoose.Schema({
+  collectionName: {
+    type: String,
+    required: true
+  },
+  recordId: {
+    type: String,
+    required: true
+  },
+  data: {
+    type: mongoose.Schema.Types.Mixed,
+    default: null
+  },
+  deleted: {
+    type: Boolean,
+    default: false
+  },
+  serverSeq: {
+    type: Number,
+    required: true
+  }
+}, {
+  timestamps: true
+});
+
+syncRecordSchema.index({ collectionName: 1, recordId: 1 }, { unique: true });
+
+module.exports = mongoose.model('SyncRecord', syncRecordSchema);
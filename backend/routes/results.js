@@ -1,5 +1,5 @@
 const express = require('express');
-const { body, query } = require('express-validator');
+const { body, param, query } = require('express-validator');
 const resultController = require('../controllers/resultController');
 const { authorize } = require('../middleware/auth');
 
@@ -93,8 +93,9 @@ router.post('/:id/report', authorize('admin', 'manager', 'doctor'), [
 
 // @route   POST /api/results/:id/amend
 // @desc    Amend result
-// @access  Private (requires edit_results permission)
-router.post('/:id/amend', authorize('admin', 'manager', 'lab_technician'), [
+// @access  Private (Admin/Doctor, the roles the app lets amend finalized results)
+router.post('/:id/amend', authorize('admin', 'doctor'), [
+  param('id').isMongoId().withMessage('Valid result ID is required'),
   body('amendments').isArray({ min: 1 }).withMessage('Amendments are required'),
   body('amendments.*.parameter').isString().withMessage('Parameter is required'),
   body('amendments.*.originalValue').isString().withMessage('Original value is required'),
@@ -142,9 +143,10 @@ router.get('/critical/values', [
 
 // @route   POST /api/results/batch/approve
 // @desc    Batch approve results
-// @access  Private (Manager/Admin only)
-router.post('/batch/approve', authorize('admin', 'manager'), [
+// @access  Private (Manager/Admin/Doctor, as for single approval)
+router.post('/batch/approve', authorize('admin', 'manager', 'doctor'), [
   body('resultIds').isArray({ min: 1 }).withMessage('Result IDs array is required'),
+  // Document ids; the app sends the backendId of results the backend holds, not its local RES ids
   body('resultIds.*').isMongoId().withMessage('Valid result IDs are required'),
   body('approvalComments').optional().trim()
 ], resultController.batchApproveResults);
@@ -0,0 +1,34 @@
+const express = require('express');
+const { body, query } = require('express-validator');
+const syncController = require('../controllers/syncController');
+const { authorize } = require('../middleware/auth');
+
+const router = express.Router();
+
+// Mirrored collections of the Streamlit kiosk (streamlit_app/kiosk.py)
+const COLLECTIONS = ['worklist', 'results', 'patients', 'panels', 'invoices'];
+const SYNC_ROLES = ['admin', 'manager', 'lab_technician', 'receptionist'];
+
+// @route   POST /api/sync/push
+// @desc    Apply a kiosk's changes; each is applied or returned as a conflict with the central copy
+// @access  Private (kiosk accounts: Admin/Manager/Lab Technician/Receptionist)
+router.post('/push', authorize(...SYNC_ROLES), [
+  body('siteId').isString().trim().notEmpty().withMessage('Site ID is required'),
+  body('changes').isArray({ max: 1000 }).withMessage('Changes must be an array of at most 1000'),
+  body('changes.*.seq').isInt().withMessage('Change sequence number is required'),
+  body('changes.*.collection').isIn(COLLECTIONS).withMessage('Unknown collection'),
+  body('changes.*.id').notEmpty().withMessage('Record ID is required'),
+  body('changes.*.op').isIn(['upsert', 'delete']).withMessage('Operation must be upsert or delete'),
+  body('changes.*.baseSeq').isInt({ min: 0 }).withMessage('Base sequence number is required')
+], syncController.pushChanges);
+
+// @route   GET /api/sync/changes
+// @desc    Central changes after a sequence number, other than the site's own
+// @access  Private (kiosk accounts: Admin/Manager/Lab Technician/Receptionist)
+router.get('/changes', authorize(...SYNC_ROLES), [
+  query('siteId').isString().trim().notEmpty().withMessage('Site ID is required'),
+  query('since').optional().isInt({ min: 0 }).withMessage('Since must be a non-negative integer'),
+  query('limit').optional().isInt({ min: 1, max: 1000 }).withMessage('Limit must be between 1 and 1000')
+], syncController.getChanges);
+
+module.exports = router;
@@ -0,0 +1,55 @@
+// In-memory stand-ins for the sync models, enough for the sync controller
+const state = { counter: 0, records: new Map(), changes: [] };
+
+const keyOf = ({ collectionName, recordId }) => `${collectionName}/${recordId}`;
+
+const Counter = {
+  next: async () => ++state.counter,
+  current: async () => state.counter
+};
+
+const SyncRecord = {
+  findOne: async (key) => state.records.get(keyOf(key)) || null,
+  findOneAndUpdate: async (filter, update) => {
+    const current = state.records.get(keyOf(filter));
+    if (current && current.serverSeq > filter.serverSeq.$lte) {
+      // As MongoDB does when the upsert collides with the unique index
+      throw Object.assign(new Error('E11000 duplicate key error'), { code: 11000 });
+    }
+    const record = { collectionName: filter.collectionName, recordId: filter.recordId, ...update };
+    state.records.set(keyOf(filter), record);
+    return record;
+  }
+};
+
+const SyncChange = {
+  create: async (change) => {
+    state.changes.push(change);
+    return change;
+  },
+  find: (filter) => {
+    let found = state.changes.filter(
+      change => change.serverSeq > filter.serverSeq.$gt && change.site !== filter.site.$ne
+    );
+    const query = {
+      sort: () => {
+        found = [...found].sort((a, b) => a.serverSeq - b.serverSeq);
+        return query;
+      },
+      limit: (n) => {
+        found = found.slice(0, n);
+        return query;
+      },
+      lean: async () => found
+    };
+    return query;
+  }
+};
+
+const reset = () => {
+  state.counter = 0;
+  state.records.clear();
+  state.changes.length = 0;
+};
+
+module.exports = { Counter, SyncRecord, SyncChange, reset };
@@ -0,0 +1,97 @@
+const express = require('express');
+const request = require('supertest');
+
+jest.mock('../models/Counter', () => require('./helpers/syncModels').Counter);
+jest.mock('../models/SyncRecord', () => require('./helpers/syncModels').SyncRecord);
+jest.mock('../models/SyncChange', () => require('./helpers/syncModels').SyncChange);
+
+const { reset } = require('./helpers/syncModels');
+const syncRoutes = require('../routes/sync');
+
+const buildApp = (role = 'lab_technician') => {
+  const app = express();
+  app.use(express.json());
+  app.use((req, res, next) => {
+    req.user = { id: 'user1', role };
+    next();
+  });
+  app.use('/api/sync', syncRoutes);
+  return app;
+};
+
+const change = (seq, id, data, baseSeq = 0, op = 'upsert') => ({
+  seq, collection: 'worklist', id, op, data, baseSeq
+});
+
+describe('Kiosk sync routes', () => {
+  beforeEach(reset);
+
+  it('applies new changes with increasing server sequence numbers', async () => {
+    const res = await request(buildApp())
+      .post('/api/sync/push')
+      .send({
+        siteId: 'KSK01',
+        changes: [
+          change(1, 'KSK01-T1', { testId: 'KSK01-T1', status: 'pending' }),
+          change(2, 'KSK01-T2', { testId: 'KSK01-T2', status: 'pending' })
+        ]
+      });
+
+    expect(res.status).toBe(200);
+    expect(res.body.data.results).toEqual([
+      { seq: 1, status: 'applied', serverSeq: 1 },
+      { seq: 2, status: 'applied', serverSeq: 2 }
+    ]);
+  });
+
+  it('returns the central copy when the change is based on an older one', async () => {
+    const app = buildApp();
+    await request(app).post('/api/sync/push').send({
+      siteId: 'CENTRAL',
+      changes: [change(1, 'T1', { testId: 'T1', status: 'processing' })]
+    });
+
+    const res = await request(app).post('/api/sync/push').send({
+      siteId: 'KSK01',
+      changes: [change(7, 'T1', { testId: 'T1', status: 'collected' }, 0)]
+    });
+
+    expect(res.body.data.results).toEqual([
+      { seq: 7, status: 'conflict', serverSeq: 1, record: { testId: 'T1', status: 'processing' } }
+    ]);
+  });
+
+  it('lists changes after the cursor, leaving out the site\'s own', async () => {
+    const app = buildApp();
+    await request(app).post('/api/sync/push').send({
+      siteId: 'KSK01', changes: [change(1, 'T1', { testId: 'T1' })]
+    });
+    await request(app).post('/api/sync/push').send({
+      siteId: 'KSK02', changes: [change(1, 'T2', { testId: 'T2' }), change(2, 'T3', { testId: 'T3' })]
+    });
+
+    const res = await request(app)
+      .get('/api/sync/changes')
+      .query({ siteId: 'KSK01', since: 0, limit: 1 });
+
+    expect(res.status).toBe(200);
+    expect(res.body.data.changes).toEqual([
+      { serverSeq: 2, collection: 'worklist', id: 'T2', op: 'upsert', data: { testId: 'T2' } }
+    ]);
+    expect(res.body.data.lastSeq).toBe(3);
+  });
+
+  it('rejects unknown operations and collections', async () => {
+    const res = await request(buildApp())
+      .post('/api/sync/push')
+      .send({ siteId: 'KSK01', changes: [{ ...change(1, 'T1', {}), op: 'merge', collection: 'users' }] });
+
+    expect(res.status).toBe(400);
+  });
+
+  it('is limited to kiosk roles', async () => {
+    const res = await request(buildApp('doctor')).get('/api/sync/changes').query({ siteId: 'KSK01' });
+
+    expect(res.status).toBe(403);
+  });
+});
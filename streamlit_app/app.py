@@ -1,25 +1,255 @@
+import json
 import streamlit as st
-from datetime import datetime
+import pandas as pd
+import plotly.express as px
+from datetime import datetime, timedelta
+
+import audit_log
+import auth
+import backend_client
+import billing
+import instrumentation
+import interface_engine
+import inventory
+import kiosk
+import report_renderer
+import report_scheduler
+import calculations
+import catalog_search
+import flagging
+import panel_editor
+import records
+import reference_ranges
+import reflex
+import result_versions
+import signoff
+import stability
+import surveillance
+import worksheet
+import shared_state
+
+# Panel form options with precomputed default-index lookups
+PANEL_CATEGORIES = ["Hematology", "Chemistry", "Microbiology", "Immunology", "Molecular", "Pathology", "Other"]
+SAMPLE_TYPES = ["Blood", "Serum", "Plasma", "Urine", "Stool", "CSF", "Sputum", "Swab", "Tissue", "Other"]
+CONTAINER_TYPES = ["EDTA Tube", "Plain Tube", "Heparin Tube", "Fluoride Tube", "Sterile Container", "Other"]
+TEST_METHODS = ["Automated Analyzer", "Manual Method", "Microscopy", "Culture", "PCR", "ELISA", "Flow Cytometry", "Other"]
+AUTH_LEVELS = signoff.AUTH_LEVELS
+QC_FREQUENCIES = ["Every Batch", "Daily", "Weekly", "Monthly"]
+REPORT_GROUP_BY = ["category", "day", "status", "priority", "payer", "testName"]
+STABILITY_ICONS = {stability.NEAR_EXPIRY: "⏳ ", stability.EXPIRED: "⌛ "}
+
+OPTION_INDEX = {
+    options_name: {option: i for i, option in enumerate(options)}
+    for options_name, options in [
+        ('category', PANEL_CATEGORIES),
+        ('sample_type', SAMPLE_TYPES),
+        ('container_type', CONTAINER_TYPES),
+        ('test_method', TEST_METHODS),
+        ('authorization_level', AUTH_LEVELS),
+        ('qc_frequency', QC_FREQUENCIES),
+        ('storage_condition', stability.STORAGE_CONDITIONS)
+    ]
+}
+
+
+# Permission needed to open each page; pages without an entry are open to every user
+PAGE_PERMISSIONS = {
+    "👥 Patient Management": 'view_patients',
+    "🧪 Test Management": 'view_tests',
+    "📝 Test Results Entry": 'create_results',
+    "📊 Results & Reports": 'view_results',
+    "✍️ Sign-off Queue": 'approve_results',
+    "💰 Billing": 'generate_reports',
+    "🦠 Surveillance": 'view_reports',
+    "📦 Inventory": 'view_tests',
+    "🔬 Test Panels": 'edit_tests',
+    "👤 User Management": 'manage_users',
+    "🧾 Audit Trail": 'system_admin',
+    "🩺 Diagnostics": 'system_admin'
+}
+
+def default_option_index(field, default_values):
+    """Index of the auto-filled value for a selectbox, defaulting to the first option"""
+    return OPTION_INDEX[field].get(default_values.get(field), 0)
+
+
+# Mock worklist (in production, this would come from backend API)
+DEMO_PENDING_TESTS = [
+    {
+        "testId": "TEST000001",
+        "patientId": "PAT001",
+        "patientName": "John Doe",
+        "patientAge": 45,
+        "patientSex": "M",
+        "testType": "complete_blood_count",
+        "category": "hematology",
+        "priority": "routine",
+        "status": "collected",
+        "sampleType": "blood",
+        "collectionDate": "2024-01-15"
+    },
+    {
+        "testId": "TEST000002", 
+        "patientId": "PAT002",
+        "patientName": "Jane Smith",
+        "patientAge": 29,
+        "patientSex": "F",
+        "pregnancyTrimester": 2,
+        "testType": "basic_metabolic_panel",
+        "category": "chemistry",
+        "priority": "urgent",
+        "status": "processing",
+        "sampleType": "blood",
+        "collectionDate": "2024-01-15"
+    },
+    {
+        "testId": "TEST000003",
+        "patientId": "PAT003", 
+        "patientName": "Bob Johnson",
+        "patientAge": 67,
+        "patientSex": "M",
+        "testType": "urinalysis",
+        "category": "chemistry",
+        "priority": "stat",
+        "status": "collected",
+        "sampleType": "urine",
+        "collectionDate": "2024-01-15"
+    }
+]
+
 
 class LISApp:
     def __init__(self):
         self.session_state = {}
+        self.store = shared_state.get_store(DEMO_PENDING_TESTS)
+        self.audit_log = audit_log.get_audit_log()
+        self.backend = backend_client.get_client().with_token(st.session_state.get('auth_token'))
 
     def run(self):
-        st.session_state.authenticated = False
-        st.session_state.user_role = None
-        st.session_state.user_name = None
+        if st.session_state.get('authenticated'):
+            self.audit([{'action': 'logout', 'entityType': 'user', 'entityId': st.session_state.get('user_name')}])
+        auth.end_session(st.session_state)
         st.session_state.admin_mode = False
         st.rerun()
 
-    def login(self):
-        """Login function"""
-        st.session_state.authenticated = True
-        st.session_state.user_role = "lab_technician"
-        st.session_state.user_name = "John Doe"
+    def login(self, username=None, password=None, demo_role=None):
+        """Sign in with credentials, or as a demo user"""
+        try:
+            token = auth.demo_login(demo_role) if demo_role else auth.login(username, password, self.backend)
+        except auth.AuthError as e:
+            st.error(f"❌ {e}")
+            return
+        auth.start_session(st.session_state, token)
         st.session_state.admin_mode = False
+        self.audit([{'action': 'login', 'entityType': 'user', 'entityId': st.session_state.user_name}])
         st.rerun()
+    
+    def login_page(self):
+        """Sign-in form and demo access"""
+        st.markdown('<div class="main-header">🔬 QuXAT LIS</div>', unsafe_allow_html=True)
+        
+        with st.form("login_form"):
+            username = st.text_input("Email" if self.backend.enabled else "Username or Email")
+            password = st.text_input("Password", type="password")
+            if st.form_submit_button("🔐 Login", type="primary"):
+                self.login(username, password)
+        
+        if auth.DEMO_MODE:
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                demo_role = st.selectbox(
+                    "Demo Role", list(auth.DEMO_USERS),
+                    format_func=lambda role: f"{auth.DEMO_USERS[role]['fullName']} ({role})"
+                )
+            with col2:
+                st.write("")
+                if st.button("🎭 Demo Mode", use_container_width=True):
+                    self.login(demo_role=demo_role)
+    
+    def permissions(self):
+        """The current user's permissions: their role's plus any granted individually"""
+        permissions = st.session_state.get('permissions')
+        if permissions is None:
+            permissions = auth.permissions_for(st.session_state.get('user_role'))
+        return permissions
+    
+    def can(self, permission):
+        """Whether the current user holds a permission"""
+        return permission in self.permissions()
+    
+    def audit(self, entries):
+        """Append audit trail entries on behalf of the current user"""
+        self.audit_log.record_many([
+            {
+                'user': st.session_state.get('user_name'),
+                'role': st.session_state.get('user_role'),
+                'changes': {},
+                **entry
+            }
+            for entry in entries
+        ])
+    
+    def audit_worklist_changes(self, replaced):
+        """Audit the (old, new) pairs returned by a worklist update"""
+        self.audit([
+            {'action': 'edit', 'entityType': 'test', 'entityId': new['testId'],
+             'changes': audit_log.field_changes(old, new)}
+            for old, new in replaced
+        ])
+    
+    def audit_panels(self, action, panels, changes=None):
+        self.audit([
+            {'action': action, 'entityType': 'panel', 'entityId': panel['id'],
+             'changes': changes or {'test_code': panel.get('test_code'), 'test_name': panel.get('test_name')}}
+            for panel in panels
+        ])
+
+    def get_pages(self):
+        """Navigation pages available to the current user"""
+        pages = {
+            "👥 Patient Management": self.patient_management_page,
+            "🧪 Test Management": self.test_management_page,
+            "📝 Test Results Entry": self.test_results_entry_page,
+            "📊 Results & Reports": self.results_page,
+            "✍️ Sign-off Queue": self.signoff_queue_page,
+            "💰 Billing": self.billing_page,
+            "🦠 Surveillance": self.surveillance_page,
+            "📦 Inventory": self.inventory_page,
+            "🔬 Test Panels": self.test_panel_creation_page,
+            "👤 User Management": self.user_management_page,
+            "⚙️ Settings": self.settings_page,
+            "🧾 Audit Trail": self.audit_trail_page,
+            "🩺 Diagnostics": self.diagnostics_page
+        }
+        return {
+            label: page for label, page in pages.items()
+            if label not in PAGE_PERMISSIONS or self.can(PAGE_PERMISSIONS[label])
+        }
+
+    def main(self):
+        """Render the sidebar navigation and the selected page"""
+        instrumentation.record_rerun(st.session_state)
+        
+        if st.session_state.get('authenticated') and not auth.session_valid(st.session_state):
+            auth.end_session(st.session_state)
+            st.warning("⏰ Your session has expired. Please sign in again.")
+        
+        if not st.session_state.get('authenticated'):
+            self.login_page()
+            return
+        
+        pages = self.get_pages()
+        with st.sidebar:
+            st.markdown(f"**👤 {st.session_state.user_name}** ({st.session_state.user_role})")
+            page = st.radio("Navigation", list(pages.keys()), key="nav_page")
+            self.kiosk_sync_badge()
+            if st.button("🚪 Logout"):
+                self.run()
+        
+        pages[page]()
+        instrumentation.REGISTRY.export_file()
 
+    @instrumentation.timed('page')
     def patient_management_page(self):
         """Patient management interface"""
         st.markdown('<div class="main-header">👥 Patient Management</div>', unsafe_allow_html=True)
@@ -44,48 +274,73 @@ class LISApp:
                 submitted = st.form_submit_button("Register Patient")
                 
                 if submitted:
-                    st.success("✅ Patient registered successfully!")
-                    st.info("🔄 Connect to backend API to save patient data")
+                    if not first_name or not last_name:
+                        st.error("❌ Please enter the patient's first and last name")
+                    else:
+                        patient = self.store.add_patient({
+                            'firstName': first_name.strip(),
+                            'lastName': last_name.strip(),
+                            'patientName': f"{first_name.strip()} {last_name.strip()}",
+                            'dateOfBirth': str(date_of_birth),
+                            'gender': gender,
+                            'phone': phone.strip(),
+                            'email': email.strip(),
+                            'address': address.strip(),
+                            'emergencyContact': emergency_contact.strip(),
+                            'registeredBy': st.session_state.user_name,
+                            'registeredAt': datetime.now().isoformat()
+                        })
+                        self.audit([{'action': 'create', 'entityType': 'patient', 'entityId': patient['patientId']}])
+                        st.success(f"✅ Patient registered successfully! Patient ID: {patient['patientId']}")
         
         st.markdown("---")
         
         # Patient search and list
         st.markdown("### 🔍 Patient Search")
-        search_term = st.text_input("Search patients by name, ID, or phone")
+        search_term = st.text_input("Search patients by name, ID, or phone").strip().lower()
         
+        patients = self.store.patients.snapshot()
         if search_term:
-            st.info(f"🔍 Searching for: {search_term}")
-            st.info("🔄 Connect to backend API to search patients")
+            patients = [p for p in patients if
+                        search_term in p['patientId'].lower() or
+                        search_term in p.get('patientName', '').lower() or
+                        search_term in p.get('phone', '')]
+        if patients:
+            st.dataframe([
+                {'Patient ID': p['patientId'], 'Name': p.get('patientName'), 'Date of Birth': p.get('dateOfBirth'),
+                 'Gender': p.get('gender'), 'Phone': p.get('phone')}
+                for p in patients[-200:][::-1]
+            ], use_container_width=True, hide_index=True)
+        elif search_term:
+            st.info(f"🔍 No patients match: {search_term}")
+        else:
+            st.info("📋 No patients registered yet")
+    
+    def kiosk_sync_badge(self):
+        """Link and outbox state in the sidebar when running as an offline kiosk"""
+        sync = kiosk.get_sync(self.store)
+        if sync is None:
+            return
+        status = sync.status()
+        if status['online'] is False:
+            st.markdown(f"🔴 **Offline** · {status['pending']} change(s) queued")
+        elif status['pending']:
+            st.markdown(f"🟡 **Syncing** · {status['pending']} change(s) queued")
+        elif status['lastSync']:
+            st.markdown(f"🟢 **Online** · synced {datetime.fromtimestamp(status['lastSync']):%H:%M}")
         else:
-            st.info("📋 Connect to backend API to display patient list")
+            st.markdown("⚪ **Not synced yet**")
+        if st.button("🔄 Sync Now"):
+            sync.request_sync()
     
+    @instrumentation.timed('page')
     def test_management_page(self):
         """Test management interface"""
         st.markdown('<div class="main-header">🧪 Test Management</div>', unsafe_allow_html=True)
         
         # Test ordering form
         with st.expander("➕ Order New Test", expanded=False):
-            with st.form("test_form"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    patient_id = st.text_input("Patient ID")
-                    test_type = st.selectbox("Test Type", [
-                        "Blood Chemistry", "Hematology", "Microbiology", 
-                        "Immunology", "Molecular", "Pathology"
-                    ])
-                    priority = st.selectbox("Priority", ["Routine", "Urgent", "STAT"])
-                
-                with col2:
-                    ordered_by = st.text_input("Ordered By (Doctor)")
-                    collection_date = st.date_input("Collection Date")
-                    notes = st.text_area("Special Instructions")
-                
-                submitted = st.form_submit_button("Order Test")
-                
-                if submitted:
-                    st.success("✅ Test ordered successfully!")
-                    st.info("🔄 Connect to backend API to save test order")
+            self.order_entry_section()
         
         st.markdown("---")
         
@@ -95,7 +350,7 @@ class LISApp:
         tab1, tab2, tab3 = st.tabs(["🔄 In Progress", "✅ Completed", "⚠️ Critical"])
         
         with tab1:
-            st.info("🔄 Connect to backend API to display in-progress tests")
+            self.in_progress_tests()
         
         with tab2:
             st.info("✅ Connect to backend API to display completed tests")
@@ -103,10 +358,184 @@ class LISApp:
         with tab3:
             st.info("⚠️ Connect to backend API to display critical results")
     
+    def get_stability_monitor(self):
+        """Process-wide sample stability monitor"""
+        return stability.get_monitor(self.store, self.get_predefined_tests())
+    
+    def stability_alerts(self):
+        """Near-expiry and expired samples still on the worklist"""
+        self.get_stability_monitor()
+        flagged = [
+            t for t in self.store.worklist.snapshot()
+            if t.get('stabilityStatus') and t.get('status') in stability.IN_FLIGHT
+        ]
+        near = [t for t in flagged if t['stabilityStatus'] == stability.NEAR_EXPIRY]
+        expired = [t for t in flagged if t['stabilityStatus'] == stability.EXPIRED]
+        if near:
+            st.warning(f"⏳ {len(near)} sample(s) near the end of their stability window - process first: "
+                       + ", ".join(f"{t['testId']} ({t['patientName']})" for t in near[:10]))
+        if expired:
+            st.error(f"⌛ {len(expired)} sample(s) past their stability window - recollection required: "
+                     + ", ".join(f"{t['testId']} ({t['patientName']})" for t in expired[:10]))
+    
+    def in_progress_tests(self):
+        """In-flight worklist tests, soonest to expire first"""
+        monitor = self.get_stability_monitor()
+        tests = [t for t in self.store.worklist.snapshot() if t.get('status') in stability.IN_FLIGHT]
+        if not tests:
+            st.info("🔄 No tests in progress")
+            return
+        
+        def remaining_hours(test):
+            seconds = monitor.remaining(test)
+            return None if seconds is None else round(seconds / 3600, 1)
+        
+        rows = [
+            {
+                'Test ID': t['testId'],
+                'Patient': t['patientName'],
+                'Test': t.get('testName', t['testType']),
+                'Priority': t.get('priority', 'routine'),
+                'Status': t['status'],
+                'Stability': STABILITY_ICONS.get(t.get('stabilityStatus'), '') + (t.get('stabilityStatus') or 'ok'),
+                'Hours Left': remaining_hours(t)
+            }
+            for t in tests
+        ]
+        rows.sort(key=lambda r: (r['Hours Left'] is None, r['Hours Left'] or 0))
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    
+    def get_catalog_index(self):
+        """Typeahead index over the test catalog and active panels"""
+        return catalog_search.get_index(self.get_predefined_tests(), self.store.panels)
+    
+    def order_entry_section(self):
+        """Catalog search, order cart and order form"""
+        cart = st.session_state.setdefault('order_cart', [])
+        
+        query = st.text_input(
+            "🔍 Search tests",
+            placeholder="Code, name, synonym or billing code, e.g. CBC, thyroid, KFT, NABL-LFT",
+            key="order_test_search"
+        )
+        if query:
+            matches = self.get_catalog_index().search(query, limit=8)
+            if not matches:
+                st.info(f"No tests match '{query}'")
+            # A panel may share a catalog test's code, so entries are told apart by source and key
+            in_cart = {(item['source'], item['key']) for item in cart}
+            for match in matches:
+                col1, col2, col3 = st.columns([4, 2, 1])
+                with col1:
+                    st.write(f"**{match['code']}** · {match['name']}")
+                with col2:
+                    st.caption(f"{match['category']} · {match['sample_type']} · ₹{match['test_cost']:,.0f}")
+                with col3:
+                    if st.button("➕", key=f"order_add_{match['source']}_{match['key']}",
+                                 disabled=(match['source'], match['key']) in in_cart):
+                        cart.append(match)
+                        st.rerun()
+        
+        if not cart:
+            st.info("🛒 Search the catalog and add one or more tests to the order")
+            return
+        
+        st.markdown(f"**🛒 Tests on this order ({len(cart)})**")
+        for i, item in enumerate(cart):
+            col1, col2 = st.columns([6, 1])
+            with col1:
+                st.write(f"{item['code']} · {item['name']} ({item['sample_type']})")
+            with col2:
+                if st.button("🗑️", key=f"order_remove_{i}_{item['code']}"):
+                    cart.pop(i)
+                    st.rerun()
+        
+        with st.form("test_form"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                patient_id = st.text_input("Patient ID")
+                patient_name = st.text_input("Patient Name")
+                patient_age = st.number_input("Age", min_value=0, max_value=120, value=30)
+                patient_sex = st.selectbox("Sex", ["M", "F"])
+                patient_region = st.text_input("Region / District")
+                priority = st.selectbox("Priority", ["Routine", "Urgent", "STAT"])
+            
+            with col2:
+                payer = st.selectbox("Payer", billing.PAYERS)
+                ordered_by = st.text_input("Ordered By (Doctor)")
+                collection_date = st.date_input("Collection Date")
+                notes = st.text_area("Special Instructions")
+            
+            submitted = st.form_submit_button(f"Order {len(cart)} Test{'s' if len(cart) > 1 else ''}")
+            
+            if submitted:
+                if not patient_id or not patient_name:
+                    st.error("❌ Patient ID and name are required")
+                    return
+                order = {
+                    'patientId': patient_id.strip(),
+                    'patientName': patient_name.strip(),
+                    'patientAge': int(patient_age),
+                    'patientSex': patient_sex,
+                    'patientRegion': patient_region.strip(),
+                    'priority': priority.lower(),
+                    'payer': payer,
+                    'orderedBy': ordered_by,
+                    'collectionDate': str(collection_date),
+                    'collectedAt': datetime.combine(collection_date, datetime.now().time()).isoformat(timespec='seconds'),
+                    'notes': notes
+                }
+                tests = self.store.add_tests([self.order_test(item, order) for item in cart])
+                self.audit([
+                    {'action': 'create', 'entityType': 'test', 'entityId': test['testId'],
+                     'changes': {'orderId': test['orderId'], 'testCode': test['testCode'],
+                                 'patientId': test['patientId']}}
+                    for test in tests
+                ])
+                st.session_state.order_cart = []
+                st.success(f"✅ Order {tests[0]['orderId']} created with {len(tests)} test(s)")
+    
+    def order_test(self, item, order):
+        """Worklist entry for a catalog test or panel on an order"""
+        if item['source'] == 'panel':
+            panel = self.store.panels.get(item['key'])
+            if panel is not None:
+                return {**self.panel_to_pending_test(panel), **order, 'status': 'collected'}
+        test = self.get_predefined_tests().get(item['key'], {})
+        return {
+            "testType": item['name'].lower().replace(' ', '_'),
+            "testCode": item['code'],
+            "testName": item['name'],
+            "category": item['category'].lower(),
+            "sampleType": item['sample_type'].lower(),
+            "status": "collected",
+            "authorizationLevel": test.get('authorization_level'),
+            **order
+        }
+    
+    @instrumentation.timed('page')
     def test_results_entry_page(self):
         """Test Results Entry Interface"""
         st.markdown('<div class="main-header">📝 Test Results Entry</div>', unsafe_allow_html=True)
         
+        reflex_ordered = st.session_state.pop('reflex_ordered', None)
+        if reflex_ordered:
+            st.info("🔁 Reflex tests added to the worklist:\n" + "\n".join(f"- {line}" for line in reflex_ordered))
+        for message in st.session_state.pop('save_warnings', []):
+            st.warning(f"⚠️ {message}")
+        self.stability_alerts()
+        
+        entry_mode = st.radio(
+            "Entry Mode",
+            ["📝 Single Test", "📊 Worksheet (Bulk)"],
+            horizontal=True,
+            key="results_entry_mode"
+        )
+        if entry_mode == "📊 Worksheet (Bulk)":
+            self.results_worksheet_view()
+            return
+        
         # Test selection and results entry
         col1, col2 = st.columns([1, 2])
         
@@ -120,77 +549,10 @@ class LISApp:
             filter_priority = st.selectbox("Filter by Priority", 
                 ["All", "STAT", "Urgent", "Routine"])
             
-            # Mock test list (in production, this would come from backend API)
-            if 'pending_tests' not in st.session_state:
-                st.session_state.pending_tests = [
-                    {
-                        "testId": "TEST000001",
-                        "patientId": "PAT001",
-                        "patientName": "John Doe",
-                        "testType": "complete_blood_count",
-                        "category": "hematology",
-                        "priority": "routine",
-                        "status": "collected",
-                        "sampleType": "blood",
-                        "collectionDate": "2024-01-15"
-                    },
-                    {
-                        "testId": "TEST000002", 
-                        "patientId": "PAT002",
-                        "patientName": "Jane Smith",
-                        "testType": "basic_metabolic_panel",
-                        "category": "chemistry",
-                        "priority": "urgent",
-                        "status": "processing",
-                        "sampleType": "blood",
-                        "collectionDate": "2024-01-15"
-                    },
-                    {
-                        "testId": "TEST000003",
-                        "patientId": "PAT003", 
-                        "patientName": "Bob Johnson",
-                        "testType": "urinalysis",
-                        "category": "chemistry",
-                        "priority": "stat",
-                        "status": "collected",
-                        "sampleType": "urine",
-                        "collectionDate": "2024-01-15"
-                    }
-                ]
-            
-            # Add custom test panels to pending tests if they exist
-            if 'custom_test_panels' in st.session_state and st.session_state.custom_test_panels:
-                # Convert custom test panels to pending tests format
-                for panel in st.session_state.custom_test_panels:
-                    if panel['status'] == 'active':
-                        # Check if this panel is already in pending tests
-                        existing_test = next((t for t in st.session_state.pending_tests if t.get('testCode') == panel['test_code']), None)
-                        if not existing_test:
-                            custom_test = {
-                                "testId": f"CUSTOM_{panel['id']}",
-                                "patientId": "CUSTOM_PAT",
-                                "patientName": "Custom Test Panel",
-                                "testType": panel['test_code'].lower().replace(' ', '_'),
-                                "testCode": panel['test_code'],
-                                "testName": panel['test_name'],
-                                "category": panel['category'].lower(),
-                                "priority": "routine",
-                                "status": "ready_for_testing",
-                                "sampleType": panel['sample_type'].lower(),
-                                "collectionDate": panel['collection_date'],
-                                "collectionTime": panel['collection_time'],
-                                "testingDate": panel['testing_date'],
-                                "testingTime": panel['testing_time'],
-                                "testMethod": panel['test_method'],
-                                "parameters": panel['parameters'],
-                                "authorizationLevel": panel['authorization_level'],
-                                "requiresAuthorization": panel['requires_authorization'],
-                                "isCustomPanel": True
-                            }
-                            st.session_state.pending_tests.append(custom_test)
+            pending_tests = self.get_pending_tests()
             
             # Display filtered tests
-            filtered_tests = st.session_state.pending_tests
+            filtered_tests = pending_tests
             if search_patient:
                 filtered_tests = [t for t in filtered_tests if 
                     search_patient.lower() in t['patientId'].lower() or 
@@ -208,7 +570,8 @@ class LISApp:
                 selected_test_idx = st.selectbox(
                     "Select Test to Enter Results:",
                     range(len(filtered_tests)),
-                    format_func=lambda x: f"{filtered_tests[x]['testId']} - {filtered_tests[x]['patientName']} ({filtered_tests[x]['testType']})"
+                    format_func=lambda x: f"{STABILITY_ICONS.get(filtered_tests[x].get('stabilityStatus'), '')}"
+                                          f"{filtered_tests[x]['testId']} - {filtered_tests[x]['patientName']} ({filtered_tests[x]['testType']})"
                 )
                 selected_test = filtered_tests[selected_test_idx]
             else:
@@ -223,6 +586,7 @@ class LISApp:
                 st.markdown(f"""
                 **Test ID:** {selected_test['testId']}  
                 **Patient:** {selected_test['patientName']} ({selected_test['patientId']})  
+                **Age / Sex:** {selected_test.get('patientAge', '-')} / {selected_test.get('patientSex', '-')}{f" (Pregnancy T{selected_test['pregnancyTrimester']})" if selected_test.get('pregnancyTrimester') else ''}  
                 **Test Type:** {selected_test['testType'].replace('_', ' ').title()}  
                 **Category:** {selected_test['category'].title()}  
                 **Priority:** {selected_test['priority'].upper()}  
@@ -237,7 +601,11 @@ class LISApp:
                     st.markdown("#### 🧪 Test Parameters & Results")
                     
                     # Define test parameters based on test type
-                    test_parameters = self.get_test_parameters(selected_test['testType'], selected_test)
+                    test_parameters = reference_ranges.personalize_parameters(
+                        self.get_test_parameters(selected_test['testType'], selected_test), selected_test
+                    )
+                    
+                    calculated_parameters = self.get_calculated_parameters(selected_test)
                     
                     results_data = {}
                     for param in test_parameters:
@@ -245,14 +613,24 @@ class LISApp:
                         
                         with col_param:
                             st.write(f"**{param['name']}**")
+                            if param.get('reference_range'):
+                                st.caption(f"Ref: {param['reference_range']}")
                         
                         with col_value:
-                            value = st.number_input(
-                                "Value",
-                                key=f"value_{param['key']}",
-                                label_visibility="collapsed",
-                                format=param.get('format', '%.2f')
-                            )
+                            if param.get('format') == '%s':
+                                value = st.text_input(
+                                    "Value",
+                                    key=f"value_{param['key']}",
+                                    label_visibility="collapsed"
+                                )
+                            else:
+                                value = st.number_input(
+                                    "Value",
+                                    value=None,
+                                    key=f"value_{param['key']}",
+                                    label_visibility="collapsed",
+                                    format=param.get('format', '%.2f')
+                                )
                         
                         with col_unit:
                             st.write(param['unit'])
@@ -260,7 +638,7 @@ class LISApp:
                         with col_flag:
                             flag = st.selectbox(
                                 "Flag",
-                                ["Normal", "High", "Low", "Critical High", "Critical Low"],
+                                ["Auto"] + flagging.FLAG_OPTIONS,
                                 key=f"flag_{param['key']}",
                                 label_visibility="collapsed"
                             )
@@ -270,9 +648,13 @@ class LISApp:
                             'value': value,
                             'unit': param['unit'],
                             'flag': flag.lower().replace(' ', '_'),
-                            'referenceRange': param.get('reference_range', '')
+                            'referenceRange': param.get('reference_range', ''),
+                            'criticalValues': param.get('critical_values', '')
                         }
                     
+                    if calculated_parameters:
+                        st.caption("🧮 Calculated on save: " + ", ".join(c['name'] for c in calculated_parameters))
+                    
                     st.markdown("---")
                     
                     # Custom panel specific fields (if applicable)
@@ -364,10 +746,38 @@ class LISApp:
                     
                     # Handle form submission
                     if save_draft or submit_review or approve_final:
+                        # 'Auto' flags are computed against the patient-specific ranges
+                        auto_values = [v for v in results_data.values() if v['flag'] == 'auto']
+                        if auto_values:
+                            computed = flagging.compute_flags(
+                                [v['value'] for v in auto_values],
+                                [v['referenceRange'] for v in auto_values],
+                                [v['criticalValues'] for v in auto_values]
+                            )
+                            for value, computed_flag in zip(auto_values, computed):
+                                value['flag'] = computed_flag or 'normal'
+                        for value in results_data.values():
+                            value.pop('criticalValues', None)
+                        
+                        derived_values = calculations.calculate_test_values(
+                            calculated_parameters, results_data, selected_test
+                        )
+                        if derived_values:
+                            derived_flags = flagging.compute_flags(
+                                [v['value'] for v in derived_values],
+                                [v['referenceRange'] for v in derived_values]
+                            )
+                            for value, derived_flag in zip(derived_values, derived_flags):
+                                value['flag'] = derived_flag
+                        
                         result_data = {
                             "test": selected_test['testId'],
                             "patient": selected_test['patientId'],
-                            "testValues": list(results_data.values()),
+                            "patientName": selected_test['patientName'],
+                            "testType": selected_test['testType'],
+                            "testName": selected_test.get('testName', selected_test['testType'].replace('_', ' ').title()),
+                            "collectionDate": selected_test['collectionDate'],
+                            "testValues": list(results_data.values()) + derived_values,
                             "overallStatus": overall_status.lower(),
                             "interpretation": interpretation,
                             "recommendations": recommendations,
@@ -379,9 +789,19 @@ class LISApp:
                                 "humidity": humidity
                             },
                             "technicalComments": technical_comments,
-                            "status": "draft" if save_draft else ("pending_review" if submit_review else "approved")
+                            "status": "draft" if save_draft else ("pending_review" if submit_review else "approved"),
+                            **signoff.signoff_fields(selected_test)
                         }
                         
+                        # Tests needing a higher authorization level go to the sign-off queue
+                        routed = approve_final and not signoff.can_sign(
+                            st.session_state.get('user_role'), self.permissions(), result_data['authorizationLevel']
+                        )
+                        if routed:
+                            result_data['status'] = 'pending_review'
+                        elif approve_final:
+                            result_data.update(self.approval_fields())
+                        
                         # Add custom panel specific data if applicable
                         if selected_test.get('isCustomPanel'):
                             result_data.update({
@@ -403,19 +823,45 @@ class LISApp:
                                 st.success("✅ Results saved as draft!")
                             elif submit_review:
                                 st.success("✅ Results submitted for review!")
+                            elif routed:
+                                st.info(f"🔏 {result_data['authorizationLevel']} sign-off required - "
+                                        f"results sent to the Sign-off Queue")
                             else:
                                 st.success("✅ Results approved and finalized!")
                                 if selected_test.get('isCustomPanel'):
                                     st.info(f"🕒 Authorization Date/Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
                             
                             # Update test status
-                            selected_test['status'] = 'completed'
+                            self.audit_worklist_changes(
+                                self.store.update_tests([selected_test['testId']], {'status': 'completed'})
+                            )
                             st.rerun()
                         else:
                             st.error("❌ Failed to save results. Please try again.")
             else:
                 st.info("👈 Please select a test from the left panel to enter results")
     
+    @instrumentation.timed('catalog')
+    def get_pending_tests(self):
+        """Pending worklist snapshot, including active custom test panels"""
+        self.store.sync_worklist_with_panels(self.panel_to_pending_test)
+        return self.store.worklist.snapshot()
+    
+    def panel_to_pending_test(self, panel):
+        """Convert a custom test panel to pending test format (a view over the panel)"""
+        return records.PanelTest(panel, self.store.panels)
+    
+    def get_calculated_parameters(self, selected_test):
+        """Derived parameter declarations for a worklist test"""
+        if 'calculatedParameters' in selected_test:
+            return selected_test['calculatedParameters']
+        for test in self.get_predefined_tests().values():
+            if selected_test.get('testCode') == test['test_code'] or \
+                    selected_test['testType'] == test['test_name'].lower().replace(' ', '_'):
+                return test.get('calculated_parameters', [])
+        return []
+    
+    @instrumentation.timed('catalog')
     def get_test_parameters(self, test_type, selected_test=None):
         """Get test parameters based on test type"""
         
@@ -460,6 +906,9 @@ class LISApp:
                 {'key': 'ph', 'name': 'pH', 'unit': '', 'reference_range': '5.0-8.0', 'format': '%.1f'},
                 {'key': 'protein', 'name': 'Protein', 'unit': 'mg/dL', 'reference_range': 'Negative', 'format': '%.0f'},
                 {'key': 'glucose_urine', 'name': 'Glucose', 'unit': 'mg/dL', 'reference_range': 'Negative', 'format': '%.0f'}
+            ],
+            'hepatitis_b_surface_antigen': [
+                {'key': 'hbsag', 'name': 'HBsAg', 'unit': '', 'reference_range': 'Non-reactive', 'format': '%s'}
             ]
         }
         
@@ -467,19 +916,184 @@ class LISApp:
             {'key': 'result', 'name': 'Result', 'unit': '', 'reference_range': '', 'format': '%.2f'}
         ])
     
+    def results_worksheet_view(self):
+        """Grid entry of many tests x parameters, saved as one batch"""
+        st.markdown("### 📊 Results Worksheet")
+        
+        col_search, col_status, col_priority = st.columns(3)
+        with col_search:
+            search_patient = st.text_input("🔍 Search Patient ID/Name", key="worksheet_search")
+        with col_status:
+            filter_status = st.selectbox("Filter by Status",
+                ["All", "Collected", "Processing", "Pending Results"], key="worksheet_status")
+        with col_priority:
+            filter_priority = st.selectbox("Filter by Priority",
+                ["All", "STAT", "Urgent", "Routine"], key="worksheet_priority")
+        
+        tests = [t for t in self.get_pending_tests() if t['status'] != 'completed']
+        if search_patient:
+            tests = [t for t in tests if
+                search_patient.lower() in t['patientId'].lower() or
+                search_patient.lower() in t['patientName'].lower()]
+        if filter_status != "All":
+            status_map = {"Collected": "collected", "Processing": "processing", "Pending Results": "pending"}
+            tests = [t for t in tests if t['status'] == status_map.get(filter_status, filter_status.lower())]
+        if filter_priority != "All":
+            tests = [t for t in tests if t['priority'] == filter_priority.lower()]
+        
+        if not tests:
+            st.warning("No tests found matching the criteria")
+            return
+        
+        if len(tests) > worksheet.MAX_WORKSHEET_TESTS:
+            st.info(f"Showing the first {worksheet.MAX_WORKSHEET_TESTS} of {len(tests)} tests")
+        
+        # Rebuild the grid only when the selection of tests changes
+        worksheet_ids = tuple(t['testId'] for t in tests[:worksheet.MAX_WORKSHEET_TESTS])
+        if st.session_state.get('worksheet_ids') != worksheet_ids:
+            st.session_state.worksheet_ids = worksheet_ids
+            st.session_state.worksheet_frame = worksheet.build_worksheet(
+                tests, self.get_test_parameters, self.get_calculated_parameters
+            )
+            st.session_state.worksheet_rev = st.session_state.get('worksheet_rev', 0) + 1
+        
+        entry_units = st.radio(
+            "Values entered in",
+            ["Conventional units", "SI units"],
+            horizontal=True,
+            key="worksheet_entry_units"
+        )
+        si_entry = entry_units == "SI units"
+        
+        with st.form("worksheet_form"):
+            edited = st.data_editor(
+                st.session_state.worksheet_frame,
+                disabled=[c for c in worksheet.WORKSHEET_COLUMNS if c not in worksheet.EDITABLE_COLUMNS],
+                column_order=['testId', 'patientName', 'testName', 'calculated', 'parameter', 'value',
+                              'siUnit' if si_entry else 'unit', 'referenceRange', 'flag'],
+                column_config={
+                    'calculated': st.column_config.CheckboxColumn("ƒ", help="Calculated from other parameters"),
+                    'testId': st.column_config.TextColumn("Test ID"),
+                    'patientName': st.column_config.TextColumn("Patient"),
+                    'testName': st.column_config.TextColumn("Test"),
+                    'parameter': st.column_config.TextColumn("Parameter"),
+                    'value': st.column_config.TextColumn("Value"),
+                    'unit': st.column_config.TextColumn("Unit"),
+                    'siUnit': st.column_config.TextColumn("SI Unit"),
+                    'referenceRange': st.column_config.TextColumn("Reference Range"),
+                    'flag': st.column_config.TextColumn("Flag")
+                },
+                hide_index=True,
+                use_container_width=True,
+                key=f"worksheet_editor_{st.session_state.worksheet_rev}"
+            )
+            
+            performed_by = st.text_input(
+                "Performed By",
+                value=st.session_state.get('user_name', 'Lab Technician')
+            )
+            
+            col_flags, col_draft, col_review = st.columns(3)
+            with col_flags:
+                compute = st.form_submit_button("🚩 Calculate & Flag")
+            with col_draft:
+                save_draft = st.form_submit_button("💾 Save Batch as Draft", type="secondary")
+            with col_review:
+                submit_review = st.form_submit_button("📋 Submit Batch for Review", type="primary")
+        
+        if si_entry and (compute or save_draft or submit_review):
+            edited = worksheet.convert_si_entries(edited, st.session_state.worksheet_frame)
+        
+        if compute:
+            st.session_state.worksheet_frame = worksheet.flag_worksheet(edited, st.session_state.worksheet_frame)
+            st.session_state.worksheet_rev += 1
+            st.rerun()
+        
+        if save_draft or submit_review:
+            tests_by_id = {t['testId']: t for t in tests}
+            results = worksheet.worksheet_to_results(
+                edited, tests_by_id, performed_by,
+                "draft" if save_draft else "pending_review"
+            )
+            if not results:
+                st.warning("⚠️ Enter at least one value before saving")
+            elif self.save_test_results_batch(results):
+                self.audit_worklist_changes(
+                    self.store.update_tests([result['test'] for result in results], {'status': 'completed'})
+                )
+                del st.session_state.worksheet_ids
+                st.success(f"✅ Saved results for {len(results)} tests")
+                st.rerun()
+            else:
+                st.error("❌ Failed to save results. Please try again.")
+    
     def save_test_results(self, result_data):
         """Save test results (mock function - in production would call backend API)"""
+        return self.save_test_results_batch([result_data])
+    
+    @instrumentation.timed('backend')
+    def save_test_results_batch(self, results):
+        """Save a batch of test results in one call"""
         try:
             # Mock API call - in production this would be:
             # response = requests.post(f"{API_BASE_URL}/results", json=result_data)
             # return response.status_code == 201
             
-            # For demo purposes, just return True
-            return True
+            # For demo purposes, keep results in the shared store
+            saved_at = datetime.now().isoformat()
+            for result_data in results:
+                result_data.setdefault('savedAt', saved_at)
+                if 'authorizationLevel' not in result_data:
+                    result_data.update(signoff.signoff_fields(self.store.worklist.get(result_data['test']) or {}))
+            stored = self.store.add_results(results)
         except Exception as e:
             st.error(f"Error saving results: {str(e)}")
             return False
+        
+        # The results are stored from here on; a failure below must not report the save as failed
+        actions = {'approved': 'approve', 'pending_review': 'submit'}
+        self.audit([
+            {
+                'action': actions.get(result.get('status'), 'create'),
+                'entityType': 'result',
+                'entityId': result['resultId'],
+                'changes': {'status': [None, result.get('status')], 'test': result.get('test'),
+                            'values': len(result.get('testValues', []))}
+            }
+            for result in stored
+        ])
+        try:
+            self.order_reflex_tests(stored)
+        except Exception as e:
+            self.save_warning(f"Results saved, but reflex tests could not be ordered: {e}")
+        try:
+            self.export_results(stored)
+        except Exception as e:
+            self.save_warning(f"Results saved, but could not be queued for the hospital system: {e}")
+        return True
+    
+    def save_warning(self, message):
+        """Warning shown on the next run of the results entry page, which reruns after a save"""
+        st.session_state['save_warnings'] = st.session_state.get('save_warnings', []) + [message]
+    
+    def order_reflex_tests(self, results):
+        """Add the reflex tests saved results trigger to the worklist"""
+        engine = reflex.get_engine(self.get_predefined_tests())
+        new_tests = engine.reflex_tests(results, self.store.worklist)
+        if not new_tests:
+            return []
+        stored = self.store.add_tests(new_tests, new_order=False)
+        self.audit([
+            {'action': 'create', 'entityType': 'test', 'entityId': test['testId'],
+             'changes': {'testCode': test['testCode'], 'reflexOf': test['reflexOf'], 'rule': test['reflexRule']}}
+            for test in stored
+        ])
+        st.session_state.reflex_ordered = st.session_state.get('reflex_ordered', []) + [
+            f"{test['testName']} for {test['patientName']} ({test['reflexTrigger']})" for test in stored
+        ]
+        return stored
     
+    @instrumentation.timed('page')
     def results_page(self):
         """Results and reports interface"""
         st.markdown('<div class="main-header">📊 Results & Reports</div>', unsafe_allow_html=True)
@@ -512,18 +1126,37 @@ class LISApp:
         st.markdown("### 📋 Generate Reports")
         
         col1, col2, col3 = st.columns(3)
+        today = datetime.now().date()
         
         with col1:
             if st.button("📊 Daily Report", use_container_width=True):
-                st.info("📊 Connect to backend API to generate daily report")
+                st.session_state.report_request = ('daily-summary', {'dateFrom': str(today), 'dateTo': str(today)})
         
         with col2:
             if st.button("📈 Weekly Summary", use_container_width=True):
-                st.info("📈 Connect to backend API to generate weekly summary")
+                st.session_state.report_request = (
+                    'weekly-summary', {'dateFrom': str(today - timedelta(days=6)), 'dateTo': str(today)}
+                )
         
         with col3:
             if st.button("📋 Custom Report", use_container_width=True):
-                st.info("📋 Connect to backend API to generate custom report")
+                st.session_state.show_custom_report = not st.session_state.get('show_custom_report', False)
+        
+        if st.session_state.get('show_custom_report'):
+            self.custom_report_form()
+        self.report_output_section()
+        
+        if self.can('generate_reports'):
+            st.markdown("---")
+            self.report_schedules_section()
+        
+        st.markdown("---")
+        
+        self.patient_reports_section()
+        
+        st.markdown("---")
+        
+        self.result_amendment_section()
         
         st.markdown("---")
         
@@ -531,11 +1164,892 @@ class LISApp:
         st.markdown("### 🔍 Recent Results")
         st.info("🔄 Connect to backend API to display recent results")
     
+    def custom_report_form(self):
+        """Report type, period and grouping for an on-demand report"""
+        today = datetime.now().date()
+        with st.form("custom_report_form"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                report_type = st.selectbox("Report", list(report_scheduler.REPORTS),
+                                           format_func=lambda r: report_scheduler.REPORTS[r]['title'])
+            with col2:
+                date_from = st.date_input("From", value=today - timedelta(days=29))
+                date_to = st.date_input("To", value=today)
+            with col3:
+                group_by = st.selectbox("Group By (volume and revenue)", REPORT_GROUP_BY)
+            if st.form_submit_button("📋 Generate Report"):
+                params = {'dateFrom': str(date_from), 'dateTo': str(date_to)}
+                if group_by in report_scheduler.GROUP_BY.get(report_type, []):
+                    params['groupBy'] = group_by
+                st.session_state.report_request = (report_type, params)
+    
+    def report_output_section(self):
+        """The requested report, from the cache or computed on the report pool"""
+        request = st.session_state.get('report_request')
+        if request is None:
+            return
+        report_type, params = request
+        title = report_scheduler.REPORTS[report_type]['title']
+        output, pending = report_scheduler.get_report_service(self.store).request(report_type, params)
+        if output is None:
+            if pending is None:
+                st.warning("⚠️ Too many reports are being generated; please try again in a moment")
+            else:
+                st.info(f"⏳ {title} is being generated in the background")
+                st.button("🔄 Refresh", key="report_refresh")
+            return
+        
+        st.markdown(f"#### {title} · {params['dateFrom']} to {params['dateTo']}")
+        st.caption(f"Generated at {output.generated_at:%H:%M:%S} in {output.seconds * 1000:.0f} ms; "
+                   f"served from cache until the data changes")
+        for section, frame in output.sections.items():
+            st.markdown(f"**{section}**")
+            if frame.empty:
+                st.info("📋 No data for this period")
+            else:
+                st.dataframe(frame, use_container_width=True, hide_index=True)
+        st.download_button(
+            label="💾 Download CSV",
+            data=output.to_csv(),
+            file_name=f"{report_type}_{params['dateFrom']}_{params['dateTo']}.csv",
+            mime="text/csv"
+        )
+    
+    def report_schedules_section(self):
+        """Recurring reports run by the report scheduler"""
+        st.markdown("### ⏰ Scheduled Reports")
+        
+        with st.expander("➕ Schedule a Report", expanded=False):
+            with st.form("report_schedule_form"):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    report_type = st.selectbox("Report", list(report_scheduler.REPORTS),
+                                               format_func=lambda r: report_scheduler.REPORTS[r]['title'])
+                    frequency = st.selectbox("Frequency", report_scheduler.FREQUENCIES, format_func=str.title)
+                with col2:
+                    run_at = st.time_input("Run At", value=datetime.strptime("06:00", "%H:%M").time())
+                    weekday = st.selectbox("Day of Week (weekly)", range(7),
+                                           format_func=report_scheduler.WEEKDAYS.__getitem__)
+                with col3:
+                    day = st.number_input("Day of Month (monthly, quarterly)", min_value=1, max_value=28, value=1)
+                    fmt = st.selectbox("Format", report_scheduler.FORMATS, format_func=str.upper)
+                if st.form_submit_button("⏰ Schedule Report"):
+                    schedule = self.store.add_report_schedule({
+                        'reportType': report_type,
+                        'frequency': frequency,
+                        'time': run_at.strftime("%H:%M"),
+                        'weekday': weekday,
+                        'day': int(day),
+                        'format': fmt,
+                        'parameters': {},
+                        'isActive': True,
+                        'createdBy': st.session_state.user_name,
+                        'createdAt': datetime.now().isoformat()
+                    })
+                    self.audit([{'action': 'create', 'entityType': 'report_schedule',
+                                 'entityId': schedule['scheduleId'],
+                                 'changes': {'reportType': report_type, 'frequency': frequency}}])
+                    st.success(f"✅ {report_scheduler.REPORTS[report_type]['title']} scheduled "
+                               f"({schedule['scheduleId']})")
+        
+        schedules = self.store.report_schedules.snapshot()
+        if not schedules:
+            st.info("📋 No reports scheduled yet")
+            return
+        
+        now = datetime.now()
+        st.dataframe([
+            {
+                'Schedule': s['scheduleId'],
+                'Report': report_scheduler.REPORTS[s['reportType']]['title'],
+                'Frequency': s['frequency'].title(),
+                'Next Run': f"{report_scheduler.next_run(s, now):%Y-%m-%d %H:%M}" if s.get('isActive') else "Paused",
+                'Last Run': (s.get('lastRun') or '')[:16].replace('T', ' '),
+                'Status': s.get('lastStatus') or '',
+                'Files': len(s.get('lastOutput') or [])
+            }
+            for s in schedules
+        ], use_container_width=True, hide_index=True)
+        
+        col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+        with col1:
+            schedule_id = st.selectbox("Schedule", [s['scheduleId'] for s in schedules], key="report_schedule_id",
+                                       label_visibility="collapsed")
+        schedule = self.store.report_schedules.get(schedule_id)
+        with col2:
+            if st.button("▶️ Run Now", use_container_width=True):
+                report_scheduler.get_scheduler(self.store).run_in_background(schedule)
+                st.info(f"⏳ {schedule_id} started; refresh to see its status")
+        with col3:
+            if st.button("⏸️ Pause" if schedule.get('isActive') else "▶️ Resume", use_container_width=True):
+                self.store.update_report_schedule(schedule_id, {'isActive': not schedule.get('isActive')})
+                self.audit([{'action': 'toggle', 'entityType': 'report_schedule', 'entityId': schedule_id,
+                             'changes': {'isActive': [schedule.get('isActive'), not schedule.get('isActive')]}}])
+                st.rerun()
+        with col4:
+            if st.button("🗑️ Delete", use_container_width=True):
+                self.store.remove_report_schedule(schedule_id)
+                self.audit([{'action': 'delete', 'entityType': 'report_schedule', 'entityId': schedule_id}])
+                st.rerun()
+        if schedule.get('lastError'):
+            st.warning(f"⚠️ Last run failed: {schedule['lastError']}")
+        elif schedule.get('lastOutput'):
+            with st.expander("Last output files", expanded=False):
+                for path in schedule['lastOutput']:
+                    st.text(path)
+    
+    def patient_reports_section(self):
+        """Single and batch patient report generation"""
+        st.markdown("### 🖨️ Patient Reports")
+        
+        finalized = [r for r in self.store.results.snapshot() if r['status'] in ('approved', 'amended')]
+        if not finalized:
+            st.info("📝 No finalized results yet. Approve results in Test Results Entry to generate reports.")
+            return
+        
+        col_single, col_batch = st.columns(2)
+        
+        with col_single:
+            st.markdown("#### 📄 Single Report")
+            selected_idx = st.selectbox(
+                "Finalized Result",
+                range(len(finalized)),
+                format_func=lambda x: f"{finalized[x]['resultId']} - {finalized[x]['patientName']} ({finalized[x]['testName']})",
+                key="report_result_selector"
+            )
+            result = finalized[selected_idx]
+            # Rendered only on request, and kept while the selected result version is unchanged
+            report_key = (result['resultId'], result_versions.current_version(result))
+            prepared = st.session_state.get('prepared_report')
+            if prepared is None or prepared['key'] != report_key:
+                if st.button("📄 Prepare Report", use_container_width=True):
+                    report_html = report_renderer.render_patient_report(result)
+                    prepared = st.session_state.prepared_report = {
+                        'key': report_key,
+                        'html': report_html,
+                        'pdf': report_renderer.html_to_pdf(report_html) if report_renderer.PDF_AVAILABLE else None
+                    }
+                else:
+                    prepared = None
+            if prepared is not None:
+                st.download_button(
+                    label="💾 Download HTML Report",
+                    data=prepared['html'],
+                    file_name=f"{result['resultId']}.html",
+                    mime="text/html",
+                    use_container_width=True
+                )
+                if prepared['pdf'] is not None:
+                    st.download_button(
+                        label="💾 Download PDF Report",
+                        data=prepared['pdf'],
+                        file_name=f"{result['resultId']}.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+        
+        with col_batch:
+            st.markdown("#### 📦 Batch Dispatch")
+            formats = ["html", "pdf"] if report_renderer.PDF_AVAILABLE else ["html"]
+            batch_format = st.selectbox("Report Format", formats, key="batch_report_format")
+            
+            job = report_renderer.get_batch_job(st.session_state.get('report_batch_job_id'))
+            if st.button(f"🚚 Render {len(finalized)} Finalized Reports", use_container_width=True,
+                         disabled=job is not None and not job.done):
+                job = report_renderer.start_batch_job(finalized, fmt=batch_format)
+                st.session_state.report_batch_job_id = job.id
+            
+            if job is not None:
+                st.progress(job.progress, text=f"{job.completed}/{job.total} rendered ({job.status})")
+                if job.errors:
+                    st.warning(f"⚠️ {len(job.errors)} reports failed to render")
+                if job.done:
+                    st.download_button(
+                        label="💾 Download Reports (ZIP)",
+                        data=job.zip_bytes(),
+                        file_name=f"reports_{job.id}.zip",
+                        mime="application/zip",
+                        use_container_width=True
+                    )
+                elif st.button("🔄 Refresh Progress", use_container_width=True):
+                    st.rerun()
+    
+    def result_amendment_section(self):
+        """Amend finalized results and compare their versions"""
+        st.markdown("### ✏️ Result Amendments")
+        
+        if not self.can('approve_results'):
+            st.info("🔒 Amending finalized results requires result approval rights.")
+            return
+        
+        amendable = [r for r in self.store.results.snapshot() if r['status'] in ('approved', 'amended')]
+        if not amendable:
+            st.info("📝 Only approved results can be amended.")
+            return
+        
+        selected_idx = st.selectbox(
+            "Result to Amend",
+            range(len(amendable)),
+            format_func=lambda x: f"{amendable[x]['resultId']} - {amendable[x]['patientName']} "
+                                  f"({amendable[x]['testName']}) · v{result_versions.current_version(amendable[x])}",
+            key="amend_result_selector"
+        )
+        result = amendable[selected_idx]
+        result_id = result['resultId']
+        version = result_versions.current_version(result)
+        
+        tab_amend, tab_history = st.tabs(["✏️ Amend", f"🕘 Versions ({version})"])
+        
+        with tab_amend:
+            # Keys carry the version so the form shows the latest values after each amendment
+            with st.form(f"amend_form_{result_id}_{version}"):
+                test_values = result.get('testValues', [])
+                entered = []
+                col1, col2 = st.columns(2)
+                for i, test_value in enumerate(test_values):
+                    with (col1 if i % 2 == 0 else col2):
+                        label = f"{'ƒ ' if test_value.get('calculated') else ''}{test_value.get('parameter')}"
+                        entered.append(st.text_input(
+                            f"{label} ({test_value.get('unit') or '-'})",
+                            value=str(test_value.get('value', '')),
+                            help=f"Ref: {test_value.get('referenceRange') or '-'}",
+                            key=f"amend_{result_id}_{version}_{i}"
+                        ))
+                interpretation = st.text_area("Interpretation", value=result.get('interpretation') or '',
+                                              key=f"amend_{result_id}_{version}_interpretation")
+                reason = st.text_input("Reason for Amendment *", key=f"amend_{result_id}_{version}_reason")
+                submitted = st.form_submit_button("✏️ Amend Result", type="primary")
+            
+            if submitted:
+                if not reason.strip():
+                    st.error("❌ A reason is required to amend a finalized result")
+                else:
+                    self.amend_result(result, test_values, entered, interpretation, reason.strip())
+        
+        with tab_history:
+            history = result_versions.amendment_history(result)
+            if not history:
+                st.info("📄 This result has not been amended.")
+            else:
+                st.dataframe(
+                    [{**row, 'amendedAt': str(row['amendedAt'])[:19].replace('T', ' '),
+                      'before': str(row['before'] or ''), 'after': str(row['after'] or '')} for row in history],
+                    use_container_width=True, hide_index=True
+                )
+                col1, col2 = st.columns(2)
+                with col1:
+                    from_version = st.selectbox("Compare Version", range(1, version + 1), key="amend_diff_from")
+                with col2:
+                    to_version = st.selectbox("With Version", range(1, version + 1), index=version - 1,
+                                              key="amend_diff_to")
+                diff = result_versions.version_diff(result, from_version, to_version)
+                if diff:
+                    st.dataframe(
+                        [{**row, 'before': str(row['before'] or ''), 'after': str(row['after'] or '')} for row in diff],
+                        use_container_width=True, hide_index=True
+                    )
+                else:
+                    st.caption("No differences between these versions")
+                with st.expander(f"📄 Version {from_version} Values"):
+                    st.dataframe(
+                        [{**v, 'value': str(v.get('value', ''))}
+                         for v in result_versions.reconstruct(result, from_version)['testValues']],
+                        use_container_width=True, hide_index=True
+                    )
+    
+    def amend_result(self, result, test_values, entered, interpretation, reason):
+        """Store an amendment as a new version of a finalized result"""
+        new_values = []
+        changed = []
+        for test_value, value in zip(test_values, entered):
+            new_value = dict(test_value)
+            value = value.strip()
+            if value != str(test_value.get('value', '')):
+                # Numeric results stay numeric
+                if isinstance(test_value.get('value'), (int, float)):
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        pass
+                new_value['value'] = value
+                changed.append(new_value)
+            new_values.append(new_value)
+        
+        # Re-flag amended values against their reference ranges
+        if changed:
+            flags = flagging.compute_flags([v['value'] for v in changed], [v.get('referenceRange') for v in changed])
+            for new_value, flag in zip(changed, flags):
+                new_value['flag'] = flag or 'normal'
+        
+        changes = result_versions.amend(
+            result, new_values, reason, st.session_state.get('user_name'), interpretation=interpretation
+        )
+        if changes is None:
+            st.warning("⚠️ Nothing was changed")
+            return
+        
+        delta = changes['amendments'][-1]['delta']
+        backend_id = backend_client.backend_id(result)
+        if self.backend.enabled and backend_id:
+            try:
+                self.backend.amend_result(
+                    backend_id, result_versions.backend_amendments(delta, reason), reason,
+                    test_values=new_values, interpretation=interpretation
+                )
+            except backend_client.BackendError as e:
+                st.error(f"❌ Amendment rejected by the backend: {e}")
+                return
+        
+        amended = self.store.update_result(result['resultId'], changes)
+        self.audit([{
+            'action': 'amend',
+            'entityType': 'result',
+            'entityId': result['resultId'],
+            'changes': {'version': [changes['version'] - 1, changes['version']],
+                        **{'.'.join(filter(None, (row['parameter'], row['field']))): [row['before'], row['after']]
+                           for row in result_versions.delta_rows(delta)}},
+            'reason': reason
+        }])
+        self.export_results([amended])
+        st.success(f"✅ {result['resultId']} amended (version {changes['version']})")
+        st.rerun()
+    
+    def approval_fields(self, comments=None):
+        """Who approved a result and when"""
+        fields = {'approvedBy': st.session_state.get('user_name'), 'approvedAt': datetime.now().isoformat()}
+        if comments:
+            fields['approvalComments'] = comments
+        return fields
+    
+    @instrumentation.timed('page')
+    def signoff_queue_page(self):
+        """Results awaiting authorization, reviewed and approved in bulk"""
+        st.markdown('<div class="main-header">✍️ Sign-off Queue</div>', unsafe_allow_html=True)
+        
+        signer_level = signoff.role_level(st.session_state.get('user_role'), self.permissions())
+        if signer_level is None:
+            st.warning("⚠️ You do not have permission to sign off results.")
+            return
+        levels = signoff.AUTH_LEVELS[:signoff.LEVEL_RANK[signer_level] + 1]
+        queue = signoff.get_queue(self.store.results)
+        counts = queue.counts(levels)
+        
+        cols = st.columns(len(signoff.PRIORITIES))
+        for col, priority in zip(cols, signoff.PRIORITIES):
+            with col:
+                st.metric(priority.upper(), sum(n for (_, p), n in counts.items() if p == priority))
+        
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            selected_levels = st.multiselect("Authorization Level", levels, default=levels, key="signoff_levels")
+        with col2:
+            selected_priorities = st.multiselect(
+                "Priority", [p.upper() for p in signoff.PRIORITIES], key="signoff_priorities"
+            )
+        with col3:
+            page_size = st.selectbox("Show", [50, 100, 250, 500], index=1, key="signoff_page_size")
+        
+        selected_levels = selected_levels or levels
+        priorities = [p.lower() for p in selected_priorities]
+        waiting = sum(n for (level, p), n in counts.items()
+                      if level in selected_levels and (not priorities or p in priorities))
+        pending = queue.pending(selected_levels, priorities, limit=page_size)
+        if not pending:
+            st.success("🎉 Nothing is waiting for your sign-off")
+            return
+        
+        st.caption(f"Showing {len(pending)} of {waiting} waiting results, most urgent and oldest first")
+        
+        with st.form("signoff_form"):
+            edited = st.data_editor(
+                [
+                    {
+                        'select': False,
+                        'resultId': r['resultId'],
+                        'priority': r.get('priority', 'routine').upper(),
+                        'level': r.get('authorizationLevel'),
+                        'patientName': r.get('patientName'),
+                        'testName': r.get('testName'),
+                        'flags': signoff.flag_summary(r),
+                        'critical': signoff.is_critical(r),
+                        'savedAt': str(r.get('savedAt', ''))[:16].replace('T', ' '),
+                        'performedBy': r.get('performedBy')
+                    }
+                    for r in pending
+                ],
+                disabled=['resultId', 'priority', 'level', 'patientName', 'testName', 'flags', 'critical',
+                          'savedAt', 'performedBy'],
+                column_config={
+                    'select': st.column_config.CheckboxColumn("✅"),
+                    'resultId': st.column_config.TextColumn("Result ID"),
+                    'priority': st.column_config.TextColumn("Priority"),
+                    'level': st.column_config.TextColumn("Level"),
+                    'patientName': st.column_config.TextColumn("Patient"),
+                    'testName': st.column_config.TextColumn("Test"),
+                    'flags': st.column_config.TextColumn("Out of Range"),
+                    'critical': st.column_config.CheckboxColumn("⚠️ Critical"),
+                    'savedAt': st.column_config.TextColumn("Submitted"),
+                    'performedBy': st.column_config.TextColumn("Performed By")
+                },
+                hide_index=True,
+                use_container_width=True,
+                key="signoff_editor"
+            )
+            comments = st.text_input("Approval Comments")
+            include_critical = st.checkbox("Include critical results when approving all shown", value=False)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                approve_selected = st.form_submit_button("✅ Approve Selected", type="primary",
+                                                         use_container_width=True)
+            with col2:
+                approve_all = st.form_submit_button(f"✅ Approve All {len(pending)} Shown", use_container_width=True)
+        
+        if approve_selected or approve_all:
+            result_ids = [
+                row['resultId'] for row in edited
+                if (row['select'] if approve_selected else include_critical or not row['critical'])
+            ]
+            if not result_ids:
+                st.warning("⚠️ Select at least one result to approve")
+            else:
+                approved, error = self.approve_results(result_ids, comments.strip() or None)
+                if error:
+                    st.error(f"❌ Approved {len(approved)} results before the backend failed: {error}")
+                else:
+                    st.success(f"✅ Approved {len(approved)} results")
+                    st.rerun()
+        
+        with st.expander("🔍 Review Result Values"):
+            review_idx = st.selectbox(
+                "Result", range(len(pending)),
+                format_func=lambda x: f"{pending[x]['resultId']} - {pending[x].get('patientName')} ({pending[x].get('testName')})",
+                key="signoff_review_result"
+            )
+            review = pending[review_idx]
+            st.dataframe(
+                [{**v, 'value': str(v.get('value', ''))} for v in review.get('testValues', [])],
+                use_container_width=True, hide_index=True
+            )
+            if review.get('interpretation'):
+                st.markdown(f"**Interpretation:** {review['interpretation']}")
+    
+    def approve_results(self, result_ids, comments=None, chunk_size=500):
+        """Approve queued results, writing those the backend holds to it in batches
+
+        Returns the approved results and the backend error that stopped the run, if any.
+        """
+        role, permissions = st.session_state.get('user_role'), self.permissions()
+        # Skip results someone else signed off since the queue was shown, and any above the user's level
+        result_ids = [
+            result_id for result_id in result_ids
+            if (result := self.store.results.get(result_id)) is not None
+            and result['status'] == signoff.QUEUE_STATUS
+            and signoff.can_sign(role, permissions, result.get('authorizationLevel'))
+        ]
+        changes = {'status': 'approved', **self.approval_fields(comments)}
+        approved = []
+        for start in range(0, len(result_ids), chunk_size):
+            chunk = result_ids[start:start + chunk_size]
+            # Results that exist only in the app are approved locally
+            backend_ids = [
+                backend_id for result_id in chunk
+                if (backend_id := backend_client.backend_id(self.store.results.get(result_id) or {}))
+            ]
+            if self.backend.enabled and backend_ids:
+                try:
+                    self.backend.batch_approve(backend_ids, comments)
+                except backend_client.BackendError as e:
+                    return approved, str(e)
+            replaced = self.store.update_results(chunk, changes)
+            self.audit([
+                {'action': 'approve', 'entityType': 'result', 'entityId': new['resultId'],
+                 'changes': {'status': [old['status'], new['status']]}}
+                for old, new in replaced
+            ])
+            approved.extend(new for _, new in replaced)
+            self.export_results([new for _, new in replaced])
+        return approved, None
+    
+    def export_results(self, results):
+        """Queue finalized results for the hospital information system"""
+        interface = interface_engine.get_interface()
+        if not interface.enabled:
+            return 0
+        exported = []
+        for result in results:
+            test = self.store.worklist.get(result.get('test')) or {}
+            exported.append({**{field: test[field] for field in interface_engine.TEST_FIELDS if test.get(field)},
+                             **result})
+        return interface.export(exported)
+    
+    def get_price_list(self):
+        """Catalog and active panel prices"""
+        return billing.build_price_list(
+            [*self.get_predefined_tests().values(), *reflex.REFLEX_TESTS.values()], self.store.panels.snapshot()
+        )
+    
+    @instrumentation.timed('page')
+    def billing_page(self):
+        """Invoicing runs and revenue reports"""
+        st.markdown('<div class="main-header">💰 Billing</div>', unsafe_allow_html=True)
+        
+        lines = billing.get_invoice_lines(self.store.invoices)
+        
+        # Nightly billing run
+        st.markdown("### 🌙 Billing Run")
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            run_start = st.date_input("Collected From", value=None, key="billing_run_start")
+        with col2:
+            run_end = st.date_input("Collected To", value=datetime.now().date(), key="billing_run_end")
+        with col3:
+            st.write("")
+            run = st.button("🧾 Invoice Unbilled Tests", type="primary", use_container_width=True)
+        
+        if run:
+            invoices, priced = billing.run_billing(
+                self.store.worklist.snapshot(), self.get_price_list(), set(lines['testId']),
+                start=run_start, end=run_end
+            )
+            if not invoices:
+                st.info("📭 No unbilled tests in this period")
+            else:
+                stored = self.store.add_invoices(invoices)
+                self.audit([
+                    {'action': 'create', 'entityType': 'invoice', 'entityId': invoice['invoiceId'],
+                     'changes': {'orderId': invoice['orderId'], 'total': invoice['total']}}
+                    for invoice in stored
+                ])
+                st.success(f"✅ Issued {len(stored)} invoices for {len(priced)} tests "
+                           f"(₹{priced['amount'].sum():,.2f})")
+                lines = billing.get_invoice_lines(self.store.invoices)
+        
+        if lines.empty:
+            st.info("💡 No invoices yet. Run billing to invoice ordered tests.")
+            with st.expander("💲 Price List"):
+                st.dataframe(self.get_price_list().drop_duplicates('testCode'), use_container_width=True, hide_index=True)
+            return
+        
+        st.markdown("---")
+        
+        # Revenue roll-up
+        st.markdown("### 📈 Revenue")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            dates = sorted(lines['collectionDate'].dropna().astype(str).unique())
+            period = st.select_slider("Collection Period", options=dates, value=(dates[0], dates[-1]),
+                                      key="billing_period") if len(dates) > 1 else (dates[0], dates[0])
+        with col2:
+            group_by = st.selectbox("Group By", ["Test", "Category", "Payer", "Collection Date", "Package"],
+                                    key="billing_group_by")
+        with col3:
+            payers = st.multiselect("Payer", sorted(lines['payer'].dropna().unique()), key="billing_payers")
+        
+        period_lines = lines[lines['collectionDate'].astype(str).between(*period)]
+        if payers:
+            period_lines = period_lines[period_lines['payer'].isin(payers)]
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Revenue", f"₹{period_lines['amount'].sum():,.0f}")
+        with col2:
+            st.metric("Tests Billed", f"{len(period_lines):,}")
+        with col3:
+            st.metric("Discounts", f"₹{period_lines['discount'].sum():,.0f}")
+        with col4:
+            st.metric("Insurer Share", f"₹{period_lines['insurerAmount'].sum():,.0f}")
+        
+        column = {'Test': 'testName', 'Category': 'category', 'Payer': 'payer',
+                  'Collection Date': 'collectionDate', 'Package': 'package'}[group_by]
+        rollup = billing.revenue_rollup(period_lines, column)
+        st.bar_chart(rollup.set_index(column)['amount'])
+        st.dataframe(rollup, use_container_width=True, hide_index=True)
+        st.download_button(
+            "💾 Download Billing Lines (CSV)",
+            data=period_lines.to_csv(index=False),
+            file_name=f"billing_{period[0]}_{period[1]}.csv",
+            mime="text/csv"
+        )
+        
+        st.markdown("---")
+        
+        # Invoices
+        st.markdown("### 🧾 Invoices")
+        invoices = self.store.invoices.snapshot()
+        search = st.text_input("🔍 Search by invoice, order or patient", key="billing_invoice_search").strip().lower()
+        matches = [
+            invoice for invoice in reversed(invoices)
+            if not search or search in invoice['invoiceId'].lower() or search in invoice['orderId'].lower()
+            or search in str(invoice.get('patientName', '')).lower()
+        ][:200]
+        if not matches:
+            st.info("No invoices match your search")
+            return
+        st.dataframe(
+            [{k: invoice[k] for k in ('invoiceId', 'orderId', 'patientName', 'payer', 'collectionDate',
+                                      'subtotal', 'discount', 'total', 'insurerAmount', 'patientAmount')}
+             for invoice in matches],
+            use_container_width=True, hide_index=True
+        )
+        selected_idx = st.selectbox(
+            "Invoice Details", range(len(matches)),
+            format_func=lambda x: f"{matches[x]['invoiceId']} - {matches[x]['patientName']} (₹{matches[x]['total']:,.2f})",
+            key="billing_invoice_selector"
+        )
+        st.dataframe(
+            [{k: line[k] for k in ('testCode', 'billingCode', 'testName', 'priority', 'basePrice', 'surcharge',
+                                   'package', 'packagePrice', 'discountRule', 'discount', 'amount')}
+             for line in matches[selected_idx]['lines']],
+            use_container_width=True, hide_index=True
+        )
+    
+    @instrumentation.timed('page')
+    def surveillance_page(self):
+        """Public-health indicators from finalized results"""
+        st.markdown('<div class="main-header">🦠 Surveillance</div>', unsafe_allow_html=True)
+        
+        cube = self.store.surveillance
+        if not len(cube):
+            st.info("📋 No finalized results yet")
+            return
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            condition = st.selectbox("Indicator", list(surveillance.CONDITIONS), key="surveillance_condition")
+        with col2:
+            regions = st.multiselect("Regions", cube.values('region'), key="surveillance_regions")
+        with col3:
+            age_bands = st.multiselect("Age Bands", [label for _, _, label in surveillance.AGE_BANDS],
+                                       key="surveillance_age_bands")
+        weeks = cube.values('week')
+        if len(weeks) > 1:
+            week_range = st.select_slider("Weeks", options=weeks, value=(weeks[0], weeks[-1]),
+                                          key="surveillance_weeks")
+            weeks = weeks[weeks.index(week_range[0]):weeks.index(week_range[1]) + 1]
+        filters = {'region': regions, 'age_band': age_bands, 'week': weeks}
+        
+        by_week = cube.prevalence(condition, ['week'], filters)
+        if by_week.empty:
+            st.info(f"📋 No {surveillance.CONDITIONS[condition]['test']} results in this selection")
+            return
+        tested = int(by_week['tested'].sum())
+        positive = int(by_week['positive'].sum())
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Tested", f"{tested:,}")
+        with col2:
+            st.metric("Positive", f"{positive:,}")
+        with col3:
+            st.metric("Prevalence", f"{positive / tested * 100:.1f}%")
+        
+        st.markdown("### 📈 Weekly Trend")
+        by_region_week = cube.prevalence(condition, ['week', 'region'], filters)
+        st.plotly_chart(
+            px.line(by_region_week, x='week', y='percent', color='region', markers=True,
+                    labels={'percent': '% positive', 'week': 'Week', 'region': 'Region'}),
+            use_container_width=True
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("### 🗺️ By Region")
+            by_region = cube.prevalence(condition, ['region'], filters).sort_values('percent', ascending=False)
+            st.plotly_chart(
+                px.bar(by_region, x='region', y='percent', hover_data=['tested', 'positive'],
+                       labels={'percent': '% positive', 'region': 'Region'}),
+                use_container_width=True
+            )
+        with col2:
+            st.markdown("### 👥 Age Band × Region")
+            grid = cube.prevalence(condition, ['age_band', 'region'], filters).pivot(
+                index='age_band', columns='region', values='percent'
+            )
+            grid = grid.reindex([label for _, _, label in surveillance.AGE_BANDS if label in grid.index])
+            st.plotly_chart(
+                px.imshow(grid, text_auto=True, aspect='auto', color_continuous_scale='Reds',
+                          labels={'color': '% positive', 'x': 'Region', 'y': 'Age band'}),
+                use_container_width=True
+            )
+        
+        # Free slicing over every dimension
+        with st.expander("🧮 Explore Results by Flag", expanded=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                tests = st.multiselect("Tests", cube.values('test'), key="surveillance_tests")
+            with col2:
+                group_by = st.multiselect("Group By", ['region', 'age_band', 'week'], default=['region'],
+                                          key="surveillance_group_by")
+            rollup = cube.rollup([*group_by, 'flag'], {**filters, 'test': tests})
+            if group_by and not rollup.empty:
+                table = rollup.pivot_table(index=group_by, columns='flag', values='count', fill_value=0,
+                                           observed=True)
+                st.dataframe(table, use_container_width=True)
+                st.plotly_chart(
+                    px.bar(rollup, x=group_by[0], y='count', color='flag', barmode='stack'),
+                    use_container_width=True
+                )
+    
+    @instrumentation.timed('page')
+    def inventory_page(self):
+        """Reagent stock, stock-out forecasts and lot QC"""
+        st.markdown('<div class="main-header">📦 Reagent Inventory</div>', unsafe_allow_html=True)
+        
+        lots = self.store.reagent_lots.snapshot()
+        reagent_ids = list(inventory.REAGENTS)
+        reagent_label = lambda reagent_id: f"{inventory.REAGENTS[reagent_id]['name']} ({reagent_id})"
+        
+        if self.can('edit_tests'):
+            with st.expander("📥 Receive Reagent Lot", expanded=False):
+                with st.form("reagent_lot_form"):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        reagent_id = st.selectbox("Reagent", reagent_ids, format_func=reagent_label)
+                        lot_number = st.text_input("Lot Number")
+                        quantity = st.number_input("Quantity", min_value=0.0, value=1000.0, step=100.0)
+                    with col2:
+                        supplier = st.text_input("Supplier")
+                        received_date = st.date_input("Received", value=datetime.now().date())
+                        expiry_date = st.date_input("Expiry Date",
+                                                    value=datetime.now().date() + timedelta(days=365))
+                    if st.form_submit_button("📥 Receive Lot"):
+                        if not lot_number or quantity <= 0:
+                            st.error("❌ Please enter the lot number and a quantity")
+                        else:
+                            lot = self.store.add_reagent_lot({
+                                'reagentId': reagent_id,
+                                'lotNumber': lot_number.strip(),
+                                'quantity': quantity,
+                                'supplier': supplier.strip(),
+                                'receivedDate': str(received_date),
+                                'expiryDate': str(expiry_date),
+                                'receivedBy': st.session_state.user_name
+                            })
+                            self.audit([{'action': 'create', 'entityType': 'reagent_lot', 'entityId': lot['lotId'],
+                                         'changes': {'reagentId': reagent_id, 'lotNumber': lot['lotNumber'],
+                                                     'quantity': quantity}}])
+                            st.success(f"✅ Lot {lot['lotNumber']} received as {lot['lotId']}; run QC before use")
+                            lots = self.store.reagent_lots.snapshot()
+        
+        lot_labels = {lot['lotId']: f"{lot['lotNumber']} · {reagent_label(lot['reagentId'])}" for lot in lots}
+        if lots and self.can('create_results'):
+            with st.expander("🎯 Record QC Run", expanded=False):
+                with st.form("qc_run_form"):
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        lot_id = st.selectbox("Reagent Lot", list(lot_labels), format_func=lot_labels.get)
+                        test_code = st.selectbox("Test", sorted(inventory.CONSUMPTION))
+                    with col2:
+                        level = st.selectbox("Control Level", inventory.QC_LEVELS)
+                        value = st.number_input("Measured Value", value=0.0, format="%.3f")
+                    with col3:
+                        target = st.number_input("Target Mean", value=0.0, format="%.3f")
+                        sd = st.number_input("Target SD", min_value=0.0, value=1.0, format="%.3f")
+                    if st.form_submit_button("🎯 Record QC Run"):
+                        if sd <= 0:
+                            st.error("❌ Target SD must be greater than zero")
+                        elif self.store.reagent_lots.get(lot_id) is None:
+                            st.error(f"❌ Reagent lot {lot_id} no longer exists")
+                        else:
+                            run = self.store.add_qc_run({
+                                'lotId': lot_id,
+                                'testCode': test_code,
+                                'level': level,
+                                'value': value,
+                                'target': target,
+                                'sd': sd,
+                                'runAt': datetime.now().isoformat(),
+                                'runBy': st.session_state.user_name
+                            })
+                            self.audit([{'action': 'create', 'entityType': 'qc_run', 'entityId': run['qcRunId'],
+                                         'changes': {'lotId': lot_id, 'zScore': run['zScore'],
+                                                     'outcome': run['outcome']}}])
+                            message = f"QC run {run['qcRunId']}: z = {run['zScore']:+.2f}"
+                            if run['outcome'] == 'fail':
+                                st.error(f"❌ {message}, {run['rule']} rejected; lot taken out of use")
+                            elif run['outcome'] == 'warn':
+                                st.warning(f"⚠️ {message}, {run['rule']} warning")
+                            else:
+                                st.success(f"✅ {message}, in control")
+                            lots = self.store.reagent_lots.snapshot()
+        
+        if not lots:
+            st.info("📋 No reagent lots received yet")
+            return
+        
+        # Stock-out forecast from the rolling usage series
+        forecast = self.store.reagent_forecast()
+        tracked = forecast[forecast['status'] != 'unused']
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Reagents Tracked", len(tracked))
+        with col2:
+            st.metric("Order Now", int(tracked['status'].isin(['order now', 'out']).sum()))
+        with col3:
+            st.metric("Order Soon", int((tracked['status'] == 'order soon').sum()))
+        with col4:
+            st.metric("Lots Failing QC", sum(1 for lot in lots if lot.get('qcStatus') == 'fail'))
+        
+        st.markdown("### 📉 Stock-out Forecast")
+        st.dataframe(
+            tracked.rename(columns={
+                'reagent': 'Reagent', 'unit': 'Unit', 'stock': 'Usable Stock', 'dailyUsage': 'Daily Usage',
+                'trendPerWeek': 'Trend / Week', 'daysLeft': 'Days Left', 'stockOutDate': 'Stock-out',
+                'reorderBy': 'Reorder By', 'status': 'Status'
+            }).drop(columns=['reagentId']),
+            use_container_width=True, hide_index=True
+        )
+        shortfall = self.store.inventory.shortfall
+        if shortfall:
+            st.warning("⚠️ Runs finalized without usable stock: " + ", ".join(
+                f"{reagent_label(reagent_id)} {amount:g} {inventory.REAGENTS[reagent_id]['unit']}"
+                for reagent_id, amount in shortfall.items()
+            ))
+        
+        usage_reagent = st.selectbox("Daily Usage", tracked['reagentId'].tolist() or reagent_ids,
+                                     format_func=reagent_label, key="inventory_usage_reagent")
+        st.plotly_chart(
+            px.bar(self.store.inventory.daily_usage(usage_reagent), x='date', y='usage',
+                   labels={'date': 'Day', 'usage': inventory.REAGENTS[usage_reagent]['unit']}),
+            use_container_width=True
+        )
+        
+        # Lots and their QC runs
+        st.markdown("### 🏷️ Reagent Lots")
+        st.dataframe([
+            {'Lot ID': lot['lotId'], 'Reagent': reagent_label(lot['reagentId']), 'Lot Number': lot['lotNumber'],
+             'Remaining': lot['remaining'], 'Quantity': lot['quantity'], 'Expiry': lot.get('expiryDate'),
+             'Status': lot['status'], 'QC': lot.get('qcStatus')}
+            for lot in lots
+        ], use_container_width=True, hide_index=True)
+        
+        qc_runs = self.store.qc_runs.snapshot()
+        if qc_runs:
+            st.markdown("### 🎯 Quality Control")
+            chart_lot = st.selectbox("Levey-Jennings Chart", list(lot_labels), format_func=lot_labels.get,
+                                     key="inventory_qc_lot")
+            lot_runs = [run for run in qc_runs if run['lotId'] == chart_lot]
+            if lot_runs:
+                st.plotly_chart(
+                    px.line(lot_runs, x='runAt', y='zScore', color='level', markers=True,
+                            labels={'runAt': 'Run', 'zScore': 'SD from target', 'level': 'Level'}),
+                    use_container_width=True
+                )
+                st.dataframe([
+                    {'QC Run': run['qcRunId'], 'Run At': run['runAt'][:16].replace('T', ' '), 'Test': run['testCode'],
+                     'Level': run['level'], 'Value': run['value'], 'z': run['zScore'], 'Rule': run['rule'],
+                     'Outcome': run['outcome'], 'By': run.get('runBy')}
+                    for run in reversed(lot_runs)
+                ], use_container_width=True, hide_index=True)
+            else:
+                st.info("📋 No QC runs on this lot yet")
+    
+    @instrumentation.timed('page')
     def user_management_page(self):
         """User management interface"""
         st.markdown('<div class="main-header">👤 User Management</div>', unsafe_allow_html=True)
         
-        if st.session_state.user_role in ['admin', 'super_admin']:
+        if self.can('manage_users'):
             # User creation form
             with st.expander("➕ Add New User", expanded=False):
                 with st.form("user_form"):
@@ -545,7 +2059,7 @@ class LISApp:
                         first_name = st.text_input("First Name")
                         last_name = st.text_input("Last Name")
                         email = st.text_input("Email")
-                        role = st.selectbox("Role", ["lab_technician", "doctor", "admin", "nurse"])
+                        role = st.selectbox("Role", auth.ROLES)
                     
                     with col2:
                         department = st.text_input("Department")
@@ -570,6 +2084,164 @@ class LISApp:
         else:
             st.warning("⚠️ Access denied. Admin privileges required.")
     
+    @instrumentation.timed('page')
+    def audit_trail_page(self):
+        """Admin-only audit trail search"""
+        st.markdown('<div class="main-header">🧾 Audit Trail</div>', unsafe_allow_html=True)
+        
+        if not self.can('system_admin'):
+            st.warning("⚠️ Access denied. Admin privileges required.")
+            return
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            entity_id = st.text_input("🔍 Entity ID", placeholder="e.g. RES000012, TP_0003, TEST000001")
+            entity_type = st.selectbox("Entity Type", ["All"] + self.audit_log.entity_types())
+        with col2:
+            user = st.text_input("👤 User")
+            action = st.selectbox("Action", ["All"] + audit_log.ACTIONS)
+        with col3:
+            date_range = st.date_input("Date Range", value=[], key="audit_date_range")
+            limit = st.number_input("Max Entries", min_value=10, max_value=5000, value=200, step=50)
+        
+        start = end = None
+        if len(date_range) == 2:
+            start, end = date_range[0].isoformat(), date_range[1].isoformat()
+        
+        query_start = datetime.now()
+        entries = self.audit_log.query(
+            entity_id=entity_id.strip() or None,
+            user=user.strip() or None,
+            action=None if action == "All" else action,
+            entity_type=None if entity_type == "All" else entity_type,
+            start=start,
+            end=end,
+            limit=int(limit)
+        )
+        query_ms = (datetime.now() - query_start).total_seconds() * 1000
+        
+        col_total, col_matches, col_time = st.columns(3)
+        with col_total:
+            st.metric("Total Entries", len(self.audit_log))
+        with col_matches:
+            st.metric("Matching", len(entries))
+        with col_time:
+            st.metric("Query Time", f"{query_ms:.1f} ms")
+        
+        if entries:
+            rows = pd.DataFrame([
+                {
+                    'Seq': e['seq'],
+                    'Time': e['timestamp'][:19].replace('T', ' '),
+                    'User': e.get('user'),
+                    'Role': e.get('role'),
+                    'Action': e['action'],
+                    'Entity Type': e['entityType'],
+                    'Entity ID': e['entityId'],
+                    'Changes': json.dumps(e.get('changes') or {}, default=str)
+                }
+                for e in entries
+            ])
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+            st.download_button(
+                label="💾 Download CSV",
+                data=rows.to_csv(index=False),
+                file_name=f"audit_trail_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv"
+            )
+        else:
+            st.info("No audit entries match the filters")
+        
+        if st.button("🔗 Verify Hash Chain"):
+            verification = self.audit_log.verify()
+            if verification['ok']:
+                st.success(f"✅ Chain intact ({verification['checked']} entries verified)")
+            else:
+                st.error(f"❌ Chain broken at entry #{verification['broken_at']}")
+    
+    @instrumentation.timed('page')
+    def diagnostics_page(self):
+        """Admin-only performance diagnostics"""
+        st.markdown('<div class="main-header">🩺 Diagnostics</div>', unsafe_allow_html=True)
+        
+        if not self.can('system_admin'):
+            st.warning("⚠️ Access denied. Admin privileges required.")
+            return
+        
+        registry = instrumentation.REGISTRY
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Total Reruns", registry.counters.get('reruns', 0))
+        with col2:
+            st.metric("Session Reruns", st.session_state.get('_metrics_reruns', 0))
+        with col3:
+            st.metric("Session State Size", f"{st.session_state.get('_metrics_session_bytes', 0) / 1024:.1f} KB")
+        with col4:
+            st.metric("Slow Events", len(registry.slow_events))
+        
+        st.markdown("### ⏱️ Timings")
+        st.dataframe(registry.snapshot(), use_container_width=True, hide_index=True)
+        
+        st.markdown(f"### 🐢 Slow Paths (≥ {instrumentation.SLOW_THRESHOLD_SECONDS * 1000:.0f} ms)")
+        if registry.slow_events:
+            st.dataframe(list(reversed(registry.slow_events)), use_container_width=True, hide_index=True)
+        else:
+            st.info("No slow events recorded")
+        
+        st.markdown("### 📈 Prometheus Metrics")
+        metrics_text = registry.render_prometheus()
+        st.download_button(
+            label="💾 Download metrics.prom",
+            data=metrics_text,
+            file_name="metrics.prom",
+            mime="text/plain"
+        )
+        if instrumentation.METRICS_FILE:
+            st.caption(f"Also exported to {instrumentation.METRICS_FILE} every {instrumentation.METRICS_FILE_INTERVAL:.0f}s")
+        with st.expander("Show exposition text", expanded=False):
+            st.code(metrics_text, language="text")
+        
+        sync = kiosk.get_sync(self.store)
+        if sync is not None:
+            st.markdown("### 📡 Kiosk Sync")
+            status = sync.status()
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Site", sync.backend.site_id)
+            with col2:
+                st.metric("Queued Changes", status['pending'])
+            with col3:
+                st.metric("Pushed / Pulled", f"{sync.stats['pushed']} / {sync.stats['pulled']}")
+            with col4:
+                st.metric("Conflicts Resolved", sync.stats['conflicts'])
+            if status['lastError']:
+                st.warning(f"⚠️ Last sync failed: {status['lastError']}")
+        
+        st.markdown("### 📤 Result Export")
+        interface = interface_engine.get_interface()
+        if not interface.enabled:
+            st.info("🔄 Set LIS_HIS_MLLP and/or LIS_HIS_FHIR_URL to send finalized results to the HIS")
+            return
+        counts = interface.outbox.counts()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Queued", sum(n for (_, status), n in counts.items() if status in ('pending', 'sending')))
+        with col2:
+            st.metric("Sent", sum(n for (_, status), n in counts.items() if status == 'sent'))
+        with col3:
+            st.metric("Failed", sum(n for (_, status), n in counts.items() if status == 'dead'))
+        with col4:
+            st.metric("Endpoints", ", ".join(p.upper() for p in interface.sender.protocols))
+        dead = interface.outbox.recent('dead')
+        if dead:
+            st.dataframe(dead, use_container_width=True, hide_index=True)
+            if st.button("🔁 Retry Failed Messages"):
+                st.success(f"✅ {interface.outbox.retry_dead()} message(s) requeued")
+        with st.expander("Recent messages", expanded=False):
+            st.dataframe(interface.outbox.recent(), use_container_width=True, hide_index=True)
+    
+    @instrumentation.timed('page')
     def settings_page(self):
         """Settings and configuration"""
         st.markdown('<div class="main-header">⚙️ Settings</div>', unsafe_allow_html=True)
@@ -615,13 +2287,13 @@ class LISApp:
             st.success("✅ Preferences saved successfully!")
             st.info("🔄 Connect to backend API to save preferences")
     
+    @instrumentation.timed('page')
     def test_panel_creation_page(self):
         """Test Panel Creation and Management Interface"""
         st.markdown('<div class="main-header">🔬 Test Panel Creation & Management</div>', unsafe_allow_html=True)
         
-        # Initialize test panels in session state
-        if 'custom_test_panels' not in st.session_state:
-            st.session_state.custom_test_panels = []
+        # Test panels are shared by every session; take one snapshot per render
+        panels = self.store.panels.snapshot()
         
         # Create tabs for different functionalities
         tab1, tab2, tab3 = st.tabs(["➕ Create New Test Panel", "📋 Manage Test Panels", "📊 Test Panel Library"])
@@ -634,11 +2306,24 @@ class LISApp:
             st.markdown("#### 🔍 Quick Test Selection")
             predefined_tests = self.get_predefined_tests()
             
+            quick_search = st.text_input(
+                "🔍 Search common tests",
+                placeholder="Code, name, synonym or billing code",
+                key="predefined_test_search"
+            )
+            if quick_search:
+                test_options = [
+                    m['key'] for m in self.get_catalog_index().search(quick_search, limit=20)
+                    if m['source'] == 'catalog'
+                ]
+            else:
+                test_options = list(predefined_tests.keys())
+            
             col_auto1, col_auto2 = st.columns([3, 1])
             with col_auto1:
                 selected_predefined = st.selectbox(
                     "Select from Common Tests (Optional)",
-                    ["None"] + list(predefined_tests.keys()),
+                    ["None"] + test_options,
                     help="Choose a predefined test to auto-populate all fields",
                     key="predefined_test_selector"
                 )
@@ -649,6 +2334,8 @@ class LISApp:
                         # Store the selected test data in session state
                         st.session_state.auto_fill_data = predefined_tests[selected_predefined]
                         st.session_state.auto_fill_test_name = selected_predefined
+                        st.session_state.pasted_parameters = None
+                        st.session_state.param_editor_rev = st.session_state.get('param_editor_rev', 0) + 1
                         st.success(f"✅ Auto-populated fields for {selected_predefined}")
                         st.rerun()
             
@@ -664,9 +2351,34 @@ class LISApp:
                         del st.session_state.auto_fill_data
                     if 'auto_fill_test_name' in st.session_state:
                         del st.session_state.auto_fill_test_name
+                    st.session_state.pasted_parameters = None
+                    st.session_state.param_editor_rev = st.session_state.get('param_editor_rev', 0) + 1
                     st.success("✅ Auto-filled data cleared!")
                     st.rerun()
             
+            # Table mode renders all parameters in a single editable grid
+            table_mode = st.toggle(
+                "📊 Table Editor Mode",
+                key="param_table_mode",
+                help=f"Edit up to {panel_editor.MAX_TABLE_PARAMETERS} parameters in one grid instead of individual fields"
+            )
+            if table_mode:
+                with st.expander("📋 Paste from Spreadsheet", expanded=False):
+                    pasted_text = st.text_area(
+                        "Paste rows: Name, Unit, Reference Range, Critical Values",
+                        key="pasted_parameter_text",
+                        placeholder="WBC\t10³/μL\t4.0-11.0\t<2.0 or >30.0"
+                    )
+                    if st.button("📥 Load Pasted Rows", key="load_pasted_params"):
+                        pasted = panel_editor.parse_pasted_parameters(pasted_text)
+                        if pasted:
+                            st.session_state.pasted_parameters = pasted
+                            st.session_state.param_editor_rev = st.session_state.get('param_editor_rev', 0) + 1
+                            st.success(f"✅ Loaded {len(pasted)} parameters")
+                            st.rerun()
+                        else:
+                            st.warning("⚠️ No parameter rows found in the pasted text")
+            
             with st.form("create_test_panel"):
                 
                 # Basic Test Information
@@ -685,35 +2397,17 @@ class LISApp:
                         placeholder="e.g., CBC, LFT, BMP"
                     )
                     
-                    # Find the index of the default category
-                    categories = ["Hematology", "Chemistry", "Microbiology", "Immunology", "Molecular", "Pathology", "Other"]
-                    default_category_index = 0
-                    if 'category' in default_values:
-                        try:
-                            default_category_index = categories.index(default_values['category'])
-                        except ValueError:
-                            default_category_index = 0
-                    
                     category = st.selectbox(
                         "Test Category *",
-                        categories,
-                        index=default_category_index
+                        PANEL_CATEGORIES,
+                        index=default_option_index('category', default_values)
                     )
                 
                 with col2:
-                    # Find the index of the default sample type
-                    sample_types = ["Blood", "Serum", "Plasma", "Urine", "Stool", "CSF", "Sputum", "Swab", "Tissue", "Other"]
-                    default_sample_index = 0
-                    if 'sample_type' in default_values:
-                        try:
-                            default_sample_index = sample_types.index(default_values['sample_type'])
-                        except ValueError:
-                            default_sample_index = 0
-                    
                     sample_type = st.selectbox(
                         "Sample Type *",
-                        sample_types,
-                        index=default_sample_index
+                        SAMPLE_TYPES,
+                        index=default_option_index('sample_type', default_values)
                     )
                     sample_volume = st.text_input(
                         "Sample Volume Required",
@@ -721,19 +2415,10 @@ class LISApp:
                         placeholder="e.g., 5ml, 2-3ml"
                     )
                     
-                    # Find the index of the default container type
-                    container_types = ["EDTA Tube", "Plain Tube", "Heparin Tube", "Fluoride Tube", "Sterile Container", "Other"]
-                    default_container_index = 0
-                    if 'container_type' in default_values:
-                        try:
-                            default_container_index = container_types.index(default_values['container_type'])
-                        except ValueError:
-                            default_container_index = 0
-                    
                     container_type = st.selectbox(
                         "Container Type",
-                        container_types,
-                        index=default_container_index
+                        CONTAINER_TYPES,
+                        index=default_option_index('container_type', default_values)
                     )
                 
                 st.markdown("---")
@@ -741,19 +2426,10 @@ class LISApp:
                 # Test Method and Parameters
                 st.markdown("#### 🔬 Test Method & Parameters")
                 
-                # Find the index of the default test method
-                test_methods = ["Automated Analyzer", "Manual Method", "Microscopy", "Culture", "PCR", "ELISA", "Flow Cytometry", "Other"]
-                default_method_index = 0
-                if 'test_method' in default_values:
-                    try:
-                        default_method_index = test_methods.index(default_values['test_method'])
-                    except ValueError:
-                        default_method_index = 0
-                
                 test_method = st.selectbox(
                     "Test Method *",
-                    test_methods,
-                    index=default_method_index
+                    TEST_METHODS,
+                    index=default_option_index('test_method', default_values)
                 )
                 
                 if test_method == "Other":
@@ -763,12 +2439,32 @@ class LISApp:
                 st.markdown("##### Test Parameters")
                 
                 # Auto-populate parameters if available
-                default_params = default_values.get('parameters', [])
-                default_param_count = len(default_params) if default_params else 1
+                default_params = st.session_state.get('pasted_parameters') or default_values.get('parameters', [])
                 
-                num_parameters = st.number_input("Number of Parameters", min_value=1, max_value=20, value=default_param_count)
+                if table_mode:
+                    edited_parameters = st.data_editor(
+                        panel_editor.parameters_to_frame(default_params or [{}]),
+                        num_rows="dynamic",
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            column: st.column_config.TextColumn(label)
+                            for column, label in panel_editor.PARAMETER_LABELS.items()
+                        },
+                        key=f"param_editor_{st.session_state.get('param_editor_rev', 0)}"
+                    )
+                    parameters = panel_editor.frame_to_parameters(edited_parameters)
+                    num_parameters = 0
+                else:
+                    default_param_count = min(len(default_params), panel_editor.MAX_WIDGET_PARAMETERS) if default_params else 1
+                    num_parameters = st.number_input(
+                        "Number of Parameters",
+                        min_value=1,
+                        max_value=panel_editor.MAX_WIDGET_PARAMETERS,
+                        value=default_param_count
+                    )
+                    parameters = []
                 
-                parameters = []
                 for i in range(int(num_parameters)):
                     st.markdown(f"**Parameter {i+1}:**")
                     param_col1, param_col2, param_col3, param_col4 = st.columns(4)
@@ -818,37 +2514,19 @@ class LISApp:
                 with col5:
                     requires_authorization = st.checkbox("Requires Authorization", value=True)
                     
-                    # Find the index of the default authorization level
-                    auth_levels = ["Technician", "Senior Technician", "Lab Supervisor", "Pathologist"]
-                    default_auth_index = 0
-                    if 'authorization_level' in default_values:
-                        try:
-                            default_auth_index = auth_levels.index(default_values['authorization_level'])
-                        except ValueError:
-                            default_auth_index = 0
-                    
                     authorization_level = st.selectbox(
                         "Authorization Level",
-                        auth_levels,
-                        index=default_auth_index
+                        AUTH_LEVELS,
+                        index=default_option_index('authorization_level', default_values)
                     )
                 
                 with col6:
                     qc_required = st.checkbox("Quality Control Required", value=default_values.get('qc_required', True))
                     if qc_required:
-                        # Find the index of the default QC frequency
-                        qc_frequencies = ["Every Batch", "Daily", "Weekly", "Monthly"]
-                        default_qc_index = 0
-                        if 'qc_frequency' in default_values:
-                            try:
-                                default_qc_index = qc_frequencies.index(default_values['qc_frequency'])
-                            except ValueError:
-                                default_qc_index = 0
-                        
                         qc_frequency = st.selectbox(
                             "QC Frequency",
-                            qc_frequencies,
-                            index=default_qc_index
+                            QC_FREQUENCIES,
+                            index=default_option_index('qc_frequency', default_values)
                         )
                 
                 # Additional Information
@@ -863,6 +2541,21 @@ class LISApp:
                     value=default_values.get('special_instructions', ''),
                     placeholder="Any special handling or processing instructions..."
                 )
+                col_stab1, col_stab2 = st.columns(2)
+                with col_stab1:
+                    stability_hours = st.number_input(
+                        "Sample Stability (hours)",
+                        min_value=0.0,
+                        step=1.0,
+                        value=float(default_values.get('stability_hours') or 0.0),
+                        help="Time from collection within which the sample must be processed (0 = not tracked)"
+                    )
+                with col_stab2:
+                    storage_condition = st.selectbox(
+                        "Storage Condition",
+                        stability.STORAGE_CONDITIONS,
+                        index=default_option_index('storage_condition', default_values)
+                    )
                 
                 # Cost and Billing
                 st.markdown("#### 💰 Cost & Billing")
@@ -897,7 +2590,6 @@ class LISApp:
                 if submitted:
                     if test_name and test_code and category and sample_type:
                         new_test_panel = {
-                            'id': f"TP_{len(st.session_state.custom_test_panels) + 1:04d}",
                             'test_name': test_name,
                             'test_code': test_code,
                             'category': category,
@@ -906,12 +2598,15 @@ class LISApp:
                             'container_type': container_type,
                             'test_method': test_method,
                             'parameters': parameters,
+                            'calculated_parameters': default_values.get('calculated_parameters', []),
                             'requires_authorization': requires_authorization,
                             'authorization_level': authorization_level,
                             'qc_required': qc_required,
                             'qc_frequency': qc_frequency if qc_required else None,
                             'clinical_significance': clinical_significance,
                             'special_instructions': special_instructions,
+                            'stability_hours': stability_hours or stability.parse_stability(special_instructions),
+                            'storage_condition': storage_condition,
                             'test_cost': test_cost,
                             'billing_code': billing_code,
                             'insurance_covered': insurance_covered,
@@ -921,7 +2616,7 @@ class LISApp:
                             'status': 'active'
                         }
                         
-                        st.session_state.custom_test_panels.append(new_test_panel)
+                        self.audit_panels('create', [self.store.add_panel(new_test_panel)])
                         st.success(f"✅ Test Panel '{test_name}' created successfully!")
                         st.info("📋 Collection & Testing Schedule will be entered during sample processing.")
                         
@@ -930,6 +2625,8 @@ class LISApp:
                             del st.session_state.auto_fill_data
                         if 'auto_fill_test_name' in st.session_state:
                             del st.session_state.auto_fill_test_name
+                        st.session_state.pasted_parameters = None
+                        st.session_state.param_editor_rev = st.session_state.get('param_editor_rev', 0) + 1
                         
                         st.rerun()
                     else:
@@ -938,7 +2635,7 @@ class LISApp:
         with tab2:
             st.markdown("### 📋 Manage Existing Test Panels")
             
-            if st.session_state.custom_test_panels:
+            if panels:
                 # Search and filter
                 col_search, col_filter = st.columns(2)
                 
@@ -946,11 +2643,10 @@ class LISApp:
                     search_term = st.text_input("🔍 Search Test Panels", placeholder="Search by name or code...")
                 
                 with col_filter:
-                    category_filter = st.selectbox("Filter by Category", 
-                        ["All"] + ["Hematology", "Chemistry", "Microbiology", "Immunology", "Molecular", "Pathology", "Other"])
+                    category_filter = st.selectbox("Filter by Category", ["All"] + PANEL_CATEGORIES)
                 
                 # Filter test panels
-                filtered_panels = st.session_state.custom_test_panels
+                filtered_panels = panels
                 
                 if search_term:
                     filtered_panels = [panel for panel in filtered_panels if 
@@ -972,7 +2668,7 @@ class LISApp:
                             st.write(f"**Parameters:** {len(panel['parameters'])}")
                         
                         with col_info2:
-                            st.write(f"**Turnaround:** {panel['turnaround_time']}")
+                            st.write(f"**Turnaround:** {panel.get('turnaround_time', 'N/A')}")
                             st.write(f"**Cost:** ₹{panel['test_cost']:.2f}")
                             st.write(f"**Authorization:** {panel['authorization_level']}")
                             st.write(f"**Status:** {panel['status'].title()}")
@@ -982,13 +2678,15 @@ class LISApp:
                                 st.info("Edit functionality - Coming soon!")
                             
                             if st.button(f"🗑️ Delete", key=f"delete_{panel['id']}"):
-                                st.session_state.custom_test_panels.remove(panel)
+                                self.audit_panels('delete', filter(None, [self.store.remove_panel(panel['id'])]))
                                 st.success(f"Deleted {panel['test_name']}")
                                 st.rerun()
                             
                             status_toggle = "Deactivate" if panel['status'] == 'active' else "Activate"
                             if st.button(f"🔄 {status_toggle}", key=f"toggle_{panel['id']}"):
-                                panel['status'] = 'inactive' if panel['status'] == 'active' else 'active'
+                                new_status = 'inactive' if panel['status'] == 'active' else 'active'
+                                self.store.set_panel_status(panel['id'], new_status)
+                                self.audit_panels('toggle', [panel], {'status': [panel['status'], new_status]})
                                 st.success(f"{status_toggle}d {panel['test_name']}")
                                 st.rerun()
             else:
@@ -997,27 +2695,48 @@ class LISApp:
         with tab3:
             st.markdown("### 📊 Test Panel Library & Statistics")
             
-            if st.session_state.custom_test_panels:
-                # Statistics
-                total_panels = len(st.session_state.custom_test_panels)
-                active_panels = len([p for p in st.session_state.custom_test_panels if p['status'] == 'active'])
+            if panels:
+                # Statistics are maintained incrementally on create/delete/import events
+                stats = self.get_panel_stats()
                 
                 col_stat1, col_stat2, col_stat3, col_stat4 = st.columns(4)
                 
                 with col_stat1:
-                    st.metric("Total Test Panels", total_panels)
+                    st.metric("Total Test Panels", stats.total)
                 
                 with col_stat2:
-                    st.metric("Active Panels", active_panels)
+                    st.metric("Active Panels", stats.active)
                 
                 with col_stat3:
-                    categories = [p['category'] for p in st.session_state.custom_test_panels]
-                    most_common = max(set(categories), key=categories.count) if categories else "N/A"
-                    st.metric("Most Common Category", most_common)
+                    st.metric("Most Common Category", stats.most_common_category)
                 
                 with col_stat4:
-                    avg_cost = sum([p['test_cost'] for p in st.session_state.custom_test_panels]) / total_panels
-                    st.metric("Average Cost", f"₹{avg_cost:.2f}")
+                    st.metric("Average Cost", f"₹{stats.average_cost:.2f}")
+                
+                # Breakdowns
+                with st.expander("📈 Library Breakdown", expanded=False):
+                    col_break1, col_break2 = st.columns(2)
+                    
+                    with col_break1:
+                        st.markdown("**Panels by Category**")
+                        st.bar_chart(dict(stats.by_category))
+                        st.markdown("**Panels by Sample Type**")
+                        st.bar_chart(dict(stats.by_sample_type))
+                    
+                    with col_break2:
+                        st.markdown("**Panels by Method**")
+                        st.bar_chart(dict(stats.by_method))
+                        st.markdown("**Cost Distribution**")
+                        st.bar_chart(stats.cost_distribution())
+                    
+                    st.markdown("**Average Cost by Category**")
+                    st.dataframe(
+                        [{"Category": c, "Panels": stats.by_category[c], "Average Cost (₹)": round(avg, 2)}
+                         for c, avg in stats.average_cost_by_category().items()],
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                    st.caption(f"Average parameters per panel: {stats.average_parameters:.1f}")
                 
                 st.markdown("---")
                 
@@ -1028,8 +2747,7 @@ class LISApp:
                 
                 with col_export:
                     if st.button("📤 Export Test Panels", use_container_width=True):
-                        import json
-                        export_data = json.dumps(st.session_state.custom_test_panels, indent=2)
+                        export_data = json.dumps(list(panels), indent=2)
                         st.download_button(
                             label="💾 Download JSON File",
                             data=export_data,
@@ -1041,10 +2759,10 @@ class LISApp:
                     uploaded_file = st.file_uploader("📤 Import Test Panels", type=['json'])
                     if uploaded_file is not None:
                         try:
-                            import json
                             imported_data = json.load(uploaded_file)
                             if st.button("✅ Confirm Import"):
-                                st.session_state.custom_test_panels.extend(imported_data)
+                                # Imported panels get fresh ids so they cannot collide with existing ones
+                                self.audit_panels('create', self.store.add_panels([{**panel, 'id': None} for panel in imported_data]))
                                 st.success(f"✅ Imported {len(imported_data)} test panels!")
                                 st.rerun()
                         except Exception as e:
@@ -1063,18 +2781,45 @@ class LISApp:
                 with col_quick2:
                     if st.button("🧹 Clear All Panels", use_container_width=True):
                         if st.checkbox("⚠️ Confirm deletion of all panels"):
-                            st.session_state.custom_test_panels = []
+                            cleared = self.store.panels.snapshot()
+                            self.store.clear_panels()
+                            self.audit_panels('delete', cleared)
                             st.success("✅ All test panels cleared!")
                             st.rerun()
                 
                 with col_quick3:
-                    if st.button("📋 Generate Report", use_container_width=True):
-                        st.info("📊 Test panel report generation - Coming soon!")
+                    # Built only when asked for, and kept until the panel library changes
+                    library_report = st.session_state.get('panel_library_report')
+                    if library_report is None or library_report['version'] != self.store.panels.version:
+                        library_report = None
+                        if st.button("📋 Generate Report", use_container_width=True):
+                            library_report = st.session_state.panel_library_report = {
+                                'version': self.store.panels.version,
+                                'html': report_renderer.render_panel_library_report(panels),
+                                'file_name': f"test_panel_library_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
+                            }
+                    if library_report is not None:
+                        st.download_button(
+                            label="💾 Download Report",
+                            data=library_report['html'],
+                            file_name=library_report['file_name'],
+                            mime="text/html",
+                            use_container_width=True
+                        )
             else:
                 st.info("📝 No test panels available. Create some test panels first!")
     
+    def get_panel_stats(self):
+        """Panel library statistics, maintained by the shared store"""
+        return self.store.panel_stats
+    
+    @instrumentation.timed('catalog')
     def get_predefined_tests(self):
         """Get predefined test database for auto-population"""
+        return self.store.catalog(self.load_predefined_tests)
+    
+    def load_predefined_tests(self):
+        """Predefined test database, loaded once per process"""
         return {
             'Albumin': {
                 'test_name': 'Albumin',
@@ -1097,7 +2842,9 @@ class LISApp:
                 'test_cost': 150.00,
                 'billing_code': 'NABL-ALB-001',
                 'clinical_significance': 'Liver function assessment, protein-energy malnutrition screening, chronic kidney disease monitoring as per Indian guidelines',
-                'special_instructions': 'Fasting not required. Avoid hemolysis.'
+                'special_instructions': 'Fasting not required. Avoid hemolysis.',
+                'stability_hours': 24,
+                'storage_condition': 'Refrigerated (2-8°C)'
             },
             'Complete Blood Count': {
                 'test_name': 'Complete Blood Count',
@@ -1114,12 +2861,15 @@ class LISApp:
                     {'name': 'Hematocrit', 'unit': '%', 'reference_range': '36-46', 'critical_values': '<20 or >60'},
                     {'name': 'Platelets', 'unit': '10³/μL', 'reference_range': '150-450', 'critical_values': '<50 or >1000'}
                 ],
+                'calculated_parameters': calculations.PANEL_CALCULATIONS['CBC'],
                 'authorization_level': 'Lab Technician',
                 'qc_frequency': 'Daily',
                 'test_cost': 300.00,
                 'billing_code': 'NABL-CBC-001',
                 'clinical_significance': 'Anemia screening (high prevalence in India), infection detection, blood cancer evaluation, nutritional deficiency assessment',
-                'special_instructions': 'EDTA tube required. Process within 4 hours.'
+                'special_instructions': 'EDTA tube required. Process within 4 hours.',
+                'stability_hours': 4,
+                'storage_condition': 'Room temperature'
             },
             'Basic Metabolic Panel': {
                 'test_name': 'Basic Metabolic Panel',
@@ -1138,12 +2888,15 @@ class LISApp:
                     {'name': 'Chloride', 'unit': 'mEq/L', 'reference_range': '98-107', 'critical_values': '<80 or >120'},
                     {'name': 'CO2', 'unit': 'mEq/L', 'reference_range': '22-29', 'critical_values': '<10 or >40'}
                 ],
+                'calculated_parameters': calculations.PANEL_CALCULATIONS['BMP'],
                 'authorization_level': 'Lab Technician',
                 'qc_frequency': 'Daily',
                 'test_cost': 450.00,
                 'billing_code': 'NABL-KFT-001',
                 'clinical_significance': 'Chronic kidney disease monitoring (high prevalence in India), diabetes complications, hypertension management, electrolyte imbalance',
-                'special_instructions': 'Fasting preferred but not required.'
+                'special_instructions': 'Fasting preferred but not required.',
+                'stability_hours': 8,
+                'storage_condition': 'Room temperature'
             },
             'Liver Function Test': {
                 'test_name': 'Liver Function Test',
@@ -1162,12 +2915,15 @@ class LISApp:
                     {'name': 'Total Protein', 'unit': 'g/dL', 'reference_range': '6.0-8.3', 'critical_values': '<4.0'},
                     {'name': 'Albumin', 'unit': 'g/dL', 'reference_range': '3.5-5.0', 'critical_values': '<2.0'}
                 ],
+                'calculated_parameters': calculations.PANEL_CALCULATIONS['LFT'],
                 'authorization_level': 'Lab Technician',
                 'qc_frequency': 'Daily',
                 'test_cost': 600.00,
                 'billing_code': 'NABL-LFT-001',
                 'clinical_significance': 'Hepatitis B/C screening (endemic in India), alcoholic liver disease, drug-induced hepatotoxicity, fatty liver disease assessment',
-                'special_instructions': 'Fasting not required. Avoid hemolysis.'
+                'special_instructions': 'Fasting not required. Avoid hemolysis.',
+                'stability_hours': 24,
+                'storage_condition': 'Refrigerated (2-8°C)'
             },
             'Thyroid Function Test': {
                 'test_name': 'Thyroid Function Test',
@@ -1187,7 +2943,9 @@ class LISApp:
                 'test_cost': 800.00,
                 'billing_code': 'NABL-TFT-001',
                 'clinical_significance': 'Thyroid disorders screening (iodine deficiency common in India), hypothyroidism in pregnancy, goiter evaluation, metabolic disorders',
-                'special_instructions': 'Morning collection preferred. No special preparation required.'
+                'special_instructions': 'Morning collection preferred. No special preparation required.',
+                'stability_hours': 24,
+                'storage_condition': 'Refrigerated (2-8°C)'
             },
             'Urinalysis': {
                 'test_name': 'Urinalysis',
@@ -1211,7 +2969,9 @@ class LISApp:
                 'test_cost': 200.00,
                 'billing_code': 'NABL-UA-001',
                 'clinical_significance': 'Urinary tract infection diagnosis (common in tropical climate), diabetes screening, kidney disease monitoring, pregnancy complications',
-                'special_instructions': 'Clean catch midstream urine. Process within 2 hours.'
+                'special_instructions': 'Clean catch midstream urine. Process within 2 hours.',
+                'stability_hours': 2,
+                'storage_condition': 'Room temperature'
             },
             'Lipid Panel': {
                 'test_name': 'Lipid Panel',
@@ -1227,12 +2987,15 @@ class LISApp:
                     {'name': 'LDL Cholesterol', 'unit': 'mg/dL', 'reference_range': '<100', 'critical_values': '>300'},
                     {'name': 'Triglycerides', 'unit': 'mg/dL', 'reference_range': '<150', 'critical_values': '>1000'}
                 ],
+                'calculated_parameters': calculations.PANEL_CALCULATIONS['LIPID'],
                 'authorization_level': 'Lab Technician',
                 'qc_frequency': 'Daily',
                 'test_cost': 400.00,
                 'billing_code': 'NABL-LIPID-001',
                 'clinical_significance': 'Cardiovascular disease risk assessment (rising prevalence in urban India), coronary artery disease screening, metabolic syndrome evaluation',
-                'special_instructions': '12-hour fasting required.'
+                'special_instructions': '12-hour fasting required.',
+                'stability_hours': 24,
+                'storage_condition': 'Refrigerated (2-8°C)'
             },
             'HbA1c': {
                 'test_name': 'Hemoglobin A1c',
@@ -1250,7 +3013,9 @@ class LISApp:
                 'test_cost': 500.00,
                 'billing_code': 'NABL-HBA1C-001',
                 'clinical_significance': 'Diabetes mellitus monitoring (epidemic in India), long-term glycemic control assessment, diabetic complications screening',
-                'special_instructions': 'No fasting required. Stable for 7 days at room temperature.'
+                'special_instructions': 'No fasting required. Stable for 7 days at room temperature.',
+                'stability_hours': 168,
+                'storage_condition': 'Room temperature'
             }
         }
 
@@ -1275,6 +3040,7 @@ class LISApp:
                     {'name': 'Hematocrit', 'unit': '%', 'reference_range': '36-46', 'critical_values': '<20 or >60'},
                     {'name': 'Platelets', 'unit': '10³/μL', 'reference_range': '150-450', 'critical_values': '<50 or >1000'}
                 ],
+                'calculated_parameters': calculations.PANEL_CALCULATIONS['CBC'],
                 'turnaround_time': 'Same Day',
                 'requires_authorization': True,
                 'authorization_level': 'Lab Technician',
@@ -1300,6 +3066,7 @@ class LISApp:
                     {'name': 'Sodium', 'unit': 'mEq/L', 'reference_range': '136-145', 'critical_values': '<120 or >160'},
                     {'name': 'Potassium', 'unit': 'mEq/L', 'reference_range': '3.5-5.0', 'critical_values': '<2.5 or >6.5'}
                 ],
+                'calculated_parameters': calculations.PANEL_CALCULATIONS['BMP'],
                 'turnaround_time': 'Same Day',
                 'requires_authorization': True,
                 'authorization_level': 'Lab Technician',
@@ -1329,9 +3096,8 @@ class LISApp:
             })
         
         # Add to session state if not already present
-        existing_codes = [panel['test_code'] for panel in st.session_state.test_panels]
-        if new_panel['test_code'] not in existing_codes:
-            st.session_state.test_panels.append(new_panel)
+        existing_codes = {panel['test_code'] for panel in self.store.panels.snapshot()}
+        self.audit_panels('create', self.store.add_panels([p for p in common_tests if p['test_code'] not in existing_codes]))
 
 # Main execution
 if __name__ == "__main__":
@@ -0,0 +1,287 @@
+"""Append-only, hash-chained audit trail
+
+Every create, edit, approve, delete and toggle is appended as one JSON line.
+Each entry carries the hash of the entry before it, so editing or removing
+a line breaks the chain and shows up in verify(). Entries are buffered and
+written by a background thread in batches with one fsync per batch; the file
+is locked while a batch is written, and entries other workers appended are
+read in first, so several processes can share one chain.
+
+In memory the log keeps indexes by entity id, user and timestamp, so queries
+such as "who changed result X" only touch the matching entries.
+
+    LIS_AUDIT_LOG=/var/lib/lis/audit_log.jsonl    (default: audit_log.jsonl next to app.py)
+    LIS_AUDIT_LOG=memory                          (no file, for demos and benchmarks)
+"""
+import atexit
+import bisect
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(APP_DIR, 'audit_log.jsonl')
+GENESIS_HASH = '0' * 64
+
+ACTIONS = ['create', 'edit', 'submit', 'approve', 'amend', 'delete', 'toggle', 'login', 'logout']
+
+
+def _digest(entry):
+    """Hash of an entry's content chained to the previous entry's hash"""
+    body = {k: v for k, v in entry.items() if k != 'hash'}
+    text = json.dumps(body, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256((entry['prevHash'] + text).encode('utf-8')).hexdigest()
+
+
+def field_changes(old, new, fields=None):
+    """Compact {field: [old, new]} for the fields that differ"""
+    fields = fields or sorted(set(old) | set(new))
+    return {f: [old.get(f), new.get(f)] for f in fields if old.get(f) != new.get(f)}
+
+
+class AuditLog:
+    """Append-only audit trail with entity, user and time indexes"""
+
+    def __init__(self, path=None, flush_interval=0.2, batch_size=256):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._entries = []
+        self._pending = []
+        self._by_entity = {}
+        self._by_user = {}
+        self._by_type = set()
+        self._by_time = []
+        self._last_hash = GENESIS_HASH
+        self._offset = 0
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        if self.path:
+            self._read_new_entries()
+            self._flusher = threading.Thread(target=self._flush_loop, name="lis-audit-flush", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    # Writing
+
+    def record(self, action, entity_type, entity_id, user=None, role=None, changes=None, **details):
+        """Queue one entry; it is chained and written with the next batch"""
+        return self.record_many([{
+            'action': action,
+            'entityType': entity_type,
+            'entityId': entity_id,
+            'user': user,
+            'role': role,
+            'changes': changes or {},
+            **details
+        }])[0]
+
+    def record_many(self, entries):
+        timestamp = datetime.now().isoformat(timespec='microseconds')
+        entries = [{'timestamp': timestamp, **entry, 'entityId': str(entry['entityId'])} for entry in entries]
+        with self._lock:
+            if self.path:
+                self._pending.extend(entries)
+                if len(self._pending) >= self.batch_size:
+                    self._wakeup.set()
+            else:
+                self._append(entries)
+        return entries
+
+    def _chain(self, entries):
+        """Number and hash entries onto the end of the chain"""
+        seq, previous = len(self._entries), self._last_hash
+        for entry in entries:
+            seq += 1
+            entry['seq'] = seq
+            entry['prevHash'] = previous
+            entry['hash'] = previous = _digest(entry)
+        return entries
+
+    def _append(self, entries):
+        for entry in self._chain(entries):
+            self._index(entry)
+
+    def _index(self, entry):
+        position = len(self._entries)
+        self._entries.append(entry)
+        self._last_hash = entry['hash']
+        self._by_entity.setdefault(entry['entityId'], []).append(position)
+        self._by_user.setdefault(entry.get('user'), []).append(position)
+        self._by_type.add(entry['entityType'])
+        # Clocks of different workers may disagree slightly; keep the time index sorted
+        item = (entry['timestamp'], position)
+        if not self._by_time or item >= self._by_time[-1]:
+            self._by_time.append(item)
+        else:
+            bisect.insort(self._by_time, item)
+
+    def _read_new_entries(self, f=None):
+        """Index entries appended to the file since we last read it"""
+        if not os.path.exists(self.path):
+            return
+        own = f is None
+        f = f or open(self.path, 'rb')
+        try:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self._offset += len(line)
+                self._index(json.loads(line))
+        finally:
+            if own:
+                f.close()
+
+    def flush(self):
+        """Write queued entries in one batch with a single fsync"""
+        with self._lock:
+            if not self.path or not self._pending:
+                return 0
+            pending, self._pending = self._pending, []
+            with open(self.path, 'a+b') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    self._read_new_entries(f)
+                    data = b''.join(
+                        json.dumps(entry, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+                        for entry in self._chain(pending)
+                    )
+                    f.seek(0, os.SEEK_END)
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                except OSError:
+                    # Keep the batch queued; it is re-chained on the next attempt
+                    self._pending[:0] = pending
+                    raise
+                else:
+                    for entry in pending:
+                        self._index(entry)
+                    self._offset = f.tell()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            return len(pending)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def close(self):
+        self._closed = True
+        self.flush()
+
+    # Reading
+
+    def refresh(self):
+        """Write our queued entries and pick up those of other workers"""
+        with self._lock:
+            if self.path:
+                if self._pending:
+                    self.flush()
+                else:
+                    self._read_new_entries()
+
+    def __len__(self):
+        return len(self._entries) + len(self._pending)
+
+    def query(self, entity_id=None, user=None, action=None, entity_type=None, start=None, end=None, limit=500):
+        """Matching entries, newest first
+
+        Index lookups narrow the candidates before any entry is inspected;
+        start and end are ISO timestamps (or dates) bounding the entry time.
+        """
+        self.refresh()
+        with self._lock:
+            candidates = []
+            if entity_id:
+                candidates.append(self._by_entity.get(str(entity_id), []))
+            if user:
+                candidates.append(self._by_user.get(user, []))
+            if start or end:
+                low = bisect.bisect_left(self._by_time, (str(start),)) if start else 0
+                high = bisect.bisect_left(self._by_time, (str(end) + '\uffff',)) if end else len(self._by_time)
+                candidates.append(sorted(position for _, position in self._by_time[low:high]))
+
+            if candidates:
+                candidates.sort(key=len)
+                positions = candidates[0]
+                for other in candidates[1:]:
+                    other = set(other)
+                    positions = [p for p in positions if p in other]
+            else:
+                positions = range(len(self._entries))
+
+            matches = []
+            for position in reversed(positions):
+                entry = self._entries[position]
+                if action and entry['action'] != action:
+                    continue
+                if entity_type and entry['entityType'] != entity_type:
+                    continue
+                matches.append(entry)
+                if limit and len(matches) >= limit:
+                    break
+            return matches
+
+    def entity_types(self):
+        """Entity types that have entries in the log, sorted"""
+        self.refresh()
+        with self._lock:
+            return sorted(self._by_type)
+
+    def history(self, entity_id):
+        """Every entry for one entity, oldest first"""
+        return list(reversed(self.query(entity_id=entity_id, limit=None)))
+
+    def verify(self):
+        """Recompute the hash chain, reporting the first broken entry"""
+        self.refresh()
+        with self._lock:
+            previous = GENESIS_HASH
+            for entry in self._entries:
+                if entry['prevHash'] != previous or _digest(entry) != entry['hash']:
+                    return {'ok': False, 'checked': entry['seq'], 'broken_at': entry['seq']}
+                previous = entry['hash']
+            return {'ok': True, 'checked': len(self._entries), 'broken_at': None}
+
+
+_LOG = None
+_LOG_LOCK = threading.Lock()
+
+
+def get_audit_log():
+    """Process-wide audit log at LIS_AUDIT_LOG, created on first use"""
+    global _LOG
+    if _LOG is None:
+        with _LOG_LOCK:
+            if _LOG is None:
+                path = os.environ.get('LIS_AUDIT_LOG', DEFAULT_PATH)
+                _LOG = AuditLog(None if path in ('memory', '') else path)
+    return _LOG
+
+
+def reset_audit_log(path=None):
+    """Replace the process-wide audit log (benchmarks and load tests)"""
+    global _LOG
+    with _LOG_LOCK:
+        if _LOG is not None:
+            _LOG.close()
+        _LOG = AuditLog(path)
+    return _LOG
@@ -0,0 +1,329 @@
+"""Authentication, session tokens and the role permission matrix
+
+Users sign in against the backend (POST /api/auth/login) when API_BASE_URL is
+set, otherwise against a local user store. Either way the session holds a
+JWT (HS256). A token's signature is checked once and its claims memoized
+until it expires, so the per-rerun check is a dictionary lookup and a clock
+comparison. Permissions are precomputed per role into frozensets and page
+access is a set membership test.
+
+    LIS_USERS_FILE=/etc/lis/users.json   (default: users.json next to app.py)
+    LIS_JWT_SECRET=...                   (or JWT_SECRET, shared with the backend)
+    LIS_JWT_EXPIRE_HOURS=8
+    LIS_DEMO_MODE=1                      (show the demo login; off by default)
+
+Add local users with ``python auth.py add-user <username> <role>``.
+"""
+import argparse
+import base64
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import backend_client
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+USERS_FILE = os.environ.get('LIS_USERS_FILE', os.path.join(APP_DIR, 'users.json'))
+JWT_SECRET_CONFIGURED = bool(os.environ.get('LIS_JWT_SECRET') or os.environ.get('JWT_SECRET'))
+# Without a configured secret, tokens are only valid in the process that issued them
+JWT_SECRET = os.environ.get('LIS_JWT_SECRET') or os.environ.get('JWT_SECRET') or secrets.token_hex(32)
+JWT_EXPIRE_SECONDS = float(os.environ.get('LIS_JWT_EXPIRE_HOURS', '8')) * 3600
+DEMO_MODE = os.environ.get('LIS_DEMO_MODE', '0') == '1'
+PBKDF2_ITERATIONS = 200_000
+
+# Permissions as defined by the backend User model
+PERMISSIONS = (
+    'view_patients', 'create_patients', 'edit_patients', 'delete_patients',
+    'view_tests', 'create_tests', 'edit_tests', 'delete_tests',
+    'view_results', 'create_results', 'edit_results', 'approve_results',
+    'view_reports', 'generate_reports',
+    'manage_users', 'system_admin'
+)
+
+ROLE_PERMISSIONS = {
+    'super_admin': PERMISSIONS,
+    'admin': PERMISSIONS,
+    'manager': (
+        'view_patients', 'view_tests', 'view_results', 'view_reports', 'generate_reports'
+    ),
+    'doctor': (
+        'view_patients', 'view_tests', 'create_tests', 'view_results', 'approve_results',
+        'view_reports', 'generate_reports'
+    ),
+    'lab_technician': (
+        'view_patients', 'view_tests', 'create_tests', 'edit_tests', 'view_results',
+        'create_results', 'edit_results', 'view_reports', 'generate_reports'
+    ),
+    'nurse': ('view_patients', 'view_tests', 'create_tests', 'view_results'),
+    'receptionist': ('view_patients', 'create_patients', 'edit_patients', 'view_tests', 'create_tests'),
+}
+ROLES = list(ROLE_PERMISSIONS)
+
+PERMISSION_MATRIX = {role: frozenset(permissions) for role, permissions in ROLE_PERMISSIONS.items()}
+
+DEMO_USERS = {
+    role: {'username': f"demo_{role}", 'fullName': name, 'role': role}
+    for role, name in [
+        ('lab_technician', 'John Doe'),
+        ('doctor', 'Dr. Priya Raman'),
+        ('admin', 'Lab Administrator'),
+        ('receptionist', 'Front Desk'),
+    ]
+}
+
+
+class AuthError(Exception):
+    """Sign-in failed or a token is invalid"""
+
+
+@lru_cache(maxsize=None)
+def permissions_for(role, extra=()):
+    """Frozen set of a role's permissions plus any granted to the user individually"""
+    return PERMISSION_MATRIX.get(role, frozenset()) | frozenset(extra)
+
+
+# Tokens
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def encode_token(claims, secret=None):
+    """Sign claims as an HS256 JWT"""
+    header = _b64encode(b'{"alg":"HS256","typ":"JWT"}')
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    signature = hmac.new((secret or JWT_SECRET).encode('utf-8'), f"{header}.{payload}".encode('ascii'),
+                         hashlib.sha256).digest()
+    return f"{header}.{payload}.{_b64encode(signature)}"
+
+
+def decode_token(token, secret=None, verify=True):
+    """Claims of an HS256 JWT, checking signature and expiry"""
+    try:
+        header, payload, signature = token.split('.')
+        if json.loads(_b64decode(header)).get('alg') != 'HS256':
+            raise AuthError("Unsupported token algorithm")
+        claims = json.loads(_b64decode(payload))
+        if not isinstance(claims, dict):
+            raise ValueError("Token claims are not an object")
+        signature = _b64decode(signature)
+    except (ValueError, AttributeError) as e:
+        raise AuthError("Malformed token") from e
+    if verify:
+        expected = hmac.new((secret or JWT_SECRET).encode('utf-8'), f"{header}.{payload}".encode('ascii'),
+                            hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, signature):
+            raise AuthError("Invalid token signature")
+    exp = claims.get('exp')
+    if exp is not None and (isinstance(exp, bool) or not isinstance(exp, (int, float))):
+        raise AuthError("Malformed token")
+    if exp is not None and exp <= time.time():
+        raise AuthError("Token expired")
+    return claims
+
+
+class TokenCache:
+    """Verified claims per token, kept until the token expires"""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+
+    def validate(self, token):
+        now = time.time()
+        with self._lock:
+            claims = self._claims.get(token)
+            if claims is not None:
+                if claims.get('exp') is None or claims['exp'] > now:
+                    self._claims.move_to_end(token)
+                    return claims
+                del self._claims[token]
+        claims = decode_token(token)
+        with self._lock:
+            self._claims[token] = claims
+            while len(self._claims) > self.maxsize:
+                self._claims.popitem(last=False)
+        return claims
+
+    def revoke(self, token):
+        with self._lock:
+            self._claims.pop(token, None)
+
+
+TOKEN_CACHE = TokenCache()
+
+
+# Local user store
+
+def hash_password(password, salt=None, iterations=PBKDF2_ITERATIONS):
+    salt = salt or secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), bytes.fromhex(salt), iterations)
+    return f"pbkdf2_sha256${iterations}${salt}${digest.hex()}"
+
+
+def check_password(password, password_hash):
+    try:
+        _, iterations, salt, _ = password_hash.split('$')
+    except (AttributeError, ValueError):
+        return False
+    return hmac.compare_digest(hash_password(password, salt, int(iterations)), password_hash)
+
+
+def load_users(path=None):
+    """Local users keyed by lower-case username and email"""
+    path = path or USERS_FILE
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        users = json.load(f)
+    return {
+        key.lower(): user
+        for user in users
+        for key in (user['username'], user.get('email'))
+        if key
+    }
+
+
+def add_user(username, password, role, full_name=None, email=None, permissions=(), path=None):
+    """Add or replace a user in the local user store"""
+    if role not in ROLE_PERMISSIONS:
+        raise ValueError(f"Unknown role: {role}")
+    path = path or USERS_FILE
+    users = []
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            users = [u for u in json.load(f) if u['username'] != username]
+    users.append({
+        'username': username,
+        'email': email,
+        'fullName': full_name or username,
+        'role': role,
+        'permissions': list(permissions),
+        'passwordHash': hash_password(password),
+        'isActive': True
+    })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(users, f, indent=2)
+
+
+# Sign-in
+
+def issue_token(user):
+    """Signed session token for a locally authenticated user"""
+    now = int(time.time())
+    return encode_token({
+        'sub': user['username'],
+        'name': user.get('fullName') or user['username'],
+        'role': user['role'],
+        'permissions': list(user.get('permissions', [])),
+        'iat': now,
+        'exp': now + int(JWT_EXPIRE_SECONDS)
+    })
+
+
+def _local_login(username, password):
+    user = load_users().get(username.strip().lower())
+    if user is None or not check_password(password, user.get('passwordHash')):
+        raise AuthError("Invalid credentials")
+    if not user.get('isActive', True):
+        raise AuthError("Account is deactivated")
+    return issue_token(user)
+
+
+def _backend_login(client, email, password):
+    # Backend tokens are signed with the backend's secret; without it they cannot be verified here
+    if not JWT_SECRET_CONFIGURED:
+        raise AuthError("Backend sign-in needs LIS_JWT_SECRET (the backend's JWT_SECRET)")
+    try:
+        payload = client.request('POST', '/auth/login', json={'email': email.strip(), 'password': password})
+    except backend_client.BackendError as e:
+        raise AuthError(str(e)) from e
+    token, user = payload['token'], payload['user']
+    # Backend tokens carry only id and role; keep the profile alongside the claims
+    claims = TOKEN_CACHE.validate(token)
+    claims.update({
+        'sub': user.get('email') or claims.get('id'),
+        'name': user.get('fullName') or user.get('email'),
+        'role': user.get('role', claims.get('role')),
+        'permissions': user.get('permissions', [])
+    })
+    return token
+
+
+def login(username, password, client=None):
+    """Authenticate and return a session token"""
+    client = client or backend_client.get_client()
+    if not username or not password:
+        raise AuthError("Username and password are required")
+    if client.enabled:
+        return _backend_login(client, username, password)
+    return _local_login(username, password)
+
+
+def demo_login(role='lab_technician'):
+    """Session token for a built-in demo user"""
+    if not DEMO_MODE:
+        raise AuthError("Demo mode is disabled")
+    return issue_token(DEMO_USERS.get(role) or {'username': f"demo_{role}", 'fullName': 'Demo User', 'role': role})
+
+
+def start_session(session_state, token):
+    """Validate a token and cache the session's identity and permissions"""
+    claims = TOKEN_CACHE.validate(token)
+    session_state.auth_token = token
+    session_state.auth_expires = claims.get('exp') or float('inf')
+    session_state.authenticated = True
+    session_state.user_name = claims.get('name') or claims.get('sub')
+    session_state.user_role = claims.get('role')
+    session_state.permissions = permissions_for(claims.get('role'), tuple(sorted(claims.get('permissions', []))))
+    return claims
+
+
+def end_session(session_state):
+    token = session_state.get('auth_token')
+    if token:
+        TOKEN_CACHE.revoke(token)
+    for key in ('auth_token', 'auth_expires', 'permissions'):
+        session_state.pop(key, None)
+    session_state.authenticated = False
+    session_state.user_role = None
+    session_state.user_name = None
+
+
+def session_valid(session_state):
+    """Whether the session's token is still live; no crypto on the hot path"""
+    return session_state.get('auth_token') is not None and session_state.get('auth_expires', 0) > time.time()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage QuXAT LIS local users")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add-user', help="add or replace a local user")
+    add.add_argument('username')
+    add.add_argument('role', choices=ROLES)
+    add.add_argument('--name', help="display name")
+    add.add_argument('--email')
+    add.add_argument('--file', default=USERS_FILE)
+    args = parser.parse_args(argv)
+
+    password = getpass.getpass(f"Password for {args.username}: ")
+    if password != getpass.getpass("Confirm password: "):
+        parser.error("passwords do not match")
+    add_user(args.username, password, args.role, args.name, args.email, path=args.file)
+    print(f"Saved {args.username} ({args.role}) to {args.file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Thin client for the QuXAT LIS backend API
+
+The Streamlit app runs standalone (demo mode) unless API_BASE_URL is set, in
+which case writes that the backend supports are sent there as well. Results
+are kept under the app's own ids (RES000012); only results carrying the
+backend's document id as backendId are written to the backend, the rest stay
+local until they are synced.
+"""
+import copy
+import os
+
+import requests
+
+import instrumentation
+
+API_BASE_URL = os.environ.get('API_BASE_URL', '').rstrip('/')
+DEFAULT_TIMEOUT = float(os.environ.get('API_TIMEOUT', '10'))
+
+
+class BackendError(Exception):
+    """The backend rejected a request or could not be reached"""
+
+
+def backend_id(result):
+    """The backend's document id for a result, None while it only exists locally"""
+    return result.get('backendId')
+
+
+class BackendClient:
+    """JSON requests against the backend with a pooled HTTP session"""
+
+    def __init__(self, base_url=API_BASE_URL, timeout=DEFAULT_TIMEOUT, token=None):
+        self.base_url = (base_url or '').rstrip('/')
+        self.timeout = timeout
+        self.token = token
+        self._session = requests.Session()
+
+    @property
+    def enabled(self):
+        return bool(self.base_url)
+
+    def with_token(self, token):
+        """A client sending token on each request, sharing this client's connections"""
+        if token == self.token:
+            return self
+        client = copy.copy(self)
+        client.token = token
+        return client
+
+    def request(self, method, path, **kwargs):
+        headers = kwargs.pop('headers', {})
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        with instrumentation.timer(f"{method} /{path.strip('/').split('/')[0]}", 'backend'):
+            try:
+                response = self._session.request(
+                    method, f"{self.base_url}{path}", headers=headers, timeout=self.timeout, **kwargs
+                )
+            except requests.RequestException as e:
+                raise BackendError(f"Backend unreachable: {e}") from e
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if not response.ok or payload.get('success') is False:
+            raise BackendError(payload.get('message') or f"Backend returned HTTP {response.status_code}")
+        return payload
+
+    # Results
+
+    def amend_result(self, result_id, amendments, reason, test_values=None, interpretation=None):
+        """POST /results/:id/amend, with the result's backend id"""
+        body = {
+            'amendments': amendments,
+            'reason': reason,
+            'previousValues': {a['parameter']: a['originalValue'] for a in amendments},
+            'newValues': {a['parameter']: a['newValue'] for a in amendments}
+        }
+        if test_values is not None:
+            body['testValues'] = test_values
+        if interpretation:
+            body['interpretation'] = interpretation
+        return self.request('POST', f"/results/{result_id}/amend", json=body)
+
+    def batch_approve(self, result_ids, comments=None):
+        """POST /results/batch/approve, with the results' backend ids"""
+        body = {'resultIds': list(result_ids)}
+        if comments:
+            body['approvalComments'] = comments
+        return self.request('POST', '/results/batch/approve', json=body).get('data', {})
+
+    def result_history(self, result_id):
+        """GET /results/:id/history"""
+        return self.request('GET', f"/results/{result_id}/history").get('data', {})
+
+    # Kiosk sync
+
+    def sync_push(self, site_id, changes):
+        """POST /sync/push; one outcome per change: {seq, status: applied|conflict, serverSeq, record}"""
+        return self.request('POST', '/sync/push', json={'siteId': site_id, 'changes': changes}).get('data', {})
+
+    def sync_changes(self, site_id, since, limit):
+        """GET /sync/changes; central changes after since, other than the site's own"""
+        return self.request(
+            'GET', '/sync/changes', params={'siteId': site_id, 'since': since, 'limit': limit}
+        ).get('data', {})
+
+
+_CLIENT = None
+
+
+def get_client():
+    """Process-wide client for API_BASE_URL"""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = BackendClient()
+    return _CLIENT
@@ -0,0 +1,6 @@
+"""Synthetic-load benchmarks for the QuXAT LIS Streamlit app
+
+Run from the streamlit_app directory:
+
+    python -m benchmarks --patients 500 --pending 2000 --panels 200 --results 5000
+"""
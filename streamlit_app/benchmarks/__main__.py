@@ -0,0 +1,74 @@
+"""Command line entry point: python -m benchmarks"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime
+
+from streamlit import logger as streamlit_logger
+
+from benchmarks.harness import SCENARIOS, compare, run_all
+from benchmarks.synthetic import generate_lab
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS synthetic-load benchmarks")
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--pending', type=int, default=500)
+    parser.add_argument('--panels', type=int, default=100)
+    parser.add_argument('--results', type=int, default=2000)
+    parser.add_argument('--reruns', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenario', action='append', choices=[s.name for s in SCENARIOS],
+                        help="Run only this scenario (repeatable)")
+    parser.add_argument('--output', help="Write results JSON to this file")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Store results as the regression baseline")
+    parser.add_argument('--baseline', metavar='PATH', help="Compare against a stored baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown before a regression is reported (default 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    # AppTest runs outside `streamlit run`; silence the bare-mode warnings
+    streamlit_logger.set_log_level('error')
+
+    lab = generate_lab(args.patients, args.pending, args.panels, args.results, args.seed)
+    results = run_all(lab, args.reruns, args.scenario)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parameters': {
+            'patients': args.patients,
+            'pending': args.pending,
+            'panels': args.panels,
+            'results': args.results,
+            'reruns': args.reruns
+        },
+        'results': results
+    }
+
+    print(f"{'scenario':<26}{'median ms':>12}{'p95 ms':>10}{'max ms':>10}{'peak KB':>12}{'state KB':>12}")
+    for r in results:
+        print(f"{r['scenario']:<26}{r['median_ms']:>12}{r['p95_ms']:>10}{r['max_ms']:>10}"
+              f"{r['peak_rerun_kb']:>12}{r['session_state_kb']:>12}")
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != report['parameters']:
+            print("⚠️ Baseline was recorded with different load parameters")
+        regressions = compare(results, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['scenario']} {r['metric']}: {r['baseline']} -> {r['current']} (+{r['change_pct']}%)")
+        if regressions:
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
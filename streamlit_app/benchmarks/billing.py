@@ -0,0 +1,87 @@
+"""Billing-run throughput over a month of synthetic orders
+
+Prices and invoices every order collected over N days, then rolls revenue up
+by test, category and payer, the way the nightly run and finance report do:
+
+    python -m benchmarks.billing --days 30 --orders-per-day 1000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from streamlit import logger as streamlit_logger
+
+import billing
+from app import LISApp
+from benchmarks.synthetic import FIRST_NAMES, LAST_NAMES, PAYERS, PRIORITIES
+
+# Tests per order, weighted towards single tests
+ORDER_SIZES = [1, 1, 1, 2, 2, 3, 4, 6]
+
+
+def generate_orders(days, orders_per_day, seed=42):
+    """Ordered tests for days x orders_per_day orders drawn from the catalog"""
+    rng = random.Random(seed)
+    catalog = list(LISApp().get_predefined_tests().values())
+    today = date.today()
+    tests = []
+    for day in range(days):
+        collection_date = str(today - timedelta(days=day))
+        for order in range(orders_per_day):
+            patient_id = f"PAT{rng.randint(1, orders_per_day * days):06d}"
+            age = rng.randint(1, 90)
+            payer = rng.choice(PAYERS)
+            priority = rng.choice(PRIORITIES)
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            for test in rng.sample(catalog, rng.choice(ORDER_SIZES)):
+                tests.append({
+                    'testId': f"TEST{len(tests) + 1:07d}",
+                    'orderId': f"ORD{day:03d}{order:05d}",
+                    'patientId': patient_id,
+                    'patientName': name,
+                    'patientAge': age,
+                    'payer': payer,
+                    'priority': priority,
+                    'testType': test['test_name'].lower().replace(' ', '_'),
+                    'testCode': test['test_code'],
+                    'collectionDate': collection_date,
+                    'status': 'completed'
+                })
+    return tests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS billing-run benchmark")
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--orders-per-day', type=int, default=1000)
+    parser.add_argument('--max-seconds', type=float, default=10.0,
+                        help="Fail when the billing run and roll-ups take longer than this")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    tests = generate_orders(args.days, args.orders_per_day)
+    price_list = billing.build_price_list(LISApp().get_predefined_tests().values())
+
+    start = time.perf_counter()
+    invoices, lines = billing.run_billing(tests, price_list)
+    billed = time.perf_counter()
+    rollups = {by: billing.revenue_rollup(lines, by) for by in ('testName', 'category', 'payer')}
+    finished = time.perf_counter()
+
+    print(f"{len(tests):,} tests in {len(invoices):,} invoices over {args.days} days")
+    print(f"{'billing run':<20}{(billed - start) * 1000:>10.0f} ms")
+    print(f"{'revenue roll-ups':<20}{(finished - billed) * 1000:>10.0f} ms")
+    print(f"{'revenue':<20}{lines['amount'].sum():>14,.2f}")
+    print(rollups['payer'].to_string(index=False))
+
+    if finished - start > args.max_seconds:
+        print(f"❌ Billing took {finished - start:.1f}s, over {args.max_seconds}s")
+        return 1
+    print("✅ Month of orders billed within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
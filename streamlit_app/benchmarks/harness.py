@@ -0,0 +1,180 @@
+"""Headless benchmark scenarios driven through Streamlit's AppTest"""
+import os
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+import audit_log
+import auth
+import instrumentation
+import shared_state
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(APP_DIR, 'app.py')
+
+
+def _page_script(page, app_dir):
+    import sys
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    from app import LISApp
+    getattr(LISApp(), page)()
+
+
+def _widget(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"No widget labelled {label!r}")
+
+
+class Scenario:
+    """A page plus the widget interaction applied before each measured rerun
+
+    A scenario without a page runs the whole app script through LISApp.main.
+    """
+
+    def __init__(self, name, page, interact=None, setup=None):
+        self.name = name
+        self.page = page
+        self.interact = interact
+        self.setup = setup
+
+
+def _filter_worklist(at, i):
+    _widget(at.text_input, "🔍 Search Patient ID/Name").set_value(["PAT0001", "Sharma", "", "Nair"][i % 4])
+    _widget(at.selectbox, "Filter by Priority").set_value(["All", "STAT", "Urgent", "Routine"][i % 4])
+
+
+def _search_panels(at, i):
+    _widget(at.text_input, "🔍 Search Test Panels").set_value(["", "CBC", "Lipid", "TFT"][i % 4])
+
+
+def _worksheet_mode(at):
+    at.radio(key="results_entry_mode").set_value("📊 Worksheet (Bulk)")
+
+
+def _fill_worksheet(at, i):
+    _widget(at.selectbox, "Filter by Priority").set_value(["STAT", "Urgent"][i % 2])
+
+
+NAVIGATION = ["📝 Test Results Entry", "📊 Results & Reports", "🔬 Test Panels", "✍️ Sign-off Queue"]
+
+
+def _navigate(at, i):
+    at.sidebar.radio(key="nav_page").set_value(NAVIGATION[i % len(NAVIGATION)])
+
+
+SCENARIOS = [
+    Scenario("worklist_filtering", "test_results_entry_page", _filter_worklist),
+    Scenario("panel_management", "test_panel_creation_page", _search_panels),
+    Scenario("result_entry_worksheet", "test_results_entry_page", _fill_worksheet, _worksheet_mode),
+    Scenario("reporting", "results_page"),
+    Scenario("app_navigation", None, _navigate),
+]
+
+
+def seed_store(lab):
+    """Load a synthetic lab into a fresh process-wide store"""
+    audit_log.reset_audit_log()
+    store = shared_state.reset_store(lab['pending_tests'])
+    store.add_panels(lab['custom_test_panels'])
+    store.add_results(lab['test_results'])
+    return store
+
+
+def new_session(page):
+    """A headless session of one page, or of the whole app when page is None, logged in as an admin"""
+    if page is None:
+        at = AppTest.from_file(APP_FILE, default_timeout=120)
+        token = auth.issue_token({'username': 'benchmark', 'fullName': 'Benchmark', 'role': 'admin'})
+        claims = auth.TOKEN_CACHE.validate(token)
+        at.session_state['auth_token'] = token
+        at.session_state['auth_expires'] = claims['exp']
+        at.session_state['permissions'] = auth.permissions_for('admin')
+    else:
+        at = AppTest.from_function(_page_script, args=(page, APP_DIR), default_timeout=120)
+    at.session_state['authenticated'] = True
+    at.session_state['user_name'] = 'Benchmark'
+    at.session_state['user_role'] = 'admin'
+    return at
+
+
+def session_state_bytes(at):
+    """Estimated size of the user-visible keys in a session's state"""
+    state = at.session_state
+    return sum(instrumentation.estimate_size(state[key]) for key in state.keys() if not key.startswith('$$'))
+
+
+def _check(at, scenario):
+    if at.exception:
+        raise RuntimeError(f"{scenario.name}: {at.exception[0].value}")
+
+
+def run_scenario(scenario, lab, reruns=5):
+    """Measure per-rerun latency and memory for one scenario"""
+    seed_store(lab)
+    at = new_session(scenario.page)
+    at.run()
+    _check(at, scenario)
+    if scenario.setup:
+        scenario.setup(at)
+        at.run()
+        _check(at, scenario)
+
+    latencies = []
+    for i in range(reruns):
+        if scenario.interact:
+            scenario.interact(at, i)
+        start = time.perf_counter()
+        at.run()
+        latencies.append(time.perf_counter() - start)
+        _check(at, scenario)
+
+    tracemalloc.start()
+    at.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    session_bytes = session_state_bytes(at)
+    return {
+        'scenario': scenario.name,
+        'reruns': reruns,
+        'median_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2),
+        'peak_rerun_kb': round(peak / 1024, 1),
+        'session_state_kb': round(session_bytes / 1024, 1)
+    }
+
+
+def run_all(lab, reruns=5, only=None):
+    """Run every scenario (or the named subset) against a synthetic lab"""
+    return [
+        run_scenario(scenario, lab, reruns)
+        for scenario in SCENARIOS
+        if not only or scenario.name in only
+    ]
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Scenarios whose median latency or peak memory regressed beyond tolerance"""
+    baseline_by_name = {b['scenario']: b for b in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = baseline_by_name.get(result['scenario'])
+        if not base:
+            continue
+        for metric in ('median_ms', 'peak_rerun_kb'):
+            if base[metric] and result[metric] > base[metric] * (1 + tolerance):
+                regressions.append({
+                    'scenario': result['scenario'],
+                    'metric': metric,
+                    'baseline': base[metric],
+                    'current': result[metric],
+                    'change_pct': round((result[metric] / base[metric] - 1) * 100, 1)
+                })
+    return regressions
@@ -0,0 +1,104 @@
+"""Result-export throughput against the local mock HIS
+
+Queues synthetic approved results as HL7 ORU^R01 messages and FHIR batch
+entries in an outbox, then drains it through the sender to an in-process
+mock receiver that rejects a share of messages, so retries are exercised:
+
+    python -m benchmarks.interface --results 5000 --fail-rate 0.02
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from streamlit import logger as streamlit_logger
+
+import interface_engine
+import mock_his
+from benchmarks.synthetic import FLAGS, generate_lab
+
+
+def generate_results(n_results, seed=42):
+    """Approved results with one value per test parameter"""
+    rng = random.Random(seed)
+    tests = generate_lab(n_patients=max(n_results // 4, 1), m_pending=n_results, p_panels=0, k_results=0,
+                         seed=seed)['pending_tests']
+    approved_at = datetime.now().isoformat()
+    return [
+        {
+            'resultId': f"RES{i:06d}",
+            'test': test['testId'],
+            'patient': test['patientId'],
+            'patientName': test['patientName'],
+            'testType': test['testType'],
+            'testName': test['testType'].replace('_', ' ').title(),
+            'collectionDate': test['collectionDate'],
+            'status': 'approved',
+            'approvedAt': approved_at,
+            'approvedBy': 'Benchmark',
+            'testValues': [
+                {'parameter': p['name'], 'value': round(rng.uniform(0.5, 300), 2), 'unit': p['unit'],
+                 'referenceRange': p['reference_range'], 'flag': rng.choice(FLAGS)}
+                for p in test['parameters']
+            ]
+        }
+        for i, test in enumerate(tests, 1)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS result interface benchmark")
+    parser.add_argument('--results', type=int, default=5000)
+    parser.add_argument('--fail-rate', type=float, default=0.02, help="Share of messages the mock HIS rejects")
+    parser.add_argument('--batch-size', type=int, default=interface_engine.BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=interface_engine.CONCURRENCY)
+    parser.add_argument('--min-per-minute', type=float, default=5000,
+                        help="Fail when fewer messages per minute are delivered")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    results = generate_results(args.results)
+    his = mock_his.start_mock_his(fail_rate=args.fail_rate, seed=42)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Retry at once so rejected messages are redelivered within the run
+        outbox = interface_engine.Outbox(os.path.join(directory, 'outbox.db'), backoff=0)
+        sender = interface_engine.Sender(outbox, mllp=his.mllp_address, fhir_url=his.fhir_url,
+                                         batch_size=args.batch_size, concurrency=args.concurrency)
+        interface = interface_engine.ResultInterface(outbox, sender)
+
+        began = time.perf_counter()
+        queued = interface.export(results)
+        built = time.perf_counter() - began
+
+        began = time.perf_counter()
+        sent, failed = asyncio.run(sender.run_once())
+        elapsed = time.perf_counter() - began
+        counts = outbox.counts()
+    his.stop()
+
+    per_minute = sent / elapsed * 60
+    print(f"{len(results):,} approved results, HL7 + FHIR, batches of {args.batch_size} x {args.concurrency}")
+    print(f"{'messages queued':<24}{queued:>12,}   ({built * 1000:.0f} ms to build and store)")
+    print(f"{'delivered':<24}{sent:>12,}   in {elapsed * 1000:.0f} ms")
+    print(f"{'rejected and retried':<24}{failed:>12,}")
+    print(f"{'dead':<24}{sum(n for (_, status), n in counts.items() if status == 'dead'):>12,}")
+    print(f"{'messages / minute':<24}{per_minute:>12,.0f}")
+    print(f"{'mock HIS received':<24}{his.stats}")
+
+    if sent < queued:
+        print(f"❌ {queued - sent:,} messages were not delivered")
+        return 1
+    if per_minute < args.min_per_minute:
+        print(f"❌ {per_minute:,.0f} messages/minute, under {args.min_per_minute:,.0f}")
+        return 1
+    print("✅ Result export within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
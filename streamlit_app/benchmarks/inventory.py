@@ -0,0 +1,112 @@
+"""Reagent decrement and stock-out forecast refresh against recomputing history
+
+Receives a set of reagent lots, loads synthetic result history, then streams
+new results through the store in batches, approving each batch the way the
+sign-off queue does. Times the batch decrement, the forecast refresh after
+each batch and a repeat page view, against a forecast rebuilt from the full
+result history, and checks that the stock taken (plus any shortfall once a
+reagent runs out) matches the runs finalized:
+
+    python -m benchmarks.inventory --results 100000
+"""
+import argparse
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import numpy as np
+from streamlit import logger as streamlit_logger
+
+import inventory
+from benchmarks.synthetic import generate_lab
+from cache_backend import create_backend
+from shared_state import SharedStore
+
+
+def expected_usage(results):
+    """Reagent usage recounted run by run from finalized results"""
+    usage = Counter()
+    for result in results:
+        key = inventory.run_key(result)
+        if key is not None and result.get('status') in inventory.FINAL_STATUSES:
+            for reagent_id, amount in {**inventory.METHOD_CONSUMPTION, **inventory.CONSUMPTION}[key].items():
+                usage[reagent_id] += amount
+    return usage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS reagent inventory benchmark")
+    parser.add_argument('--results', type=int, default=100000, help="Results in history")
+    parser.add_argument('--stream', type=int, default=10000, help="New results streamed in batches")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-refresh-ms', type=float, default=20.0,
+                        help="Fail when the median forecast refresh takes longer than this")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    lab = generate_lab(n_patients=max(args.results // 10, 1), m_pending=0, p_panels=0,
+                       k_results=args.results + args.stream)
+    history, stream = lab['test_results'][:args.results], lab['test_results'][args.results:]
+    today = date.today()
+    for i, result in enumerate(history):
+        # Volume grows through the window, so the forecast has a trend to find
+        result['approvedAt'] = str(today - timedelta(days=int(90 * (1 - (i / len(history)) ** 0.5))))
+    for result in stream:
+        result['status'] = 'pending_review'
+        result['approvedAt'] = str(today)
+
+    store = SharedStore(backend=create_backend('memory'))
+    expiry = str(today + timedelta(days=400))
+    for reagent_id in inventory.REAGENT_IDS:
+        for n in range(2):
+            store.add_reagent_lot({'reagentId': reagent_id, 'lotNumber': f"{reagent_id}-{n}",
+                                   'quantity': 1e5, 'expiryDate': expiry})
+    initial = sum(lot['quantity'] for lot in store.reagent_lots.snapshot())
+    store.add_results(history)
+
+    decrements, refreshes, views = [], [], []
+    for i in range(0, len(stream), args.batch_size):
+        batch = store.add_results(stream[i:i + args.batch_size])
+        began = time.perf_counter()
+        store.update_results([result['resultId'] for result in batch], {'status': 'approved'})
+        decrements.append(time.perf_counter() - began)
+        began = time.perf_counter()
+        store.reagent_forecast()
+        refreshes.append(time.perf_counter() - began)
+        began = time.perf_counter()
+        store.reagent_forecast()
+        views.append(time.perf_counter() - began)
+
+    results = store.results.snapshot()
+    began = time.perf_counter()
+    inventory.ReagentInventory(results).forecast(store.reagent_lots.snapshot(), -1)
+    rebuild = time.perf_counter() - began
+
+    taken = initial - sum(lot['remaining'] for lot in store.reagent_lots.snapshot())
+    short = sum(store.inventory.shortfall.values())
+    expected = sum(expected_usage(results).values())
+    forecast = store.reagent_forecast()
+    median_refresh = statistics.median(refreshes) * 1000
+    print(f"{len(history):,} results in history, {len(stream):,} streamed in batches of {args.batch_size}")
+    print(f"{'batch decrement (median)':<28}{statistics.median(decrements) * 1000:>10.2f} ms   (approve + stock)")
+    print(f"{'forecast refresh (median)':<28}{median_refresh:>10.2f} ms")
+    print(f"{'repeat page view (median)':<28}{statistics.median(views) * 1000:>10.3f} ms   (cached)")
+    print(f"{'rebuild from history':<28}{rebuild * 1000:>10.2f} ms")
+    print(f"{'stock taken':<28}{taken:>10,.0f}   (+ {short:,.0f} short; recounted from results: {expected:,.0f})")
+    print(forecast[forecast['status'] != 'unused'][['reagentId', 'stock', 'dailyUsage', 'trendPerWeek',
+                                                     'daysLeft', 'status']].to_string(index=False))
+
+    if not np.isclose(taken + short, expected):
+        print(f"❌ Stock taken {taken + short:,.1f} does not match the {expected:,.1f} the results used")
+        return 1
+    if median_refresh > args.max_refresh_ms:
+        print(f"❌ Median forecast refresh {median_refresh:.2f} ms, over {args.max_refresh_ms} ms")
+        return 1
+    print("✅ Reagent stock consistent and forecast within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
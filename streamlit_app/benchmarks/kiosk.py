@@ -0,0 +1,183 @@
+"""Kiosk mode: local write latency and delta sync over a flaky link
+
+A kiosk pulls its mirror from an in-process central LIS, then registers
+patients, orders tests and moves tests along the workflow while offline,
+as central staff update some of the same tests. The link comes back flaky
+(rejecting a share of requests, with added latency) and sync rounds run
+until the outbox is empty and the mirror matches the central copy:
+
+    python -m benchmarks.kiosk --tests 5000 --writes 2000 --fail-rate 0.3
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from streamlit import logger as streamlit_logger
+
+from backend_client import BackendError
+from benchmarks.synthetic import generate_lab
+from cache_backend import KioskBackend
+from kiosk import KioskSync
+from shared_state import SharedStore
+
+COLLECTIONS = {'patients': 'patientId', 'worklist': 'testId'}
+
+
+class CentralStub:
+    """Central LIS sync endpoints with change sequence numbers over a flaky link"""
+
+    def __init__(self, fail_rate=0.0, latency=0.0, seed=7):
+        self.records = {}
+        self.log = []
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.requests = 0
+        self.failures = 0
+        self.received = 0
+        self._rng = random.Random(seed)
+
+    def write(self, collection, record_id, data, site='CENTRAL', op='upsert'):
+        seq = len(self.log) + 1
+        self.log.append({'serverSeq': seq, 'collection': collection, 'id': record_id, 'op': op, 'data': data,
+                         'site': site})
+        if op == 'delete':
+            self.records.pop((collection, record_id), None)
+        else:
+            self.records[(collection, record_id)] = (data, seq)
+        return seq
+
+    def _link(self):
+        self.requests += 1
+        time.sleep(self.latency)
+        if self._rng.random() < self.fail_rate:
+            self.failures += 1
+            raise BackendError("Backend unreachable: link down")
+
+    def sync_push(self, site_id, changes):
+        self._link()
+        self.received += len(changes)
+        results = []
+        for change in changes:
+            key = (change['collection'], change['id'])
+            data, seq = self.records.get(key, (None, 0))
+            if change['baseSeq'] < seq:
+                results.append({'seq': change['seq'], 'status': 'conflict', 'serverSeq': seq, 'record': data})
+                continue
+            seq = self.write(change['collection'], change['id'], change['data'], site_id, change['op'])
+            results.append({'seq': change['seq'], 'status': 'applied', 'serverSeq': seq})
+        return {'results': results}
+
+    def sync_changes(self, site_id, since, limit):
+        self._link()
+        changes = [c for c in self.log[since:] if c['site'] != site_id][:limit]
+        return {'changes': changes, 'lastSeq': len(self.log)}
+
+
+def mirror_matches(backend, central):
+    for collection, key in COLLECTIONS.items():
+        local = {str(r[key]): json.dumps(r, sort_keys=True, default=str) for r in backend.load(collection)}
+        remote = {record_id: json.dumps(data, sort_keys=True, default=str)
+                  for (c, record_id), (data, _) in central.records.items() if c == collection}
+        if local != remote:
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS kiosk sync benchmark")
+    parser.add_argument('--tests', type=int, default=5000, help="Open tests on the central LIS")
+    parser.add_argument('--writes', type=int, default=2000, help="Writes made at the kiosk while offline")
+    parser.add_argument('--central-edits', type=int, default=500, help="Central edits to the kiosk's tests")
+    parser.add_argument('--fail-rate', type=float, default=0.3, help="Share of sync requests the link drops")
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-write-ms', type=float, default=20.0,
+                        help="Fail when the p95 local write takes longer than this")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    rng = random.Random(42)
+    lab = generate_lab(n_patients=max(args.tests // 5, 1), m_pending=args.tests, p_panels=0, k_results=0)
+    central = CentralStub()
+    for patient in lab['patients']:
+        central.write('patients', patient['patientId'], patient)
+    for test in lab['pending_tests']:
+        central.write('worklist', test['testId'], test)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = KioskBackend(os.path.join(tmp, 'kiosk.db'), site_id='KSK01', poll_interval=0.05)
+        sync = KioskSync(backend, central, batch_size=args.batch_size, interval=0)
+        began = time.perf_counter()
+        sync.sync_once()
+        initial_pull = time.perf_counter() - began
+        store = SharedStore(backend=backend)
+        deadline = time.time() + 10
+        while len(store.worklist) < args.tests and time.time() < deadline:
+            time.sleep(0.05)
+
+        # Offline: every write lands in the mirror and the outbox only
+        central.fail_rate = 1.0
+        test_ids = [test['testId'] for test in lab['pending_tests']]
+        edited = rng.sample(test_ids, min(args.writes // 2, len(test_ids)))
+        writes = []
+        for i in range(args.writes):
+            began = time.perf_counter()
+            if i % 4 == 0:
+                patient = store.add_patient({'patientName': f"Walk-in {i}", 'gender': rng.choice(['Male', 'Female'])})
+                store.add_tests([{**lab['pending_tests'][i % args.tests], 'patientId': patient['patientId'],
+                                  'patientName': patient['patientName'], 'status': 'collected'}])
+            else:
+                store.update_tests([edited[i % len(edited)]], {'status': rng.choice(['collected', 'processing'])})
+            writes.append(time.perf_counter() - began)
+        for test_id in rng.sample(edited, min(args.central_edits, len(edited))):
+            data, _ = central.records[('worklist', test_id)]
+            central.write('worklist', test_id, {**data, 'status': 'in_progress', 'priority': 'urgent'})
+        queued = backend.pending_count()
+
+        # Back online over a flaky link
+        central.fail_rate = args.fail_rate
+        central.latency = args.latency_ms / 1000
+        central.requests = central.failures = central.received = 0
+        rounds = failed_rounds = 0
+        began = time.perf_counter()
+        while rounds < 100:
+            rounds += 1
+            try:
+                sync.sync_once()
+            except BackendError:
+                failed_rounds += 1
+                continue
+            if backend.pending_count() == 0 and mirror_matches(backend, central):
+                break
+        converge = time.perf_counter() - began
+        converged = backend.pending_count() == 0 and mirror_matches(backend, central)
+        store.backend.close()
+
+    p95 = statistics.quantiles(writes, n=20)[18] * 1000
+    print(f"{args.tests:,} central tests mirrored in {initial_pull:.2f} s; {args.writes:,} offline writes")
+    print(f"{'local write (median)':<26}{statistics.median(writes) * 1000:>10.2f} ms")
+    print(f"{'local write (p95)':<26}{p95:>10.2f} ms")
+    print(f"{'changes queued':<26}{queued:>10,}   (edits of one record coalesce)")
+    print(f"{'changes sent':<26}{central.received:>10,}   (including resent conflict resolutions)")
+    print(f"{'conflicts resolved':<26}{sync.stats['conflicts']:>10,}")
+    print(f"{'sync rounds':<26}{rounds:>10}   ({failed_rounds} failed, "
+          f"{central.failures}/{central.requests} requests dropped)")
+    print(f"{'time to converge':<26}{converge:>10.2f} s")
+
+    if not converged:
+        print("❌ Kiosk mirror did not converge with the central LIS")
+        return 1
+    if p95 > args.max_write_ms:
+        print(f"❌ p95 local write {p95:.2f} ms, over {args.max_write_ms} ms")
+        return 1
+    print("✅ Kiosk converged with local writes within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
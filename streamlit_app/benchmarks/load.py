@@ -0,0 +1,79 @@
+"""Concurrent-session memory load test
+
+Opens many headless sessions against one shared store and checks that
+process memory stays flat as sessions are added:
+
+    python -m benchmarks.load --sessions 1 10 30 60
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from streamlit import logger as streamlit_logger
+
+from benchmarks.harness import new_session, seed_store, session_state_bytes
+from benchmarks.synthetic import generate_lab
+
+PAGES = ["test_results_entry_page", "test_panel_creation_page", "results_page"]
+
+
+def _open_session(i):
+    at = new_session(PAGES[i % len(PAGES)])
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return at
+
+
+def measure(session_counts, lab):
+    """Traced memory held by N live sessions, for each N"""
+    rows = []
+    for count in session_counts:
+        seed_store(lab)
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        # AppTest is not thread-safe; sessions are opened one after another but all stay live
+        sessions = [_open_session(i) for i in range(count)]
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rows.append({
+            'sessions': count,
+            'total_kb': round((current - baseline) / 1024, 1),
+            'per_session_kb': round((current - baseline) / 1024 / count, 1),
+            'session_state_kb': round(sum(session_state_bytes(at) for at in sessions) / count / 1024, 1)
+        })
+        del sessions
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS concurrent-session memory test")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 30, 60])
+    parser.add_argument('--pending', type=int, default=2000)
+    parser.add_argument('--panels', type=int, default=200)
+    parser.add_argument('--results', type=int, default=2000)
+    parser.add_argument('--max-session-kb', type=float, default=512.0,
+                        help="Fail when a session's own state exceeds this size")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    lab = generate_lab(500, args.pending, args.panels, args.results)
+    rows = measure(args.sessions, lab)
+
+    print(f"{'sessions':>10}{'total KB':>14}{'per session KB':>16}{'state KB':>12}")
+    for row in rows:
+        print(f"{row['sessions']:>10}{row['total_kb']:>14}{row['per_session_kb']:>16}{row['session_state_kb']:>12}")
+
+    worst = max(row['session_state_kb'] for row in rows)
+    if worst > args.max_session_kb:
+        print(f"❌ Session state {worst} KB exceeds {args.max_session_kb} KB; data is being copied per session")
+        return 1
+    print("✅ Per-session state stays flat; worklist and panels are shared")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Worklist memory with dict records against compact records
+
+Loads a synthetic worklist the way a worker gets it from a shared backend
+(one JSON document per test) and measures the memory it holds as plain
+dicts and as compact records, then the active custom panels merged into it
+as copied dicts and as PanelTest views. Sessions read the worklist from the
+shared store, so this is also the worklist's share of every session:
+
+    python -m benchmarks.memory --pending 50000 --panels 500
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+
+from streamlit import logger as streamlit_logger
+
+import records
+from benchmarks.synthetic import generate_lab
+from shared_state import SharedCollection
+
+
+def retained(build):
+    """Bytes still allocated by build()'s result once temporaries are freed"""
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    kept = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return kept, current - baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS worklist memory benchmark")
+    parser.add_argument('--pending', type=int, default=50000)
+    parser.add_argument('--panels', type=int, default=500)
+    parser.add_argument('--min-ratio', type=float, default=5.0,
+                        help="Fail when compact records save less than this factor")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    lab = generate_lab(n_patients=max(args.pending // 5, 1), m_pending=args.pending, p_panels=args.panels,
+                       k_results=0)
+    stored = [json.dumps(test) for test in lab['pending_tests']]
+    panels = [panel for panel in lab['custom_test_panels'] if panel['status'] == 'active']
+
+    dicts, dict_bytes = retained(lambda: SharedCollection('worklist', 'testId', map(json.loads, stored)))
+    del dicts
+    compacts, compact_bytes = retained(
+        lambda: SharedCollection('worklist', 'testId', map(json.loads, stored), record=records.compact)
+    )
+    del compacts
+    copies, copy_bytes = retained(lambda: [dict(records.PanelTest(panel)) for panel in panels])
+    del copies
+    views, view_bytes = retained(lambda: [records.PanelTest(panel) for panel in panels])
+    del views
+
+    ratio = dict_bytes / compact_bytes
+    print(f"{args.pending:,} worklist tests loaded from JSON, {len(panels):,} active custom panels")
+    print(f"{'':<22}{'total KB':>12}{'bytes / test':>14}")
+    print(f"{'dict records':<22}{dict_bytes / 1024:>12,.0f}{dict_bytes / args.pending:>14,.0f}")
+    print(f"{'compact records':<22}{compact_bytes / 1024:>12,.0f}{compact_bytes / args.pending:>14,.0f}")
+    print(f"{'panel dict copies':<22}{copy_bytes / 1024:>12,.1f}{copy_bytes / max(len(panels), 1):>14,.0f}")
+    print(f"{'panel views':<22}{view_bytes / 1024:>12,.1f}{view_bytes / max(len(panels), 1):>14,.0f}")
+    print(f"{'reduction':<22}{ratio:>12.1f}x")
+
+    if ratio < args.min_ratio:
+        print(f"❌ Compact records are {ratio:.1f}x smaller, under {args.min_ratio}x")
+        return 1
+    print("✅ Compact worklist within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
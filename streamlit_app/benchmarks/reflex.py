@@ -0,0 +1,80 @@
+"""Reflex-rule throughput over batched result streams
+
+Saves synthetic results for a synthetic worklist in batches, the way the
+bulk worksheet and instrument imports do, and measures how many results per
+second the reflex engine evaluates and how many reflex tests it orders:
+
+    python -m benchmarks.reflex --results 50000 --batch-size 500
+"""
+import argparse
+import random
+import sys
+import time
+
+from streamlit import logger as streamlit_logger
+
+import reflex
+from app import LISApp
+from benchmarks.synthetic import FLAGS, generate_lab
+from shared_state import SharedCollection
+
+
+def generate_stream(n_results, seed=42):
+    """Worklist tests and one result per test"""
+    rng = random.Random(seed)
+    lab = generate_lab(n_patients=max(n_results // 4, 1), m_pending=n_results, p_panels=0, k_results=0, seed=seed)
+    tests = lab['pending_tests']
+    results = []
+    for i, test in enumerate(tests):
+        test['orderId'] = f"ORD{i // 2:07d}"
+        results.append({
+            'test': test['testId'],
+            'patient': test['patientId'],
+            'patientName': test['patientName'],
+            'testType': test['testType'],
+            'collectionDate': test['collectionDate'],
+            'status': 'pending_review',
+            'testValues': [
+                {'parameter': p['name'], 'value': round(rng.uniform(0.5, 300), 2), 'flag': rng.choice(FLAGS)}
+                for p in test['parameters']
+            ]
+        })
+    return tests, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS reflex-rule benchmark")
+    parser.add_argument('--results', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--min-rate', type=float, default=50000,
+                        help="Fail when fewer results per second are evaluated")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    tests, results = generate_stream(args.results)
+    worklist = SharedCollection('worklist', 'testId', tests)
+    engine = reflex.ReflexEngine(reflex.REFLEX_RULES, LISApp().get_predefined_tests().values())
+
+    ordered = 0
+    start = time.perf_counter()
+    for i in range(0, len(results), args.batch_size):
+        new_tests = engine.reflex_tests(results[i:i + args.batch_size], worklist)
+        worklist.extend({**test, 'testId': f"RFX{ordered + n:07d}"} for n, test in enumerate(new_tests))
+        ordered += len(new_tests)
+    elapsed = time.perf_counter() - start
+
+    rate = len(results) / elapsed
+    print(f"{len(results):,} results in batches of {args.batch_size} against {len(reflex.REFLEX_RULES)} rules")
+    print(f"{'evaluated in':<20}{elapsed * 1000:>10.0f} ms")
+    print(f"{'results / second':<20}{rate:>10,.0f}")
+    print(f"{'reflex tests':<20}{ordered:>10,}")
+
+    if rate < args.min_rate:
+        print(f"❌ {rate:,.0f} results/s, under {args.min_rate:,.0f}")
+        return 1
+    print("✅ Reflex evaluation within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Report cache and bounded report pool against computing reports on the request path
+
+Loads a synthetic lab into the shared store, then times each report computed
+cold, a repeat view served from the cache, and the recompute after a result
+is finalized. A burst of distinct report requests is then fired at once from
+page threads: the pool computes at most --workers of them at a time, turns
+away what does not fit in --queue, and the page threads never wait longer
+than the page wait:
+
+    python -m benchmarks.reports --results 50000 --burst 40
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from streamlit import logger as streamlit_logger
+
+import report_scheduler
+from benchmarks.synthetic import generate_lab
+from cache_backend import create_backend
+from shared_state import SharedStore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS report cache and pool benchmark")
+    parser.add_argument('--results', type=int, default=50000, help="Finalized results in the store")
+    parser.add_argument('--pending', type=int, default=5000, help="Tests on the worklist")
+    parser.add_argument('--burst', type=int, default=40, help="Distinct reports requested at once")
+    parser.add_argument('--workers', type=int, default=report_scheduler.REPORT_WORKERS)
+    parser.add_argument('--queue', type=int, default=report_scheduler.REPORT_QUEUE)
+    parser.add_argument('--max-cached-ms', type=float, default=5.0,
+                        help="Fail when a median cached view takes longer than this")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    lab = generate_lab(n_patients=max(args.results // 10, 1), m_pending=args.pending, p_panels=0,
+                       k_results=args.results + 1)
+    store = SharedStore(backend=create_backend('memory'))
+    store.add_tests(lab['pending_tests'])
+    store.add_results(lab['test_results'][:-1])
+    late = lab['test_results'][-1]
+
+    today = date.today()
+    params = {'dateFrom': str(today - timedelta(days=89)), 'dateTo': str(today)}
+    service = report_scheduler.ReportService(store, workers=args.workers, max_queued=args.queue)
+    print(f"{args.results:,} results, {args.pending:,} worklist tests; {args.workers} workers, queue {args.queue}")
+    print(f"{'report':<20}{'cold':>10}{'cached':>12}{'after change':>15}")
+    worst_cached = 0.0
+    for report_type in report_scheduler.REPORTS:
+        began = time.perf_counter()
+        service.run(report_type, params)
+        cold = time.perf_counter() - began
+        views = []
+        for _ in range(20):
+            began = time.perf_counter()
+            service.run(report_type, params)
+            views.append(time.perf_counter() - began)
+        cached = statistics.median(views)
+        worst_cached = max(worst_cached, cached)
+        print(f"{report_type:<20}{cold * 1000:>8.1f} ms{cached * 1000:>9.3f} ms", end='')
+        if report_type == 'turnaround-time':
+            late = store.add_results([{**late, 'approvedAt': str(today)}])[0]
+            began = time.perf_counter()
+            output = service.run(report_type, params)
+            print(f"{(time.perf_counter() - began) * 1000:>12.1f} ms", end='')
+            if service.run(report_type, params) is not output:
+                print("\n❌ Report not served from the cache after recomputing")
+                return 1
+        print()
+
+    # A burst of distinct reports, as from many sessions at once
+    waits, outcomes, lock = [], [], threading.Lock()
+    peak = [0]
+
+    def page(i):
+        burst = {'dateFrom': str(today - timedelta(days=30 + i)), 'dateTo': str(today)}
+        began = time.perf_counter()
+        output, future = service.request('weekly-summary', burst)
+        with lock:
+            waits.append(time.perf_counter() - began)
+            outcomes.append('ready' if output is not None else 'pending' if future is not None else 'rejected')
+            peak[0] = max(peak[0], service.running())
+
+    threads = [threading.Thread(target=page, args=(i,)) for i in range(args.burst)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    deadline = time.time() + 120
+    while service.running() and time.time() < deadline:
+        time.sleep(0.05)
+    service.shutdown()
+
+    print(f"{'burst of ' + str(args.burst):<20}{outcomes.count('ready'):>6} ready, {outcomes.count('pending')} "
+          f"generating, {outcomes.count('rejected')} turned away; peak {peak[0]} in the pool")
+    limit = report_scheduler.REPORT_WAIT_SECONDS
+    print(f"{'page wait (max)':<20}{max(waits) * 1000:>8.1f} ms   (limit {limit * 1000:.0f} ms)")
+
+    if worst_cached * 1000 > args.max_cached_ms:
+        print(f"❌ Cached report view {worst_cached * 1000:.2f} ms, over {args.max_cached_ms} ms")
+        return 1
+    if peak[0] > args.queue or max(waits) > limit + 0.5:
+        print("❌ Report pool exceeded its queue or held a page past the wait")
+        return 1
+    print("✅ Reports cached and kept off the request path")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
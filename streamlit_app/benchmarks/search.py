@@ -0,0 +1,86 @@
+"""Catalog typeahead latency over a synthetic test menu
+
+Builds the prefix index over the catalog plus generated tests and times
+typical typeahead queries, one keystroke at a time:
+
+    python -m benchmarks.search --tests 2000
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from streamlit import logger as streamlit_logger
+
+import catalog_search
+from app import LISApp
+
+WORDS = [
+    'Serum', 'Plasma', 'Total', 'Free', 'Direct', 'Vitamin', 'Antibody', 'IgG', 'IgM', 'Panel', 'Profile',
+    'Culture', 'Ratio', 'Level', 'Assay', 'Screen', 'Quantitative', 'Hormone', 'Protein', 'Enzyme',
+    'Marker', 'Factor', 'Antigen', 'Ferritin', 'Iron', 'Calcium', 'Cortisol', 'Insulin', 'Troponin'
+]
+CATEGORIES = ['Chemistry', 'Hematology', 'Immunology', 'Microbiology', 'Endocrinology', 'Serology']
+QUERIES = ['cbc', 'hemogram', 'thyroid prof', 'kft', 'NABL-LFT', 'vitamin d', 'iron total', 'a', 'igg anti', 'T0123']
+
+
+def generate_menu(tests, seed=42):
+    """Catalog tests plus generated ones, as search entries"""
+    rng = random.Random(seed)
+    entries = catalog_search.catalog_entries(LISApp().get_predefined_tests())
+    for i in range(len(entries), tests):
+        words = rng.sample(WORDS, rng.randint(2, 4))
+        code = f"T{i:04d}"
+        entries.append({
+            'code': code,
+            'name': ' '.join(words),
+            'category': rng.choice(CATEGORIES),
+            'billing_code': f"NABL-{code}-001",
+            'synonyms': [' '.join(rng.sample(WORDS, 2))],
+            'sample_type': 'Serum',
+            'test_cost': float(rng.randint(100, 3000)),
+            'source': 'catalog',
+            'key': code
+        })
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS catalog search benchmark")
+    parser.add_argument('--tests', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--max-ms', type=float, default=1.0,
+                        help="Fail when a query's median latency exceeds this")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    entries = generate_menu(args.tests)
+    start = time.perf_counter()
+    index = catalog_search.CatalogIndex(entries)
+    print(f"{len(entries):,} tests indexed in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # Every keystroke of every query, as the text box would send them
+    slowest = 0.0
+    for query in QUERIES:
+        timings = []
+        for length in range(1, len(query) + 1):
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                index.search(query[:length])
+                timings.append(time.perf_counter() - start)
+        median = statistics.median(timings) * 1000
+        worst = max(timings) * 1000
+        slowest = max(slowest, median)
+        top = ', '.join(entry['code'] for entry in index.search(query, limit=3))
+        print(f"{query!r:<16}{median:>8.3f} ms median{worst:>8.3f} ms max   {top}")
+
+    if slowest > args.max_ms:
+        print(f"❌ Median query latency {slowest:.3f} ms, over {args.max_ms} ms")
+        return 1
+    print("✅ Typeahead within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
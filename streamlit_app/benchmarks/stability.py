@@ -0,0 +1,87 @@
+"""Stability-monitor tick cost with tens of thousands of samples in flight
+
+Loads a worklist of samples collected over the past day, then runs the
+monitor through a simulated day of one-minute ticks and reports the cost of
+a tick, against a full scan of the worklist for comparison:
+
+    python -m benchmarks.stability --samples 50000 --hours 24
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from streamlit import logger as streamlit_logger
+
+import audit_log
+import shared_state
+import stability
+from app import LISApp
+from benchmarks.synthetic import generate_lab
+
+
+def generate_samples(n_samples, seed=42):
+    """In-flight worklist tests collected at random times over the past 24 hours"""
+    rng = random.Random(seed)
+    tests = generate_lab(n_patients=max(n_samples // 4, 1), m_pending=n_samples, p_panels=0, k_results=0,
+                         seed=seed)['pending_tests']
+    now = time.time()
+    for test in tests:
+        test['status'] = 'collected'
+        test['collectedAt'] = datetime.fromtimestamp(now - rng.uniform(0, 24 * 3600)).isoformat(timespec='seconds')
+    return tests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS sample stability monitor benchmark")
+    parser.add_argument('--samples', type=int, default=50000)
+    parser.add_argument('--hours', type=int, default=24, help="Simulated hours of one-minute ticks")
+    parser.add_argument('--max-tick-ms', type=float, default=5.0,
+                        help="Fail when the median tick takes longer than this")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    audit_log.reset_audit_log()
+    store = shared_state.reset_store(generate_samples(args.samples))
+    catalog = LISApp().get_predefined_tests()
+    start = time.time()
+    monitor = stability.StabilityMonitor(store, catalog, now=start)
+
+    began = time.perf_counter()
+    monitor.tick(start)
+    first = time.perf_counter() - began
+
+    timings = []
+    fired = {stability.NEAR_EXPIRY: 0, stability.EXPIRED: 0}
+    for minute in range(1, args.hours * 60 + 1):
+        began = time.perf_counter()
+        for state, test_ids in monitor.tick(start + minute * 60).items():
+            fired[state] += len(test_ids)
+        timings.append(time.perf_counter() - began)
+
+    # What every tick would cost if it rescanned the worklist instead
+    began = time.perf_counter()
+    for test in store.worklist.snapshot():
+        monitor.remaining(test, start)
+    scan = time.perf_counter() - began
+
+    median = statistics.median(timings) * 1000
+    print(f"{args.samples:,} samples in flight, {len(timings):,} one-minute ticks")
+    print(f"{'first tick':<24}{first * 1000:>10.1f} ms   (schedules every sample)")
+    print(f"{'median tick':<24}{median:>10.3f} ms")
+    print(f"{'p99 tick':<24}{statistics.quantiles(timings, n=100)[98] * 1000:>10.3f} ms")
+    print(f"{'full worklist scan':<24}{scan * 1000:>10.1f} ms")
+    print(f"{'near-expiry alerts':<24}{fired[stability.NEAR_EXPIRY]:>10,}")
+    print(f"{'expired':<24}{fired[stability.EXPIRED]:>10,}")
+
+    if median > args.max_tick_ms:
+        print(f"❌ Median tick {median:.3f} ms, over {args.max_tick_ms} ms")
+        return 1
+    print("✅ Monitor ticks within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
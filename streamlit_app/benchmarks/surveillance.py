@@ -0,0 +1,92 @@
+"""Surveillance cube upkeep and slice latency against rescanning history
+
+Streams synthetic results into the cube in batches, approving each batch
+the way the sign-off queue does, then times dashboard slices on the cube
+against the same slice computed by rescanning every stored result:
+
+    python -m benchmarks.surveillance --results 100000
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import pandas as pd
+from streamlit import logger as streamlit_logger
+
+import surveillance
+from benchmarks.synthetic import generate_lab
+
+SLICES = [
+    ('Anemia', ['week']),
+    ('Anemia', ['week', 'region']),
+    ('Raised HbA1c (diabetes)', ['region']),
+    ('Hyperglycemia', ['age_band', 'region']),
+]
+
+
+def rescan(results, condition, by):
+    """The slice computed from result history, as the dashboard would without the cube"""
+    spec = surveillance.CONDITIONS[condition]
+    rows = [
+        (surveillance.region_name(r.get('patientRegion')), surveillance.age_band(r.get('patientAge')),
+         surveillance.iso_week(r.get('collectionDate')), v.get('flag') in spec['flags'])
+        for r in results if r.get('status') in surveillance.FINAL_STATUSES
+        for v in r.get('testValues', []) if v.get('parameter') == spec['test']
+    ]
+    frame = pd.DataFrame(rows, columns=['region', 'age_band', 'week', 'positive'])
+    return frame.groupby(by)['positive'].agg(['size', 'sum']).reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS surveillance cube benchmark")
+    parser.add_argument('--results', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-slice-ms', type=float, default=50.0,
+                        help="Fail when the median dashboard slice takes longer than this")
+    args = parser.parse_args(argv)
+
+    streamlit_logger.set_log_level('error')
+    results = generate_lab(n_patients=max(args.results // 10, 1), m_pending=0, p_panels=0,
+                           k_results=args.results)['test_results']
+    for result in results:
+        result['status'] = 'pending_review'
+
+    cube = surveillance.SurveillanceCube()
+    updates = []
+    for i in range(0, len(results), args.batch_size):
+        batch = results[i:i + args.batch_size]
+        began = time.perf_counter()
+        cube.add_results(batch)
+        approved = [{**result, 'status': 'approved'} for result in batch]
+        cube.replace(list(zip(batch, approved)))
+        updates.append(time.perf_counter() - began)
+        results[i:i + args.batch_size] = approved
+
+    # Each slice follows a fresh batch, so it pays for rebuilding the partitions that batch touched
+    fresh = [{**result, 'resultId': f"NEW{i:06d}"} for i, result in enumerate(results[:args.batch_size])]
+    slice_times, rescan_times = [], []
+    for condition, by in SLICES:
+        cube.replace([(result, result) for result in fresh])
+        began = time.perf_counter()
+        cube.prevalence(condition, by)
+        slice_times.append(time.perf_counter() - began)
+        began = time.perf_counter()
+        rescan(results, condition, by)
+        rescan_times.append(time.perf_counter() - began)
+
+    median_slice = statistics.median(slice_times) * 1000
+    print(f"{len(results):,} results streamed in batches of {args.batch_size}, {len(cube):,} cube cells")
+    print(f"{'batch update (median)':<26}{statistics.median(updates) * 1000:>10.2f} ms   (save + approve)")
+    print(f"{'slice on cube (median)':<26}{median_slice:>10.2f} ms")
+    print(f"{'slice by rescan (median)':<26}{statistics.median(rescan_times) * 1000:>10.2f} ms")
+
+    if median_slice > args.max_slice_ms:
+        print(f"❌ Median slice {median_slice:.2f} ms, over {args.max_slice_ms} ms")
+        return 1
+    print("✅ Surveillance slices within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Synthetic lab data generated from the real test catalog"""
+import random
+from datetime import date, timedelta
+
+from app import LISApp
+
+FIRST_NAMES = ["Aarav", "Priya", "Rahul", "Ananya", "Vikram", "Sneha", "Arjun", "Kavya", "Rohan", "Meera"]
+LAST_NAMES = ["Sharma", "Patel", "Reddy", "Iyer", "Singh", "Nair", "Gupta", "Das", "Khan", "Joshi"]
+PRIORITIES = ["routine", "routine", "routine", "urgent", "stat"]
+STATUSES = ["collected", "processing", "pending"]
+PAYERS = ["Self Pay", "Self Pay", "CGHS", "Star Health", "Corporate"]
+REGIONS = ["Bengaluru Urban", "Mysuru", "Chennai", "Hyderabad", "Pune", "Kolkata", "Lucknow", "Jaipur"]
+FLAGS = ["normal", "normal", "normal", "high", "low", "critical_high", "critical_low"]
+
+
+def _catalog_panel(index, test, rng, today):
+    return {
+        'id': f"TP_{index + 1:04d}",
+        'test_name': f"{test['test_name']} #{index + 1}",
+        'test_code': f"{test['test_code']}{index + 1}",
+        'category': test['category'],
+        'sample_type': test['sample_type'],
+        'sample_volume': test['sample_volume'],
+        'container_type': test['container_type'],
+        'test_method': test['test_method'],
+        'parameters': [dict(p) for p in test['parameters']],
+        'turnaround_time': 'Same Day',
+        'requires_authorization': True,
+        'authorization_level': test['authorization_level'],
+        'qc_required': True,
+        'qc_frequency': test['qc_frequency'],
+        'clinical_significance': test['clinical_significance'],
+        'special_instructions': test['special_instructions'],
+        'test_cost': test['test_cost'] * rng.uniform(0.8, 1.2),
+        'billing_code': test['billing_code'],
+        'insurance_covered': rng.random() < 0.5,
+        'priority_levels': ['Routine', 'Urgent', 'STAT'],
+        'collection_date': str(today),
+        'collection_time': '09:00:00',
+        'testing_date': str(today),
+        'testing_time': '10:00:00',
+        'created_date': str(today),
+        'created_time': '08:00:00',
+        'status': 'active' if rng.random() < 0.9 else 'inactive'
+    }
+
+
+def generate_lab(n_patients=100, m_pending=300, p_panels=50, k_results=1000, seed=42):
+    """Generate patients, pending tests, custom panels and historical results"""
+    rng = random.Random(seed)
+    today = date.today()
+    catalog = list(LISApp().get_predefined_tests().values())
+
+    patients = [
+        {
+            'patientId': f"PAT{i + 1:06d}",
+            'patientName': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'age': rng.randint(1, 90),
+            'sex': rng.choice(['M', 'F']),
+            'region': REGIONS[i % len(REGIONS)]
+        }
+        for i in range(n_patients)
+    ]
+
+    panels = [_catalog_panel(i, rng.choice(catalog), rng, today) for i in range(p_panels)]
+
+    pending_tests = []
+    for i in range(m_pending):
+        patient = rng.choice(patients)
+        test = rng.choice(catalog)
+        pending_tests.append({
+            'testId': f"TEST{i + 1:06d}",
+            'patientId': patient['patientId'],
+            'patientName': patient['patientName'],
+            'patientAge': patient['age'],
+            'patientSex': patient['sex'],
+            'patientRegion': patient['region'],
+            'testType': test['test_name'].lower().replace(' ', '_'),
+            'testName': test['test_name'],
+            'testCode': test['test_code'],
+            'category': test['category'].lower(),
+            'priority': rng.choice(PRIORITIES),
+            'payer': rng.choice(PAYERS),
+            'status': rng.choice(STATUSES),
+            'sampleType': test['sample_type'].lower(),
+            'collectionDate': str(today - timedelta(days=rng.randint(0, 2))),
+            'parameters': test['parameters'],
+            'isCustomPanel': True
+        })
+
+    test_results = []
+    for i in range(k_results):
+        patient = rng.choice(patients)
+        test = rng.choice(catalog)
+        test_results.append({
+            'resultId': f"RES{i + 1:06d}",
+            'test': f"HIST{i + 1:06d}",
+            'patient': patient['patientId'],
+            'patientName': patient['patientName'],
+            'patientAge': patient['age'],
+            'patientRegion': patient['region'],
+            'testType': test['test_name'].lower().replace(' ', '_'),
+            'testName': test['test_name'],
+            'collectionDate': str(today - timedelta(days=rng.randint(0, 90))),
+            'testValues': [
+                {
+                    'parameter': p['name'],
+                    'value': round(rng.uniform(0.5, 300), 2),
+                    'unit': p['unit'],
+                    'flag': rng.choice(FLAGS),
+                    'referenceRange': p['reference_range']
+                }
+                for p in test['parameters']
+            ],
+            'overallStatus': 'normal',
+            'interpretation': '',
+            'recommendations': '',
+            'performedBy': 'Synthetic Tech',
+            'status': rng.choice(['approved', 'approved', 'pending_review', 'draft'])
+        })
+
+    return {
+        'patients': patients,
+        'pending_tests': pending_tests,
+        'custom_test_panels': panels,
+        'test_results': test_results
+    }
@@ -0,0 +1,244 @@
+"""Order pricing, invoicing and revenue roll-ups
+
+Tests are priced from the catalog and panel library (test_cost, billing_code,
+insurance_covered). Pricing runs over a whole batch of orders at once as a
+DataFrame: priority surcharges, package prices and order discounts are column
+operations, and revenue is aggregated with group-bys, so a nightly run over a
+month of orders takes seconds rather than a loop per test.
+
+An order is the set of tests one patient had collected together (the test's
+orderId, else patient and collection date). Packages replace the price of
+their member tests when all of them are on one order; of the discount rules
+an order qualifies for, the largest applies.
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SELF_PAY = 'Self Pay'
+PAYERS = [SELF_PAY, 'CGHS', 'ECHS', 'Star Health', 'HDFC ERGO', 'Corporate']
+
+# Tests are billed once the sample is collected; pending and cancelled tests are not
+BILLABLE_STATUSES = ('collected', 'processing', 'ready_for_testing', 'in_progress', 'completed')
+
+PRIORITY_SURCHARGES = {'routine': 0.0, 'urgent': 0.25, 'asap': 0.25, 'stat': 0.5}
+
+PACKAGES = [
+    {'name': 'Comprehensive Health Checkup', 'codes': ['CBC', 'BMP', 'LFT', 'LIPID', 'TFT', 'UA'], 'price': 2300.0},
+    {'name': 'Diabetes Care', 'codes': ['HbA1c', 'BMP', 'LIPID'], 'price': 1150.0},
+    {'name': 'Basic Health Checkup', 'codes': ['CBC', 'BMP', 'UA'], 'price': 800.0},
+]
+
+DISCOUNT_RULES = [
+    {'name': 'Senior citizen', 'percent': 10.0, 'min_age': 60},
+    {'name': 'Multi-test order', 'percent': 5.0, 'min_tests': 5},
+]
+
+LINE_COLUMNS = [
+    'orderId', 'testId', 'patientId', 'patientName', 'patientAge', 'payer', 'priority', 'collectionDate',
+    'testCode', 'billingCode', 'testName', 'category', 'insuranceCovered', 'basePrice', 'surcharge',
+    'package', 'packagePrice', 'discountRule', 'discount', 'amount', 'insurerAmount', 'patientAmount'
+]
+AMOUNT_COLUMNS = ['basePrice', 'surcharge', 'discount', 'amount', 'insurerAmount', 'patientAmount']
+
+
+def test_key(name):
+    return str(name or '').lower().replace(' ', '_')
+
+
+def build_price_list(catalog, panels=()):
+    """Prices keyed by test code and by test-type name; panels override the catalog"""
+    rows = {}
+    for test in list(catalog) + [p for p in panels if p.get('status', 'active') == 'active']:
+        row = {
+            'testCode': test['test_code'],
+            'billingCode': test.get('billing_code') or f"{test['test_code']}_001",
+            'testName': test['test_name'],
+            'category': test.get('category', 'Other'),
+            'basePrice': float(test.get('test_cost') or 0),
+            'insuranceCovered': bool(test.get('insurance_covered', False))
+        }
+        rows[test['test_code']] = row
+        rows[test_key(test['test_name'])] = row
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def order_lines(tests, price_list):
+    """One priced-at-list line per ordered test"""
+    frame = pd.DataFrame(list(tests))
+    if frame.empty:
+        return pd.DataFrame(columns=LINE_COLUMNS)
+    for column, default in (('testCode', None), ('payer', SELF_PAY), ('priority', 'routine'),
+                            ('patientAge', np.nan), ('orderId', None)):
+        if column not in frame:
+            frame[column] = default
+
+    code = frame['testCode'].where(frame['testCode'].isin(price_list.index), frame['testType'].map(test_key))
+    priced = price_list.reindex(code.to_numpy())
+    frame = frame.drop(columns=['testCode', 'testName', 'category'], errors='ignore')
+    frame = pd.concat([frame.reset_index(drop=True), priced.reset_index(drop=True)], axis=1)
+
+    frame['orderId'] = frame['orderId'].fillna(frame['patientId'] + '-' + frame['collectionDate'].astype(str))
+    frame['payer'] = frame['payer'].fillna(SELF_PAY)
+    frame['priority'] = frame['priority'].fillna('routine').str.lower()
+    frame['basePrice'] = frame['basePrice'].astype(float).fillna(0.0)
+    frame['insuranceCovered'] = frame['insuranceCovered'].fillna(False).astype(bool)
+    frame['testCode'] = frame['testCode'].fillna(frame['testType'])
+    frame['testName'] = frame['testName'].fillna(frame['testType'].str.replace('_', ' ').str.title())
+    frame['category'] = frame['category'].fillna('Other')
+    return frame
+
+
+def _assign_packages(frame):
+    """Package name and allocated price per line, largest package first within each order"""
+    package = pd.Series(None, index=frame.index, dtype=object)
+    package_price = pd.Series(np.nan, index=frame.index)
+    codes = {code for p in PACKAGES for code in p['codes']}
+    # A test ordered twice on one order joins a package once
+    candidates = frame[frame['testCode'].isin(codes)].drop_duplicates(['orderId', 'testCode'])
+    if candidates.empty:
+        return package, package_price
+
+    prices = candidates.pivot(index='orderId', columns='testCode', values='basePrice')
+    line_ids = candidates.pivot(index='orderId', columns='testCode', values='testId')
+    for pkg in sorted(PACKAGES, key=lambda p: -len(p['codes'])):
+        if not set(pkg['codes']) <= set(prices.columns):
+            continue
+        members = prices[pkg['codes']]
+        total = members.sum(axis=1)
+        full = members.notna().all(axis=1) & (total > pkg['price'])
+        if not full.any():
+            continue
+        allocated = members[full].div(total[full], axis=0).mul(pkg['price']).round(2).stack()
+        test_ids = line_ids.loc[full, pkg['codes']].stack()
+        positions = frame.index[frame['testId'].isin(set(test_ids))]
+        by_test = pd.Series(allocated.to_numpy(), index=test_ids.to_numpy())
+        package.loc[positions] = pkg['name']
+        package_price.loc[positions] = frame.loc[positions, 'testId'].map(by_test).to_numpy()
+        # Tests in this package cannot join another one
+        prices.loc[full, pkg['codes']] = np.nan
+    return package, package_price
+
+
+def price_orders(frame):
+    """Apply surcharges, packages, discounts and payer splits to order lines"""
+    if frame.empty:
+        return frame
+    frame = frame.copy()
+    frame['surcharge'] = (frame['basePrice'] * frame['priority'].map(PRIORITY_SURCHARGES).fillna(0.0)).round(2)
+    frame['package'], frame['packagePrice'] = _assign_packages(frame)
+    net = frame['packagePrice'].fillna(frame['basePrice']) + frame['surcharge']
+
+    orders = frame.groupby('orderId', sort=False)
+    age = orders['patientAge'].transform('first').astype(float)
+    size = orders['testId'].transform('size')
+    rate = np.zeros(len(frame))
+    rule = np.full(len(frame), None, dtype=object)
+    for discount in sorted(DISCOUNT_RULES, key=lambda r: r['percent']):
+        applies = np.ones(len(frame), dtype=bool)
+        if 'min_age' in discount:
+            applies &= (age >= discount['min_age']).to_numpy()
+        if 'min_tests' in discount:
+            applies &= (size >= discount['min_tests']).to_numpy()
+        better = applies & (discount['percent'] / 100 > rate)
+        rate = np.where(better, discount['percent'] / 100, rate)
+        rule = np.where(better, discount['name'], rule)
+
+    frame['discountRule'] = rule
+    frame['discount'] = (net * rate).round(2)
+    frame['amount'] = (net - frame['discount']).round(2)
+    insured = frame['insuranceCovered'] & (frame['payer'] != SELF_PAY)
+    frame['insurerAmount'] = frame['amount'].where(insured, 0.0)
+    frame['patientAmount'] = frame['amount'] - frame['insurerAmount']
+    return frame
+
+
+def build_invoices(frame, issued_at=None):
+    """One invoice per order from priced lines"""
+    if frame.empty:
+        return []
+    issued_at = issued_at or datetime.now().isoformat()
+    totals = frame.groupby('orderId', sort=False)[AMOUNT_COLUMNS].sum().round(2)
+    # Building the records column-wise is several times faster than DataFrame.to_dict
+    columns = [frame[c].astype(object).where(frame[c].notna(), None).tolist() for c in LINE_COLUMNS]
+    lines = [dict(zip(LINE_COLUMNS, row)) for row in zip(*columns)]
+
+    by_order = {}
+    for line in lines:
+        by_order.setdefault(line['orderId'], []).append(line)
+    invoices = []
+    for order_id, total in zip(totals.index, totals.to_dict('records')):
+        order = by_order[order_id]
+        first = order[0]
+        invoices.append({
+            'orderId': order_id,
+            'patientId': first['patientId'],
+            'patientName': first['patientName'],
+            'payer': first['payer'],
+            'collectionDate': first['collectionDate'],
+            'issuedAt': issued_at,
+            'status': 'issued',
+            'lines': order,
+            'subtotal': round(total['basePrice'] + total['surcharge'], 2),
+            'discount': total['discount'],
+            'total': total['amount'],
+            'insurerAmount': total['insurerAmount'],
+            'patientAmount': total['patientAmount']
+        })
+    return invoices
+
+
+def billable(test):
+    """Whether a worklist row is a patient test that can be invoiced"""
+    return (test.get('status') in BILLABLE_STATUSES and not test.get('isCustomPanel')
+            and test.get('patientId') != 'CUSTOM_PAT')
+
+
+def run_billing(tests, price_list, invoiced_test_ids=(), start=None, end=None, issued_at=None):
+    """Nightly batch: price and invoice billable tests not yet billed, collected in [start, end]
+
+    Returns the new invoices and their priced lines.
+    """
+    invoiced = set(invoiced_test_ids)
+    tests = [
+        t for t in tests
+        if billable(t) and t['testId'] not in invoiced
+        and (start is None or str(t.get('collectionDate')) >= str(start))
+        and (end is None or str(t.get('collectionDate')) <= str(end))
+    ]
+    lines = price_orders(order_lines(tests, price_list))
+    return build_invoices(lines, issued_at), lines
+
+
+def invoice_lines(invoices):
+    """Flatten stored invoices back into a lines frame"""
+    lines = [line for invoice in invoices for line in invoice['lines']]
+    return pd.DataFrame(lines, columns=LINE_COLUMNS)
+
+
+def revenue_rollup(lines, by):
+    """Tests, gross, discounts and revenue split by payer, grouped by one or more columns"""
+    if lines.empty:
+        return pd.DataFrame(columns=[*([by] if isinstance(by, str) else by), 'tests', *AMOUNT_COLUMNS])
+    grouped = lines.groupby(by, sort=False, dropna=False)
+    rollup = grouped[AMOUNT_COLUMNS].sum().round(2)
+    rollup.insert(0, 'tests', grouped.size())
+    return rollup.sort_values('amount', ascending=False).reset_index()
+
+
+_LINES = None
+_LINES_VERSION = None
+_LINES_LOCK = threading.Lock()
+
+
+def get_invoice_lines(invoices_collection):
+    """Lines of every stored invoice, flattened again only when invoices change"""
+    global _LINES, _LINES_VERSION
+    key = (id(invoices_collection), invoices_collection.version)
+    with _LINES_LOCK:
+        if _LINES is None or _LINES_VERSION != key:
+            _LINES = invoice_lines(invoices_collection.snapshot())
+            _LINES_VERSION = key
+        return _LINES
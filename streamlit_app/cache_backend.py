@@ -0,0 +1,613 @@
+"""Pluggable persistence and invalidation for the shared store
+
+Several Streamlit worker processes can share one worklist, panel library and
+result set by pointing them at the same backend:
+
+    LIS_CACHE_BACKEND=memory                       (default, single process)
+    LIS_CACHE_BACKEND=sqlite:///var/lib/lis/cache.db
+    LIS_CACHE_BACKEND=redis://localhost:6379/0     (a running Redis or Redis-compatible server)
+    LIS_CACHE_BACKEND=kiosk:///var/lib/lis/kiosk.db  (offline kiosk mirror, see kiosk.py)
+
+Each write bumps a per-collection version and announces it; other workers
+reload that collection when they see a newer version. SQLite announces by
+polling a versions table, Redis through pub/sub, so a panel created in one
+worker appears in the others within the poll interval or on the next message.
+A Redis message also names the records written, so readers fetch just those.
+
+The Redis backend needs the optional redis package (pip install redis).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+DEFAULT_POLL_INTERVAL = float(os.environ.get('LIS_CACHE_POLL_INTERVAL', '1.0'))
+
+
+def _notify(callbacks, collection, version, ids=None):
+    """Run invalidation callbacks; a failing one is logged so the listener thread survives
+
+    ids are the records written when the backend knows them, else None.
+    """
+    for callback in callbacks:
+        try:
+            callback(collection, version, ids)
+        except Exception:
+            traceback.print_exc()
+
+
+class InProcessBackend:
+    """No external storage; the shared store is the only copy"""
+
+    shared = False
+    id_prefix = ''
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._sequences = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def load(self, collection):
+        return None
+
+    def upsert(self, collection, key, records):
+        return 0
+
+    def delete(self, collection, ids):
+        return 0
+
+    def clear(self, collection):
+        return 0
+
+    def next_sequence(self, name):
+        with self._lock:
+            self._sequences[name] = self._sequences.get(name, 0) + 1
+            return self._sequences[name]
+
+    def advance(self, name, value):
+        """Raise a named sequence to value; True only for the caller that raised it"""
+        with self._lock:
+            if self._sequences.get(name, 0) >= value:
+                return False
+            self._sequences[name] = value
+            return True
+
+    def lease(self, name, owner, seconds):
+        """Take or renew a named lease for seconds; True while owner holds it"""
+        now = time.time()
+        with self._lock:
+            holder, expires = self._leases.get(name, (None, 0.0))
+            if holder != owner and expires > now:
+                return False
+            self._leases[name] = (owner, now + seconds)
+            return True
+
+    def subscribe(self, callback):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Shared SQLite database (WAL mode) with polled invalidation"""
+
+    shared = True
+    id_prefix = ''
+
+    def __init__(self, path, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._local = threading.local()
+        self._callbacks = []
+        self._seen_versions = {}
+        self._stop = threading.Event()
+        self._poller = None
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (collection, id)
+            );
+            CREATE INDEX IF NOT EXISTS records_order ON records (collection, seq);
+            CREATE TABLE IF NOT EXISTS versions (
+                collection TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sequences (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _bump(self, conn, collection):
+        conn.execute(
+            "INSERT INTO versions (collection, version) VALUES (?, 1) "
+            "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+            (collection,)
+        )
+        version = conn.execute("SELECT version FROM versions WHERE collection = ?", (collection,)).fetchone()[0]
+        # Only skip our own write; if another worker wrote in between, let the poller reload
+        if version == self._seen_versions.get(collection, 0) + 1:
+            self._seen_versions[collection] = version
+        return version
+
+    def load(self, collection):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            version = conn.execute("SELECT version FROM versions WHERE collection = ?", (collection,)).fetchone()
+            if version is None:
+                return None
+            rows = conn.execute(
+                "SELECT data FROM records WHERE collection = ? ORDER BY seq", (collection,)
+            ).fetchall()
+        self._seen_versions[collection] = max(version[0], self._seen_versions.get(collection, 0))
+        return [json.loads(row[0]) for row in rows]
+
+    def load_records(self, collection, ids):
+        """{id: record} for the given ids, with None for those no longer stored"""
+        ids = [str(item_id) for item_id in ids]
+        rows = self._conn().execute(
+            f"SELECT id, data FROM records WHERE collection = ? AND id IN ({','.join('?' * len(ids))})",
+            (collection, *ids)
+        ).fetchall() if ids else []
+        found = {record_id: json.loads(data) for record_id, data in rows}
+        return {item_id: found.get(item_id) for item_id in ids}
+
+    def _write_records(self, conn, collection, rows):
+        """Insert or replace (id, json) rows; updates keep their original position in the collection"""
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM records WHERE collection = ?", (collection,)).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO records (collection, id, seq, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(collection, id) DO UPDATE SET data = excluded.data",
+            [(collection, record_id, seq + i, data) for i, (record_id, data) in enumerate(rows, 1)]
+        )
+
+    def _delete_records(self, conn, collection, ids):
+        conn.executemany("DELETE FROM records WHERE collection = ? AND id = ?", [(collection, i) for i in ids])
+
+    def upsert(self, collection, key, records):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_records(conn, collection, [
+                (str(record[key]), json.dumps(dict(record), default=str)) for record in records
+            ])
+            return self._bump(conn, collection)
+
+    def delete(self, collection, ids):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete_records(conn, collection, [str(item_id) for item_id in ids])
+            return self._bump(conn, collection)
+
+    def clear(self, collection):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM records WHERE collection = ?", (collection,))
+            return self._bump(conn, collection)
+
+    def next_sequence(self, name):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO sequences (name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,)
+            )
+            return conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()[0]
+
+    def advance(self, name, value):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return conn.execute(
+                "INSERT INTO sequences (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value WHERE sequences.value < excluded.value",
+                (name, value)
+            ).rowcount == 1
+
+    def lease(self, name, owner, seconds):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires <= ?",
+                (name, owner, now + seconds, now)
+            )
+            return conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()[0] == owner
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll, name="lis-sqlite-invalidation", daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                rows = self._conn().execute("SELECT collection, version FROM versions").fetchall()
+            except sqlite3.Error:
+                continue
+            for collection, version in rows:
+                if version > self._seen_versions.get(collection, 0):
+                    self._seen_versions[collection] = version
+                    _notify(self._callbacks, collection, version)
+
+    def close(self):
+        self._stop.set()
+
+
+class KioskBackend(SQLiteBackend):
+    """Local SQLite mirror for an offline kiosk (synced by kiosk.py)
+
+    Local writes go to the mirror and, in the same transaction, to an outbox
+    keyed by record, so repeated edits of one record before a sync leave one
+    change to send. Each outbox row carries the central change sequence number
+    of the copy it was based on, which is how the central LIS spots conflicts.
+    Changes pulled from the central LIS are written to the mirror without
+    queueing, and the store reloads them through the usual version poll.
+    """
+
+    def __init__(self, path, site_id=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(path, poll_interval)
+        self.site_id = site_id or os.environ.get('LIS_SITE_ID', 'KIOSK')
+        self.id_prefix = f"{self.site_id}-"
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY,
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                op TEXT NOT NULL,
+                data TEXT,
+                base_seq INTEGER NOT NULL,
+                changed_at REAL NOT NULL,
+                UNIQUE (collection, id)
+            );
+            CREATE TABLE IF NOT EXISTS server_seqs (
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (collection, id)
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        conn.commit()
+
+    def load(self, collection):
+        # The mirror only holds what was synced or entered here; nothing is seeded locally
+        stored = super().load(collection)
+        return [] if stored is None else stored
+
+    def _queue(self, conn, collection, changes):
+        """Add (id, op, data) changes to the outbox, replacing any unsent change of the same record"""
+        first = conn.execute(
+            "INSERT INTO sequences (name, value) VALUES ('change', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (len(changes),)
+        ).fetchone()[0] - len(changes)
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO outbox (seq, collection, id, op, data, base_seq, changed_at) "
+            "VALUES (?, ?, ?, ?, ?, COALESCE((SELECT seq FROM server_seqs WHERE collection = ? AND id = ?), 0), ?) "
+            "ON CONFLICT(collection, id) DO UPDATE SET "
+            "seq = excluded.seq, op = excluded.op, data = excluded.data, changed_at = excluded.changed_at",
+            [(first + i, collection, record_id, op, data, collection, record_id, now)
+             for i, (record_id, op, data) in enumerate(changes, 1)]
+        )
+
+    def upsert(self, collection, key, records):
+        rows = [(str(record[key]), json.dumps(dict(record), default=str)) for record in records]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_records(conn, collection, rows)
+            self._queue(conn, collection, [(record_id, 'upsert', data) for record_id, data in rows])
+            return self._bump(conn, collection)
+
+    def delete(self, collection, ids):
+        ids = [str(item_id) for item_id in ids]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._delete_records(conn, collection, ids)
+            self._queue(conn, collection, [(record_id, 'delete', None) for record_id in ids])
+            return self._bump(conn, collection)
+
+    def clear(self, collection):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [row[0] for row in conn.execute("SELECT id FROM records WHERE collection = ?", (collection,))]
+            self._delete_records(conn, collection, ids)
+            if ids:
+                self._queue(conn, collection, [(record_id, 'delete', None) for record_id in ids])
+            return self._bump(conn, collection)
+
+    # Sync (kiosk.py)
+
+    def pending(self, limit):
+        """Oldest unsent changes: [(seq, collection, id, op, data, base_seq)]"""
+        return self._conn().execute(
+            "SELECT seq, collection, id, op, data, base_seq FROM outbox ORDER BY seq LIMIT ?", (limit,)
+        ).fetchall()
+
+    def pending_count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def acknowledge(self, acks):
+        """Drop sent changes the central LIS accepted: [(seq, collection, id, server_seq)]
+
+        A newer edit of the same record queued meanwhile stays, rebased on the
+        accepted copy.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM outbox WHERE seq = ?", [(seq,) for seq, _, _, _ in acks])
+            self._record_server_seqs(conn, [(collection, record_id, server_seq)
+                                            for _, collection, record_id, server_seq in acks])
+
+    def _record_server_seqs(self, conn, rows):
+        conn.executemany(
+            "INSERT INTO server_seqs (collection, id, seq) VALUES (?, ?, ?) "
+            "ON CONFLICT(collection, id) DO UPDATE SET seq = MAX(seq, excluded.seq)", rows
+        )
+        conn.executemany(
+            "UPDATE outbox SET base_seq = MAX(base_seq, ?) WHERE collection = ? AND id = ?",
+            [(seq, collection, record_id) for collection, record_id, seq in rows]
+        )
+
+    def apply_remote(self, changes, cursor=None, force=False):
+        """Write central changes to the mirror: [(collection, id, op, data, server_seq)]
+
+        Records with an unsent local change are skipped (their push resolves
+        the conflict) unless force is set, which also drops the local change.
+        Returns the collections that changed.
+        """
+        conn = self._conn()
+        touched = set()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            pending = {tuple(row) for row in conn.execute("SELECT collection, id FROM outbox")}
+            applied = []
+            writes = {}
+            for collection, record_id, op, data, server_seq in changes:
+                if (collection, record_id) in pending:
+                    if not force:
+                        continue
+                    conn.execute("DELETE FROM outbox WHERE collection = ? AND id = ?", (collection, record_id))
+                if op == 'delete':
+                    self._write_batch(conn, collection, writes.pop(collection, None))
+                    self._delete_records(conn, collection, [record_id])
+                else:
+                    writes.setdefault(collection, {})[record_id] = data
+                applied.append((collection, record_id, server_seq))
+                touched.add(collection)
+            for collection, rows in writes.items():
+                self._write_batch(conn, collection, rows)
+            self._record_server_seqs(conn, applied)
+            if cursor is not None:
+                self._set_state(conn, 'cursor', cursor)
+            for collection in touched:
+                # Not marked as seen, so the poller reloads the store's copy
+                conn.execute(
+                    "INSERT INTO versions (collection, version) VALUES (?, 1) "
+                    "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+                    (collection,)
+                )
+        return touched
+
+    def _write_batch(self, conn, collection, rows):
+        if rows:
+            self._write_records(conn, collection, list(rows.items()))
+
+    def requeue(self, seq, collection, record_id, data, server_seq):
+        """Replace a sent change with its conflict resolution, rebased on the central copy"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+            self._record_server_seqs(conn, [(collection, record_id, server_seq)])
+            self._write_records(conn, collection, [(record_id, data)])
+            if not conn.execute(
+                "SELECT 1 FROM outbox WHERE collection = ? AND id = ?", (collection, record_id)
+            ).fetchone():
+                self._queue(conn, collection, [(record_id, 'upsert', data)])
+            conn.execute(
+                "INSERT INTO versions (collection, version) VALUES (?, 1) "
+                "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+                (collection,)
+            )
+
+    def _set_state(self, conn, name, value):
+        conn.execute(
+            "INSERT INTO sync_state (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, str(value))
+        )
+
+    def get_state(self, name, default=None):
+        row = self._conn().execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_state(self, name, value):
+        conn = self._conn()
+        with conn:
+            self._set_state(conn, name, value)
+
+
+class RedisBackend:
+    """A running Redis (or Redis-compatible) server with pub/sub invalidation"""
+
+    shared = True
+    id_prefix = ''
+    CHANNEL = 'lis:invalidate'
+
+    def __init__(self, url, prefix='lis'):
+        if redis is None:
+            raise RuntimeError("The redis cache backend requires the optional 'redis' package "
+                               "(pip install redis); use a sqlite:/// backend otherwise")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._callbacks = []
+        self._listener = None
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def _publish(self, collection, version, ids=None):
+        self.client.publish(self.CHANNEL, json.dumps({
+            'collection': collection,
+            'version': version,
+            'origin': self.worker_id,
+            'ids': ids
+        }))
+        return version
+
+    def load(self, collection):
+        if not self.client.exists(self._key('version', collection)):
+            return None
+        ids = self.client.zrange(self._key('order', collection), 0, -1)
+        if not ids:
+            return []
+        data = self.client.hmget(self._key('records', collection), ids)
+        return [json.loads(d) for d in data if d is not None]
+
+    def load_records(self, collection, ids):
+        ids = [str(item_id) for item_id in ids]
+        data = self.client.hmget(self._key('records', collection), ids) if ids else []
+        return {item_id: None if d is None else json.loads(d) for item_id, d in zip(ids, data)}
+
+    def upsert(self, collection, key, records):
+        now = time.time()
+        ids = [str(record[key]) for record in records]
+        pipe = self.client.pipeline(transaction=True)
+        for i, (record_id, record) in enumerate(zip(ids, records)):
+            pipe.hset(self._key('records', collection), record_id, json.dumps(dict(record), default=str))
+            # NX keeps an updated record in its original position
+            pipe.zadd(self._key('order', collection), {record_id: now + i * 1e-6}, nx=True)
+        pipe.incr(self._key('version', collection))
+        return self._publish(collection, pipe.execute()[-1], ids)
+
+    def delete(self, collection, ids):
+        ids = [str(item_id) for item_id in ids]
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hdel(self._key('records', collection), *ids)
+        pipe.zrem(self._key('order', collection), *ids)
+        pipe.incr(self._key('version', collection))
+        return self._publish(collection, pipe.execute()[-1], ids)
+
+    def clear(self, collection):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self._key('records', collection), self._key('order', collection))
+        pipe.incr(self._key('version', collection))
+        return self._publish(collection, pipe.execute()[-1])
+
+    def next_sequence(self, name):
+        return self.client.incr(self._key('sequence', name))
+
+    # Raise the sequence only when value is past it, in one step
+    ADVANCE_SCRIPT = """
+        local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+        if current < tonumber(ARGV[1]) then
+            redis.call('SET', KEYS[1], ARGV[1])
+            return 1
+        end
+        return 0
+    """
+
+    def advance(self, name, value):
+        return self.client.eval(self.ADVANCE_SCRIPT, 1, self._key('sequence', name), value) == 1
+
+    # Set the lease when it is free or already ours, in one step
+    LEASE_SCRIPT = """
+        local holder = redis.call('GET', KEYS[1])
+        if holder == false or holder == ARGV[1] then
+            redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+            return 1
+        end
+        return 0
+    """
+
+    def lease(self, name, owner, seconds):
+        return self.client.eval(self.LEASE_SCRIPT, 1, self._key('lease', name), owner, int(seconds * 1000)) == 1
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name="lis-redis-invalidation", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    if payload['origin'] == self.worker_id:
+                        continue
+                    _notify(self._callbacks, payload['collection'], payload['version'], payload.get('ids'))
+            except Exception:
+                # Keep listening whatever went wrong; messages may have been missed, so reload everything
+                traceback.print_exc()
+                time.sleep(1.0)
+                _notify(self._callbacks, None, None)
+
+    def close(self):
+        self.client.close()
+
+
+def create_backend(url=None):
+    """Build the backend named by a URL or the LIS_CACHE_BACKEND setting"""
+    url = url or os.environ.get('LIS_CACHE_BACKEND', 'memory')
+    if url in ('memory', 'inprocess', ''):
+        return InProcessBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith('kiosk:///'):
+        return KioskBackend(url[len('kiosk:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f"Unknown cache backend: {url}")
@@ -0,0 +1,256 @@
+"""Calculated parameters declared per panel
+
+A panel declares its derived parameters as expressions over the keys of its
+measured parameters, e.g.
+
+    {'key': 'globulin', 'name': 'Globulin', 'unit': 'g/dL',
+     'formula': 'total_protein - albumin', 'input_units': {'total_protein': 'g/dL'}}
+
+Each distinct set of declarations is compiled once per process into a
+dependency graph. Evaluation runs over NumPy arrays, so one call computes a
+whole batch of tests, and an edit only recomputes the formulas downstream of
+the changed inputs.
+"""
+import ast
+import hashlib
+import json
+import threading
+from graphlib import CycleError, TopologicalSorter
+
+import numpy as np
+
+from units import conversion_factor
+
+
+def ckd_epi_2021(creatinine, age, female):
+    """eGFR (mL/min/1.73m²) from serum creatinine in mg/dL, race-free CKD-EPI 2021"""
+    kappa = np.where(female, 0.7, 0.9)
+    alpha = np.where(female, -0.241, -0.302)
+    ratio = creatinine / kappa
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (142 * np.minimum(ratio, 1) ** alpha * np.maximum(ratio, 1) ** -1.200
+                * 0.9938 ** age * np.where(female, 1.012, 1.0))
+
+
+FUNCTIONS = {
+    'where': np.where,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+    'log': np.log,
+    'exp': np.exp,
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+    'nan': np.nan,
+    'ckd_epi_2021': ckd_epi_2021,
+}
+# Patient context available to every formula
+PATIENT_VARIABLES = ('age', 'female')
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp, ast.Call, ast.Name, ast.Load,
+    ast.Constant, ast.operator, ast.unaryop, ast.cmpop, ast.boolop, ast.IfExp
+)
+
+
+class Formula:
+    """One compiled derived parameter"""
+
+    def __init__(self, declaration):
+        self.key = declaration['key']
+        self.name = declaration['name']
+        self.unit = declaration.get('unit', '')
+        self.expression = declaration['formula']
+        self.reference_range = declaration.get('reference_range', '')
+        self.format = declaration.get('format', '%.2f')
+        self.input_units = declaration.get('input_units', {})
+
+        tree = ast.parse(self.expression, mode='eval')
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError(f"{self.name}: unsupported expression {type(node).__name__}")
+            if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+                raise ValueError(f"{self.name}: unknown function in {self.expression!r}")
+        self.names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} - set(FUNCTIONS)
+        self.code = compile(tree, f"<formula {self.key}>", 'eval')
+
+    def evaluate(self, variables):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = eval(self.code, {'__builtins__': {}, **FUNCTIONS}, variables)
+        return np.broadcast_to(np.asarray(result, dtype=float), np.shape(variables['age']))
+
+
+class CalculationGraph:
+    """Formulas of one panel in dependency order"""
+
+    def __init__(self, declarations):
+        self.formulas = {d['key']: Formula(d) for d in declarations}
+        graph = {key: formula.names & set(self.formulas) for key, formula in self.formulas.items()}
+        try:
+            self.order = tuple(TopologicalSorter(graph).static_order())
+        except CycleError as e:
+            raise ValueError(f"Circular calculated parameters: {e.args[1]}")
+
+        self.inputs = set().union(*(f.names for f in self.formulas.values())) - set(self.formulas) - set(PATIENT_VARIABLES)
+
+        # Every formula downstream of each variable, in evaluation order
+        downstream = {}
+        for key in reversed(self.order):
+            for name in self.formulas[key].names:
+                downstream.setdefault(name, set()).update({key}, downstream.get(key, ()))
+        self.dependents = {
+            name: tuple(k for k in self.order if k in keys) for name, keys in downstream.items()
+        }
+
+    def affected(self, changed):
+        """Formulas to recompute when the given inputs change"""
+        keys = set()
+        for name in changed:
+            keys.update(self.dependents.get(name, ()))
+        return tuple(k for k in self.order if k in keys)
+
+    def evaluate(self, inputs, age, female, units=None, changed=None, previous=None):
+        """Compute derived parameters for a batch of tests
+
+        ``inputs`` maps parameter keys to arrays (NaN where not entered) and
+        ``units`` gives each input's reported unit. With ``changed``, only the
+        formulas downstream of those inputs are recomputed; the rest are taken
+        from ``previous``.
+        """
+        units = units or {}
+        size = len(np.atleast_1d(age))
+        variables = {'age': np.asarray(age, dtype=float), 'female': np.asarray(female, dtype=bool)}
+        for name in self.inputs:
+            values = np.asarray(inputs.get(name, np.full(size, np.nan)), dtype=float)
+            expected, reported = self._expected_unit(name), units.get(name)
+            if expected and reported:
+                values = values * conversion_factor(name, reported, expected)
+            variables[name] = values
+
+        keys = self.order if changed is None or previous is None else self.affected(changed)
+        results = dict(previous or {})
+        for key in self.order:
+            if key not in keys:
+                variables[key] = np.asarray(results[key], dtype=float)
+                continue
+            variables[key] = results[key] = self.formulas[key].evaluate(variables)
+        return results
+
+    def _expected_unit(self, name):
+        for key in self.order:
+            unit = self.formulas[key].input_units.get(name)
+            if unit:
+                return unit
+        return None
+
+
+_GRAPHS = {}
+_GRAPHS_LOCK = threading.Lock()
+
+
+def graph_id(declarations):
+    """Stable identifier for a set of formula declarations"""
+    text = json.dumps(declarations, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+def compile_graph(declarations):
+    """Compiled graph for the declarations, built once per process"""
+    if not declarations:
+        return None, None
+    gid = graph_id(declarations)
+    graph = _GRAPHS.get(gid)
+    if graph is None:
+        with _GRAPHS_LOCK:
+            graph = _GRAPHS.get(gid)
+            if graph is None:
+                graph = _GRAPHS[gid] = CalculationGraph(declarations)
+    return gid, graph
+
+
+def get_graph(gid):
+    return _GRAPHS.get(gid)
+
+
+def is_female(sex):
+    return (sex or '').upper().startswith('F')
+
+
+def format_value(value, value_format):
+    """Round a computed value the way the parameter is reported"""
+    if value is None or np.isnan(value) or np.isinf(value):
+        return None
+    return float(value_format % value) if value_format != '%s' else value
+
+
+def calculate_test_values(declarations, values, test):
+    """Derived parameters for one test from its entered values
+
+    ``values`` maps parameter keys to {'value', 'unit'} entries as entered on
+    the results form; a blank (None) value is missing, a measured 0 is not.
+    Returns testValues entries for the computable formulas.
+    """
+    gid, graph = compile_graph(declarations)
+    if graph is None:
+        return []
+
+    inputs, units = {}, {}
+    for key in graph.inputs:
+        entry = values.get(key)
+        value = entry.get('value') if entry else None
+        inputs[key] = [float(value) if isinstance(value, (int, float)) else np.nan]
+        units[key] = entry.get('unit') if entry else None
+
+    age = test.get('patientAge')
+    computed = graph.evaluate(
+        inputs, [np.nan if age in (None, '') else float(age)], [is_female(test.get('patientSex'))], units
+    )
+    test_values = []
+    for key in graph.order:
+        formula = graph.formulas[key]
+        value = format_value(computed[key][0], formula.format)
+        if value is not None:
+            test_values.append({
+                'parameter': formula.name,
+                'value': value,
+                'unit': formula.unit,
+                'referenceRange': formula.reference_range,
+                'calculated': True
+            })
+    return test_values
+
+
+# Derived parameters of the catalog panels, keyed by test code
+PANEL_CALCULATIONS = {
+    'CBC': [
+        {'key': 'mcv', 'name': 'MCV', 'unit': 'fL', 'formula': 'hematocrit * 10 / rbc',
+         'reference_range': '80-100', 'format': '%.1f'},
+        {'key': 'mch', 'name': 'MCH', 'unit': 'pg', 'formula': 'hemoglobin * 10 / rbc',
+         'reference_range': '27-33', 'format': '%.1f'},
+        {'key': 'mchc', 'name': 'MCHC', 'unit': 'g/dL', 'formula': 'hemoglobin * 100 / hematocrit',
+         'reference_range': '32-36', 'format': '%.1f'},
+    ],
+    'BMP': [
+        {'key': 'egfr', 'name': 'eGFR (CKD-EPI 2021)', 'unit': 'mL/min/1.73m²',
+         'formula': 'ckd_epi_2021(creatinine, age, female)', 'input_units': {'creatinine': 'mg/dL'},
+         'reference_range': '>90', 'format': '%.0f'},
+    ],
+    'LFT': [
+        {'key': 'globulin', 'name': 'Globulin', 'unit': 'g/dL', 'formula': 'total_protein - albumin',
+         'input_units': {'total_protein': 'g/dL', 'albumin': 'g/dL'},
+         'reference_range': '2.0-3.5', 'format': '%.1f'},
+        {'key': 'ag_ratio', 'name': 'A/G Ratio', 'unit': '', 'formula': 'albumin / globulin',
+         'reference_range': '1.1-2.5', 'format': '%.2f'},
+    ],
+    'LIPID': [
+        # Friedewald is not valid above 400 mg/dL triglycerides
+        {'key': 'vldl', 'name': 'VLDL Cholesterol (Calculated)', 'unit': 'mg/dL',
+         'formula': 'where(triglycerides <= 400, triglycerides / 5, nan)',
+         'input_units': {'triglycerides': 'mg/dL'}, 'reference_range': '<30', 'format': '%.0f'},
+        {'key': 'ldl_friedewald', 'name': 'LDL Cholesterol (Friedewald)', 'unit': 'mg/dL',
+         'formula': 'total_cholesterol - hdl_cholesterol - vldl',
+         'input_units': {'total_cholesterol': 'mg/dL', 'hdl_cholesterol': 'mg/dL'},
+         'reference_range': '<100', 'format': '%.0f'},
+        {'key': 'non_hdl', 'name': 'Non-HDL Cholesterol', 'unit': 'mg/dL',
+         'formula': 'total_cholesterol - hdl_cholesterol', 'reference_range': '<130', 'format': '%.0f'},
+    ],
+}
@@ -0,0 +1,174 @@
+"""Typeahead search over the test menu backed by a prefix trie
+
+Every test is indexed under its code, the words of its name, its synonyms and
+its billing code. Each trie node keeps the tests below it already ranked, so
+a lookup walks one node per typed character and slices the head of a list;
+multi-word queries intersect the lists of each word. The index is built once
+per process and rebuilt only when the panel library changes.
+"""
+import heapq
+import re
+import threading
+
+# Field weights; a term typed in full scores an extra EXACT_BONUS
+FIELD_WEIGHTS = {'code': 100, 'name': 80, 'synonym': 60, 'billing_code': 40}
+EXACT_BONUS = 20
+FIRST_WORD_BONUS = 10
+
+# Common alternative names for the catalog tests, keyed by test code
+SYNONYMS = {
+    'CBC': ['Hemogram', 'Full Blood Count', 'FBC', 'CBP'],
+    'BMP': ['Kidney Function Test', 'KFT', 'Renal Function Test', 'RFT', 'Chem 7'],
+    'LFT': ['Liver Panel', 'Hepatic Function Panel'],
+    'TFT': ['Thyroid Profile', 'Thyroid Panel', 'T3 T4 TSH'],
+    'UA': ['Urine Routine', 'Urine R/M', 'Urine Analysis'],
+    'LIPID': ['Lipid Profile', 'Cholesterol Panel'],
+    'HbA1c': ['Glycated Hemoglobin', 'Glycosylated Hemoglobin', 'A1C'],
+    'ALB': ['Serum Albumin'],
+}
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    return _WORD_RE.findall(str(text or '').lower())
+
+
+class _Node:
+    __slots__ = ('children', 'scores', 'ranked')
+
+    def __init__(self):
+        self.children = {}
+        self.scores = {}
+        self.ranked = ()
+
+
+class CatalogIndex:
+    """Prefix index over test entries with precomputed rankings"""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._root = _Node()
+        for entry_id, entry in enumerate(self.entries):
+            for term, score in self._terms(entry):
+                self._insert(term, entry_id, score)
+        self._finalize()
+
+    @staticmethod
+    def _terms(entry):
+        """(term, score) pairs a test is found under"""
+        terms = []
+        code = ''.join(normalize(entry['code']))
+        if code:
+            terms.append((code, FIELD_WEIGHTS['code']))
+        for i, word in enumerate(normalize(entry['name'])):
+            terms.append((word, FIELD_WEIGHTS['name'] + (FIRST_WORD_BONUS if i == 0 else 0)))
+        for synonym in entry.get('synonyms', []):
+            words = normalize(synonym)
+            terms.extend((word, FIELD_WEIGHTS['synonym'] + (FIRST_WORD_BONUS if i == 0 else 0))
+                         for i, word in enumerate(words))
+            if len(words) > 1:
+                terms.append((''.join(words), FIELD_WEIGHTS['synonym']))
+        billing_code = normalize(entry.get('billing_code'))
+        terms.extend((word, FIELD_WEIGHTS['billing_code']) for word in billing_code)
+        if len(billing_code) > 1:
+            terms.append((''.join(billing_code), FIELD_WEIGHTS['billing_code']))
+        return terms
+
+    def _insert(self, term, entry_id, score):
+        node = self._root
+        for char in term:
+            node = node.children.setdefault(char, _Node())
+            if score > node.scores.get(entry_id, -1):
+                node.scores[entry_id] = score
+        exact = score + EXACT_BONUS
+        if exact > node.scores.get(entry_id, -1):
+            node.scores[entry_id] = exact
+
+    def _finalize(self):
+        names = [entry['name'].lower() for entry in self.entries]
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            node.ranked = tuple(sorted(node.scores, key=lambda i: (-node.scores[i], names[i])))
+            stack.extend(node.children.values())
+
+    def _node(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def search(self, query, limit=10):
+        """Best matching entries for a typed query, most relevant first"""
+        words = normalize(query)
+        if not words:
+            return []
+        nodes = [self._node(word) for word in words]
+        if any(node is None for node in nodes):
+            # Codes like 'HbA1c' may be typed with spaces or punctuation
+            node = self._node(''.join(words))
+            return [self.entries[i] for i in node.ranked[:limit]] if node else []
+
+        if len(nodes) == 1:
+            return [self.entries[i] for i in nodes[0].ranked[:limit]]
+
+        # Walk the rarest word's tests best first and keep those every other word reaches,
+        # ranked by summed score; stop once no later test can beat the current top `limit`
+        driver, *others = sorted(nodes, key=lambda n: len(n.ranked))
+        best_others = sum(node.scores[node.ranked[0]] for node in others)
+        top = []
+        for entry_id in driver.ranked:
+            score = driver.scores[entry_id]
+            if len(top) >= limit and score + best_others <= top[0][0]:
+                break
+            if all(entry_id in node.scores for node in others):
+                total = (score + sum(node.scores[entry_id] for node in others), -entry_id)
+                if len(top) < limit:
+                    heapq.heappush(top, total)
+                elif total > top[0]:
+                    heapq.heapreplace(top, total)
+        return [self.entries[-i] for _, i in sorted(top, reverse=True)]
+
+
+def catalog_entries(catalog, panels=()):
+    """Search entries for the catalog and the active custom panels"""
+    entries = []
+    for key, test in catalog.items():
+        entries.append(_entry(test, 'catalog', key))
+    for panel in panels:
+        if panel.get('status', 'active') == 'active':
+            entries.append(_entry(panel, 'panel', panel.get('id')))
+    return entries
+
+
+def _entry(test, source, key):
+    return {
+        'code': test['test_code'],
+        'name': test['test_name'],
+        'category': test.get('category', 'Other'),
+        'billing_code': test.get('billing_code', ''),
+        'synonyms': list(test.get('synonyms', [])) + SYNONYMS.get(test['test_code'], []),
+        'sample_type': test.get('sample_type', ''),
+        'test_cost': float(test.get('test_cost') or 0),
+        'source': source,
+        'key': key
+    }
+
+
+_INDEX = None
+_INDEX_VERSION = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index(catalog, panels_collection):
+    """Process-wide index, rebuilt only when the panel library changes"""
+    global _INDEX, _INDEX_VERSION
+    key = (id(catalog), id(panels_collection), panels_collection.version)
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX_VERSION != key:
+            _INDEX = CatalogIndex(catalog_entries(catalog, panels_collection.snapshot()))
+            _INDEX_VERSION = key
+        return _INDEX
@@ -0,0 +1,100 @@
+"""Reference range parsing and vectorized result flagging"""
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+FLAG_OPTIONS = ["Normal", "High", "Low", "Critical High", "Critical Low"]
+
+_NUMBER = r'[-+]?\d*\.?\d+'
+_RANGE_RE = re.compile(rf'^\s*({_NUMBER})\s*-\s*({_NUMBER})')
+_BOUND_RE = re.compile(rf'([<>]=?)\s*({_NUMBER})')
+# Qualitative ranges a measured zero satisfies, e.g. urine glucose 0 mg/dL against 'Negative'
+NEGATIVE_TERMS = ('negative', 'nil', 'absent', 'none', 'not detected')
+
+
+@lru_cache(maxsize=4096)
+def parse_reference_range(text):
+    """Parse '4.0-11.0', '<200' or '>40' into (low, high, expected_text)"""
+    text = (text or '').strip()
+    if not text:
+        return None, None, None
+
+    match = _RANGE_RE.match(text)
+    if match:
+        return float(match.group(1)), float(match.group(2)), None
+
+    match = _BOUND_RE.search(text)
+    if match:
+        operator, number = match.group(1), float(match.group(2))
+        return (None, number, None) if operator.startswith('<') else (number, None, None)
+
+    # Qualitative ranges such as 'Negative' or 'Yellow'
+    return None, None, text.lower()
+
+
+@lru_cache(maxsize=4096)
+def parse_critical_values(text):
+    """Parse '<2.0 or >30.0' into (critical_low, critical_high)"""
+    low = high = None
+    for operator, number in _BOUND_RE.findall(text or ''):
+        if operator.startswith('<'):
+            low = float(number)
+        else:
+            high = float(number)
+    return low, high
+
+
+def _parse_column(strings, parser):
+    """Parse each distinct string once and broadcast the parsed tuples back to rows"""
+    codes, uniques = pd.factorize(pd.Series(list(strings), dtype=object).fillna('').astype(str), sort=False)
+    return codes, [parser(u) for u in uniques]
+
+
+def _bound(codes, parsed, position):
+    return np.array([np.nan if p[position] is None else p[position] for p in parsed], dtype=float)[codes]
+
+
+def compute_flags(values, reference_ranges, critical_values=None):
+    """Flag a column of results against reference ranges and critical limits
+
+    Returns an array of backend flag codes ('normal', 'high', 'critical_low', ...);
+    blank values get an empty flag. A number checked against a qualitative range
+    is normal only when it is zero and the range is negative; otherwise it is
+    flagged abnormal rather than passed as normal.
+    """
+    text = pd.Series(list(values), dtype=object).fillna('').astype(str).str.strip()
+    numeric = pd.to_numeric(text, errors='coerce').to_numpy(dtype=float)
+    if critical_values is None:
+        critical_values = [''] * len(text)
+
+    ref_codes, ref_parsed = _parse_column(reference_ranges, parse_reference_range)
+    crit_codes, crit_parsed = _parse_column(critical_values, parse_critical_values)
+    low, high = _bound(ref_codes, ref_parsed, 0), _bound(ref_codes, ref_parsed, 1)
+    crit_low, crit_high = _bound(crit_codes, crit_parsed, 0), _bound(crit_codes, crit_parsed, 1)
+    expected = np.array([p[2] for p in ref_parsed], dtype=object)[ref_codes]
+
+    blank = (text == '').to_numpy()
+    is_number = ~np.isnan(numeric)
+    qualitative = np.array([p[2] is not None for p in ref_parsed], dtype=bool)[ref_codes]
+    negative = np.array([p[2] in NEGATIVE_TERMS for p in ref_parsed], dtype=bool)[ref_codes]
+    # Qualitative results match their expected text, e.g. 'Negative' or 'Clear'
+    text_match = text.str.lower().to_numpy() == expected
+
+    with np.errstate(invalid='ignore'):
+        flags = np.select(
+            [
+                blank,
+                is_number & (numeric <= crit_low),
+                is_number & (numeric >= crit_high),
+                is_number & (numeric < low),
+                is_number & (numeric > high),
+                is_number & ~qualitative,
+                is_number & negative & (numeric == 0),
+                text_match,
+            ],
+            ['', 'critical_low', 'critical_high', 'low', 'high', 'normal', 'normal', 'normal'],
+            default='abnormal'
+        )
+    return flags.astype(object)
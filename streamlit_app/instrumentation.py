@@ -0,0 +1,230 @@
+"""Lightweight timing and session metrics for the LIS app
+
+Metrics live in one process-wide registry so every Streamlit session reports
+into the same histograms. Recording is a bisect plus a few additions under a
+lock, cheap enough to leave on in production.
+"""
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+
+# Bucket upper bounds in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+SLOW_THRESHOLD_SECONDS = float(os.environ.get('LIS_SLOW_THRESHOLD', '0.5'))
+SESSION_SIZE_SAMPLE_EVERY = 20
+METRICS_FILE = os.environ.get('LIS_METRICS_FILE')
+METRICS_FILE_INTERVAL = 15.0
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus semantics"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self.max
+
+
+class MetricsRegistry:
+    """Process-wide timings, counters and session size samples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.durations = {}
+        self.counters = {}
+        self.session_size = Histogram(SIZE_BUCKETS)
+        self.slow_events = deque(maxlen=100)
+        self._last_export = 0.0
+
+    def observe_duration(self, name, kind, seconds):
+        with self._lock:
+            histogram = self.durations.get((kind, name))
+            if histogram is None:
+                histogram = self.durations[(kind, name)] = Histogram(DURATION_BUCKETS)
+            histogram.observe(seconds)
+            if seconds >= SLOW_THRESHOLD_SECONDS:
+                self.slow_events.append({
+                    'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'kind': kind,
+                    'name': name,
+                    'ms': round(seconds * 1000, 1)
+                })
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe_session_size(self, size_bytes):
+        with self._lock:
+            self.session_size.observe(size_bytes)
+
+    def snapshot(self):
+        """Copy of the timing table for display"""
+        with self._lock:
+            return [
+                {
+                    'kind': kind,
+                    'name': name,
+                    'count': h.count,
+                    'mean_ms': round(h.mean * 1000, 2),
+                    'p50_ms': round(h.quantile(0.5) * 1000, 2),
+                    'p95_ms': round(h.quantile(0.95) * 1000, 2),
+                    'max_ms': round(h.max * 1000, 2)
+                }
+                for (kind, name), h in sorted(self.durations.items())
+            ]
+
+    def render_prometheus(self):
+        """Prometheus text exposition of every metric"""
+        lines = [
+            '# HELP lis_duration_seconds Time spent in LIS pages, catalog lookups and backend calls',
+            '# TYPE lis_duration_seconds histogram'
+        ]
+        with self._lock:
+            for (kind, name), h in sorted(self.durations.items()):
+                labels = f'kind="{kind}",name="{name}"'
+                lines.extend(_histogram_lines('lis_duration_seconds', labels, h))
+
+            lines.append('# HELP lis_session_state_bytes Sampled estimated size of st.session_state')
+            lines.append('# TYPE lis_session_state_bytes histogram')
+            lines.extend(_histogram_lines('lis_session_state_bytes', '', self.session_size))
+
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'# TYPE lis_{name}_total counter')
+                lines.append(f'lis_{name}_total {value}')
+
+        lines.append('# TYPE lis_uptime_seconds gauge')
+        lines.append(f'lis_uptime_seconds {time.time() - self.started_at:.0f}')
+        return '\n'.join(lines) + '\n'
+
+    def export_file(self, path=None, force=False):
+        """Write the exposition for a node_exporter textfile collector, throttled"""
+        path = path or METRICS_FILE
+        if not path:
+            return False
+        now = time.time()
+        if not force and now - self._last_export < METRICS_FILE_INTERVAL:
+            return False
+        self._last_export = now
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+        return True
+
+
+def _histogram_lines(metric, labels, histogram):
+    prefix = f'{labels},' if labels else ''
+    cumulative = 0
+    lines = []
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    suffix = f'{{{labels}}}' if labels else ''
+    lines.append(f'{metric}_sum{suffix} {histogram.sum:.6f}')
+    lines.append(f'{metric}_count{suffix} {histogram.count}')
+    return lines
+
+
+REGISTRY = MetricsRegistry()
+
+
+class timer:
+    """Context manager recording the duration of a block"""
+
+    def __init__(self, name, kind='block'):
+        self.name = name
+        self.kind = kind
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        REGISTRY.observe_duration(self.name, self.kind, time.perf_counter() - self._start)
+        return False
+
+
+def timed(kind, name=None):
+    """Decorator recording each call of a function under (kind, name)"""
+    def decorator(func):
+        metric_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe_duration(metric_name, kind, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def estimate_size(obj, depth=4, _seen=None):
+    """Approximate deep size of plain Python containers"""
+    _seen = _seen if _seen is not None else set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, depth - 1, _seen) + estimate_size(value, depth - 1, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, depth - 1, _seen)
+    elif hasattr(obj, 'memory_usage') and hasattr(obj, 'columns'):
+        size += int(obj.memory_usage(deep=False).sum())
+    elif hasattr(type(obj), '__slots__'):
+        # Compact records: count what their slots hold
+        for name in type(obj).__slots__:
+            size += estimate_size(getattr(obj, name, None), depth - 1, _seen)
+    return size
+
+
+def record_rerun(session_state):
+    """Count a rerun and periodically sample the session-state footprint"""
+    REGISTRY.increment('reruns')
+    reruns = session_state.get('_metrics_reruns', 0) + 1
+    session_state['_metrics_reruns'] = reruns
+    if reruns == 1 or reruns % SESSION_SIZE_SAMPLE_EVERY == 0:
+        with timer('session_state_size', 'metrics'):
+            size = sum(estimate_size(session_state[key]) for key in list(session_state.keys()))
+        session_state['_metrics_session_bytes'] = size
+        REGISTRY.observe_session_size(size)
@@ -0,0 +1,589 @@
+"""Outbound result interface to hospital systems (HL7 v2 and FHIR)
+
+Finalized results are converted to HL7 v2.5.1 ORU^R01 messages and/or FHIR R4
+DiagnosticReport + Observation entries and written to a persistent outbox
+(SQLite) in the same step that approves them. A sender thread runs an
+asyncio loop that claims due messages in batches and delivers them:
+
+    HL7   over MLLP; each connection pipelines a batch and reads the ACKs back
+    FHIR  one batch Bundle per HTTP POST, with a per-entry outcome
+
+Failed messages are retried with exponential backoff and parked as 'dead'
+after MAX_ATTEMPTS. Claims are leases, so a message claimed by a worker that
+died is retried once the lease runs out. Segment templates are parsed once
+at import; building a message only escapes and joins field values, and FHIR
+entries are serialized when queued so a batch body is a string join.
+
+    LIS_HIS_MLLP=his.example.org:2575        (HL7 v2 receiver)
+    LIS_HIS_FHIR_URL=https://his.example.org/fhir
+    LIS_OUTBOX=/var/lib/lis/outbox.db        (default: outbox.db next to app.py)
+    LIS_FACILITY=QUXAT_LAB                    (MSH-4 sending facility)
+
+Try it against the mock receiver: ``python mock_his.py``.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import string
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+import instrumentation
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTBOX_PATH = os.environ.get('LIS_OUTBOX', os.path.join(APP_DIR, 'outbox.db'))
+HIS_MLLP = os.environ.get('LIS_HIS_MLLP', '')
+HIS_FHIR_URL = os.environ.get('LIS_HIS_FHIR_URL', '')
+FACILITY = os.environ.get('LIS_FACILITY', 'QUXAT_LAB')
+SENDING_APP = 'QuXAT LIS'
+
+BATCH_SIZE = 200
+CONCURRENCY = 4
+MAX_ATTEMPTS = 8
+BACKOFF_SECONDS = 5.0
+BACKOFF_MAX_SECONDS = 900.0
+LEASE_SECONDS = 60.0
+POLL_SECONDS = 1.0
+
+# Results in these statuses are final and go to the hospital
+EXPORT_STATUSES = ('approved', 'amended')
+# Worklist fields copied onto a result before it is exported
+TEST_FIELDS = ('orderId', 'testCode', 'patientSex', 'category')
+
+# HL7 table 0078 abnormal flags; the same codes are FHIR v3 ObservationInterpretation codes
+ABNORMAL_FLAGS = {'normal': 'N', 'high': 'H', 'low': 'L', 'critical_high': 'HH', 'critical_low': 'LL',
+                  'abnormal': 'A'}
+INTERPRETATION_SYSTEM = 'http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation'
+LOINC_SYSTEM = 'http://loinc.org'
+LOCAL_SYSTEM = 'urn:quxat:lis:parameter'
+
+# LOINC codes of common catalog parameters; others are sent with a local code
+LOINC_CODES = {
+    'white blood cells': ('6690-2', 'Leukocytes [#/volume] in Blood'),
+    'red blood cells': ('789-8', 'Erythrocytes [#/volume] in Blood'),
+    'hemoglobin': ('718-7', 'Hemoglobin [Mass/volume] in Blood'),
+    'hematocrit': ('4544-3', 'Hematocrit [Volume Fraction] of Blood'),
+    'platelets': ('777-3', 'Platelets [#/volume] in Blood'),
+    'glucose': ('2345-7', 'Glucose [Mass/volume] in Serum or Plasma'),
+    'creatinine': ('2160-0', 'Creatinine [Mass/volume] in Serum or Plasma'),
+    'bun': ('3094-0', 'Urea nitrogen [Mass/volume] in Serum or Plasma'),
+    'sodium': ('2951-2', 'Sodium [Moles/volume] in Serum or Plasma'),
+    'potassium': ('2823-3', 'Potassium [Moles/volume] in Serum or Plasma'),
+    'alt': ('1742-6', 'Alanine aminotransferase [Enzymatic activity/volume] in Serum or Plasma'),
+    'ast': ('1920-8', 'Aspartate aminotransferase [Enzymatic activity/volume] in Serum or Plasma'),
+    'albumin': ('1751-7', 'Albumin [Mass/volume] in Serum or Plasma'),
+    'tsh': ('3016-3', 'Thyrotropin [Units/volume] in Serum or Plasma'),
+    'free t4': ('3024-7', 'Thyroxine (T4) free [Mass/volume] in Serum or Plasma'),
+    'total cholesterol': ('2093-3', 'Cholesterol [Mass/volume] in Serum or Plasma'),
+    'hba1c': ('4548-4', 'Hemoglobin A1c/Hemoglobin.total in Blood'),
+}
+
+
+# HL7 v2
+
+_HL7_ESCAPES = str.maketrans({'\\': '\\E\\', '|': '\\F\\', '^': '\\S\\', '&': '\\T\\', '~': '\\R\\',
+                              '\r': ' ', '\n': ' '})
+
+
+def hl7_escape(value):
+    return '' if value is None else str(value).translate(_HL7_ESCAPES)
+
+
+class SegmentTemplate:
+    """HL7 segment with {placeholders} parsed once; render only escapes and joins"""
+
+    def __init__(self, name, fields):
+        # MSH-1 is the field separator itself
+        first = 2 if name == 'MSH' else 1
+        text = name + ''.join('|' + fields.get(i, '') for i in range(first, max(fields) + 1))
+        self._parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+
+    def render(self, values):
+        return ''.join(
+            literal + (hl7_escape(values.get(field)) if field else '')
+            for literal, field in self._parts
+        )
+
+
+MSH = SegmentTemplate('MSH', {
+    2: '^~\\&', 3: '{sending_app}', 4: '{facility}', 5: '{receiving_app}', 6: '{receiving_facility}',
+    7: '{timestamp}', 9: 'ORU^R01^ORU_R01', 10: '{control_id}', 11: 'P', 12: '2.5.1'
+})
+PID = SegmentTemplate('PID', {
+    1: '1', 3: '{patient_id}^^^{facility}^MR', 5: '{family}^{given}', 8: '{sex}'
+})
+ORC = SegmentTemplate('ORC', {1: 'RE', 2: '{order_id}', 3: '{result_id}', 5: 'CM'})
+OBR = SegmentTemplate('OBR', {
+    1: '1', 2: '{order_id}', 3: '{result_id}', 4: '{test_code}^{test_name}^L', 7: '{collected}',
+    22: '{reported}', 24: '{section}', 25: '{result_status}', 32: '{approved_by}'
+})
+OBX = SegmentTemplate('OBX', {
+    1: '{set_id}', 2: '{value_type}', 3: '{code}^{name}^{coding}', 5: '{value}', 6: '{unit}',
+    7: '{range}', 8: '{flag}', 11: '{observation_status}', 14: '{observed}'
+})
+NTE = SegmentTemplate('NTE', {1: '{set_id}', 2: 'L', 3: '{comment}'})
+
+
+def hl7_timestamp(value=None):
+    """YYYYMMDDHHMMSS from an ISO date/time string (or now)"""
+    if not value:
+        return datetime.now().strftime('%Y%m%d%H%M%S')
+    try:
+        return datetime.fromisoformat(str(value)).strftime('%Y%m%d%H%M%S')
+    except ValueError:
+        return str(value).replace('-', '').replace(':', '').replace('T', '')[:14]
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return not isinstance(value, bool)
+    except (TypeError, ValueError):
+        return False
+
+
+def _coding(parameter):
+    loinc = LOINC_CODES.get(str(parameter or '').strip().lower())
+    if loinc:
+        return loinc[0], loinc[1], 'LN'
+    return str(parameter or '').strip().lower().replace(' ', '_'), parameter, 'L'
+
+
+def message_id(result, protocol):
+    """Outbox id of one result version in one protocol"""
+    return f"{result['resultId']}.{result.get('version', 1)}.{protocol}"
+
+
+def build_oru(result, receiving_app='HIS', receiving_facility='HOSPITAL'):
+    """HL7 v2.5.1 ORU^R01 message for a finalized result"""
+    corrected = result.get('status') == 'amended'
+    names = str(result.get('patientName') or '').rsplit(' ', 1)
+    reported = hl7_timestamp(result.get('approvedAt') or result.get('amendedAt') or result.get('savedAt'))
+    values = {
+        'sending_app': SENDING_APP,
+        'facility': FACILITY,
+        'receiving_app': receiving_app,
+        'receiving_facility': receiving_facility,
+        'timestamp': hl7_timestamp(),
+        'control_id': message_id(result, 'hl7'),
+        'patient_id': result.get('patient'),
+        'family': names[-1],
+        'given': names[0] if len(names) > 1 else '',
+        'sex': result.get('patientSex', ''),
+        'order_id': result.get('orderId') or result.get('test'),
+        'result_id': result['resultId'],
+        'test_code': result.get('testCode') or result.get('testType'),
+        'test_name': result.get('testName'),
+        'collected': hl7_timestamp(result.get('collectionDate')),
+        'reported': reported,
+        'section': result.get('category', ''),
+        'result_status': 'C' if corrected else 'F',
+        'approved_by': result.get('approvedBy') or result.get('performedBy'),
+    }
+    segments = [MSH.render(values), PID.render(values), ORC.render(values), OBR.render(values)]
+    observation_status = 'C' if corrected else 'F'
+    for i, value in enumerate(result.get('testValues', []), 1):
+        code, name, coding = _coding(value.get('parameter'))
+        segments.append(OBX.render({
+            'set_id': i,
+            'value_type': 'NM' if _is_number(value.get('value')) else 'ST',
+            'code': code,
+            'name': name,
+            'coding': coding,
+            'value': value.get('value'),
+            'unit': value.get('unit'),
+            'range': value.get('referenceRange'),
+            'flag': ABNORMAL_FLAGS.get(value.get('flag'), ''),
+            'observation_status': observation_status,
+            'observed': reported
+        }))
+    if result.get('interpretation'):
+        segments.append(NTE.render({'set_id': 1, 'comment': result['interpretation']}))
+    return '\r'.join(segments) + '\r'
+
+
+# FHIR R4
+
+def fhir_entries(result):
+    """PUT entries for a DiagnosticReport and its Observations (idempotent on retry)"""
+    result_id = result['resultId']
+    status = 'amended' if result.get('status') == 'amended' else 'final'
+    issued = datetime.fromisoformat(
+        result.get('approvedAt') or result.get('amendedAt') or result.get('savedAt') or datetime.now().isoformat()
+    ).astimezone().isoformat(timespec='seconds')
+    subject = {'reference': f"Patient/{result.get('patient')}", 'display': result.get('patientName')}
+    entries = []
+    for i, value in enumerate(result.get('testValues', []), 1):
+        code, name, coding = _coding(value.get('parameter'))
+        observation = {
+            'resourceType': 'Observation',
+            'id': f"{result_id}-{i}",
+            'status': status,
+            'category': [{'coding': [{'system': 'http://terminology.hl7.org/CodeSystem/observation-category',
+                                      'code': 'laboratory'}]}],
+            'code': {'coding': [{'system': LOINC_SYSTEM if coding == 'LN' else LOCAL_SYSTEM, 'code': code,
+                                 'display': name}], 'text': value.get('parameter')},
+            'subject': subject,
+            'issued': issued,
+        }
+        if _is_number(value.get('value')):
+            observation['valueQuantity'] = {'value': float(value['value']), 'unit': value.get('unit') or None}
+        else:
+            observation['valueString'] = str(value.get('value', ''))
+        if value.get('flag') in ABNORMAL_FLAGS:
+            observation['interpretation'] = [{'coding': [{'system': INTERPRETATION_SYSTEM,
+                                                          'code': ABNORMAL_FLAGS[value['flag']]}]}]
+        if value.get('referenceRange'):
+            observation['referenceRange'] = [{'text': str(value['referenceRange'])}]
+        entries.append(observation)
+    report = {
+        'resourceType': 'DiagnosticReport',
+        'id': result_id,
+        'status': status,
+        'category': [{'coding': [{'system': 'http://terminology.hl7.org/CodeSystem/v2-0074', 'code': 'LAB'}]}],
+        'code': {'coding': [{'system': LOCAL_SYSTEM, 'code': result.get('testCode') or result.get('testType'),
+                             'display': result.get('testName')}]},
+        'subject': subject,
+        'effectiveDateTime': str(result.get('collectionDate')),
+        'issued': issued,
+        'result': [{'reference': f"Observation/{o['id']}"} for o in entries],
+    }
+    if result.get('interpretation'):
+        report['conclusion'] = result['interpretation']
+    entries.append(report)
+    return [
+        {'resource': resource, 'request': {'method': 'PUT', 'url': f"{resource['resourceType']}/{resource['id']}"}}
+        for resource in entries
+    ]
+
+
+def fhir_batch_body(payloads):
+    """Batch Bundle text from queued entry payloads without re-serializing them"""
+    return '{"resourceType":"Bundle","type":"batch","entry":[' + ','.join(payloads) + ']}'
+
+
+# Outbox
+
+class Outbox:
+    """Persistent queue of outbound messages (SQLite)"""
+
+    def __init__(self, path=OUTBOX_PATH, backoff=BACKOFF_SECONDS):
+        self.path = ':memory:' if path == 'memory' else path
+        self.backoff = backoff
+        self._local = threading.local()
+        self._memory_conn = None
+        # An in-memory database is one connection shared by every thread
+        self._memory_lock = threading.Lock() if self.path == ':memory:' else None
+        conn = self._conn()
+        if self.path != ':memory:':
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT NOT NULL UNIQUE,
+                result_id TEXT NOT NULL,
+                protocol TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                parts INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS outbox_due ON outbox (protocol, status, next_attempt);
+        """)
+
+    def _conn(self):
+        if self._memory_lock is not None:
+            if self._memory_conn is None:
+                self._memory_conn = sqlite3.connect(':memory:', isolation_level=None, check_same_thread=False)
+            return self._memory_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, work):
+        conn = self._conn()
+        if self._memory_lock is None:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                return work(conn)
+        with self._memory_lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return work(conn)
+
+    def enqueue(self, messages):
+        """Queue (message_id, result_id, protocol, payload, parts) rows; already queued ids are skipped"""
+        now = time.time()
+        rows = [(*message, now, now) for message in messages]
+        return self._execute(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO outbox (message_id, result_id, protocol, payload, parts, next_attempt, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        ).rowcount)
+
+    def claim(self, protocol, limit, lease=LEASE_SECONDS):
+        """Lease up to limit due messages: [(id, message_id, payload, parts, attempts)]"""
+        now = time.time()
+        return self._execute(lambda conn: conn.execute(
+            "UPDATE outbox SET status = 'sending', next_attempt = ? WHERE id IN ("
+            "  SELECT id FROM outbox WHERE protocol = ? AND status IN ('pending', 'sending')"
+            "  AND next_attempt <= ? ORDER BY next_attempt, id LIMIT ?"
+            ") RETURNING id, message_id, payload, parts, attempts",
+            (now + lease, protocol, now, limit)
+        ).fetchall())
+
+    def mark_sent(self, ids):
+        now = time.time()
+        self._execute(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, error = NULL WHERE id = ?",
+            [(now, i) for i in ids]
+        ))
+
+    def mark_failed(self, failures, max_attempts=MAX_ATTEMPTS):
+        """Schedule retries with exponential backoff; [(id, attempts so far, error)]"""
+        now = time.time()
+        rows = [
+            ('dead' if attempts + 1 >= max_attempts else 'pending',
+             now + min(self.backoff * 2 ** attempts, BACKOFF_MAX_SECONDS), str(error)[:500], i)
+            for i, attempts, error in failures
+        ]
+        self._execute(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt = ?, error = ? WHERE id = ?", rows
+        ))
+
+    def retry_dead(self):
+        """Requeue messages that ran out of attempts"""
+        return self._execute(lambda conn: conn.execute(
+            "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt = ? WHERE status = 'dead'",
+            (time.time(),)
+        ).rowcount)
+
+    def counts(self):
+        """{(protocol, status): messages}"""
+        rows = self._execute(lambda conn: conn.execute(
+            "SELECT protocol, status, COUNT(*) FROM outbox GROUP BY protocol, status"
+        ).fetchall())
+        return {(protocol, status): count for protocol, status, count in rows}
+
+    def due(self):
+        """Messages waiting to be sent now"""
+        return self._execute(lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending') AND next_attempt <= ?",
+            (time.time(),)
+        ).fetchone()[0])
+
+    def recent(self, status=None, limit=50):
+        query = "SELECT message_id, protocol, status, attempts, created_at, sent_at, error FROM outbox"
+        params = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        rows = self._execute(lambda conn: conn.execute(query + " ORDER BY id DESC LIMIT ?", (*params, limit))
+                             .fetchall())
+        columns = ('messageId', 'protocol', 'status', 'attempts', 'createdAt', 'sentAt', 'error')
+        return [dict(zip(columns, row)) for row in rows]
+
+
+# Sender
+
+def _mllp_frame(message):
+    return b'\x0b' + message.encode('utf-8') + b'\x1c\r'
+
+
+def _ack_code(ack):
+    """MSA-1 of an ACK message (AA, AE or AR)"""
+    for segment in ack.split('\r'):
+        if segment.startswith('MSA|'):
+            return segment.split('|')[1]
+    return 'AR'
+
+
+class Sender:
+    """Delivers outbox messages from an asyncio loop in a background thread"""
+
+    def __init__(self, outbox, mllp=HIS_MLLP, fhir_url=HIS_FHIR_URL, batch_size=BATCH_SIZE,
+                 concurrency=CONCURRENCY, timeout=10.0, max_attempts=MAX_ATTEMPTS):
+        self.outbox = outbox
+        self.mllp = mllp
+        self.fhir_url = fhir_url.rstrip('/') if fhir_url else ''
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.protocols = [p for p, target in (('hl7', self.mllp), ('fhir', self.fhir_url)) if target]
+        self._connections = None
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="lis-fhir")
+        self._http = threading.local()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # HL7 over MLLP
+
+    async def _connection(self):
+        host, port = self.mllp.rsplit(':', 1)
+        return await asyncio.wait_for(asyncio.open_connection(host, int(port)), self.timeout)
+
+    async def _send_hl7(self, batch):
+        """Pipeline a batch over one connection and match ACKs in order"""
+        connection = await self._connections.get()
+        try:
+            if connection is None:
+                connection = await self._connection()
+            reader, writer = connection
+            writer.write(b''.join(_mllp_frame(payload) for _, _, payload, _, _ in batch))
+            await writer.drain()
+            sent, failed = [], []
+            for row_id, _, _, _, attempts in batch:
+                frame = await asyncio.wait_for(reader.readuntil(b'\x1c\r'), self.timeout)
+                code = _ack_code(frame.strip(b'\x0b\x1c\r').decode('utf-8', 'replace'))
+                if code == 'AA':
+                    sent.append(row_id)
+                else:
+                    failed.append((row_id, attempts, f"ACK {code}"))
+            return sent, failed
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            if connection is not None:
+                connection[1].close()
+            connection = None
+            return [], [(row_id, attempts, f"MLLP: {e!r}") for row_id, _, _, _, attempts in batch]
+        finally:
+            self._connections.put_nowait(connection)
+
+    # FHIR over HTTP
+
+    def _post_bundle(self, body):
+        session = getattr(self._http, 'session', None)
+        if session is None:
+            session = self._http.session = requests.Session()
+        response = session.post(self.fhir_url, data=body.encode('utf-8'), timeout=self.timeout,
+                                headers={'Content-Type': 'application/fhir+json'})
+        response.raise_for_status()
+        return response.json()
+
+    async def _send_fhir(self, batch):
+        """One batch Bundle; a message succeeds when all of its entries do"""
+        body = fhir_batch_body([payload for _, _, payload, _, _ in batch])
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self._executor, self._post_bundle, body)
+            outcomes = [str(e.get('response', {}).get('status', '')) for e in response.get('entry', [])]
+        except (requests.RequestException, ValueError) as e:
+            return [], [(row_id, attempts, f"FHIR: {e}") for row_id, _, _, _, attempts in batch]
+        sent, failed, position = [], [], 0
+        for row_id, _, _, parts, attempts in batch:
+            statuses = outcomes[position:position + parts]
+            position += parts
+            if len(statuses) == parts and all(s[:1] == '2' for s in statuses):
+                sent.append(row_id)
+            else:
+                failed.append((row_id, attempts, f"FHIR entry status {', '.join(statuses) or 'missing'}"))
+        return sent, failed
+
+    # Loop
+
+    async def _deliver(self, protocol, batch):
+        with instrumentation.timer(f"send {protocol}", 'backend'):
+            sent, failed = await (self._send_hl7(batch) if protocol == 'hl7' else self._send_fhir(batch))
+        if sent:
+            self.outbox.mark_sent(sent)
+            instrumentation.REGISTRY.increment(f"his_{protocol}_sent", len(sent))
+        if failed:
+            self.outbox.mark_failed(failed, self.max_attempts)
+            instrumentation.REGISTRY.increment(f"his_{protocol}_failed", len(failed))
+        return len(sent), len(failed)
+
+    async def run_once(self):
+        """Send everything due now; returns (sent, failed)"""
+        if self._connections is None:
+            self._connections = asyncio.Queue()
+            for _ in range(self.concurrency):
+                self._connections.put_nowait(None)
+        totals = [0, 0]
+        while True:
+            batches = [
+                (protocol, batch)
+                for protocol in self.protocols
+                for batch in [self.outbox.claim(protocol, self.batch_size) for _ in range(self.concurrency)]
+                if batch
+            ]
+            if not batches:
+                return tuple(totals)
+            for sent, failed in await asyncio.gather(*(self._deliver(p, b) for p, b in batches)):
+                totals[0] += sent
+                totals[1] += failed
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await self.run_once()
+            except Exception:
+                # Keep sending; leased messages are claimed again once their lease runs out
+                instrumentation.REGISTRY.increment('his_sender_errors')
+                traceback.print_exc()
+            await asyncio.sleep(POLL_SECONDS)
+        while not self._connections.empty():
+            connection = self._connections.get_nowait()
+            if connection is not None:
+                connection[1].close()
+
+    def start(self):
+        if self._thread is None and self.protocols:
+            self._thread = threading.Thread(target=asyncio.run, args=(self._run(),), name="lis-his-sender",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class ResultInterface:
+    """Outbox plus sender for the configured hospital endpoints"""
+
+    def __init__(self, outbox, sender):
+        self.outbox = outbox
+        self.sender = sender
+
+    @property
+    def enabled(self):
+        return bool(self.sender.protocols)
+
+    def export(self, results):
+        """Queue messages for finalized results; returns how many were queued"""
+        messages = []
+        for result in results:
+            if result.get('status') not in EXPORT_STATUSES:
+                continue
+            if 'hl7' in self.sender.protocols:
+                messages.append((message_id(result, 'hl7'), result['resultId'], 'hl7', build_oru(result), 1))
+            if 'fhir' in self.sender.protocols:
+                entries = fhir_entries(result)
+                payload = ','.join(json.dumps(entry, separators=(',', ':'), default=str) for entry in entries)
+                messages.append((message_id(result, 'fhir'), result['resultId'], 'fhir', payload, len(entries)))
+        return self.outbox.enqueue(messages) if messages else 0
+
+
+_INTERFACE = None
+_INTERFACE_LOCK = threading.Lock()
+
+
+def get_interface():
+    """Process-wide interface, its sender started on first use when an endpoint is configured"""
+    global _INTERFACE
+    with _INTERFACE_LOCK:
+        if _INTERFACE is None:
+            # Without an endpoint nothing is queued, so keep the outbox off disk
+            outbox = Outbox(OUTBOX_PATH if HIS_MLLP or HIS_FHIR_URL else 'memory')
+            _INTERFACE = ResultInterface(outbox, Sender(outbox))
+            _INTERFACE.sender.start()
+        return _INTERFACE
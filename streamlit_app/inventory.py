@@ -0,0 +1,311 @@
+"""Reagent inventory, consumption by test volume and stock-out forecasts
+
+Each test run consumes a fixed amount of one or more reagents (CONSUMPTION,
+by test code; tests without an entry fall back to their method). When
+results finalize, the shared store turns the batch into a reagent usage
+vector with one matrix product over the runs per test, and takes it from the
+usable lots first-expiry-first-out in a single write.
+
+Daily usage per reagent is kept in a NumPy ring buffer of the last
+WINDOW_DAYS days, added to as batches finalize, so history is scanned once
+when the store loads rather than on each page view. The forecast fits a
+linear trend to the window for all reagents in one least-squares call,
+projects daily usage forward and finds the day cumulative usage passes the
+usable stock; it is cached until usage, stock or the date changes.
+
+Reagent lots are linked to QC runs: each run is evaluated against the
+control's target and SD with Westgard rules (1-3s and 2-2s reject, 1-2s
+warns), and a rejected run takes the lot out of use until a run passes.
+"""
+import threading
+from collections import Counter
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+FINAL_STATUSES = ('approved', 'amended')
+WINDOW_DAYS = 56
+ROLLING_DAYS = 14
+HORIZON_DAYS = 365
+MIN_TREND_DAYS = 14
+# Projected usage never falls below this share of the recent rate, so a downward trend cannot hide a stock-out
+MIN_RATE_SHARE = 0.25
+
+REAGENTS = {
+    'HEM-DIL': {'name': 'Hematology diluent', 'unit': 'mL', 'lead_days': 7},
+    'HEM-LYSE': {'name': 'Hematology lyse', 'unit': 'mL', 'lead_days': 7},
+    'CHEM-GLU': {'name': 'Glucose reagent', 'unit': 'tests', 'lead_days': 10},
+    'CHEM-ELEC': {'name': 'ISE electrolyte pack', 'unit': 'tests', 'lead_days': 10},
+    'CHEM-RENAL': {'name': 'Urea / creatinine reagent', 'unit': 'tests', 'lead_days': 10},
+    'CHEM-LIVER': {'name': 'Liver enzyme reagent', 'unit': 'tests', 'lead_days': 10},
+    'CHEM-ALB': {'name': 'Albumin reagent', 'unit': 'tests', 'lead_days': 10},
+    'CHEM-LIPID': {'name': 'Lipid reagent', 'unit': 'tests', 'lead_days': 10},
+    'IA-THYROID': {'name': 'Thyroid immunoassay kit', 'unit': 'tests', 'lead_days': 14},
+    'HPLC-A1C': {'name': 'HbA1c HPLC buffer', 'unit': 'tests', 'lead_days': 14},
+    'UA-STRIP': {'name': 'Urine dipstick', 'unit': 'strips', 'lead_days': 7},
+    'ELISA-KIT': {'name': 'ELISA kit', 'unit': 'wells', 'lead_days': 14},
+    'PCR-MIX': {'name': 'PCR master mix', 'unit': 'reactions', 'lead_days': 21},
+    'CULT-MEDIA': {'name': 'Culture plates', 'unit': 'plates', 'lead_days': 7},
+    'STAIN': {'name': 'Stain set', 'unit': 'slides', 'lead_days': 7},
+    'WASH': {'name': 'Analyzer wash solution', 'unit': 'mL', 'lead_days': 7},
+}
+REAGENT_IDS = list(REAGENTS)
+
+# Reagent used per run, by test code
+CONSUMPTION = {
+    'ALB': {'CHEM-ALB': 1, 'WASH': 2.0},
+    'CBC': {'HEM-DIL': 28.0, 'HEM-LYSE': 1.5, 'WASH': 1.0},
+    'BMP': {'CHEM-GLU': 1, 'CHEM-ELEC': 1, 'CHEM-RENAL': 2, 'WASH': 4.0},
+    'LFT': {'CHEM-LIVER': 4, 'CHEM-ALB': 1, 'WASH': 5.0},
+    'TFT': {'IA-THYROID': 2},
+    'FT4': {'IA-THYROID': 1},
+    'UA': {'UA-STRIP': 1},
+    'URC': {'CULT-MEDIA': 2},
+    'LIPID': {'CHEM-LIPID': 4, 'WASH': 4.0},
+    'HbA1c': {'HPLC-A1C': 1},
+    'PS': {'STAIN': 1},
+    'HBSAG': {'ELISA-KIT': 1},
+}
+# Catalog test names (as result testType keys) of the codes above
+TEST_CODES = {
+    'albumin': 'ALB', 'complete_blood_count': 'CBC', 'basic_metabolic_panel': 'BMP', 'liver_function_test': 'LFT',
+    'thyroid_function_test': 'TFT', 'free_t4': 'FT4', 'urinalysis': 'UA', 'urine_culture': 'URC',
+    'lipid_panel': 'LIPID', 'hemoglobin_a1c': 'HbA1c', 'peripheral_smear': 'PS', 'hepatitis_b_surface_antigen': 'HBSAG'
+}
+# Fallback for custom panels without their own entry
+METHOD_CONSUMPTION = {
+    'Automated Analyzer': {'WASH': 2.0},
+    'ELISA': {'ELISA-KIT': 1},
+    'PCR': {'PCR-MIX': 1},
+    'Culture': {'CULT-MEDIA': 1},
+    'Microscopy': {'STAIN': 1},
+    'Manual Method': {},
+}
+
+QC_LEVELS = ["Level 1 (Normal)", "Level 2 (Abnormal)", "Level 3 (Critical)"]
+
+
+def run_key(result, test=None):
+    """Consumption key of a finalized result: its test code, else its method"""
+    test = test or {}
+    code = test.get('testCode') or TEST_CODES.get(str(result.get('testType', '')).lower())
+    if code in CONSUMPTION:
+        return code
+    method = test.get('testMethod') or result.get('testMethod')
+    return method if method in METHOD_CONSUMPTION else None
+
+
+def usage_vector(amounts):
+    return np.array([float(amounts.get(reagent_id, 0)) for reagent_id in REAGENT_IDS])
+
+
+# One row per consumption key, one column per reagent
+USAGE_KEYS = list(CONSUMPTION) + list(METHOD_CONSUMPTION)
+USAGE_ROWS = {key: i for i, key in enumerate(USAGE_KEYS)}
+USAGE_MATRIX = np.vstack([usage_vector({**METHOD_CONSUMPTION, **CONSUMPTION}[key]) for key in USAGE_KEYS])
+
+
+def run_day(result):
+    """Day a result's reagents were used (approval, save or collection date, or a QC run's time)"""
+    for field in ('approvedAt', 'savedAt', 'collectionDate', 'runAt'):
+        try:
+            return date.fromisoformat(str(result.get(field))[:10])
+        except ValueError:
+            continue
+    return date.today()
+
+
+def evaluate_qc(value, target, sd, previous_z=None):
+    """(z-score, Westgard rule broken or None, outcome pass | warn | fail)"""
+    z = (value - target) / sd if sd else 0.0
+    if abs(z) > 3:
+        return z, '1-3s', 'fail'
+    if abs(z) > 2 and previous_z is not None and abs(previous_z) > 2 and np.sign(previous_z) == np.sign(z):
+        return z, '2-2s', 'fail'
+    if abs(z) > 2:
+        return z, '1-2s', 'warn'
+    return z, None, 'pass'
+
+
+def lot_usable(lot, today=None):
+    today = today or date.today()
+    return (lot.get('status') == 'active' and lot.get('qcStatus') != 'fail'
+            and lot.get('remaining', 0) > 0 and str(lot.get('expiryDate', '9999-12-31')) >= str(today))
+
+
+class UsageSeries:
+    """Daily reagent usage over the last WINDOW_DAYS days, as a reagents x days array"""
+
+    def __init__(self, window=WINDOW_DAYS):
+        self.window = window
+        self.days = np.zeros((len(REAGENT_IDS), window))
+        self.end = date.today().toordinal()
+        self.first = None
+        self.version = 0
+
+    def advance(self, day):
+        """Move the window so it ends at day (an ordinal), dropping older days"""
+        shift = day - self.end
+        if shift <= 0:
+            return
+        if shift >= self.window:
+            self.days[:] = 0
+        else:
+            self.days[:, :-shift] = self.days[:, shift:]
+            self.days[:, -shift:] = 0
+        self.end = day
+        self.version += 1
+
+    def add(self, day, usage):
+        day = day.toordinal()
+        self.advance(day)
+        column = self.window - 1 - (self.end - day)
+        if column < 0:
+            return
+        self.days[:, column] += usage
+        self.first = day if self.first is None else min(self.first, day)
+        self.version += 1
+
+    def observed(self):
+        """Days of the window with history (since the first recorded run)"""
+        if self.first is None:
+            return 0
+        return min(self.window, self.end - self.first + 1)
+
+
+class ReagentInventory:
+    """Usage series and cached stock-out forecast over the store's reagent lots"""
+
+    def __init__(self, results=(), worklist=None, qc_runs=()):
+        self.worklist = worklist
+        self.series = UsageSeries()
+        self.shortfall = Counter()
+        self._lock = threading.Lock()
+        self._forecast = None
+        self._forecast_key = None
+        self.record_runs([r for r in results if r.get('status') in FINAL_STATUSES])
+        self.record_qc_runs(qc_runs)
+
+    def _test(self, result):
+        return self.worklist.get(result.get('test')) if self.worklist is not None else None
+
+    def record_runs(self, results):
+        """Add finalized results to the usage series; returns the batch's usage per reagent"""
+        runs = Counter()
+        for result in results:
+            key = run_key(result, self._test(result))
+            if key is not None:
+                runs[key, run_day(result)] += 1
+        if not runs:
+            return {}
+        by_day = {}
+        for (key, day), count in runs.items():
+            by_day.setdefault(day, np.zeros(len(USAGE_KEYS)))[USAGE_ROWS[key]] += count
+        total = np.zeros(len(REAGENT_IDS))
+        with self._lock:
+            for day in sorted(by_day):
+                usage = by_day[day] @ USAGE_MATRIX
+                self.series.add(day, usage)
+                total += usage
+        return {reagent_id: total[i] for i, reagent_id in enumerate(REAGENT_IDS) if total[i]}
+
+    def record_usage(self, day, usage):
+        """Add usage outside test runs (e.g. QC) to the series: {reagent_id: amount}"""
+        with self._lock:
+            self.series.add(day, usage_vector(usage))
+
+    def record_qc_runs(self, runs):
+        """Add the reagent QC runs took from their lots to the series"""
+        for run in runs:
+            if run.get('used'):
+                self.record_usage(run_day(run), {run['reagentId']: run['used']})
+
+    def allocate(self, usage, lots, today=None):
+        """Take usage from usable lots, earliest expiry first: {lotId: changes}"""
+        by_reagent = {}
+        for lot in lots:
+            if lot_usable(lot, today):
+                by_reagent.setdefault(lot['reagentId'], []).append(lot)
+        changes = {}
+        for reagent_id, amount in usage.items():
+            for lot in sorted(by_reagent.get(reagent_id, ()), key=lambda l: (str(l['expiryDate']), l['lotId'])):
+                taken = min(amount, lot['remaining'])
+                remaining = round(lot['remaining'] - taken, 3)
+                changes[lot['lotId']] = {'remaining': remaining, 'status': 'active' if remaining > 0 else 'depleted'}
+                amount -= taken
+                if amount <= 0:
+                    break
+            if amount > 0:
+                self.shortfall[reagent_id] += amount
+        return changes
+
+    def stock(self, lots, today=None):
+        """Usable stock per reagent, in REAGENT_IDS order"""
+        stock = Counter()
+        for lot in lots:
+            if lot_usable(lot, today):
+                stock[lot['reagentId']] += lot['remaining']
+        return np.array([float(stock[reagent_id]) for reagent_id in REAGENT_IDS])
+
+    def forecast(self, lots, lots_version, today=None):
+        """Stock-out forecast per reagent, recomputed only when usage, stock or the date changed"""
+        today = today or date.today()
+        with self._lock:
+            self.series.advance(today.toordinal())
+            key = (self.series.version, lots_version, today)
+            if key == self._forecast_key:
+                return self._forecast
+            observed = self.series.observed()
+            window = self.series.days[:, self.series.window - max(observed, 1):].copy()
+        stock = self.stock(lots, today)
+        rate = window[:, -ROLLING_DAYS:].mean(axis=1)
+        slope = np.zeros(len(REAGENT_IDS))
+        if observed >= MIN_TREND_DAYS:
+            slope = np.polyfit(np.arange(observed), window.T, 1)[0]
+        # Recent rate sits mid-way through the rolling window; project the trend from there
+        ahead = np.arange(1, HORIZON_DAYS + 1) + ROLLING_DAYS / 2
+        projected = np.maximum(rate[:, None] + slope[:, None] * ahead, MIN_RATE_SHARE * rate[:, None])
+        cumulative = np.cumsum(projected, axis=1)
+        runs_out = (cumulative >= stock[:, None]) & (rate[:, None] > 0)
+        days_left = np.where(runs_out.any(axis=1), runs_out.argmax(axis=1), -1)
+
+        rows = []
+        for i, reagent_id in enumerate(REAGENT_IDS):
+            reagent = REAGENTS[reagent_id]
+            left = int(days_left[i]) if days_left[i] >= 0 else None
+            if not stock[i] and not rate[i]:
+                status = 'unused'
+            elif not stock[i]:
+                status = 'out'
+            elif left is not None and left <= reagent['lead_days']:
+                status = 'order now'
+            elif left is not None and left <= reagent['lead_days'] + ROLLING_DAYS:
+                status = 'order soon'
+            else:
+                status = 'ok'
+            rows.append({
+                'reagentId': reagent_id,
+                'reagent': reagent['name'],
+                'unit': reagent['unit'],
+                'stock': round(stock[i], 1),
+                'dailyUsage': round(rate[i], 2),
+                'trendPerWeek': round(slope[i] * 7, 2),
+                'daysLeft': left,
+                'stockOutDate': str(today + timedelta(days=left)) if left is not None else None,
+                'reorderBy': str(today + timedelta(days=max(left - reagent['lead_days'], 0)))
+                if left is not None else None,
+                'status': status
+            })
+        frame = pd.DataFrame(rows).astype({'daysLeft': 'Int64'})
+        with self._lock:
+            self._forecast, self._forecast_key = frame, key
+        return frame
+
+    def daily_usage(self, reagent_id):
+        """The reagent's usage by day over the window"""
+        with self._lock:
+            days = self.series.days[REAGENT_IDS.index(reagent_id)].copy()
+            end = date.fromordinal(self.series.end)
+        dates = pd.date_range(end=end, periods=len(days), freq='D')
+        return pd.DataFrame({'date': dates, 'usage': days})
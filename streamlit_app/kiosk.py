@@ -0,0 +1,236 @@
+"""Offline kiosk mode: two-way sync between the local mirror and the central LIS
+
+Collection centers with flaky links run the app against a local SQLite mirror
+of the patients, open orders, test panels and results:
+
+    LIS_CACHE_BACKEND=kiosk:///var/lib/lis/kiosk.db
+    LIS_SITE_ID=KSK01         (prefix of the ids created at this kiosk)
+    LIS_SYNC_INTERVAL=30      (seconds between sync rounds)
+    API_BASE_URL=https://lis.example.org/api   (the central LIS)
+    LIS_SYNC_TOKEN=...        (backend token of the kiosk's account)
+
+Every page reads and writes the mirror only (cache_backend.KioskBackend), so
+the UI never waits on the link. A background thread syncs in batches:
+
+    push  POST /sync/push      unsent local changes, oldest first, each with the
+                               central change sequence number it was based on
+    pull  GET  /sync/changes   central changes after the last sequence number seen
+
+Only deltas cross the link: the outbox holds one change per edited record, and
+the pull cursor is the last central change sequence number applied. A push
+the central LIS rejects as a conflict (the record changed there since) is
+settled by the collection's resolver in RESOLVERS and sent again, rebased on
+the central copy. Failed rounds back off exponentially up to MAX_BACKOFF.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+
+import backend_client
+from cache_backend import KioskBackend
+
+SYNC_INTERVAL = float(os.environ.get('LIS_SYNC_INTERVAL', '30'))
+SYNC_TIMEOUT = 10.0
+BATCH_SIZE = 500
+MAX_BACKOFF = 600.0
+
+FINAL_STATUSES = ('approved', 'amended')
+# Worklist statuses in workflow order; a merge keeps the one further along
+WORKFLOW = ('pending', 'collected', 'processing', 'ready_for_testing', 'in_progress', 'completed', 'cancelled')
+
+
+def resolve_test(local, server):
+    """Central copy, keeping whichever status is further along the workflow"""
+    merged = dict(server)
+    rank = {status: i for i, status in enumerate(WORKFLOW)}
+    if rank.get(local.get('status'), -1) > rank.get(server.get('status'), -1):
+        merged['status'] = local['status']
+    return merged
+
+
+def resolve_result(local, server):
+    """A finalized result beats one in review; otherwise the higher version, then the kiosk's, wins"""
+    local_final = local.get('status') in FINAL_STATUSES
+    server_final = server.get('status') in FINAL_STATUSES
+    if local_final != server_final:
+        return local if local_final else server
+    return local if local.get('version', 1) >= server.get('version', 1) else server
+
+
+def resolve_patient(local, server):
+    """Central demographics updated with the fields filled in at the kiosk"""
+    return {**server, **{field: value for field, value in local.items() if value not in (None, '')}}
+
+
+def server_wins(local, server):
+    return server
+
+
+RESOLVERS = {
+    'worklist': resolve_test,
+    'results': resolve_result,
+    'patients': resolve_patient,
+    'panels': server_wins,
+    'invoices': server_wins
+}
+
+
+class KioskSync:
+    """Pushes the kiosk's outbox and pulls central changes, in batches"""
+
+    def __init__(self, backend, client, batch_size=BATCH_SIZE, interval=SYNC_INTERVAL):
+        self.backend = backend
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = interval
+        self.online = None
+        self.last_sync = None
+        self.last_error = None
+        self.stats = {'pushed': 0, 'pulled': 0, 'conflicts': 0}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def push(self):
+        """Send unsent local changes; returns how many the central LIS accepted"""
+        accepted = 0
+        while True:
+            rows = self.backend.pending(self.batch_size)
+            if not rows:
+                return accepted
+            response = self.client.sync_push(self.backend.site_id, [
+                {'seq': seq, 'collection': collection, 'id': record_id, 'op': op,
+                 'data': json.loads(data) if data else None, 'baseSeq': base_seq}
+                for seq, collection, record_id, op, data, base_seq in rows
+            ])
+            outcomes = {outcome['seq']: outcome for outcome in response.get('results', [])}
+            acks, server_copies = [], []
+            for seq, collection, record_id, op, data, _ in rows:
+                outcome = outcomes.get(seq)
+                if outcome is None:
+                    continue
+                if outcome.get('status') == 'conflict':
+                    self._resolve(seq, collection, record_id, op, data, outcome, server_copies)
+                else:
+                    acks.append((seq, collection, record_id, outcome['serverSeq']))
+            self.backend.acknowledge(acks)
+            if server_copies:
+                self.backend.apply_remote(server_copies, force=True)
+            accepted += len(acks)
+            self.stats['pushed'] += len(acks)
+            if len(rows) < self.batch_size or not acks:
+                # Resolved conflicts are sent again next round
+                return accepted
+
+    def _resolve(self, seq, collection, record_id, op, data, outcome, server_copies):
+        """Settle a conflicting change, collecting the central copies that win in server_copies"""
+        self.stats['conflicts'] += 1
+        server = outcome.get('record')
+        server_seq = outcome['serverSeq']
+        if op == 'delete' or server is None:
+            resolved = server
+        else:
+            resolved = RESOLVERS.get(collection, server_wins)(json.loads(data), server)
+        if resolved == server:
+            server_copies.append((collection, record_id, 'delete' if server is None else 'upsert',
+                                  None if server is None else json.dumps(server, default=str), server_seq))
+        else:
+            self.backend.requeue(seq, collection, record_id, json.dumps(resolved, default=str), server_seq)
+
+    def pull(self):
+        """Apply central changes after the cursor; returns how many were applied"""
+        pulled = 0
+        while True:
+            cursor = int(self.backend.get_state('cursor', 0))
+            response = self.client.sync_changes(self.backend.site_id, cursor, self.batch_size)
+            changes = response.get('changes', [])
+            if not changes:
+                return pulled
+            self.backend.apply_remote(
+                [(c['collection'], str(c['id']), c['op'],
+                  json.dumps(c['data'], default=str) if c.get('data') is not None else None, c['serverSeq'])
+                 for c in changes],
+                cursor=max(c['serverSeq'] for c in changes)
+            )
+            pulled += len(changes)
+            self.stats['pulled'] += len(changes)
+            if len(changes) < self.batch_size:
+                return pulled
+
+    def sync_once(self):
+        """One push and pull round; returns (pushed, pulled) or raises BackendError"""
+        with self._lock:
+            try:
+                pushed = self.push()
+                pulled = self.pull()
+            except backend_client.BackendError as e:
+                self.online = False
+                self.last_error = str(e)
+                raise
+            self.online = True
+            self.last_error = None
+            self.last_sync = time.time()
+            self.backend.set_state('last_sync', self.last_sync)
+            return pushed, pulled
+
+    def status(self):
+        """Link state, queued changes and last successful sync for the UI"""
+        return {
+            'online': self.online,
+            'pending': self.backend.pending_count(),
+            'lastSync': self.last_sync or float(self.backend.get_state('last_sync', 0)) or None,
+            'lastError': self.last_error
+        }
+
+    def request_sync(self):
+        """Sync as soon as the background thread is free"""
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="lis-kiosk-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        delay = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.sync_once()
+                delay = self.interval
+            except backend_client.BackendError:
+                # Offline: back off, but the sync button retries at once
+                delay = min(max(delay * 2, self.interval / 4), MAX_BACKOFF)
+            except Exception:
+                traceback.print_exc()
+                delay = self.interval
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+_SYNC = None
+_SYNC_LOCK = threading.Lock()
+
+
+def get_sync(store):
+    """Process-wide sync for a store on a kiosk mirror, started on first use (None otherwise)"""
+    global _SYNC
+    if not isinstance(store.backend, KioskBackend):
+        return None
+    with _SYNC_LOCK:
+        if _SYNC is None or _SYNC.backend is not store.backend:
+            if _SYNC is not None:
+                _SYNC.stop()
+            client = backend_client.BackendClient(timeout=SYNC_TIMEOUT, token=os.environ.get('LIS_SYNC_TOKEN'))
+            _SYNC = KioskSync(store.backend, client)
+            if client.enabled:
+                _SYNC.start()
+        return _SYNC
@@ -0,0 +1,178 @@
+"""Local mock hospital information system for the result interface
+
+Accepts HL7 v2 messages over MLLP and answers each with an ACK (AA, or AE
+for a fail_rate share of them), and accepts FHIR batch Bundles over HTTP and
+answers with a batch-response. Received messages are counted, not stored.
+
+    python mock_his.py --mllp-port 2575 --fhir-port 8090 --fail-rate 0.05
+
+then run the app with LIS_HIS_MLLP=127.0.0.1:2575 and
+LIS_HIS_FHIR_URL=http://127.0.0.1:8090/fhir.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockHIS:
+    """MLLP and FHIR endpoints running in background threads"""
+
+    def __init__(self, host='127.0.0.1', mllp_port=0, fhir_port=0, fail_rate=0.0, seed=None):
+        self.host = host
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'hl7_received': 0, 'hl7_rejected': 0, 'fhir_bundles': 0, 'fhir_entries': 0,
+                      'fhir_rejected': 0}
+        self._loop = None
+        self._mllp_server = None
+        self._writers = set()
+        self._ready = threading.Event()
+        self._mllp_port = mllp_port
+        self._fhir = ThreadingHTTPServer((host, fhir_port), self._fhir_handler())
+        self._fhir.daemon_threads = True
+
+    @property
+    def mllp_address(self):
+        return f"{self.host}:{self._mllp_port}"
+
+    @property
+    def fhir_url(self):
+        return f"http://{self.host}:{self._fhir.server_address[1]}/fhir"
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    def _fails(self):
+        with self._lock:
+            return self.fail_rate > 0 and self._rng.random() < self.fail_rate
+
+    # HL7 over MLLP
+
+    def _ack(self, message):
+        fields = message.split('\r', 1)[0].split('|')
+        control_id = fields[9] if len(fields) > 9 else ''
+        code = 'AE' if self._fails() else 'AA'
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        ack = f"MSH|^~\\&|MOCK_HIS|HOSPITAL|||{timestamp}||ACK^R01^ACK|ACK{control_id}|P|2.5.1\rMSA|{code}|{control_id}\r"
+        return code, b'\x0b' + ack.encode('utf-8') + b'\x1c\r'
+
+    async def _handle_mllp(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                frame = await reader.readuntil(b'\x1c\r')
+                code, ack = self._ack(frame.strip(b'\x0b\x1c\r').decode('utf-8', 'replace'))
+                self._count(hl7_received=1, hl7_rejected=int(code != 'AA'))
+                writer.write(ack)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _run_mllp(self):
+        self._loop = asyncio.new_event_loop()
+        self._mllp_server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle_mllp, self.host, self._mllp_port)
+        )
+        self._mllp_port = self._mllp_server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    # FHIR over HTTP
+
+    def _fhir_handler(self):
+        his = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    bundle = json.loads(body)
+                except ValueError:
+                    self._reply(400, {'resourceType': 'OperationOutcome'})
+                    return
+                entries = []
+                rejected = 0
+                for entry in bundle.get('entry', []):
+                    if his._fails():
+                        rejected += 1
+                        entries.append({'response': {'status': '500 Internal Server Error'}})
+                    else:
+                        resource = entry.get('resource', {})
+                        entries.append({'response': {
+                            'status': '200 OK',
+                            'location': f"{resource.get('resourceType')}/{resource.get('id')}/_history/1"
+                        }})
+                his._count(fhir_bundles=1, fhir_entries=len(entries), fhir_rejected=rejected)
+                self._reply(200, {'resourceType': 'Bundle', 'type': 'batch-response', 'entry': entries})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/fhir+json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._run_mllp, name="mock-his-mllp", daemon=True).start()
+        threading.Thread(target=self._fhir.serve_forever, name="mock-his-fhir", daemon=True).start()
+        self._ready.wait()
+        return self
+
+    async def _close_mllp(self):
+        self._mllp_server.close()
+        # Close open connections while the loop still runs; their handlers then return
+        for writer in list(self._writers):
+            writer.close()
+        await asyncio.sleep(0.05)
+        self._loop.stop()
+
+    def stop(self):
+        self._fhir.shutdown()
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._close_mllp(), self._loop)
+
+
+def start_mock_his(mllp_port=0, fhir_port=0, fail_rate=0.0, seed=None):
+    """Running mock HIS on local ports (0 picks free ones)"""
+    return MockHIS(mllp_port=mllp_port, fhir_port=fhir_port, fail_rate=fail_rate, seed=seed).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock HIS receiver for QuXAT LIS result export")
+    parser.add_argument('--mllp-port', type=int, default=2575)
+    parser.add_argument('--fhir-port', type=int, default=8090)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of messages to reject")
+    args = parser.parse_args(argv)
+
+    his = start_mock_his(args.mllp_port, args.fhir_port, args.fail_rate)
+    print(f"MLLP listening on {his.mllp_address}")
+    print(f"FHIR listening on {his.fhir_url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(his.stats)
+    except KeyboardInterrupt:
+        his.stop()
+
+
+if __name__ == '__main__':
+    main()
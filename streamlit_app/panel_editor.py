@@ -0,0 +1,52 @@
+"""Table-mode editing helpers for test panel parameters"""
+import csv
+import io
+
+import pandas as pd
+
+PARAMETER_COLUMNS = ['name', 'unit', 'reference_range', 'critical_values']
+PARAMETER_LABELS = {
+    'name': 'Parameter Name',
+    'unit': 'Unit',
+    'reference_range': 'Reference Range',
+    'critical_values': 'Critical Values'
+}
+MAX_WIDGET_PARAMETERS = 20
+MAX_TABLE_PARAMETERS = 250
+
+_HEADER_NAMES = {'name', 'parameter', 'parameter name', 'analyte'}
+
+
+def parse_pasted_parameters(text):
+    """Parse rows copied from a spreadsheet (tab or comma separated) into parameters"""
+    text = text.strip()
+    if not text:
+        return []
+
+    delimiter = '\t' if '\t' in text else ','
+    parameters = []
+    for i, row in enumerate(csv.reader(io.StringIO(text), delimiter=delimiter)):
+        cells = [cell.strip() for cell in row]
+        if not cells or not cells[0]:
+            continue
+        if i == 0 and cells[0].lower() in _HEADER_NAMES:
+            continue
+        cells += [''] * (len(PARAMETER_COLUMNS) - len(cells))
+        parameters.append(dict(zip(PARAMETER_COLUMNS, cells[:len(PARAMETER_COLUMNS)])))
+        if len(parameters) >= MAX_TABLE_PARAMETERS:
+            break
+    return parameters
+
+
+def parameters_to_frame(parameters):
+    """Build the editable parameter table"""
+    frame = pd.DataFrame(parameters, columns=PARAMETER_COLUMNS)
+    return frame.fillna('').astype(str)
+
+
+def frame_to_parameters(frame):
+    """Convert an edited parameter table back into panel parameters"""
+    frame = frame.reindex(columns=PARAMETER_COLUMNS).fillna('').astype(str)
+    frame = frame.apply(lambda column: column.str.strip())
+    frame = frame[frame['name'] != ''].head(MAX_TABLE_PARAMETERS)
+    return frame.to_dict('records')
@@ -0,0 +1,105 @@
+"""Incrementally maintained statistics for the test panel library"""
+from collections import Counter
+
+COST_BUCKETS = [
+    (0, 250, "₹0-250"),
+    (250, 500, "₹250-500"),
+    (500, 1000, "₹500-1000"),
+    (1000, 2000, "₹1000-2000"),
+    (2000, float('inf'), "₹2000+")
+]
+
+
+def cost_bucket(cost):
+    """Return the distribution bucket label for a panel cost"""
+    for low, high, label in COST_BUCKETS:
+        if low <= cost < high:
+            return label
+    return COST_BUCKETS[0][2]
+
+
+class PanelStatistics:
+    """Panel library counters updated on create, delete, toggle and import events"""
+
+    def __init__(self, panels=None):
+        self.reset()
+        for panel in panels or []:
+            self.add(panel)
+
+    def reset(self):
+        self.total = 0
+        self.active = 0
+        self.cost_sum = 0.0
+        self.parameter_sum = 0
+        self.by_category = Counter()
+        self.by_sample_type = Counter()
+        self.by_method = Counter()
+        self.by_cost_bucket = Counter()
+        self.cost_by_category = Counter()
+
+    def _apply(self, panel, sign):
+        cost = float(panel.get('test_cost', 0) or 0)
+        category = panel.get('category', 'Other')
+        self.total += sign
+        if panel.get('status') == 'active':
+            self.active += sign
+        self.cost_sum += sign * cost
+        self.parameter_sum += sign * len(panel.get('parameters', []))
+        self.by_category[category] += sign
+        self.by_sample_type[panel.get('sample_type', 'Other')] += sign
+        self.by_method[panel.get('test_method', 'Other')] += sign
+        self.by_cost_bucket[cost_bucket(cost)] += sign
+        self.cost_by_category[category] += sign * cost
+        if sign < 0:
+            self._prune()
+
+    def _prune(self):
+        """Drop emptied keys so most_common never reports a deleted category"""
+        for counter in (self.by_category, self.by_sample_type, self.by_method, self.by_cost_bucket):
+            for key in [k for k, v in counter.items() if v <= 0]:
+                del counter[key]
+        for key in [k for k in self.cost_by_category if k not in self.by_category]:
+            del self.cost_by_category[key]
+
+    def add(self, panel):
+        """Record a created or imported panel"""
+        self._apply(panel, 1)
+
+    def extend(self, panels):
+        """Record a batch of imported panels"""
+        for panel in panels:
+            self._apply(panel, 1)
+
+    def remove(self, panel):
+        """Record a deleted panel"""
+        self._apply(panel, -1)
+
+    def status_changed(self, old_status, new_status):
+        """Record an activate/deactivate toggle"""
+        if old_status == 'active' and new_status != 'active':
+            self.active -= 1
+        elif old_status != 'active' and new_status == 'active':
+            self.active += 1
+
+    @property
+    def average_cost(self):
+        return self.cost_sum / self.total if self.total else 0.0
+
+    @property
+    def average_parameters(self):
+        return self.parameter_sum / self.total if self.total else 0.0
+
+    @property
+    def most_common_category(self):
+        top = self.by_category.most_common(1)
+        return top[0][0] if top else "N/A"
+
+    def average_cost_by_category(self):
+        return {
+            category: self.cost_by_category[category] / count
+            for category, count in self.by_category.items() if count
+        }
+
+    def cost_distribution(self):
+        """Cost bucket counts in bucket order"""
+        return {label: self.by_cost_bucket.get(label, 0) for _, _, label in COST_BUCKETS}
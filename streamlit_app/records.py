@@ -0,0 +1,158 @@
+"""Compact read-only records for the shared worklist
+
+A worklist test was a dict with 20-odd string keys, and a worker loading the
+worklist from a shared backend got its own copy of every status, category,
+test name and parameter list in it. A Record keeps its values in one tuple
+behind a field layout shared by every record with the same fields, interns
+the values that repeat across records (statuses, priorities, categories,
+sample types, test names, dates, patients) and shares identical parameter
+lists, so a large worklist holds one copy of each.
+
+Records are read-only Mappings: ``test['x']``, ``test.get('x')`` and
+``{**test, ...}`` work as they did on dicts. Changes go through the store,
+which builds a new record. Custom panels are put on the worklist as
+PanelTest views that read through to the panel rather than copying it.
+"""
+import sys
+from collections.abc import Mapping
+from datetime import datetime
+
+# Values shared by many records, interned so each is stored once per process
+INTERNED_FIELDS = frozenset({
+    'patientId', 'patientName', 'patientSex', 'patientRegion', 'orderId', 'testType', 'testCode', 'testName',
+    'category', 'sampleType', 'priority', 'status', 'payer', 'orderedBy', 'collectionDate', 'collectionTime',
+    'testingDate', 'testingTime', 'testMethod', 'authorizationLevel', 'stabilityStatus', 'reflexRule'
+})
+PARAMETER_FIELDS = frozenset({'parameters', 'calculatedParameters'})
+
+
+class Layout:
+    """Field names of a record shape and their positions"""
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names):
+        self.names = tuple(sys.intern(name) for name in names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+
+_LAYOUTS = {}
+_PARAMETERS = {}
+
+
+def layout(names):
+    found = _LAYOUTS.get(names)
+    if found is None:
+        found = _LAYOUTS.setdefault(names, Layout(names))
+    return found
+
+
+def shared_parameters(parameters):
+    """The first-seen list with the same parameter definitions"""
+    if not parameters:
+        return parameters
+    try:
+        key = tuple(tuple(sorted(parameter.items())) for parameter in parameters)
+        return _PARAMETERS.setdefault(key, parameters)
+    except (AttributeError, TypeError):
+        # Definitions holding lists or other unhashable values are kept as they are
+        return parameters
+
+
+def _compact(name, value):
+    if type(value) is str and name in INTERNED_FIELDS:
+        return sys.intern(value)
+    if type(value) is list and name in PARAMETER_FIELDS:
+        return shared_parameters(value)
+    return value
+
+
+class Record(Mapping):
+    """Read-only worklist record"""
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, fields):
+        self._layout = layout(tuple(fields))
+        self._values = tuple(_compact(name, value) for name, value in fields.items())
+
+    def __getitem__(self, name):
+        return self._values[self._layout.index[name]]
+
+    def get(self, name, default=None):
+        position = self._layout.index.get(name)
+        return default if position is None else self._values[position]
+
+    def __contains__(self, name):
+        return name in self._layout.index
+
+    def __iter__(self):
+        return iter(self._layout.names)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"Record({dict(self)!r})"
+
+    def __reduce__(self):
+        return Record, (dict(self),)
+
+
+class PanelTest(Mapping):
+    """Worklist view of an active custom test panel, read through to the panel"""
+    __slots__ = ('panel', 'panels')
+
+    FIELDS = {
+        'testId': lambda p: f"CUSTOM_{p['id']}",
+        'patientId': lambda p: "CUSTOM_PAT",
+        'patientName': lambda p: "Custom Test Panel",
+        'testType': lambda p: p['test_code'].lower().replace(' ', '_'),
+        'testCode': lambda p: p['test_code'],
+        'testName': lambda p: p['test_name'],
+        'category': lambda p: p['category'].lower(),
+        'priority': lambda p: "routine",
+        'status': lambda p: "ready_for_testing",
+        'sampleType': lambda p: p['sample_type'].lower(),
+        'collectionDate': lambda p: p.get('collection_date', p.get('created_date', str(datetime.now().date()))),
+        'collectionTime': lambda p: p.get('collection_time'),
+        'testingDate': lambda p: p.get('testing_date'),
+        'testingTime': lambda p: p.get('testing_time'),
+        'testMethod': lambda p: p['test_method'],
+        'parameters': lambda p: p['parameters'],
+        'calculatedParameters': lambda p: p.get('calculated_parameters', []),
+        'authorizationLevel': lambda p: p['authorization_level'],
+        'requiresAuthorization': lambda p: p.get('requires_authorization', True),
+        'isCustomPanel': lambda p: True
+    }
+
+    def __init__(self, panel, panels=None):
+        self.panel = panel
+        # The shared panel library; edits replace the panel there, so it is looked up by id
+        self.panels = panels
+
+    def current(self):
+        """The panel as it is now (as last seen if it was removed from the library)"""
+        if self.panels is not None:
+            panel = self.panels.get(self.panel['id'])
+            if panel is not None:
+                self.panel = panel
+        return self.panel
+
+    def __getitem__(self, name):
+        return self.FIELDS[name](self.current())
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        return f"PanelTest({self.panel.get('id')!r})"
+
+    def __reduce__(self):
+        return PanelTest, (self.current(),)
+
+
+def compact(record):
+    """A worklist record in compact form"""
+    return record if isinstance(record, (Record, PanelTest)) else Record(record)
@@ -0,0 +1,244 @@
+"""Patient-specific reference intervals
+
+Intervals are partitioned by (parameter, specimen, sex, pregnancy trimester,
+method). Within a partition the age bands do not overlap and are kept sorted
+by their lower bound, so resolving the band for an age is a single bisect.
+Lookups fall back from the most specific partition to the generic one, which
+keeps resolution O(log n) per parameter. They never fall back across
+specimens: urine glucose is not given the serum glucose interval.
+"""
+import re
+from bisect import bisect_right
+from typing import NamedTuple
+
+ADULT_AGE = 18
+MAX_AGE = 200
+BLOOD = 'blood'
+# Sample types reported against blood intervals; any other sample type is its own specimen
+BLOOD_SAMPLE_TYPES = {'', 'blood', 'whole blood', 'serum', 'plasma', 'capillary blood'}
+
+
+class ReferenceInterval(NamedTuple):
+    parameter: str
+    low: float = None
+    high: float = None
+    age_min: float = 0
+    age_max: float = MAX_AGE
+    sex: str = None
+    trimester: int = None
+    method: str = None
+    note: str = ''
+    specimen: str = BLOOD
+
+    @property
+    def text(self):
+        """Display form compatible with the free-text reference ranges"""
+        if self.low is not None and self.high is not None:
+            return f"{self.low:g}-{self.high:g}"
+        if self.low is not None:
+            return f">{self.low:g}"
+        if self.high is not None:
+            return f"<{self.high:g}"
+        return ''
+
+
+# Parameter names used across the catalog, mapped to one canonical key
+PARAMETER_ALIASES = {
+    'white_blood_cells': 'wbc',
+    'red_blood_cells': 'rbc',
+    'hgb': 'hemoglobin',
+    'hdl_cholesterol': 'hdl',
+    'ldl_cholesterol': 'ldl',
+    'alkaline_phosphatase': 'alp',
+}
+
+
+def parameter_key(name):
+    """Canonical key for a parameter name such as 'HDL Cholesterol'"""
+    key = re.sub(r'[^a-z0-9]+', '_', (name or '').lower()).strip('_')
+    return PARAMETER_ALIASES.get(key, key)
+
+
+def specimen_type(sample_type):
+    """Specimen an interval applies to: 'blood' for blood, serum and plasma, else the sample type"""
+    sample_type = (sample_type or '').strip().lower()
+    return BLOOD if sample_type in BLOOD_SAMPLE_TYPES else sample_type
+
+
+_SPECIMEN_SUFFIX_RE = re.compile(r'^(.+)_(urine|csf|stool|sputum|fluid)$')
+
+
+def split_specimen(key):
+    """('glucose', 'urine') for a specimen-suffixed key such as 'glucose_urine'; (key, None) otherwise"""
+    match = _SPECIMEN_SUFFIX_RE.match(key)
+    return (match.group(1), match.group(2)) if match else (key, None)
+
+
+def _band(parameter, low, high, age_min=0, age_max=MAX_AGE, sex=None, trimester=None, note='', specimen=BLOOD):
+    return ReferenceInterval(parameter, low, high, age_min, age_max, sex, trimester, None, note, specimen)
+
+
+# Default intervals for Indian adult, paediatric, geriatric and antenatal
+# populations. Each lab should verify these against its own method and
+# population before reporting.
+DEFAULT_INTERVALS = [
+    # Hemoglobin (g/dL)
+    _band('hemoglobin', 13.5, 20.0, 0, 0.08, note='Newborn'),
+    _band('hemoglobin', 9.5, 14.0, 0.08, 2),
+    _band('hemoglobin', 11.0, 14.0, 2, 12),
+    _band('hemoglobin', 12.0, 16.0, 12, ADULT_AGE),
+    _band('hemoglobin', 13.0, 17.0, ADULT_AGE, 65, sex='M'),
+    _band('hemoglobin', 12.5, 17.0, 65, MAX_AGE, sex='M', note='Geriatric'),
+    _band('hemoglobin', 12.0, 15.5, ADULT_AGE, 65, sex='F'),
+    _band('hemoglobin', 11.5, 15.5, 65, MAX_AGE, sex='F', note='Geriatric'),
+    _band('hemoglobin', 11.0, 14.0, 0, MAX_AGE, sex='F', trimester=1),
+    _band('hemoglobin', 10.5, 14.0, 0, MAX_AGE, sex='F', trimester=2),
+    _band('hemoglobin', 11.0, 14.0, 0, MAX_AGE, sex='F', trimester=3),
+    # Hematocrit (%)
+    _band('hematocrit', 31, 43, 0.08, 12),
+    _band('hematocrit', 40, 50, ADULT_AGE, MAX_AGE, sex='M'),
+    _band('hematocrit', 36, 46, ADULT_AGE, MAX_AGE, sex='F'),
+    _band('hematocrit', 36, 46, 12, ADULT_AGE),
+    # WBC (10³/μL)
+    _band('wbc', 9.0, 30.0, 0, 0.08, note='Newborn'),
+    _band('wbc', 6.0, 17.5, 0.08, 2),
+    _band('wbc', 5.0, 15.5, 2, 12),
+    _band('wbc', 4.0, 11.0, 12, MAX_AGE),
+    # RBC (10⁶/μL)
+    _band('rbc', 3.9, 5.3, 0.08, 12),
+    _band('rbc', 4.5, 5.9, ADULT_AGE, MAX_AGE, sex='M'),
+    _band('rbc', 4.0, 5.2, ADULT_AGE, MAX_AGE, sex='F'),
+    _band('rbc', 4.2, 5.4, 12, ADULT_AGE),
+    # Platelets (10³/μL)
+    _band('platelets', 150, 450, 0, MAX_AGE),
+    # Creatinine (mg/dL)
+    _band('creatinine', 0.2, 0.4, 0, 1),
+    _band('creatinine', 0.3, 0.7, 1, 12),
+    _band('creatinine', 0.5, 1.0, 12, ADULT_AGE),
+    _band('creatinine', 0.7, 1.3, ADULT_AGE, MAX_AGE, sex='M'),
+    _band('creatinine', 0.6, 1.1, ADULT_AGE, MAX_AGE, sex='F'),
+    _band('creatinine', 0.4, 0.8, 0, MAX_AGE, sex='F', trimester=2),
+    _band('creatinine', 0.4, 0.9, 0, MAX_AGE, sex='F', trimester=3),
+    # ALP (U/L) - bone growth raises paediatric values
+    _band('alp', 150, 420, 0, 12),
+    _band('alp', 100, 390, 12, ADULT_AGE),
+    _band('alp', 44, 147, ADULT_AGE, MAX_AGE),
+    _band('alp', 40, 240, 0, MAX_AGE, sex='F', trimester=3),
+    # HDL (mg/dL) - only a lower limit
+    _band('hdl', 40, None, ADULT_AGE, MAX_AGE, sex='M'),
+    _band('hdl', 50, None, ADULT_AGE, MAX_AGE, sex='F'),
+    _band('hdl', 45, None, 0, ADULT_AGE),
+    # TSH (mIU/L) - trimester-specific targets
+    _band('tsh', 0.7, 6.0, 0, 12),
+    _band('tsh', 0.4, 4.0, 12, 70),
+    _band('tsh', 0.4, 6.0, 70, MAX_AGE, note='Geriatric'),
+    _band('tsh', 0.1, 2.5, 0, MAX_AGE, sex='F', trimester=1),
+    _band('tsh', 0.2, 3.0, 0, MAX_AGE, sex='F', trimester=2),
+    _band('tsh', 0.3, 3.0, 0, MAX_AGE, sex='F', trimester=3),
+    # Fasting glucose (mg/dL)
+    _band('glucose', 60, 100, 0, ADULT_AGE),
+    _band('glucose', 70, 100, ADULT_AGE, MAX_AGE),
+    _band('glucose', 70, 92, 0, MAX_AGE, sex='F', trimester=1),
+    _band('glucose', 70, 92, 0, MAX_AGE, sex='F', trimester=2),
+    _band('glucose', 70, 92, 0, MAX_AGE, sex='F', trimester=3),
+]
+
+
+class ReferenceRangeStore:
+    """Interval index over age bands per (parameter, specimen, sex, trimester, method)"""
+
+    def __init__(self, intervals=()):
+        self._partitions = {}
+        for interval in intervals:
+            self.add(interval)
+
+    def add(self, interval):
+        key = (parameter_key(interval.parameter), interval.specimen, interval.sex, interval.trimester,
+               interval.method)
+        starts, bands = self._partitions.setdefault(key, ([], []))
+        position = bisect_right(starts, interval.age_min)
+        if (position and bands[position - 1].age_max > interval.age_min) or \
+                (position < len(bands) and interval.age_max > bands[position].age_min):
+            raise ValueError(f"Overlapping age band for {key}: {interval.age_min}-{interval.age_max}")
+        starts.insert(position, interval.age_min)
+        bands.insert(position, interval)
+
+    def _lookup(self, key, age):
+        partition = self._partitions.get(key)
+        if partition is None:
+            return None
+        starts, bands = partition
+        position = bisect_right(starts, age) - 1
+        if position >= 0 and age < bands[position].age_max:
+            return bands[position]
+        return None
+
+    def resolve(self, parameter, age=None, sex=None, trimester=None, method=None, specimen=BLOOD):
+        """Most specific interval for the patient and specimen, or None when none is defined
+
+        A specimen suffix on the parameter ('glucose_urine') takes precedence over specimen.
+        """
+        key, suffix = split_specimen(parameter_key(parameter))
+        specimen = suffix or specimen_type(specimen)
+        # Without a recorded age, fall back to the general adult band
+        age = ADULT_AGE + 12 if age in (None, '') else float(age)
+        sex = (sex or '').upper()[:1] or None
+
+        groups = []
+        if sex == 'F' and trimester:
+            groups.append(('F', int(trimester)))
+        if sex:
+            groups.append((sex, None))
+        groups.append((None, None))
+
+        for candidate_method in ((method, None) if method else (None,)):
+            for candidate_sex, candidate_trimester in groups:
+                interval = self._lookup((key, specimen, candidate_sex, candidate_trimester, candidate_method), age)
+                if interval is not None:
+                    return interval
+        return None
+
+    def resolve_text(self, parameter, fallback='', **patient):
+        """Patient-specific range text, or the catalog's generic range"""
+        interval = self.resolve(parameter, **patient)
+        return interval.text if interval is not None else fallback
+
+
+DEFAULT_STORE = ReferenceRangeStore(DEFAULT_INTERVALS)
+
+
+def patient_context(test):
+    """Age, sex and pregnancy trimester for a worklist entry"""
+    return {
+        'age': test.get('patientAge'),
+        'sex': test.get('patientSex'),
+        'trimester': test.get('pregnancyTrimester')
+    }
+
+
+_SEX_SPECIFIC_RE = re.compile(r'([^,;]+?)\s*\(([MF])\)')
+
+
+def sex_specific_text(text, sex):
+    """Pick the patient's half of a combined range such as '>40 (M), >50 (F)'"""
+    parts = {s: t.strip() for t, s in _SEX_SPECIFIC_RE.findall(text or '')}
+    sex = (sex or '').upper()[:1]
+    return parts.get(sex, text) if parts else text
+
+
+def personalize_parameters(parameters, test, store=DEFAULT_STORE):
+    """Copies of a test's parameters with ranges resolved for its patient and specimen"""
+    patient = patient_context(test)
+    method = test.get('testMethod') or None
+    specimen = specimen_type(test.get('sampleType'))
+    personalized = []
+    for param in parameters:
+        generic = sex_specific_text(param.get('reference_range', ''), patient['sex'])
+        # The parameter's own specimen suffix, else the test's; the name fallback stays on that specimen
+        param_specimen = split_specimen(parameter_key(param.get('key') or param['name']))[1] or specimen
+        interval = store.resolve(param.get('key') or param['name'], method=method, specimen=param_specimen,
+                                 **patient)
+        if interval is None and param.get('key') != parameter_key(param['name']):
+            interval = store.resolve(param['name'], method=method, specimen=param_specimen, **patient)
+        personalized.append({**param, 'reference_range': interval.text if interval is not None else generic})
+    return personalized
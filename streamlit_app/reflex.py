@@ -0,0 +1,201 @@
+"""Reflex and add-on testing rules
+
+A reflex rule orders another test on the same sample when a saved result
+meets a condition, e.g. TSH out of range orders Free T4 and a positive urine
+leukocyte esterase orders a urine culture. Rules are declarative dicts:
+
+    parameter   result parameter that triggers the rule
+    flags       flags that trigger it (high, low, critical_high, ...)
+    above/below numeric thresholds, as an alternative to flags
+    tests       only when reported by these test codes (optional)
+    unless      skip when the result already reports this parameter
+    add         code of the test to order
+
+Rules are indexed by trigger parameter, so checking a result costs one
+dictionary lookup per reported value rather than a pass over every rule.
+"""
+import threading
+
+OUT_OF_RANGE = ('high', 'low', 'critical_high', 'critical_low', 'abnormal')
+HIGH = ('high', 'critical_high')
+LOW = ('low', 'critical_low')
+
+REFLEX_RULES = [
+    {'name': 'TSH out of range → Free T4', 'parameter': 'TSH', 'flags': OUT_OF_RANGE,
+     'unless': 'Free T4', 'add': 'FT4'},
+    {'name': 'Positive leukocyte esterase → urine culture', 'parameter': 'Leukocyte Esterase',
+     'flags': OUT_OF_RANGE, 'add': 'URC'},
+    {'name': 'Low hemoglobin → peripheral smear', 'parameter': 'Hemoglobin', 'flags': LOW, 'add': 'PS'},
+    {'name': 'Raised fasting glucose → HbA1c', 'parameter': 'Glucose', 'flags': HIGH,
+     'tests': ('BMP',), 'add': 'HbA1c'},
+    {'name': 'Raised ALT → hepatitis B surface antigen', 'parameter': 'ALT', 'flags': HIGH, 'add': 'HBSAG'},
+    {'name': 'Low albumin → liver function test', 'parameter': 'Albumin', 'below': 3.0,
+     'tests': ('ALB',), 'add': 'LFT'},
+]
+
+# Reflex tests that are not on the ordering menu
+REFLEX_TESTS = {
+    'FT4': {'test_code': 'FT4', 'test_name': 'Free T4', 'category': 'Chemistry', 'sample_type': 'Serum',
+            'authorization_level': 'Lab Technician', 'test_cost': 350.00, 'billing_code': 'NABL-FT4-001'},
+    'URC': {'test_code': 'URC', 'test_name': 'Urine Culture', 'category': 'Microbiology', 'sample_type': 'Urine',
+            'authorization_level': 'Senior Lab Technician', 'test_cost': 600.00, 'billing_code': 'NABL-URC-001'},
+    'PS': {'test_code': 'PS', 'test_name': 'Peripheral Smear', 'category': 'Hematology', 'sample_type': 'Blood',
+           'authorization_level': 'Pathologist', 'test_cost': 250.00, 'billing_code': 'NABL-PS-001'},
+    'HBSAG': {'test_code': 'HBSAG', 'test_name': 'Hepatitis B Surface Antigen', 'category': 'Immunology',
+              'sample_type': 'Serum', 'authorization_level': 'Senior Lab Technician', 'test_cost': 400.00,
+              'billing_code': 'NABL-HBSAG-001'},
+}
+
+# Sample and patient fields a reflex test inherits from the test that triggered it
+INHERITED_FIELDS = (
+    'patientId', 'patientName', 'patientAge', 'patientSex', 'patientRegion', 'pregnancyTrimester', 'orderId',
+    'payer', 'priority', 'collectionDate', 'collectionTime', 'collectedAt', 'orderedBy'
+)
+
+
+def parameter_key(name):
+    return str(name or '').strip().lower()
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _triggers(rule, value):
+    """Whether a reported value meets a rule's condition"""
+    if 'flags' in rule and value.get('flag') in rule['flags']:
+        return True
+    number = _as_float(value.get('value'))
+    if number is None:
+        return False
+    return ('above' in rule and number > rule['above']) or ('below' in rule and number < rule['below'])
+
+
+class ReflexEngine:
+    """Reflex rules indexed by trigger parameter"""
+
+    def __init__(self, rules, catalog=()):
+        self.rules = list(rules)
+        self._by_parameter = {}
+        for rule in self.rules:
+            self._by_parameter.setdefault(parameter_key(rule['parameter']), []).append(rule)
+        self.tests = dict(REFLEX_TESTS)
+        self.tests.update({test['test_code']: test for test in catalog})
+        self._lock = threading.Lock()
+        self._ordered = set()
+        self._seen = (None, 0, None)
+
+    def matches(self, result, test_code=None):
+        """(rule, triggering value) pairs for one result"""
+        values = result.get('testValues', [])
+        found = []
+        reported = None
+        for value in values:
+            rules = self._by_parameter.get(parameter_key(value.get('parameter')))
+            if not rules:
+                continue
+            for rule in rules:
+                if 'tests' in rule and test_code not in rule['tests']:
+                    continue
+                if not _triggers(rule, value):
+                    continue
+                if 'unless' in rule:
+                    if reported is None:
+                        reported = {
+                            parameter_key(v.get('parameter')) for v in values
+                            if v.get('value') not in (None, '')
+                        }
+                    if parameter_key(rule['unless']) in reported:
+                        continue
+                found.append((rule, value))
+        return found
+
+    def reflex_tests(self, results, worklist):
+        """Worklist tests to add for a batch of saved results
+
+        worklist is the shared worklist collection; a test already ordered
+        for the same sample is not ordered again.
+        """
+        found_by_result = []
+        for result in results:
+            if result.get('status') == 'draft':
+                continue
+            source = worklist.get(result.get('test')) or {}
+            found = self.matches(result, source.get('testCode'))
+            if found:
+                found_by_result.append((result, source, found))
+        if not found_by_result:
+            return []
+
+        with self._lock:
+            return self._order(found_by_result, worklist)
+
+    def _ordered_tests(self, worklist):
+        """(sample, test code) of every ordered test
+
+        Kept between calls and extended with the tests appended since the
+        last one, so a stream of batches does not rescan the whole worklist.
+        """
+        items = worklist.snapshot()
+        collection, seen, last = self._seen
+        if collection != id(worklist) or seen > len(items) or (seen and items[seen - 1] is not last):
+            self._ordered = set()
+            seen = 0
+        self._ordered.update((_sample_key(t), t.get('testCode')) for t in items[seen:])
+        self._seen = (id(worklist), len(items), items[-1] if items else None)
+        return self._ordered
+
+    def _order(self, found_by_result, worklist):
+        ordered = self._ordered_tests(worklist)
+        new_tests = []
+        for result, source, found in found_by_result:
+            sample = _sample_key(source) if source else (result.get('patient'), result.get('collectionDate'))
+            for rule, value in found:
+                test = self.tests.get(rule['add'])
+                if test is None or (sample, test['test_code']) in ordered:
+                    continue
+                ordered.add((sample, test['test_code']))
+                new_tests.append(self._reflex_test(test, rule, value, result, source))
+        return new_tests
+
+    def _reflex_test(self, test, rule, value, result, source):
+        inherited = {field: source[field] for field in INHERITED_FIELDS if source.get(field) is not None}
+        return {
+            'patientId': result.get('patient'),
+            'patientName': result.get('patientName'),
+            'collectionDate': result.get('collectionDate'),
+            **inherited,
+            'testType': test['test_name'].lower().replace(' ', '_'),
+            'testCode': test['test_code'],
+            'testName': test['test_name'],
+            'category': test.get('category', 'Other').lower(),
+            'sampleType': str(test.get('sample_type', source.get('sampleType', ''))).lower(),
+            'status': 'collected',
+            'authorizationLevel': test.get('authorization_level'),
+            'reflexOf': result.get('test'),
+            'reflexRule': rule['name'],
+            'reflexTrigger': f"{value.get('parameter')} {value.get('value')} ({value.get('flag') or 'value'})"
+        }
+
+
+def _sample_key(test):
+    """Tests on one sample share an order id, else patient and collection date"""
+    return test.get('orderId') or (test.get('patientId'), test.get('collectionDate'))
+
+
+_ENGINE = None
+_ENGINE_KEY = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine(catalog):
+    """Process-wide engine over REFLEX_RULES"""
+    global _ENGINE, _ENGINE_KEY
+    with _ENGINE_LOCK:
+        if _ENGINE is None or _ENGINE_KEY != id(catalog):
+            _ENGINE = ReflexEngine(REFLEX_RULES, catalog.values())
+            _ENGINE_KEY = id(catalog)
+        return _ENGINE
@@ -0,0 +1,311 @@
+"""Patient report rendering and batch dispatch for finalized results"""
+import base64
+import html
+import io
+import os
+import string
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
+
+import result_versions
+import units
+
+try:
+    from weasyprint import HTML as _WeasyHTML
+except ImportError:
+    _WeasyHTML = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(APP_DIR, 'report_templates')
+ASSET_DIR = os.path.join(APP_DIR, 'assets')
+DEFAULT_OUTPUT_DIR = os.path.join(APP_DIR, 'generated_reports')
+
+LAB_INFO = {
+    'lab_name': 'QuXAT Laboratory',
+    'lab_address': 'NABL Accredited Clinical Laboratory',
+    'letterhead': 'letterhead.svg'
+}
+
+FLAG_LABELS = {
+    'normal': 'Normal',
+    'high': 'High',
+    'low': 'Low',
+    'critical_high': 'Critical High',
+    'critical_low': 'Critical Low',
+    'abnormal': 'Abnormal'
+}
+
+PDF_AVAILABLE = _WeasyHTML is not None
+
+
+@lru_cache(maxsize=None)
+def load_template(name):
+    """Load and compile a report template once per process"""
+    with open(os.path.join(TEMPLATE_DIR, name), encoding='utf-8') as f:
+        return string.Template(f.read())
+
+
+@lru_cache(maxsize=None)
+def load_asset_data_uri(name):
+    """Load a letterhead asset once per process as an inline data URI"""
+    path = os.path.join(ASSET_DIR, name)
+    mime = 'image/svg+xml' if name.endswith('.svg') else 'image/png'
+    with open(path, 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode('ascii')
+    return f"data:{mime};base64,{encoded}"
+
+
+def _escape(value):
+    return html.escape('' if value is None else str(value))
+
+
+def render_amendments(result):
+    """Amendment history section of a report, empty for unamended results"""
+    history = result_versions.amendment_history(result)
+    if not history:
+        return ''
+    row_template = load_template('amendment_row.html')
+    rows = ''.join(
+        row_template.substitute(
+            version=row['version'],
+            parameter=_escape(row['parameter']),
+            field=_escape(row['field']),
+            before=_escape(row['before']),
+            after=_escape(row['after']),
+            reason=_escape(row['reason']),
+            amended_by=_escape(row['amendedBy']),
+            amended_at=_escape(str(row['amendedAt'])[:16].replace('T', ' '))
+        )
+        for row in history
+    )
+    return (
+        f"<h4>Amendments (version {result_versions.current_version(result)})</h4>\n"
+        '<table class="amendments">\n'
+        '  <tr><th>Version</th><th>Parameter</th><th>Field</th><th>Before</th><th>After</th>'
+        '<th>Reason</th><th>Amended</th></tr>\n'
+        f"{rows}</table>"
+    )
+
+
+def render_patient_report(result, lab_info=None, si_values=None):
+    """Render a single finalized result as an HTML report"""
+    lab_info = lab_info or LAB_INFO
+    row_template = load_template('result_row.html')
+
+    test_values = result.get('testValues', [])
+    if si_values is None:
+        si_values = units.dual_report_values(test_values)
+
+    rows = []
+    for test_value, (si_value, si_unit) in zip(test_values, si_values):
+        flag = test_value.get('flag', 'normal') or 'normal'
+        rows.append(row_template.substitute(
+            parameter=_escape(test_value.get('parameter')),
+            value=_escape(test_value.get('value')),
+            unit=_escape(test_value.get('unit')),
+            si_value=_escape(si_value),
+            si_unit=_escape(si_unit),
+            reference_range=_escape(test_value.get('referenceRange')),
+            flag=_escape(flag),
+            flag_label=_escape(FLAG_LABELS.get(flag, flag.title()))
+        ))
+
+    test_name = result.get('testName') or str(result.get('testType', '')).replace('_', ' ').title()
+    return load_template('patient_report.html').substitute(
+        letterhead=load_asset_data_uri(lab_info['letterhead']),
+        lab_name=_escape(lab_info['lab_name']),
+        lab_address=_escape(lab_info['lab_address']),
+        result_id=_escape(result.get('resultId')),
+        patient_name=_escape(result.get('patientName')),
+        patient_id=_escape(result.get('patient')),
+        test_name=_escape(test_name),
+        test_id=_escape(result.get('test')),
+        collection_date=_escape(result.get('collectionDate')),
+        status=_escape(str(result.get('status', '')).replace('_', ' ').title()),
+        rows=''.join(rows),
+        interpretation=_escape(result.get('interpretation') or '-'),
+        recommendations=_escape(result.get('recommendations') or '-'),
+        amendments=render_amendments(result),
+        performed_by=_escape(result.get('performedBy')),
+        generated_at=datetime.now().strftime('%Y-%m-%d %H:%M')
+    )
+
+
+def render_panel_library_report(panels, lab_info=None):
+    """Render the test panel library as an HTML report"""
+    lab_info = lab_info or LAB_INFO
+    row_template = load_template('panel_row.html')
+    rows = [
+        row_template.substitute(
+            test_code=_escape(panel.get('test_code')),
+            test_name=_escape(panel.get('test_name')),
+            category=_escape(panel.get('category')),
+            sample_type=_escape(panel.get('sample_type')),
+            test_method=_escape(panel.get('test_method')),
+            parameter_count=len(panel.get('parameters', [])),
+            test_cost=f"{float(panel.get('test_cost', 0) or 0):.2f}",
+            status=_escape(str(panel.get('status', '')).title())
+        )
+        for panel in panels
+    ]
+    return load_template('panel_library.html').substitute(
+        letterhead=load_asset_data_uri(lab_info['letterhead']),
+        lab_name=_escape(lab_info['lab_name']),
+        panel_count=len(panels),
+        rows=''.join(rows),
+        generated_at=datetime.now().strftime('%Y-%m-%d %H:%M')
+    )
+
+
+def html_to_pdf(report_html):
+    """Convert a rendered HTML report to PDF bytes (requires weasyprint)"""
+    if not PDF_AVAILABLE:
+        raise RuntimeError("PDF output requires the 'weasyprint' package")
+    return _WeasyHTML(string=report_html, base_url=APP_DIR).write_pdf()
+
+
+def write_report(result, output_dir, fmt='html', si_values=None):
+    """Render a result and write it to output_dir, returning the file path"""
+    report_html = render_patient_report(result, si_values=si_values)
+    file_name = f"{result.get('resultId') or result.get('test')}.{fmt}"
+    path = os.path.join(output_dir, file_name)
+    if fmt == 'pdf':
+        with open(path, 'wb') as f:
+            f.write(html_to_pdf(report_html))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(report_html)
+    return path
+
+
+def _warm_worker():
+    """Compile templates and load assets once when a worker process starts"""
+    for name in ('patient_report.html', 'result_row.html', 'amendment_row.html'):
+        load_template(name)
+    load_asset_data_uri(LAB_INFO['letterhead'])
+
+
+def _render_chunk(results, output_dir, fmt):
+    """Render a chunk of results inside a worker process"""
+    # Convert the SI columns of the whole chunk in one pass
+    all_values = [v for result in results for v in result.get('testValues', [])]
+    si_values = units.dual_report_values(all_values)
+
+    rendered, failed = [], []
+    offset = 0
+    for result in results:
+        count = len(result.get('testValues', []))
+        result_si, offset = si_values[offset:offset + count], offset + count
+        try:
+            rendered.append(write_report(result, output_dir, fmt, result_si))
+        except Exception as e:
+            failed.append({'resultId': result.get('resultId'), 'error': str(e)})
+    return rendered, failed
+
+
+class ReportBatchJob:
+    """Progress of a background batch of patient reports"""
+
+    def __init__(self, total, output_dir, fmt):
+        self.id = uuid.uuid4().hex[:12]
+        self.total = total
+        self.output_dir = output_dir
+        self.format = fmt
+        self.completed = 0
+        self.files = []
+        self.errors = []
+        self.status = 'queued'
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def progress(self):
+        return 1.0 if not self.total else min(1.0, (self.completed + len(self.errors)) / self.total)
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed')
+
+    def record(self, files, errors):
+        with self._lock:
+            self.files.extend(files)
+            self.completed += len(files)
+            self.errors.extend(errors)
+
+    def zip_bytes(self):
+        """Bundle the rendered reports into an in-memory zip archive"""
+        buffer = io.BytesIO()
+        with self._lock:
+            files = list(self.files)
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for path in files:
+                archive.write(path, os.path.basename(path))
+        return buffer.getvalue()
+
+
+_JOBS = {}
+_JOBS_LOCK = threading.Lock()
+MAX_FINISHED_JOBS = 20
+
+
+def _evict_finished_jobs():
+    """Drop the oldest finished jobs beyond MAX_FINISHED_JOBS; caller holds _JOBS_LOCK"""
+    finished = [job_id for job_id, job in _JOBS.items() if job.done]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _JOBS[job_id]
+
+
+def get_batch_job(job_id):
+    """Look up a batch job started in this process"""
+    with _JOBS_LOCK:
+        return _JOBS.get(job_id)
+
+
+def _run_batch(job, results, workers, chunk_size):
+    job.status = 'running'
+    job.started_at = datetime.now()
+    try:
+        chunks = [results[i:i + chunk_size] for i in range(0, len(results), chunk_size)]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_warm_worker
+        ) as pool:
+            futures = [pool.submit(_render_chunk, chunk, job.output_dir, job.format) for chunk in chunks]
+            for future in as_completed(futures):
+                job.record(*future.result())
+        job.status = 'completed'
+    except Exception as e:
+        job.errors.append({'resultId': None, 'error': str(e)})
+        job.status = 'failed'
+    finally:
+        job.finished_at = datetime.now()
+
+
+def start_batch_job(results, output_dir=None, fmt='html', workers=None, chunk_size=50):
+    """Render many reports on a process pool without blocking the caller"""
+    if fmt == 'pdf' and not PDF_AVAILABLE:
+        raise RuntimeError("PDF output requires the 'weasyprint' package")
+
+    job = ReportBatchJob(len(results), None, fmt)
+    # The job id keeps batches started within the same second apart
+    job.output_dir = os.path.join(output_dir or DEFAULT_OUTPUT_DIR, f"{datetime.now():%Y%m%d_%H%M%S}_{job.id}")
+    os.makedirs(job.output_dir, exist_ok=True)
+
+    with _JOBS_LOCK:
+        _evict_finished_jobs()
+        _JOBS[job.id] = job
+
+    workers = workers or max(1, min(os.cpu_count() or 1, 8))
+    thread = threading.Thread(
+        target=_run_batch,
+        args=(job, list(results), workers, chunk_size),
+        name=f"report-batch-{job.id}",
+        daemon=True
+    )
+    thread.start()
+    return job
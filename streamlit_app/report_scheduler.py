@@ -0,0 +1,467 @@
+"""Lab reports computed off the request path, cached, and run on a schedule
+
+Reports (REPORTS) are pandas summaries of the shared store: test volume,
+turnaround time, critical values, revenue and QC, and the daily and weekly
+summaries built from them. They run on a small thread pool, so at most
+LIS_REPORT_WORKERS are computed at once and a page waits at most
+REPORT_WAIT_SECONDS before showing the report as still generating; when
+LIS_REPORT_QUEUE reports are already waiting, new requests are turned away
+rather than queued without bound. The same report requested again while it
+runs joins the run in progress.
+
+Outputs are cached by report type, parameters and the versions of the
+collections the report reads, so repeated views are served from the cache
+and any change to those collections makes the next view recompute.
+
+Schedules (daily, weekly, monthly or quarterly at a set time) are kept in
+the shared store. The scheduler thread runs each due schedule over the
+period that just ended and writes its sections as CSV or HTML files under
+LIS_REPORT_DIR. Workers sharing a cache backend claim each run through a
+backend sequence, so a run happens once however many workers are up. Set
+LIS_REPORT_SCHEDULER=0 in the app and run the scheduler as a sidecar on the
+same LIS_CACHE_BACKEND instead:
+
+    python report_scheduler.py
+
+    LIS_REPORT_WORKERS=2       (reports computed at once)
+    LIS_REPORT_QUEUE=16        (reports waiting before requests are turned away)
+    LIS_REPORT_SCHEDULER=1     (run schedules in the app process; 0 when a sidecar does)
+    LIS_REPORT_DIR=generated_reports/scheduled
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import billing
+import instrumentation
+import shared_state
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT_WORKERS = int(os.environ.get('LIS_REPORT_WORKERS', '2'))
+REPORT_QUEUE = int(os.environ.get('LIS_REPORT_QUEUE', '16'))
+SCHEDULER_ENABLED = os.environ.get('LIS_REPORT_SCHEDULER', '1') != '0'
+REPORT_DIR = os.environ.get('LIS_REPORT_DIR', os.path.join(APP_DIR, 'generated_reports', 'scheduled'))
+REPORT_WAIT_SECONDS = 1.5
+CACHE_SIZE = 64
+SCHEDULER_TICK = 30
+
+FINAL_STATUSES = ('approved', 'amended')
+CRITICAL_FLAGS = ('critical_high', 'critical_low')
+FREQUENCIES = ['daily', 'weekly', 'monthly', 'quarterly']
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+FORMATS = ['csv', 'html']
+
+
+def _in_range(column, date_from, date_to):
+    days = column.astype(str).str[:10]
+    return (days >= str(date_from)) & (days <= str(date_to))
+
+
+def tests_frame(store, date_from, date_to):
+    """Worklist tests collected in the period"""
+    frame = pd.DataFrame(
+        [(t.get('testId'), t.get('testCode'), t.get('category') or 'other', t.get('priority') or 'routine',
+          t.get('status'), str(t.get('collectionDate') or '')[:10]) for t in store.worklist.snapshot()],
+        columns=['testId', 'testCode', 'category', 'priority', 'status', 'collectionDate']
+    )
+    return frame[_in_range(frame['collectionDate'], date_from, date_to)]
+
+
+def results_frame(store, date_from, date_to):
+    """Results finalized in the period, with their test's category and priority and the turnaround in hours"""
+    rows = []
+    for result in store.results.snapshot():
+        if result.get('status') not in FINAL_STATUSES:
+            continue
+        test = store.worklist.get(result.get('test')) or {}
+        collected = f"{result.get('collectionDate') or test.get('collectionDate') or ''}"[:10]
+        if test.get('collectionTime'):
+            collected = f"{collected}T{test['collectionTime']}"
+        rows.append((result['resultId'], result.get('testName') or result.get('testType'),
+                     test.get('category') or result.get('category') or 'other', test.get('priority') or 'routine',
+                     collected, result.get('approvedAt') or result.get('savedAt')))
+    frame = pd.DataFrame(rows, columns=['resultId', 'testName', 'category', 'priority', 'collectedAt',
+                                        'finalizedAt'])
+    frame = frame[_in_range(frame['finalizedAt'], date_from, date_to)].copy()
+    hours = (pd.to_datetime(frame['finalizedAt'], errors='coerce', format='mixed')
+             - pd.to_datetime(frame['collectedAt'], errors='coerce', format='mixed')).dt.total_seconds() / 3600
+    frame['tatHours'] = hours.where(hours >= 0)
+    return frame
+
+
+def test_volume(store, params):
+    """Tests received by day (or category, status, priority) and category"""
+    tests = tests_frame(store, params['dateFrom'], params['dateTo'])
+    group_by = params.get('groupBy', 'day')
+    column = 'collectionDate' if group_by == 'day' else group_by
+    if column == 'category':
+        # Already one row per category; nothing to spread across columns
+        table = tests.groupby('category')[['testId']].count().rename(columns={'testId': 'total'})
+    else:
+        table = tests.pivot_table(index=column, columns='category', values='testId', aggfunc='count', fill_value=0)
+        table['total'] = table.sum(axis=1)
+    return {'Test volume': table.reset_index().rename(columns={'collectionDate': 'day'})}
+
+
+def turnaround_time(store, params):
+    """Collection-to-approval turnaround by category and priority"""
+    results = results_frame(store, params['dateFrom'], params['dateTo']).dropna(subset=['tatHours'])
+    grouped = results.groupby(['category', 'priority'])['tatHours']
+    table = pd.DataFrame({
+        'results': grouped.size(),
+        'medianHours': grouped.median().round(1),
+        'p90Hours': grouped.quantile(0.9).round(1)
+    })
+    return {'Turnaround time': table.reset_index()}
+
+
+def critical_values(store, params):
+    """Critical values among results finalized in the period"""
+    final = set(results_frame(store, params['dateFrom'], params['dateTo'])['resultId'])
+    rows = [
+        {'resultId': result['resultId'], 'patient': result.get('patientName') or result.get('patient'),
+         'test': result.get('testName') or result.get('testType'), 'parameter': value.get('parameter'),
+         'value': value.get('value'), 'unit': value.get('unit'), 'flag': value.get('flag'),
+         'approvedAt': result.get('approvedAt')}
+        for result in store.results.snapshot() if result['resultId'] in final
+        for value in result.get('testValues', []) if value.get('flag') in CRITICAL_FLAGS
+    ]
+    return {'Critical values': pd.DataFrame(rows, columns=['resultId', 'patient', 'test', 'parameter', 'value',
+                                                            'unit', 'flag', 'approvedAt'])}
+
+
+def revenue(store, params):
+    """Invoiced revenue for tests collected in the period"""
+    lines = billing.get_invoice_lines(store.invoices)
+    lines = lines[_in_range(lines['collectionDate'], params['dateFrom'], params['dateTo'])]
+    return {'Revenue': billing.revenue_rollup(lines, params.get('groupBy') or 'category')}
+
+
+def quality_control(store, params):
+    """QC runs by reagent lot and outcome"""
+    runs = pd.DataFrame(list(store.qc_runs.snapshot()),
+                        columns=['qcRunId', 'lotId', 'reagentId', 'testCode', 'level', 'outcome', 'runAt'])
+    runs = runs[_in_range(runs['runAt'], params['dateFrom'], params['dateTo'])]
+    table = runs.pivot_table(index=['reagentId', 'lotId'], columns='outcome', values='qcRunId', aggfunc='count',
+                             fill_value=0)
+    return {'Quality control': table.reset_index()}
+
+
+def _summary(store, params):
+    results = results_frame(store, params['dateFrom'], params['dateTo'])
+    tests = tests_frame(store, params['dateFrom'], params['dateTo'])
+    overview = pd.DataFrame([
+        {'measure': 'Tests received', 'value': len(tests)},
+        {'measure': 'Tests completed', 'value': int((tests['status'] == 'completed').sum())},
+        {'measure': 'Results finalized', 'value': len(results)},
+        {'measure': 'Median turnaround (h)', 'value': round(results['tatHours'].median(), 1)
+         if results['tatHours'].notna().any() else None},
+    ])
+    return {
+        'Overview': overview,
+        **test_volume(store, {**params, 'groupBy': 'day'}),
+        **turnaround_time(store, params),
+        **critical_values(store, params)
+    }
+
+
+REPORTS = {
+    'daily-summary': {'title': "Daily Report", 'build': _summary, 'reads': ('worklist', 'results')},
+    'weekly-summary': {'title': "Weekly Summary", 'build': _summary, 'reads': ('worklist', 'results')},
+    'test-volume': {'title': "Test Volume", 'build': test_volume, 'reads': ('worklist',)},
+    'turnaround-time': {'title': "Turnaround Time", 'build': turnaround_time, 'reads': ('worklist', 'results')},
+    'critical-values': {'title': "Critical Values", 'build': critical_values, 'reads': ('worklist', 'results')},
+    'revenue': {'title': "Revenue", 'build': revenue, 'reads': ('invoices',)},
+    'quality-control': {'title': "Quality Control", 'build': quality_control, 'reads': ('qc_runs',)},
+}
+GROUP_BY = {'test-volume': ['day', 'category', 'status', 'priority'], 'revenue': ['category', 'payer', 'testName']}
+
+
+def period(frequency, today=None):
+    """(dateFrom, dateTo) of the period a report run on today covers: the day, week, month or quarter just ended"""
+    today = today or date.today()
+    if frequency == 'daily':
+        start = end = today - timedelta(days=1)
+    elif frequency == 'weekly':
+        start, end = today - timedelta(days=7), today - timedelta(days=1)
+    elif frequency == 'monthly':
+        end = today.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+    else:
+        first_month = (today.month - 1) // 3 * 3 + 1
+        end = today.replace(month=first_month, day=1) - timedelta(days=1)
+        start = end.replace(month=(end.month - 1) // 3 * 3 + 1, day=1)
+    return str(start), str(end)
+
+
+def next_run(schedule, after):
+    """First scheduled time strictly after a datetime"""
+    hour, minute = (int(part) for part in schedule.get('time', '06:00').split(':'))
+    at = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    frequency = schedule['frequency']
+    if frequency == 'daily':
+        return at if at > after else at + timedelta(days=1)
+    if frequency == 'weekly':
+        at += timedelta(days=(schedule.get('weekday', 0) - at.weekday()) % 7)
+        return at if at > after else at + timedelta(days=7)
+    months = range(1, 13) if frequency == 'monthly' else (1, 4, 7, 10)
+    day = min(int(schedule.get('day', 1)), 28)
+    year, month = at.year, at.month
+    while True:
+        if month in months:
+            candidate = at.replace(year=year, month=month, day=day)
+            if candidate > after:
+                return candidate
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class ReportOutput:
+    """A computed report: sections of tables, when and how fast it was built"""
+
+    def __init__(self, report_type, params, sections, seconds):
+        self.report_type = report_type
+        self.params = params
+        self.sections = sections
+        self.seconds = seconds
+        self.generated_at = datetime.now()
+
+    def to_csv(self):
+        """Every section in one CSV document, each under a '# title' line"""
+        return "\n".join(f"# {title}\n{frame.to_csv(index=False)}" for title, frame in self.sections.items())
+
+    def write(self, directory, stem, fmt='csv'):
+        """Write each section to a file; returns the paths"""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for title, frame in self.sections.items():
+            path = os.path.join(directory, f"{stem}_{title.lower().replace(' ', '_')}.{fmt}")
+            if fmt == 'html':
+                frame.to_html(path, index=False)
+            else:
+                frame.to_csv(path, index=False)
+            paths.append(path)
+        return paths
+
+
+class ReportService:
+    """Reports computed on a bounded thread pool, cached by parameters and data version"""
+
+    def __init__(self, store, workers=REPORT_WORKERS, max_queued=REPORT_QUEUE, cache_size=CACHE_SIZE):
+        self.store = store
+        self.max_queued = max_queued
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lis-report')
+        self._cache = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def key(self, report_type, params):
+        """Cache key: report, parameters and the versions of the collections it reads"""
+        versions = tuple(getattr(self.store, name).version for name in REPORTS[report_type]['reads'])
+        return report_type, json.dumps(params, sort_keys=True, default=str), id(self.store), versions
+
+    def cached(self, report_type, params):
+        key = self.key(report_type, params)
+        with self._lock:
+            output = self._cache.get(key)
+            if output is not None:
+                self._cache.move_to_end(key)
+        return output
+
+    def submit(self, report_type, params):
+        """Future of the report, joining a run already in progress; None when too many are waiting"""
+        key = self.key(report_type, params)
+        with self._lock:
+            output = self._cache.get(key)
+            if output is not None:
+                self._cache.move_to_end(key)
+                future = Future()
+                future.set_result(output)
+                return future
+            future = self._running.get(key)
+            if future is not None:
+                return future
+            if len(self._running) >= self.max_queued:
+                instrumentation.REGISTRY.increment('reports_rejected')
+                return None
+            instrumentation.REGISTRY.increment('report_cache_misses')
+            future = self._running[key] = self._pool.submit(self._build, key, report_type, params)
+            return future
+
+    def _build(self, key, report_type, params):
+        try:
+            began = time.perf_counter()
+            with instrumentation.timer(report_type, 'report'):
+                sections = REPORTS[report_type]['build'](self.store, params)
+            output = ReportOutput(report_type, params, sections, time.perf_counter() - began)
+            with self._lock:
+                self._cache[key] = output
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return output
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+
+    def request(self, report_type, params, wait=REPORT_WAIT_SECONDS):
+        """(output, future) for a page: the output when cached or ready within wait, else the pending future
+
+        Both are None when the pool's queue is full.
+        """
+        output = self.cached(report_type, params)
+        if output is not None:
+            instrumentation.REGISTRY.increment('report_cache_hits')
+            return output, None
+        future = self.submit(report_type, params)
+        if future is None:
+            return None, None
+        try:
+            return future.result(timeout=wait), None
+        except TimeoutError:
+            return None, future
+
+    def run(self, report_type, params):
+        """Compute (or fetch) a report, waiting for it"""
+        output, future = self.request(report_type, params, wait=None)
+        if output is None and future is None:
+            raise RuntimeError("Too many reports are waiting; try again shortly")
+        return output
+
+    def running(self):
+        with self._lock:
+            return len(self._running)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ReportScheduler:
+    """Runs the store's report schedules when they fall due"""
+
+    def __init__(self, service, output_dir=REPORT_DIR, tick=SCHEDULER_TICK):
+        self.service = service
+        self.store = service.store
+        self.output_dir = output_dir
+        self.tick = tick
+        self._stop = threading.Event()
+        self._thread = None
+
+    def due(self, now=None):
+        """(schedule, scheduled time) of each active schedule whose next run has passed"""
+        now = now or datetime.now()
+        due = []
+        for schedule in self.store.report_schedules.snapshot():
+            if not schedule.get('isActive', True):
+                continue
+            anchor = datetime.fromisoformat(schedule.get('lastRun') or schedule['createdAt'])
+            slot = next_run(schedule, anchor)
+            if slot <= now:
+                due.append((schedule, slot))
+        return due
+
+    def run_schedule(self, schedule, slot=None):
+        """Run a schedule over the period just ended and write its files; returns the paths"""
+        slot = slot or datetime.now()
+        params = {**schedule.get('parameters', {})}
+        params['dateFrom'], params['dateTo'] = period(schedule['frequency'], slot.date())
+        try:
+            output = self.service.run(schedule['reportType'], params)
+            paths = output.write(os.path.join(self.output_dir, schedule['scheduleId']),
+                                 f"{schedule['reportType']}_{params['dateFrom']}_{params['dateTo']}",
+                                 schedule.get('format', 'csv'))
+            changes = {'lastStatus': 'completed', 'lastOutput': paths, 'lastError': None}
+        except Exception as e:
+            paths = []
+            changes = {'lastStatus': 'failed', 'lastError': str(e)}
+        self.store.update_report_schedule(schedule['scheduleId'], {**changes, 'lastRun': datetime.now().isoformat()})
+        return paths
+
+    def run_in_background(self, schedule):
+        """Run a schedule now without blocking the caller"""
+        threading.Thread(target=self.run_schedule, args=(schedule,), name="lis-report-run", daemon=True).start()
+
+    def run_due(self, now=None):
+        """Run every due schedule this worker claims; returns how many ran"""
+        ran = 0
+        for schedule, slot in self.due(now):
+            # First worker to advance the schedule's last claimed slot to this one runs it
+            if not self.store.backend.advance(f"report-run:{schedule['scheduleId']}", int(f"{slot:%Y%m%d%H%M}")):
+                continue
+            self.run_schedule(schedule, slot)
+            ran += 1
+        return ran
+
+    def start(self):
+        if self._thread is None and self.tick > 0:
+            self._thread = threading.Thread(target=self._run, name="lis-report-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.run_due()
+            except Exception:
+                # Keep scheduling; a failed schedule is retried on its next run
+                traceback.print_exc()
+
+    def stop(self):
+        self._stop.set()
+
+
+_SERVICE = None
+_SCHEDULER = None
+_SERVICE_LOCK = threading.Lock()
+
+
+def get_report_service(store):
+    """Process-wide report service for the shared store, with its scheduler unless a sidecar runs it"""
+    global _SERVICE, _SCHEDULER
+    with _SERVICE_LOCK:
+        if _SERVICE is None or _SERVICE.store is not store:
+            if _SERVICE is not None:
+                _SERVICE.shutdown()
+                _SCHEDULER.stop()
+            _SERVICE = ReportService(store)
+            _SCHEDULER = ReportScheduler(_SERVICE)
+            if SCHEDULER_ENABLED:
+                _SCHEDULER.start()
+        return _SERVICE
+
+
+def get_scheduler(store):
+    get_report_service(store)
+    return _SCHEDULER
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuXAT LIS report scheduler sidecar")
+    parser.add_argument('--once', action='store_true', help="Run the schedules due now and exit")
+    parser.add_argument('--tick', type=float, default=SCHEDULER_TICK)
+    args = parser.parse_args(argv)
+
+    scheduler = ReportScheduler(ReportService(shared_state.get_store()), tick=args.tick)
+    if args.once:
+        print(f"{scheduler.run_due()} scheduled report(s) run")
+        return 0
+    print(f"Report scheduler running every {args.tick:g}s; writing to {scheduler.output_dir}")
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Versioned result amendments stored as compact deltas
+
+A result always holds its latest version in full. Each amendment appends one
+entry to result['amendments'] carrying only what changed between the version
+before it and the version it created:
+
+    {'changed': {parameter: {field: [old, new]}},
+     'added':   {parameter: [index, entry]},
+     'removed': {parameter: [index, entry]},
+     'fields':  {'interpretation': [old, new], ...}}
+
+Because every change keeps both sides, a delta can be applied forwards or
+backwards. Older versions are rebuilt by walking back from the latest one;
+every KEYFRAME_INTERVAL amendments also store the full prior version so no
+reconstruction walks more than that many deltas.
+"""
+import copy
+from datetime import datetime
+
+VERSIONED_FIELDS = ('interpretation', 'recommendations')
+KEYFRAME_INTERVAL = 8
+
+
+def _by_parameter(test_values):
+    return {v.get('parameter'): (i, v) for i, v in enumerate(test_values)}
+
+
+def diff_values(old_values, new_values):
+    """Delta between two testValues lists, matched by parameter"""
+    old_index, new_index = _by_parameter(old_values), _by_parameter(new_values)
+    changed, added, removed = {}, {}, {}
+    for parameter, (i, old) in old_index.items():
+        if parameter not in new_index:
+            removed[parameter] = [i, old]
+            continue
+        new = new_index[parameter][1]
+        fields = {f: [old.get(f), new.get(f)] for f in sorted(set(old) | set(new)) if old.get(f) != new.get(f)}
+        if fields:
+            changed[parameter] = fields
+    for parameter, (i, new) in new_index.items():
+        if parameter not in old_index:
+            added[parameter] = [i, new]
+    return {k: v for k, v in (('changed', changed), ('added', added), ('removed', removed)) if v}
+
+
+def diff_state(old, new):
+    """Delta between two versions (testValues plus the free-text fields)"""
+    delta = diff_values(old.get('testValues', []), new.get('testValues', []))
+    fields = {f: [old.get(f), new.get(f)] for f in VERSIONED_FIELDS if old.get(f) != new.get(f)}
+    if fields:
+        delta['fields'] = fields
+    return delta
+
+
+def version_state(result):
+    """The versioned part of a result"""
+    state = {f: result.get(f) for f in VERSIONED_FIELDS}
+    state['testValues'] = copy.deepcopy(result.get('testValues', []))
+    return state
+
+
+def apply_delta(state, delta, reverse=False):
+    """Apply a delta to a version state in place; reverse=True undoes it"""
+    side = 0 if reverse else 1
+    drop, insert = ('added', 'removed') if reverse else ('removed', 'added')
+
+    values = [v for v in state['testValues'] if v.get('parameter') not in delta.get(drop, {})]
+    for parameter, fields in delta.get('changed', {}).items():
+        for value in values:
+            if value.get('parameter') == parameter:
+                for field, pair in fields.items():
+                    if pair[side] is None:
+                        value.pop(field, None)
+                    else:
+                        value[field] = pair[side]
+                break
+    for index, entry in sorted(delta.get(insert, {}).values(), key=lambda item: item[0]):
+        values.insert(index, copy.deepcopy(entry))
+    state['testValues'] = values
+
+    for field, pair in delta.get('fields', {}).items():
+        state[field] = pair[side]
+    return state
+
+
+def current_version(result):
+    return result.get('version', 1)
+
+
+def amend(result, test_values, reason, user, interpretation=None, recommendations=None, amended_at=None):
+    """Changes that record an amendment of result, or None if nothing changed
+
+    The returned dict is meant for SharedStore.update_result.
+    """
+    old = version_state(result)
+    new = {
+        'testValues': test_values,
+        'interpretation': old['interpretation'] if interpretation is None else interpretation,
+        'recommendations': old['recommendations'] if recommendations is None else recommendations
+    }
+    delta = diff_state(old, new)
+    if not delta:
+        return None
+
+    amended_at = amended_at or datetime.now().isoformat()
+    version = current_version(result) + 1
+    amendments = list(result.get('amendments', []))
+    entry = {
+        'version': version,
+        'amendedAt': amended_at,
+        'amendedBy': user,
+        'reason': reason,
+        'previousStatus': result.get('status'),
+        'delta': delta
+    }
+    if len(amendments) % KEYFRAME_INTERVAL == KEYFRAME_INTERVAL - 1:
+        entry['snapshot'] = old
+    amendments.append(entry)
+
+    return {
+        'testValues': test_values,
+        'interpretation': new['interpretation'],
+        'recommendations': new['recommendations'],
+        'status': 'amended',
+        'version': version,
+        'amendments': amendments,
+        'amendedAt': amended_at,
+        'amendedBy': user
+    }
+
+
+def reconstruct(result, version):
+    """Rebuild the versioned fields of a result as they were at version"""
+    latest = current_version(result)
+    if not 1 <= version <= latest:
+        raise ValueError(f"Result {result.get('resultId')} has no version {version}")
+
+    # amendments[i] turns version i + 1 into version i + 2; start from the
+    # nearest keyframe above the target, else from the latest version
+    amendments = result.get('amendments', [])
+    start, state = len(amendments), None
+    for i in range(version - 1, len(amendments)):
+        if 'snapshot' in amendments[i]:
+            start, state = i, copy.deepcopy(amendments[i]['snapshot'])
+            break
+    if state is None:
+        state = version_state(result)
+    for entry in reversed(amendments[version - 1:start]):
+        state = apply_delta(state, entry['delta'], reverse=True)
+    return state
+
+
+def version_diff(result, from_version, to_version):
+    """Field-level rows describing how two versions of a result differ"""
+    delta = diff_state(reconstruct(result, from_version), reconstruct(result, to_version))
+    return delta_rows(delta)
+
+
+def delta_rows(delta):
+    """Flatten a delta into {parameter, field, before, after} rows"""
+    rows = []
+    for parameter, fields in delta.get('changed', {}).items():
+        for field, (before, after) in fields.items():
+            rows.append({'parameter': parameter, 'field': field, 'before': before, 'after': after})
+    for parameter, (_, entry) in delta.get('added', {}).items():
+        rows.append({'parameter': parameter, 'field': 'value', 'before': None, 'after': entry.get('value')})
+    for parameter, (_, entry) in delta.get('removed', {}).items():
+        rows.append({'parameter': parameter, 'field': 'value', 'before': entry.get('value'), 'after': None})
+    for field, (before, after) in delta.get('fields', {}).items():
+        rows.append({'parameter': '', 'field': field, 'before': before, 'after': after})
+    return rows
+
+
+def amendment_history(result):
+    """One row per change of every amendment, oldest first"""
+    return [
+        {'version': entry['version'], 'amendedAt': entry['amendedAt'], 'amendedBy': entry['amendedBy'],
+         'reason': entry['reason'], **row}
+        for entry in result.get('amendments', [])
+        for row in delta_rows(entry['delta'])
+    ]
+
+
+def backend_amendments(delta, reason):
+    """Delta rows in the shape POST /results/:id/amend validates"""
+    return [
+        {'parameter': row['parameter'] or row['field'], 'originalValue': row['before'],
+         'newValue': row['after'], 'reason': reason}
+        for row in delta_rows(delta)
+        if row['field'] == 'value' or row['field'] in VERSIONED_FIELDS
+    ]
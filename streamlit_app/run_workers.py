@@ -0,0 +1,58 @@
+"""Launch several Streamlit workers that share one cache backend
+
+    python run_workers.py --workers 4 --base-port 8501 --backend sqlite:///lis_cache.db
+
+Put a sticky load balancer in front of the workers (see deploy/nginx.conf);
+Streamlit sessions hold a websocket, so each browser must stay on one worker.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run multiple QuXAT LIS Streamlit workers")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--base-port', type=int, default=8501)
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--backend', default=os.environ.get('LIS_CACHE_BACKEND', 'sqlite:///lis_cache.db'),
+                        help="Shared cache backend URL (sqlite:///path or redis://host:port/db)")
+    args = parser.parse_args(argv)
+
+    if args.backend in ('memory', 'inprocess'):
+        parser.error("workers need a shared backend (sqlite:/// or redis://)")
+
+    env = dict(os.environ, LIS_CACHE_BACKEND=args.backend)
+    workers = []
+    for i in range(args.workers):
+        port = args.base_port + i
+        workers.append(subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', 'app.py',
+             '--server.port', str(port),
+             '--server.address', args.address,
+             '--server.headless', 'true'],
+            cwd=APP_DIR,
+            env=env
+        ))
+        print(f"Worker {i + 1} on http://{args.address}:{port}")
+
+    print(f"Shared backend: {args.backend}")
+    try:
+        while all(worker.poll() is None for worker in workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,502 @@
+"""Process-wide shared lab state with copy-on-write snapshots
+
+The worklist, test panels, saved results and catalog are shared by every
+Streamlit session in the process; sessions only keep their own filters and
+selections. Readers take an immutable tuple snapshot without locking, and
+writers swap in a new tuple under a lock, so a page that is iterating a
+snapshot never sees a half-applied change. Records inside a snapshot are
+shared and must be treated as read-only: changes go through the store so
+they are copied on write.
+
+Writes are also passed to the configured cache backend (see cache_backend.py)
+so that several worker processes can share the same collections.
+"""
+import threading
+from collections import deque
+
+from cache_backend import create_backend
+from inventory import CONSUMPTION, FINAL_STATUSES, ReagentInventory, evaluate_qc
+from panel_stats import PanelStatistics
+from records import compact
+from surveillance import SurveillanceCube
+
+# Writes remembered per collection for changed_since
+JOURNAL_SIZE = 256
+
+
+class SharedCollection:
+    """Thread-safe list of dict records keyed by an id field"""
+
+    def __init__(self, name, key, items=(), backend=None, record=None):
+        self.name = name
+        self.key = key
+        self.backend = backend
+        # Converts incoming records (e.g. to compact records); None stores them as given
+        self.record = record
+        self._lock = threading.RLock()
+        self._items = self._records(items)
+        self._by_id = {item[key]: item for item in self._items}
+        self._positions = {item[key]: i for i, item in enumerate(self._items)}
+        self.version = 0
+        # (version, ids written) of recent commits; None ids when every record may have changed
+        self._journal = deque(maxlen=JOURNAL_SIZE)
+
+    def _records(self, items):
+        return tuple(items) if self.record is None else tuple(map(self.record, items))
+
+    def snapshot(self):
+        """Immutable view of the current records"""
+        return self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, item_id):
+        return self._by_id.get(item_id)
+
+    def _commit(self, items, ids=None):
+        self._items = tuple(items)
+        self.version += 1
+        self._journal.append((self.version, ids))
+
+    def changed_since(self, version):
+        """(current version, ids of the records written or removed after version)
+
+        The ids are None when they are no longer known (version is None or too
+        old, or the collection was cleared); the caller then rescans it.
+        """
+        with self._lock:
+            if version == self.version:
+                return self.version, set()
+            if version is None or version > self.version or not self._journal \
+                    or self._journal[0][0] > version + 1:
+                return self.version, None
+            ids = set()
+            for written, changed in self._journal:
+                if written > version:
+                    if changed is None:
+                        return self.version, None
+                    ids.update(changed)
+            return self.version, ids
+
+    def reload(self, items):
+        """Replace every record with the backend's copy, returning what changed as (old, new) pairs
+
+        old is None for a record added elsewhere and new is None for one removed.
+        """
+        with self._lock:
+            items = self._records(items)
+            previous = self._by_id
+            self._by_id = {item[self.key]: item for item in items}
+            changed = [(previous.get(item_id), item) for item_id, item in self._by_id.items()
+                       if previous.get(item_id) != item]
+            changed.extend((item, None) for item_id, item in previous.items() if item_id not in self._by_id)
+            self._commit(items, [(new if new is not None else old)[self.key] for old, new in changed])
+            self._positions = {item[self.key]: i for i, item in enumerate(self._items)}
+            return changed
+
+    def merge(self, records):
+        """Apply the backend's copies of some records ({id: record}, None when removed), returning (old, new) pairs
+
+        An updated record keeps its position and a new one is appended, so the
+        rest of the collection is neither reloaded nor compared.
+        """
+        with self._lock:
+            items = list(self._items)
+            changed, removed = [], set()
+            for item_id, item in records.items():
+                old = self._by_id.get(item_id)
+                if item is None:
+                    if old is not None:
+                        del self._by_id[item_id]
+                        removed.add(item_id)
+                        changed.append((old, None))
+                    continue
+                item = item if self.record is None else self.record(item)
+                if item == old:
+                    continue
+                self._by_id[item_id] = item
+                if old is None:
+                    self._positions[item_id] = len(items)
+                    items.append(item)
+                else:
+                    items[self._positions[item_id]] = item
+                changed.append((old, item))
+            if removed:
+                items = [item for item in items if item[self.key] not in removed]
+            if changed:
+                self._commit(items, [(new if new is not None else old)[self.key] for old, new in changed])
+            if removed:
+                self._positions = {item[self.key]: i for i, item in enumerate(self._items)}
+            return changed
+
+    def append(self, item):
+        self.extend((item,))
+
+    def extend(self, items):
+        items = self._records(items)
+        with self._lock:
+            for position, item in enumerate(items, len(self._items)):
+                self._by_id[item[self.key]] = item
+                self._positions[item[self.key]] = position
+            self._commit(self._items + items, [item[self.key] for item in items])
+            if self.backend is not None and items:
+                self.backend.upsert(self.name, self.key, items)
+
+    def remove(self, item_id):
+        """Remove a record, returning it (or None when already gone)"""
+        with self._lock:
+            item = self._by_id.pop(item_id, None)
+            if item is not None:
+                self._commit((i for i in self._items if i[self.key] != item_id), [item_id])
+                self._positions = {i[self.key]: p for p, i in enumerate(self._items)}
+                if self.backend is not None:
+                    self.backend.delete(self.name, [item_id])
+            return item
+
+    def update(self, item_ids, changes):
+        """Replace matching records with updated copies, returning (old, new) pairs"""
+        return self.update_each({item_id: changes for item_id in item_ids})
+
+    def update_each(self, changes_by_id):
+        """Apply each record's own changes in one write, returning (old, new) pairs"""
+        if not changes_by_id:
+            return []
+        with self._lock:
+            # Copy the records once and replace the changed ones in place by position
+            positions = sorted(self._positions[i] for i in changes_by_id if i in self._positions)
+            items = list(self._items)
+            replaced = []
+            for position in positions:
+                item = items[position]
+                new_item = {**item, **changes_by_id[item[self.key]]}
+                new_item = items[position] = new_item if self.record is None else self.record(new_item)
+                self._by_id[new_item[self.key]] = new_item
+                replaced.append((item, new_item))
+            if replaced:
+                self._commit(items, [new[self.key] for _, new in replaced])
+                if self.backend is not None:
+                    self.backend.upsert(self.name, self.key, [new for _, new in replaced])
+            return replaced
+
+    def clear(self):
+        with self._lock:
+            self._by_id = {}
+            self._positions = {}
+            self._commit(())
+            if self.backend is not None:
+                self.backend.clear(self.name)
+
+
+class SharedStore:
+    """Catalog, patients, worklist, panels, results and reagent stock shared across sessions"""
+
+    def __init__(self, worklist=(), backend=None):
+        self._lock = threading.RLock()
+        self._catalog = None
+        self.backend = backend or create_backend('memory')
+        self.patients = self._open_collection('patients', 'patientId')
+        self.worklist = self._open_collection('worklist', 'testId', worklist, compact)
+        self.panels = self._open_collection('panels', 'id')
+        self.results = self._open_collection('results', 'resultId')
+        self.invoices = self._open_collection('invoices', 'invoiceId')
+        self.reagent_lots = self._open_collection('reagent_lots', 'lotId')
+        self.qc_runs = self._open_collection('qc_runs', 'qcRunId')
+        self.report_schedules = self._open_collection('report_schedules', 'scheduleId')
+        self.panel_stats = PanelStatistics(self.panels.snapshot())
+        self.surveillance = SurveillanceCube(self.results.snapshot(), self.worklist)
+        self.inventory = ReagentInventory(self.results.snapshot(), self.worklist, self.qc_runs.snapshot())
+        self._merged_panels_version = -1
+        if self.backend.shared:
+            self.backend.subscribe(self._invalidate)
+
+    def _open_collection(self, name, key, initial=(), record=None):
+        """Load a collection from the backend, seeding it on first use"""
+        stored = self.backend.load(name)
+        collection = SharedCollection(name, key, initial if stored is None else stored, self.backend, record)
+        if stored is None and initial:
+            self.backend.upsert(name, key, collection.snapshot())
+        return collection
+
+    def _invalidate(self, collection_name, version, ids=None):
+        """Refresh a collection another worker changed (None reloads everything)
+
+        When the backend names the records written (ids) only those are fetched
+        and merged; otherwise the whole collection is reloaded. Panel
+        statistics, the surveillance cube and reagent usage are updated with
+        just the records that changed, as for a local write.
+        """
+        with self._lock:
+            for collection in (self.patients, self.worklist, self.panels, self.results, self.invoices,
+                               self.reagent_lots, self.qc_runs, self.report_schedules):
+                if collection_name in (None, collection.name):
+                    if ids is not None and collection_name is not None:
+                        changed = collection.merge(self.backend.load_records(collection.name, ids))
+                    else:
+                        changed = collection.reload(self.backend.load(collection.name) or ())
+                    if changed:
+                        self._apply_remote(collection.name, changed)
+
+    def _apply_remote(self, collection_name, changed):
+        """Bring derived state up to date with (old, new) pairs another worker wrote"""
+        if collection_name == 'panels':
+            for old, new in changed:
+                if old is not None:
+                    self.panel_stats.remove(old)
+                if new is not None:
+                    self.panel_stats.add(new)
+        elif collection_name == 'results':
+            self.surveillance.add_results([new for old, new in changed if old is None])
+            self.surveillance.replace([(old, new) for old, new in changed if old is not None and new is not None])
+            self.surveillance.remove_results([old for old, new in changed if new is None])
+            # The writing worker took the reagents from stock; only the usage series is ours to update
+            self.inventory.record_runs([
+                new for old, new in changed
+                if new is not None and new.get('status') in FINAL_STATUSES
+                and (old is None or old.get('status') not in FINAL_STATUSES)
+            ])
+        elif collection_name == 'qc_runs':
+            self.inventory.record_qc_runs([new for old, new in changed if old is None and new is not None])
+
+    # Catalog
+
+    def catalog(self, loader):
+        """Load the test catalog once per process"""
+        if self._catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._catalog = loader()
+        return self._catalog
+
+    def _next_id(self, sequence, collection, template):
+        """Unique id from a backend sequence, so workers never hand out the same one
+
+        Kiosk backends prefix it with their site id, so ids made offline at
+        different sites never collide centrally.
+        """
+        while True:
+            item_id = self.backend.id_prefix + template.format(self.backend.next_sequence(sequence))
+            if collection.get(item_id) is None:
+                return item_id
+
+    def _next_panel_id(self):
+        return self._next_id('panel', self.panels, "TP_{:04d}")
+
+    def _next_result_id(self):
+        return self._next_id('result', self.results, "RES{:06d}")
+
+    def _next_invoice_id(self):
+        return self._next_id('invoice', self.invoices, "INV{:06d}")
+
+    # Patients
+
+    def add_patient(self, patient):
+        """Register a patient, assigning a unique patient id when it has none"""
+        with self._lock:
+            if not patient.get('patientId'):
+                patient = {**patient, 'patientId': self._next_id('patient', self.patients, "PAT{:06d}")}
+            self.patients.append(patient)
+            return patient
+
+    # Test panels
+
+    def add_panel(self, panel):
+        """Store a new panel, assigning a unique id when it has none"""
+        with self._lock:
+            if not panel.get('id'):
+                panel = {**panel, 'id': self._next_panel_id()}
+            self.panels.append(panel)
+            self.panel_stats.add(panel)
+            return panel
+
+    def add_panels(self, panels):
+        with self._lock:
+            return [self.add_panel(panel) for panel in panels]
+
+    def remove_panel(self, panel_id):
+        with self._lock:
+            panel = self.panels.remove(panel_id)
+            if panel is not None:
+                self.panel_stats.remove(panel)
+            return panel
+
+    def set_panel_status(self, panel_id, status):
+        with self._lock:
+            for old, new in self.panels.update([panel_id], {'status': status}):
+                self.panel_stats.status_changed(old['status'], new['status'])
+
+    def clear_panels(self):
+        with self._lock:
+            self.panels.clear()
+            self.panel_stats.reset()
+
+    # Worklist
+
+    def sync_worklist_with_panels(self, to_pending_test):
+        """Add active panels to the worklist once per panel-library change"""
+        if self._merged_panels_version == self.panels.version:
+            return
+        with self._lock:
+            existing_codes = {t.get('testCode') for t in self.worklist.snapshot()}
+            new_tests = []
+            for panel in self.panels.snapshot():
+                if panel['status'] == 'active' and panel['test_code'] not in existing_codes:
+                    new_tests.append(to_pending_test(panel))
+                    existing_codes.add(panel['test_code'])
+            if new_tests:
+                self.worklist.extend(new_tests)
+            self._merged_panels_version = self.panels.version
+
+    def add_tests(self, tests, new_order=True):
+        """Add tests to the worklist in a single write, by default as one new order"""
+        with self._lock:
+            order = {}
+            if new_order:
+                order['orderId'] = self.backend.id_prefix + "ORD{:06d}".format(self.backend.next_sequence('order'))
+            stored = [
+                {**test, 'testId': self._next_id('test', self.worklist, "TEST{:06d}"), **order}
+                for test in tests
+            ]
+            self.worklist.extend(stored)
+            return stored
+
+    def update_tests(self, test_ids, changes):
+        return self.worklist.update(test_ids, changes)
+
+    # Results
+
+    def add_results(self, results):
+        """Store results, assigning unique result ids"""
+        with self._lock:
+            stored = []
+            for result in results:
+                if not result.get('resultId'):
+                    result = {**result, 'resultId': self._next_result_id()}
+                stored.append(result)
+            self.results.extend(stored)
+            self.surveillance.add_results(stored)
+            self._consume_reagents([result for result in stored if result.get('status') in FINAL_STATUSES])
+            return stored
+
+    def update_result(self, result_id, changes):
+        replaced = self.update_results([result_id], changes)
+        return replaced[0][1] if replaced else None
+
+    def update_results(self, result_ids, changes):
+        """Apply the same changes to many results in one write"""
+        with self._lock:
+            replaced = self.results.update(result_ids, changes)
+            self.surveillance.replace(replaced)
+            self._consume_reagents([
+                new for old, new in replaced
+                if new.get('status') in FINAL_STATUSES and old.get('status') not in FINAL_STATUSES
+            ])
+            return replaced
+
+    # Reagent inventory
+
+    def _consume_reagents(self, results):
+        """Take the reagents of newly finalized results from stock in one write"""
+        usage = self.inventory.record_runs(results)
+        if usage:
+            self.reagent_lots.update_each(self.inventory.allocate(usage, self.reagent_lots.snapshot()))
+
+    def add_reagent_lot(self, lot):
+        """Receive a reagent lot, assigning a unique lot id; it awaits QC before it is trusted"""
+        with self._lock:
+            lot = {
+                'lotId': self._next_id('lot', self.reagent_lots, "LOT{:05d}"),
+                'remaining': lot['quantity'],
+                'status': 'active',
+                'qcStatus': 'pending',
+                **lot
+            }
+            self.reagent_lots.append(lot)
+            return lot
+
+    def add_qc_run(self, run):
+        """Record a QC run on a reagent lot, evaluated with Westgard rules against the previous run
+
+        The reagent the run took is kept on the run, so the usage series can be rebuilt from the runs.
+        """
+        with self._lock:
+            lot = self.reagent_lots.get(run['lotId'])
+            if lot is None:
+                raise ValueError(f"Unknown reagent lot: {run['lotId']}")
+            previous = next((r for r in reversed(self.qc_runs.snapshot())
+                             if r['lotId'] == run['lotId'] and r['level'] == run['level']), None)
+            z, rule, outcome = evaluate_qc(run['value'], run['target'], run['sd'],
+                                           previous['zScore'] if previous else None)
+            # The control is run on the lot itself, using what one run of the test takes of it
+            used = min(CONSUMPTION.get(run.get('testCode'), {}).get(lot['reagentId'], 0), lot['remaining'])
+            run = {
+                'qcRunId': self._next_id('qc', self.qc_runs, "QC{:06d}"),
+                **run,
+                'reagentId': lot['reagentId'],
+                'used': used,
+                'zScore': round(z, 2),
+                'rule': rule,
+                'outcome': outcome
+            }
+            self.qc_runs.append(run)
+            self.inventory.record_qc_runs([run])
+            remaining = round(lot['remaining'] - used, 3)
+            self.reagent_lots.update([run['lotId']], {
+                'qcStatus': outcome,
+                'lastQcRun': run['qcRunId'],
+                'remaining': remaining,
+                'status': lot['status'] if remaining > 0 else 'depleted'
+            })
+            return run
+
+    def reagent_forecast(self):
+        return self.inventory.forecast(self.reagent_lots.snapshot(), self.reagent_lots.version)
+
+    # Report schedules
+
+    def add_report_schedule(self, schedule):
+        """Store a recurring report, assigning a unique schedule id"""
+        with self._lock:
+            schedule = {'scheduleId': self._next_id('schedule', self.report_schedules, "SCH{:04d}"), **schedule}
+            self.report_schedules.append(schedule)
+            return schedule
+
+    def update_report_schedule(self, schedule_id, changes):
+        replaced = self.report_schedules.update([schedule_id], changes)
+        return replaced[0][1] if replaced else None
+
+    def remove_report_schedule(self, schedule_id):
+        return self.report_schedules.remove(schedule_id)
+
+    # Billing
+
+    def add_invoices(self, invoices):
+        """Store invoices, assigning unique invoice ids"""
+        with self._lock:
+            stored = [{'invoiceId': self._next_invoice_id(), **invoice} for invoice in invoices]
+            self.invoices.extend(stored)
+            return stored
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store(initial_worklist=()):
+    """Process-wide store on the LIS_CACHE_BACKEND backend, created on first use"""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = SharedStore(initial_worklist, create_backend())
+    return _STORE
+
+
+def reset_store(initial_worklist=(), backend=None):
+    """Replace the process-wide store (benchmarks and load tests)"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is not None:
+            _STORE.backend.close()
+        _STORE = SharedStore(initial_worklist, backend)
+    return _STORE
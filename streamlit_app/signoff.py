@@ -0,0 +1,132 @@
+"""Sign-off queue for results awaiting authorization
+
+Results submitted for review wait for someone at or above the authorization
+level their test panel requires. The queue indexes them by level, then by
+priority, oldest first; the index is rebuilt only when the results
+collection changes, so paging through it or bulk approving does not rescan
+every stored result on each rerun.
+"""
+import threading
+
+AUTH_LEVELS = ["Technician", "Senior Technician", "Lab Supervisor", "Pathologist"]
+LEVEL_RANK = {level: i for i, level in enumerate(AUTH_LEVELS)}
+# Spellings used by the test catalog and older panels
+LEVEL_ALIASES = {
+    'lab technician': 'Technician',
+    'senior lab technician': 'Senior Technician',
+    'supervisor': 'Lab Supervisor',
+}
+
+PRIORITIES = ['stat', 'asap', 'urgent', 'routine']
+PRIORITY_RANK = {priority: i for i, priority in enumerate(PRIORITIES)}
+
+# Highest level each role may sign off, for users holding approve_results; users granted
+# approve_results individually in any other role sign off at the lowest level
+ROLE_AUTH_LEVELS = {
+    'lab_technician': 'Technician',
+    'manager': 'Lab Supervisor',
+    'doctor': 'Pathologist',
+    'admin': 'Pathologist',
+    'super_admin': 'Pathologist',
+}
+
+QUEUE_STATUS = 'pending_review'
+
+
+def normalize_level(level):
+    if level in LEVEL_RANK:
+        return level
+    return LEVEL_ALIASES.get(str(level or '').strip().lower(), AUTH_LEVELS[0])
+
+
+def role_level(role, permissions):
+    """Highest authorization level a user may sign off, or None without approve_results"""
+    if 'approve_results' not in permissions:
+        return None
+    return ROLE_AUTH_LEVELS.get(role, AUTH_LEVELS[0])
+
+
+def can_sign(role, permissions, level):
+    signer = role_level(role, permissions)
+    return signer is not None and LEVEL_RANK[normalize_level(level)] <= LEVEL_RANK[signer]
+
+
+def signoff_fields(test):
+    """Priority and required level stamped on a result when it is saved"""
+    level = test.get('authorizationLevel') if test.get('requiresAuthorization', True) else None
+    return {
+        'priority': str(test.get('priority') or 'routine').lower(),
+        'authorizationLevel': normalize_level(level)
+    }
+
+
+def flag_summary(result):
+    """Short text of the out-of-range values of a result, e.g. 'Hemoglobin ↑, WBC ↓↓'"""
+    arrows = {'high': '↑', 'low': '↓', 'critical_high': '↑↑', 'critical_low': '↓↓', 'abnormal': '*'}
+    return ', '.join(
+        f"{v.get('parameter')} {arrows[v['flag']]}"
+        for v in result.get('testValues', [])
+        if v.get('flag') in arrows
+    )
+
+
+def is_critical(result):
+    return result.get('overallStatus') == 'critical' or any(
+        v.get('flag') in ('critical_high', 'critical_low') for v in result.get('testValues', [])
+    )
+
+
+class SignoffQueue:
+    """Results awaiting sign-off indexed by level and priority"""
+
+    def __init__(self, results):
+        self._index = {level: {priority: [] for priority in PRIORITIES} for level in AUTH_LEVELS}
+        for result in results:
+            if result.get('status') != QUEUE_STATUS:
+                continue
+            level = normalize_level(result.get('authorizationLevel'))
+            priority = str(result.get('priority') or 'routine').lower()
+            self._index[level].setdefault(priority, []).append(result)
+        for by_priority in self._index.values():
+            for bucket in by_priority.values():
+                bucket.sort(key=lambda r: r.get('savedAt') or '')
+
+    def counts(self, levels=None):
+        """{(level, priority): waiting results}"""
+        return {
+            (level, priority): len(bucket)
+            for level in levels or AUTH_LEVELS
+            for priority, bucket in self._index[level].items()
+            if bucket
+        }
+
+    def pending(self, levels=None, priorities=None, limit=None):
+        """Waiting results, most urgent priority first and oldest first within it"""
+        buckets = sorted((
+            (PRIORITY_RANK.get(priority, len(PRIORITIES)), -LEVEL_RANK[level], bucket)
+            for level in levels or AUTH_LEVELS
+            for priority, bucket in self._index[level].items()
+            if bucket and (not priorities or priority in priorities)
+        ), key=lambda item: item[:2])
+        results = []
+        for _, _, bucket in buckets:
+            results.extend(bucket)
+            if limit and len(results) >= limit:
+                return results[:limit]
+        return results
+
+
+_QUEUE = None
+_QUEUE_VERSION = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_queue(results_collection):
+    """Queue for the current results, rebuilt only when the collection changes"""
+    global _QUEUE, _QUEUE_VERSION
+    key = (id(results_collection), results_collection.version)
+    with _QUEUE_LOCK:
+        if _QUEUE is None or _QUEUE_VERSION != key:
+            _QUEUE = SignoffQueue(results_collection.snapshot())
+            _QUEUE_VERSION = key
+        return _QUEUE
@@ -0,0 +1,271 @@
+"""Sample stability windows and the expiry monitor
+
+Each catalog test and panel carries a structured stability window
+(``stability_hours``, ``storage_condition``); older panels that only state it
+in ``special_instructions`` ("Process within 2 hours", "Stable for 7 days")
+are parsed once. Every in-flight worklist sample gets two timers, a warning
+shortly before its deadline and the deadline itself, on a timer wheel: one
+slot per tick, so a tick only touches the timers that are due, however many
+samples are in flight. Deadlines beyond the wheel wait in a heap until they
+come within range.
+
+Near-expiry samples are flagged on the worklist and routine ones raised to
+urgent; expired samples are flagged for recollection. Timers follow worklist
+edits: a changed collection time reschedules them and a sample that leaves
+the bench cancels them. Workers sharing a cache backend elect one monitor
+through a backend lease, so each alert is raised once.
+
+    LIS_STABILITY_TICK=60     (seconds between monitor ticks, 0 disables the thread)
+"""
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import audit_log
+
+TICK_SECONDS = float(os.environ.get('LIS_STABILITY_TICK', '60'))
+STORAGE_CONDITIONS = ['Room temperature', 'Refrigerated (2-8°C)', 'Frozen (-20°C)']
+# Warn this share of the window before the deadline, but never less than WARNING_MIN_SECONDS
+WARNING_FRACTION = 0.25
+WARNING_MIN_SECONDS = 30 * 60
+# The elected monitor holds its lease for this many ticks
+LEASE_TICKS = 3
+LEASE_NAME = 'stability-monitor'
+
+IN_FLIGHT = ('collected', 'processing', 'pending', 'ready_for_testing')
+NEAR_EXPIRY = 'near_expiry'
+EXPIRED = 'expired'
+
+_STABILITY_RE = re.compile(
+    r'(?:within|stable (?:for|up to)|process in)\s+(\d+(?:\.\d+)?)\s*(minute|min|hour|hr|h|day|d)s?\b',
+    re.IGNORECASE
+)
+_UNIT_HOURS = {'minute': 1 / 60, 'min': 1 / 60, 'hour': 1, 'hr': 1, 'h': 1, 'day': 24, 'd': 24}
+
+
+def parse_stability(text):
+    """Hours stated in prose such as 'Process within 4 hours', else None"""
+    match = _STABILITY_RE.search(str(text or ''))
+    if not match:
+        return None
+    return float(match.group(1)) * _UNIT_HOURS[match.group(2).lower()]
+
+
+def stability_windows(tests):
+    """Stability in hours for catalog tests and panels, keyed by test code and test type"""
+    windows = {}
+    for test in tests:
+        hours = test.get('stability_hours') or parse_stability(test.get('special_instructions'))
+        if hours:
+            windows[test['test_code']] = float(hours)
+            windows[test['test_name'].lower().replace(' ', '_')] = float(hours)
+    return windows
+
+
+def collected_at(test):
+    """Collection time of a worklist test as a timestamp, or None"""
+    text = test.get('collectedAt')
+    if not text and test.get('collectionDate'):
+        text = f"{test['collectionDate']}T{test.get('collectionTime') or '00:00:00'}"
+    try:
+        return datetime.fromisoformat(str(text)).timestamp()
+    except ValueError:
+        return None
+
+
+def warning_lead(window_seconds):
+    return max(window_seconds * WARNING_FRACTION, min(WARNING_MIN_SECONDS, window_seconds / 2))
+
+
+class TimerWheel:
+    """Hashed timer wheel with a heap for timers beyond its span"""
+
+    def __init__(self, resolution=60, slots=1440, now=None):
+        self.resolution = resolution
+        self.slots = slots
+        self._wheel = [[] for _ in range(slots)]
+        self._overflow = []
+        self._seq = itertools.count()
+        self.current = int((time.time() if now is None else now) // resolution)
+
+    def __len__(self):
+        return sum(len(slot) for slot in self._wheel) + len(self._overflow)
+
+    def schedule(self, when, item):
+        """Fire item at the first tick at or after when (overdue timers fire on the next tick)"""
+        tick = max(int(when // self.resolution), self.current)
+        if tick - self.current < self.slots:
+            self._wheel[tick % self.slots].append(item)
+        else:
+            heapq.heappush(self._overflow, (tick, next(self._seq), item))
+
+    def advance(self, now=None):
+        """Items whose tick has been reached"""
+        target = int((time.time() if now is None else now) // self.resolution)
+        due = []
+        while self.current <= target:
+            slot = self._wheel[self.current % self.slots]
+            if slot:
+                due.extend(slot)
+                slot.clear()
+            self.current += 1
+            horizon = self.current + self.slots
+            while self._overflow and self._overflow[0][0] < horizon:
+                tick, _, item = heapq.heappop(self._overflow)
+                if tick < self.current:
+                    due.append(item)
+                else:
+                    self._wheel[tick % self.slots].append(item)
+        return due
+
+
+class StabilityMonitor:
+    """Tracks in-flight worklist samples against their stability deadlines"""
+
+    def __init__(self, store, catalog, resolution=60, now=None):
+        self.store = store
+        self.catalog = catalog
+        self.windows = {}
+        self.wheel = TimerWheel(resolution, now=now)
+        self._windows_version = None
+        self._deadlines = {}
+        self._worklist_version = None
+        self.lease_seconds = LEASE_TICKS * (TICK_SECONDS or resolution)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def window(self, test):
+        """Stability window of a worklist test in hours, or None"""
+        return self.windows.get(test.get('testCode')) or self.windows.get(test.get('testType'))
+
+    def deadline(self, test):
+        hours = self.window(test)
+        start = collected_at(test) if hours else None
+        return None if start is None else start + hours * 3600
+
+    def _load_windows(self):
+        """Reload the windows when the panel library changed; True when it did"""
+        if self._windows_version == self.store.panels.version:
+            return False
+        self.windows = stability_windows([*self.catalog.values(), *self.store.panels.snapshot()])
+        self._windows_version = self.store.panels.version
+        return True
+
+    def sync(self):
+        """Bring the timers up to date with the worklist tests written since the last sync"""
+        reloaded = self._load_windows()
+        version, changed = self.store.worklist.changed_since(self._worklist_version)
+        if reloaded or changed is None:
+            # Windows changed or the worklist was reloaded: recheck every test
+            changed = set(self._deadlines) | {test['testId'] for test in self.store.worklist.snapshot()}
+        for test_id in changed:
+            self._track(test_id, self.store.worklist.get(test_id))
+        self._worklist_version = version
+
+    def _track(self, test_id, test):
+        """Schedule, reschedule or cancel a test's timers"""
+        deadline = None
+        if test is not None and test.get('status') in IN_FLIGHT and test.get('stabilityStatus') != EXPIRED:
+            deadline = self.deadline(test)
+        if deadline is None:
+            # Timers still on the wheel no longer match a deadline and are dropped when they come up
+            self._deadlines.pop(test_id, None)
+            return
+        if self._deadlines.get(test_id) == deadline:
+            return
+        self._deadlines[test_id] = deadline
+        lead = warning_lead(self.window(test) * 3600)
+        self.wheel.schedule(deadline - lead, (NEAR_EXPIRY, test_id, deadline))
+        self.wheel.schedule(deadline, (EXPIRED, test_id, deadline))
+
+    def leading(self):
+        """Whether this worker's monitor is the one that flags samples"""
+        backend = self.store.backend
+        return not backend.shared or backend.lease(LEASE_NAME, backend.worker_id, self.lease_seconds)
+
+    def tick(self, now=None):
+        """Flag and reprioritize samples whose timers are due; returns {state: [testId]}"""
+        with self._lock:
+            if not self.leading():
+                return {NEAR_EXPIRY: [], EXPIRED: []}
+            self.sync()
+            fired = {NEAR_EXPIRY: {}, EXPIRED: {}}
+            for state, test_id, deadline in self.wheel.advance(now):
+                if self._deadlines.get(test_id) != deadline:
+                    continue
+                test = self.store.worklist.get(test_id)
+                if test is None or test.get('status') not in IN_FLIGHT:
+                    self._deadlines.pop(test_id, None)
+                    continue
+                if test.get('stabilityStatus') not in (state, EXPIRED):
+                    fired[state][test_id] = test
+            return self._apply(fired)
+
+    def _apply(self, fired):
+        """Write the new stability states to the worklist and audit them"""
+        # A sample found already expired skips the warning
+        near = [t for test_id, t in fired[NEAR_EXPIRY].items() if test_id not in fired[EXPIRED]]
+        routine = [t['testId'] for t in near if t.get('priority', 'routine') == 'routine']
+        others = [t['testId'] for t in near if t.get('priority', 'routine') != 'routine']
+        near_expiry = self.store.update_tests(routine, {'stabilityStatus': NEAR_EXPIRY, 'priority': 'urgent'})
+        near_expiry += self.store.update_tests(others, {'stabilityStatus': NEAR_EXPIRY})
+        expired = self.store.update_tests(list(fired[EXPIRED]), {'stabilityStatus': EXPIRED})
+        replaced = near_expiry + expired
+        if replaced:
+            audit_log.get_audit_log().record_many([
+                {'action': 'edit', 'entityType': 'test', 'entityId': new['testId'], 'user': 'Stability Monitor',
+                 'role': 'system', 'changes': audit_log.field_changes(old, new, ['stabilityStatus', 'priority'])}
+                for old, new in replaced
+            ])
+        return {
+            NEAR_EXPIRY: [new['testId'] for _, new in near_expiry],
+            EXPIRED: [new['testId'] for _, new in expired]
+        }
+
+    def remaining(self, test, now=None):
+        """Seconds until a test's sample expires (negative once expired), or None if untracked"""
+        self._load_windows()
+        deadline = self.deadline(test)
+        return None if deadline is None else deadline - (time.time() if now is None else now)
+
+    def start(self, interval=TICK_SECONDS):
+        """Tick in a background thread every interval seconds"""
+        if self._thread is not None or interval <= 0:
+            return
+        self.lease_seconds = LEASE_TICKS * interval
+        self.tick()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="lis-stability", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.tick()
+            except Exception:
+                # Keep monitoring; the next tick retries the same timers' samples
+                traceback.print_exc()
+
+    def stop(self):
+        self._stop.set()
+
+
+_MONITOR = None
+_MONITOR_LOCK = threading.Lock()
+
+
+def get_monitor(store, catalog):
+    """Process-wide monitor over the shared worklist, started on first use"""
+    global _MONITOR
+    with _MONITOR_LOCK:
+        if _MONITOR is None or _MONITOR.store is not store:
+            if _MONITOR is not None:
+                _MONITOR.stop()
+            _MONITOR = StabilityMonitor(store, catalog)
+            _MONITOR.start()
+        return _MONITOR
@@ -0,0 +1,210 @@
+"""Public-health surveillance cube over finalized results
+
+Every reported value of a finalized result is counted in one cell of a
+sparse cube keyed by (test, flag, region, age band, week), where test is the
+reported parameter (Hemoglobin, HbA1c, ...). The shared store keeps the cube
+current as results are saved, approved and amended: the cells of the
+replaced version are decremented and those of the new one incremented, so
+the dashboard never rescans result history. Slices are grouped from frames
+of the non-empty cells, one per test and rebuilt only when that test's
+cells change, so a slice costs the size of its tests' cells rather than of
+the result history.
+
+CONDITIONS are the indicators on the dashboard: the share of a marker's
+results that carry one of the listed flags. A marker is a parameter name the
+results entry pages report, so every indicator counts real results.
+"""
+import threading
+from datetime import date
+from functools import lru_cache
+
+import pandas as pd
+
+from reflex import HIGH, LOW, OUT_OF_RANGE
+
+DIMENSIONS = ('test', 'flag', 'region', 'age_band', 'week')
+FINAL_STATUSES = ('approved', 'amended')
+UNKNOWN = 'Unknown'
+AGE_BANDS = [
+    (0, 5, '0-4'),
+    (5, 15, '5-14'),
+    (15, 25, '15-24'),
+    (25, 45, '25-44'),
+    (45, 65, '45-64'),
+    (65, float('inf'), '65+')
+]
+
+CONDITIONS = {
+    'Anemia': {'test': 'Hemoglobin', 'flags': LOW},
+    'Raised HbA1c (diabetes)': {'test': 'HbA1c', 'flags': HIGH},
+    'Hyperglycemia': {'test': 'Glucose', 'flags': HIGH},
+    'Hepatitis B (HBsAg)': {'test': 'HBsAg', 'flags': OUT_OF_RANGE}
+}
+
+
+def age_band(age):
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        return UNKNOWN
+    for low, high, label in AGE_BANDS:
+        if low <= age < high:
+            return label
+    return UNKNOWN
+
+
+@lru_cache(maxsize=4096)
+def iso_week(collection_date):
+    """'2024-W03' for a collection date, or Unknown"""
+    try:
+        year, week, _ = date.fromisoformat(str(collection_date)[:10]).isocalendar()
+    except ValueError:
+        return UNKNOWN
+    return f"{year}-W{week:02d}"
+
+
+def region_name(text):
+    return str(text or '').strip().title() or UNKNOWN
+
+
+class SurveillanceCube:
+    """Result value counts by test, flag, region, age band and collection week
+
+    Cells are partitioned by test, and each partition keeps its own frame and
+    version, so a slice only regroups the tests it selects and a new batch
+    only invalidates the partitions it touched.
+    """
+
+    def __init__(self, results=(), worklist=None):
+        self.worklist = worklist
+        self.cells = {}
+        self.version = 0
+        self._versions = {}
+        self._frames = {}
+        self._members = {dimension: {} for dimension in DIMENSIONS[1:]}
+        self._counted = {}
+        self._lock = threading.Lock()
+        self.add_results(results)
+
+    def _coordinates(self, result):
+        """(region, age band, week) of a result, from its worklist test where the result lacks them"""
+        test = (self.worklist.get(result.get('test')) if self.worklist is not None else None) or {}
+        return (
+            region_name(result.get('patientRegion') or test.get('patientRegion')),
+            age_band(result.get('patientAge', test.get('patientAge'))),
+            iso_week(result.get('collectionDate') or test.get('collectionDate'))
+        )
+
+    def _apply(self, result, coordinates, sign):
+        for value in result.get('testValues', []):
+            if value.get('value') in (None, ''):
+                continue
+            test = value.get('parameter')
+            cells = self.cells.get(test)
+            if cells is None:
+                cells = self.cells[test] = {}
+            key = (value.get('flag') or 'normal', *coordinates)
+            count = cells.get(key, 0) + sign
+            if count:
+                if key not in cells:
+                    self._track(key, 1)
+                cells[key] = count
+            else:
+                del cells[key]
+                self._track(key, -1)
+                if not cells:
+                    del self.cells[test]
+            self._versions[test] = self._versions.get(test, 0) + 1
+
+    def _track(self, key, sign):
+        """Cells per dimension member, so the dashboard can list members without a scan"""
+        for members, member in zip(self._members.values(), key):
+            count = members.get(member, 0) + sign
+            if count:
+                members[member] = count
+            else:
+                del members[member]
+
+    def _count(self, result):
+        if result.get('status') in FINAL_STATUSES:
+            coordinates = self._coordinates(result)
+            self._counted[result['resultId']] = (result, coordinates)
+            self._apply(result, coordinates, 1)
+
+    def add_results(self, results):
+        """Count newly stored results"""
+        with self._lock:
+            for result in results:
+                self._count(result)
+            self.version += 1
+
+    def replace(self, replaced):
+        """Recount results after an update; replaced is [(old, new)] as the store returns it"""
+        with self._lock:
+            for _, new in replaced:
+                counted = self._counted.pop(new['resultId'], None)
+                if counted is not None:
+                    self._apply(*counted, -1)
+                self._count(new)
+            self.version += 1
+
+    def remove_results(self, results):
+        """Uncount results removed from the store"""
+        with self._lock:
+            for result in results:
+                counted = self._counted.pop(result['resultId'], None)
+                if counted is not None:
+                    self._apply(*counted, -1)
+            self.version += 1
+
+    def __len__(self):
+        return sum(len(cells) for cells in self.cells.values())
+
+    def values(self, dimension):
+        """Sorted members of one dimension"""
+        with self._lock:
+            return sorted(self.cells if dimension == 'test' else self._members[dimension])
+
+    def _partition(self, test):
+        """Frame of one test's cells, rebuilt only after they change"""
+        version = self._versions.get(test)
+        cached = self._frames.get(test)
+        if cached is None or cached[0] != version:
+            cells = self.cells.get(test, {})
+            frame = pd.DataFrame([(*key, count) for key, count in cells.items()], columns=[*DIMENSIONS[1:], 'count'])
+            frame.insert(0, 'test', test)
+            cached = self._frames[test] = (version, frame)
+        return cached[1]
+
+    def frame(self, tests=None):
+        """Non-empty cells of the selected tests (all when None) with their counts"""
+        with self._lock:
+            partitions = [self._partition(test) for test in (tests or list(self.cells)) if test in self.cells]
+        if not partitions:
+            return pd.DataFrame(columns=[*DIMENSIONS, 'count'])
+        return partitions[0] if len(partitions) == 1 else pd.concat(partitions, ignore_index=True)
+
+    def _slice(self, filters):
+        filters = dict(filters or {})
+        frame = self.frame(filters.pop('test', None))
+        mask = None
+        for dimension, members in filters.items():
+            if members:
+                selected = frame[dimension].isin(members)
+                mask = selected if mask is None else mask & selected
+        return frame if mask is None else frame[mask]
+
+    def rollup(self, by, filters=None):
+        """Counts summed over every dimension not in by; filters maps a dimension to the members to keep"""
+        frame = self._slice(filters)
+        return frame.groupby(list(by))['count'].sum().reset_index()
+
+    def prevalence(self, condition, by, filters=None):
+        """Tested, positive and percent positive for a condition, grouped by dimensions"""
+        spec = CONDITIONS[condition]
+        frame = self._slice({**(filters or {}), 'test': [spec['test']]})
+        frame = frame.assign(positive=frame['count'].where(frame['flag'].isin(spec['flags']), 0))
+        grouped = frame.groupby(list(by))[['count', 'positive']].sum().reset_index()
+        grouped = grouped.rename(columns={'count': 'tested'})
+        grouped['percent'] = (grouped['positive'] / grouped['tested'].where(grouped['tested'] > 0) * 100).round(1)
+        return grouped
@@ -0,0 +1,5 @@
+import os
+
+# Keep the audit trail in memory and users out of the app directory while tests run
+os.environ.setdefault('LIS_AUDIT_LOG', 'memory')
+os.environ.setdefault('LIS_USERS_FILE', os.path.join(os.path.dirname(__file__), '.users.json'))
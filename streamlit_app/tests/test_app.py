@@ -0,0 +1,12 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'app.py')
+
+
+def test_app_script_renders_once():
+    at = AppTest.from_file(APP_FILE, default_timeout=60)
+    at.run()
+    assert not at.exception
+    assert len(at.get('form')) == 1
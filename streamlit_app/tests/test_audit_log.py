@@ -0,0 +1,42 @@
+import audit_log
+
+
+def test_query_indexes_and_entity_types():
+    log = audit_log.AuditLog()
+    log.record('create', 'result', 'RES000001', user='alice', changes={'status': [None, 'draft']})
+    log.record('approve', 'result', 'RES000001', user='bob')
+    log.record('create', 'qc_run', 'QC000001', user='alice')
+
+    assert [e['action'] for e in log.history('RES000001')] == ['create', 'approve']
+    assert [e['entityId'] for e in log.query(user='alice')] == ['QC000001', 'RES000001']
+    assert [e['entityId'] for e in log.query(entity_type='qc_run')] == ['QC000001']
+    assert log.query(entity_id='RES000001', action='approve')[0]['user'] == 'bob'
+    assert log.entity_types() == ['qc_run', 'result']
+    assert len(log) == 3
+
+
+def test_verify_detects_a_tampered_entry():
+    log = audit_log.AuditLog()
+    for i in range(3):
+        log.record('edit', 'panel', f'TP_{i:04d}', user='alice')
+    assert log.verify() == {'ok': True, 'checked': 3, 'broken_at': None}
+
+    log.query(entity_id='TP_0001')[0]['user'] = 'mallory'
+    assert log.verify()['broken_at'] == 2
+
+
+def test_file_log_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'audit_log.jsonl')
+    first = audit_log.AuditLog(path, flush_interval=60)
+    first.record('create', 'test', 'TEST000001', user='alice')
+    first.flush()
+
+    second = audit_log.AuditLog(path, flush_interval=60)
+    second.record('delete', 'test', 'TEST000001', user='bob')
+    second.flush()
+
+    first.refresh()
+    assert [e['action'] for e in first.history('TEST000001')] == ['create', 'delete']
+    assert first.verify()['ok'] and second.verify()['ok']
+    first.close()
+    second.close()
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import auth
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeBackend:
+    enabled = True
+
+    def __init__(self, token):
+        self.token = token
+
+    def request(self, method, path, **kwargs):
+        return {'token': self.token, 'user': {'email': 'alice@lab.org', 'fullName': "Dr. Alice", 'role': 'doctor'}}
+
+
+class SessionState(dict):
+    __getattr__ = dict.get
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+def test_demo_mode_is_off_by_default():
+    env = {k: v for k, v in os.environ.items() if k != 'LIS_DEMO_MODE'}
+    output = subprocess.run([sys.executable, '-c', 'import auth; print(auth.DEMO_MODE)'],
+                            cwd=APP_DIR, env=env, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_demo_login_refused_when_demo_mode_is_off(monkeypatch):
+    monkeypatch.setattr(auth, 'DEMO_MODE', False)
+    with pytest.raises(auth.AuthError):
+        auth.demo_login('admin')
+
+
+def test_token_round_trip_and_rejections():
+    token = auth.issue_token({'username': 'alice', 'role': 'doctor'})
+    assert auth.decode_token(token)['role'] == 'doctor'
+
+    header, payload, _ = token.split('.')
+    with pytest.raises(auth.AuthError, match="Malformed"):
+        auth.decode_token(f"{header}.{payload}.abcde")
+    with pytest.raises(auth.AuthError, match="Malformed"):
+        auth.decode_token('not-a-token')
+    with pytest.raises(auth.AuthError, match="signature"):
+        auth.decode_token(token, secret='other-secret')
+    expired = auth.encode_token({'sub': 'alice', 'exp': int(time.time()) - 1})
+    with pytest.raises(auth.AuthError, match="expired"):
+        auth.decode_token(expired)
+
+
+@pytest.mark.parametrize('claims', [{'sub': 'alice', 'exp': 'tomorrow'}, {'sub': 'alice', 'exp': [1]},
+                                    {'sub': 'alice', 'exp': True}, ['alice']])
+def test_malformed_claims_are_rejected(claims):
+    with pytest.raises(auth.AuthError, match="Malformed"):
+        auth.decode_token(auth.encode_token(claims))
+
+
+def test_token_cache_keeps_only_verified_claims():
+    cache = auth.TokenCache()
+    forged = auth.encode_token({'sub': 'mallory', 'role': 'admin'}, secret='other-secret')
+    with pytest.raises(auth.AuthError):
+        cache.validate(forged)
+    assert forged not in cache._claims
+
+    token = auth.issue_token({'username': 'alice', 'role': 'doctor'})
+    assert cache.validate(token) is cache.validate(token)
+
+
+def test_backend_login_needs_the_shared_secret(monkeypatch):
+    token = auth.encode_token({'id': 'u1', 'role': 'doctor'}, secret='backend-secret')
+    monkeypatch.setattr(auth, 'JWT_SECRET_CONFIGURED', False)
+    with pytest.raises(auth.AuthError, match="LIS_JWT_SECRET"):
+        auth.login('alice@lab.org', 'secret', FakeBackend(token))
+    assert token not in auth.TOKEN_CACHE._claims
+
+    monkeypatch.setattr(auth, 'JWT_SECRET_CONFIGURED', True)
+    monkeypatch.setattr(auth, 'JWT_SECRET', 'backend-secret')
+    assert auth.login('alice@lab.org', 'secret', FakeBackend(token)) == token
+    session = SessionState()
+    auth.start_session(session, token)
+    assert session['user_name'] == "Dr. Alice"
+    assert 'approve_results' in session['permissions']
+    auth.end_session(session)
+    assert not auth.session_valid(session)
+
+
+def test_local_login(tmp_path):
+    path = str(tmp_path / 'users.json')
+    auth.add_user('bob', 'pa55word', 'lab_technician', path=path)
+    assert auth.check_password('pa55word', auth.load_users(path)['bob']['passwordHash'])
+    assert not auth.check_password('wrong', auth.load_users(path)['bob']['passwordHash'])
+    with pytest.raises(ValueError):
+        auth.add_user('eve', 'x', 'janitor', path=path)
@@ -0,0 +1,48 @@
+import os
+import re
+
+import auth
+import backend_client
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'backend')
+
+
+def route_roles(route):
+    with open(os.path.join(BACKEND_DIR, 'routes', 'results.js'), encoding='utf-8') as f:
+        source = f.read()
+    match = re.search(r"router\.post\('" + re.escape(route) + r"', authorize\(([^)]*)\)", source)
+    return set(re.findall(r"'(\w+)'", match.group(1)))
+
+
+def backend_roles():
+    with open(os.path.join(BACKEND_DIR, 'models', 'User.js'), encoding='utf-8') as f:
+        source = f.read()
+    return set(re.findall(r"'(\w+)'", re.search(r"role: \{\s*type: String,\s*enum: \[([^\]]*)\]", source).group(1)))
+
+
+def app_roles(permission):
+    return {role for role, permissions in auth.ROLE_PERMISSIONS.items() if permission in permissions}
+
+
+def test_amend_route_allows_the_roles_the_app_does():
+    assert route_roles('/:id/amend') == app_roles('approve_results') & backend_roles()
+
+
+class RecordingClient(backend_client.BackendClient):
+    def __init__(self):
+        super().__init__(base_url='http://backend.test')
+        self.calls = []
+
+    def request(self, method, path, **kwargs):
+        self.calls.append((method, path, kwargs.get('json')))
+        return {'success': True, 'data': {}}
+
+
+def test_amend_uses_the_backend_id():
+    client = RecordingClient()
+    amendments = [{'parameter': 'Glucose', 'originalValue': '90', 'newValue': '95', 'reason': 'Rerun'}]
+    client.amend_result('6523f0c2a1b2c3d4e5f60718', amendments, 'Rerun')
+    method, path, body = client.calls[0]
+    assert path == '/results/6523f0c2a1b2c3d4e5f60718/amend'
+    assert body['previousValues'] == {'Glucose': '90'} and body['newValues'] == {'Glucose': '95'}
+    assert backend_client.backend_id({'resultId': 'RES000001'}) is None
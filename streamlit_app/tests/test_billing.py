@@ -0,0 +1,45 @@
+import billing
+from records import PanelTest
+
+CATALOG = [
+    {'test_code': 'CBC', 'test_name': "Complete Blood Count", 'category': 'Hematology', 'test_cost': 300},
+    {'test_code': 'BMP', 'test_name': "Basic Metabolic Panel", 'category': 'Chemistry', 'test_cost': 400},
+]
+PANEL = {'id': 'TP_0001', 'test_code': 'CUSTOM_PAT', 'test_name': "Custom Test Panel", 'category': 'Chemistry',
+         'sample_type': 'Serum', 'test_method': 'Manual', 'parameters': [], 'authorization_level': 'Technician',
+         'test_cost': 999.0, 'status': 'active', 'created_date': '2026-10-18'}
+
+
+def ordered(test_id, code, status='completed', collection_date='2026-10-18', **fields):
+    return {'testId': test_id, 'patientId': 'PAT000001', 'patientName': "Asha Rao", 'testCode': code,
+            'testType': code.lower(), 'status': status, 'collectionDate': collection_date, **fields}
+
+
+def billed_ids(invoices):
+    return sorted(line['testId'] for invoice in invoices for line in invoice['lines'])
+
+
+def test_only_collected_patient_tests_are_billed():
+    price_list = billing.build_price_list(CATALOG, [PANEL])
+    tests = [
+        ordered('T1', 'CBC'),
+        ordered('T2', 'BMP', status='collected'),
+        ordered('T3', 'CBC', status='pending'),
+        ordered('T4', 'BMP', status='cancelled'),
+        PanelTest(PANEL),
+        {**ordered('T5', 'CBC'), 'patientId': 'CUSTOM_PAT'},
+    ]
+    invoices, lines = billing.run_billing(tests, price_list)
+    assert billed_ids(invoices) == ['T1', 'T2']
+    assert lines['amount'].sum() == 700.0
+
+
+def test_date_window_and_already_invoiced_tests():
+    price_list = billing.build_price_list(CATALOG)
+    tests = [ordered('T1', 'CBC', collection_date='2026-10-01'), ordered('T2', 'CBC'),
+             ordered('T3', 'BMP'), ordered('T4', 'BMP', collection_date='2026-10-20')]
+    invoices, _ = billing.run_billing(tests, price_list, start='2026-10-10', end='2026-10-19')
+    assert billed_ids(invoices) == ['T2', 'T3']
+
+    again, _ = billing.run_billing(tests, price_list, invoiced_test_ids=billed_ids(invoices), end='2026-10-19')
+    assert billed_ids(again) == ['T1']
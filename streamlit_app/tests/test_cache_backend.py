@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+import cache_backend
+from cache_backend import InProcessBackend, KioskBackend, SQLiteBackend, create_backend
+
+
+def test_create_backend_from_url(tmp_path):
+    assert isinstance(create_backend('memory'), InProcessBackend)
+    assert isinstance(create_backend(f"sqlite:///{tmp_path / 'a.db'}"), SQLiteBackend)
+    assert isinstance(create_backend(f"kiosk:///{tmp_path / 'k.db'}"), KioskBackend)
+    with pytest.raises(ValueError):
+        create_backend('mongodb://localhost')
+
+
+def test_sqlite_round_trip_keeps_order_on_update(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'))
+    assert backend.load('panels') is None
+    backend.upsert('panels', 'id', [{'id': 'A', 'n': 1}, {'id': 'B', 'n': 2}])
+    backend.upsert('panels', 'id', [{'id': 'A', 'n': 10}])
+    backend.delete('panels', ['B'])
+    backend.upsert('panels', 'id', [{'id': 'C', 'n': 3}])
+    assert backend.load('panels') == [{'id': 'A', 'n': 10}, {'id': 'C', 'n': 3}]
+    assert [backend.next_sequence('panel') for _ in range(3)] == [1, 2, 3]
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_lease_is_held_by_one_owner_until_it_expires(tmp_path, shared):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db')) if shared else InProcessBackend()
+    assert backend.lease('monitor', 'w1', 60)
+    assert backend.lease('monitor', 'w1', 60)
+    assert not backend.lease('monitor', 'w2', 60)
+    assert backend.lease('monitor', 'w1', -1)
+    assert backend.lease('monitor', 'w2', 60)
+    assert not backend.lease('monitor', 'w1', 60)
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_advance_raises_a_sequence_once(tmp_path, shared):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db')) if shared else InProcessBackend()
+    assert backend.advance('report-run:RS0001', 202610190600)
+    assert not backend.advance('report-run:RS0001', 202610190600)
+    assert not backend.advance('report-run:RS0001', 202610180600)
+    assert backend.advance('report-run:RS0001', 202610200600)
+
+
+def test_failing_callback_does_not_stop_invalidation(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    writer, reader = SQLiteBackend(path), SQLiteBackend(path, poll_interval=0.02)
+    failed, delivered = threading.Event(), threading.Event()
+
+    def flaky(collection, version, ids):
+        if not failed.is_set():
+            failed.set()
+            raise RuntimeError("callback failed")
+        delivered.set()
+
+    reader.subscribe(flaky)
+    try:
+        writer.upsert('panels', 'id', [{'id': 'A'}])
+        assert failed.wait(2.0)
+        writer.upsert('panels', 'id', [{'id': 'B'}])
+        assert delivered.wait(2.0)
+    finally:
+        reader.close()
+
+
+def test_redis_backend_names_its_optional_dependency(monkeypatch):
+    monkeypatch.setattr(cache_backend, 'redis', None)
+    with pytest.raises(RuntimeError, match="pip install redis"):
+        create_backend('redis://localhost:6379/0')
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import calculations
+from calculations import PANEL_CALCULATIONS
+
+
+def entered(**values):
+    return {key: {'value': value, 'unit': None} for key, value in values.items()}
+
+
+def by_name(test_values):
+    return {v['parameter']: v['value'] for v in test_values}
+
+
+def test_graph_orders_dependencies():
+    _, graph = calculations.compile_graph(PANEL_CALCULATIONS['LIPID'])
+    assert graph.order.index('vldl') < graph.order.index('ldl_friedewald')
+    assert graph.inputs == {'triglycerides', 'total_cholesterol', 'hdl_cholesterol'}
+    assert graph.affected(['triglycerides']) == ('vldl', 'ldl_friedewald')
+    assert set(graph.affected(['hdl_cholesterol'])) == {'ldl_friedewald', 'non_hdl'}
+
+
+def test_circular_declarations_are_rejected():
+    declarations = [
+        {'key': 'a', 'name': 'A', 'unit': '', 'formula': 'b + 1'},
+        {'key': 'b', 'name': 'B', 'unit': '', 'formula': 'a + 1'},
+    ]
+    with pytest.raises(ValueError, match="Circular"):
+        calculations.CalculationGraph(declarations)
+
+
+def test_friedewald_not_reported_above_400_triglycerides():
+    values = by_name(calculations.calculate_test_values(
+        PANEL_CALCULATIONS['LIPID'],
+        entered(triglycerides=150.0, total_cholesterol=200.0, hdl_cholesterol=50.0), {}
+    ))
+    assert values['VLDL Cholesterol (Calculated)'] == 30.0
+    assert values['LDL Cholesterol (Friedewald)'] == 120.0
+
+    values = by_name(calculations.calculate_test_values(
+        PANEL_CALCULATIONS['LIPID'],
+        entered(triglycerides=450.0, total_cholesterol=200.0, hdl_cholesterol=50.0), {}
+    ))
+    assert 'LDL Cholesterol (Friedewald)' not in values
+    assert values['Non-HDL Cholesterol'] == 150.0
+
+
+def test_egfr_uses_patient_age_and_sex():
+    test = {'patientAge': 50, 'patientSex': 'F'}
+    values = by_name(calculations.calculate_test_values(PANEL_CALCULATIONS['BMP'], entered(creatinine=1.0), test))
+    expected = calculations.ckd_epi_2021(np.array([1.0]), np.array([50.0]), np.array([True]))[0]
+    assert values['eGFR (CKD-EPI 2021)'] == round(expected)
+
+    male = by_name(calculations.calculate_test_values(
+        PANEL_CALCULATIONS['BMP'], entered(creatinine=1.0), {'patientAge': 50, 'patientSex': 'M'}
+    ))
+    assert male['eGFR (CKD-EPI 2021)'] != values['eGFR (CKD-EPI 2021)']
+
+
+def test_measured_zero_is_a_value():
+    values = by_name(calculations.calculate_test_values(
+        PANEL_CALCULATIONS['LFT'], entered(total_protein=6.5, albumin=0.0), {}
+    ))
+    assert values['Globulin'] == 6.5
+    assert values['A/G Ratio'] == 0.0
+
+
+def test_blank_inputs_are_missing():
+    values = by_name(calculations.calculate_test_values(
+        PANEL_CALCULATIONS['LFT'], entered(total_protein=6.5, albumin=None), {}
+    ))
+    assert values == {}
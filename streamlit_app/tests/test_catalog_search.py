@@ -0,0 +1,61 @@
+import catalog_search
+from cache_backend import create_backend
+from shared_state import SharedStore
+
+CATALOG = {
+    'complete_blood_count': {'test_code': 'CBC', 'test_name': "Complete Blood Count", 'category': 'Hematology',
+                             'billing_code': 'NABL-CBC-001'},
+    'basic_metabolic_panel': {'test_code': 'BMP', 'test_name': "Basic Metabolic Panel", 'category': 'Chemistry'},
+    'hba1c': {'test_code': 'HbA1c', 'test_name': "Hemoglobin A1c", 'category': 'Chemistry'},
+    'blood_culture': {'test_code': 'BC', 'test_name': "Blood Culture", 'category': 'Microbiology'},
+}
+PANELS = [
+    {'id': 'TP_0001', 'test_code': 'CBC', 'test_name': "CBC with ESR", 'status': 'active'},
+    {'id': 'TP_0002', 'test_code': 'OLD', 'test_name': "Retired Panel", 'status': 'inactive'},
+]
+
+
+def codes(matches):
+    return [match['code'] for match in matches]
+
+
+def test_prefix_matching():
+    index = catalog_search.CatalogIndex(catalog_search.catalog_entries(CATALOG))
+    assert codes(index.search('hem')) == ['HbA1c', 'CBC']
+    assert codes(index.search('HEMOGRAM')) == ['CBC']
+    assert codes(index.search('nabl-cbc')) == ['CBC']
+    assert codes(index.search('hb a1c')) == ['HbA1c']
+    assert index.search('zz') == [] and index.search('  ') == []
+    assert len(index.search('b', limit=2)) == 2
+
+
+def test_ranking():
+    index = catalog_search.CatalogIndex(catalog_search.catalog_entries(CATALOG))
+    # A code beats a name word; a full word beats a longer word it prefixes
+    assert codes(index.search('bmp')) == ['BMP']
+    assert codes(index.search('blood')) == ['BC', 'CBC']
+    assert codes(index.search('bc')) == ['BC']
+    # Every word of a multi-word query must match
+    assert codes(index.search('blood count')) == ['CBC']
+    assert codes(index.search('kidney test')) == ['BMP']
+
+
+def test_panels_merge_with_the_catalog():
+    entries = catalog_search.catalog_entries(CATALOG, PANELS)
+    assert [(e['source'], e['key']) for e in entries if e['code'] == 'CBC'] == [
+        ('catalog', 'complete_blood_count'), ('panel', 'TP_0001')
+    ]
+    assert 'OLD' not in codes(entries)
+    index = catalog_search.CatalogIndex(entries)
+    # Equal scores are ordered by name
+    assert [m['name'] for m in index.search('cbc')] == ["CBC with ESR", "Complete Blood Count"]
+    assert index.search('esr')[0]['key'] == 'TP_0001'
+
+
+def test_index_is_rebuilt_when_panels_change():
+    store = SharedStore(backend=create_backend('memory'))
+    index = catalog_search.get_index(CATALOG, store.panels)
+    assert catalog_search.get_index(CATALOG, store.panels) is index
+    store.add_panel({'test_code': 'VITD', 'test_name': "Vitamin D", 'status': 'active'})
+    rebuilt = catalog_search.get_index(CATALOG, store.panels)
+    assert rebuilt is not index and codes(rebuilt.search('vit')) == ['VITD']
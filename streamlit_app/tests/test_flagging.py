@@ -0,0 +1,44 @@
+import flagging
+
+
+def flags(values, ranges, critical=None):
+    return list(flagging.compute_flags(values, ranges, critical))
+
+
+def test_parse_reference_range_forms():
+    assert flagging.parse_reference_range('4.0-11.0') == (4.0, 11.0, None)
+    assert flagging.parse_reference_range('<200') == (None, 200.0, None)
+    assert flagging.parse_reference_range('>40') == (40.0, None, None)
+    assert flagging.parse_reference_range('Negative') == (None, None, 'negative')
+    assert flagging.parse_reference_range('') == (None, None, None)
+
+
+def test_parse_critical_values():
+    assert flagging.parse_critical_values('<2.0 or >30.0') == (2.0, 30.0)
+    assert flagging.parse_critical_values('') == (None, None)
+
+
+def test_numeric_ranges_and_critical_limits():
+    assert flags(['5', '3', '12', '1.5', '35', ''], ['4.0-11.0'] * 6, ['<2.0 or >30.0'] * 6) == \
+        ['normal', 'low', 'high', 'critical_low', 'critical_high', '']
+
+
+def test_one_sided_bounds():
+    assert flags(['150', '250', '30', '50'], ['<200', '<200', '>40', '>40']) == ['normal', 'high', 'low', 'normal']
+
+
+def test_qualitative_text_results():
+    assert flags(['Negative', 'negative', 'Positive', 'Yellow'], ['Negative', 'Negative', 'Negative', 'Yellow']) == \
+        ['normal', 'normal', 'abnormal', 'normal']
+
+
+def test_number_against_qualitative_range_is_not_passed_as_normal():
+    assert flags(['0', '5', '7'], ['Negative', 'Negative', 'Yellow']) == ['normal', 'abnormal', 'abnormal']
+
+
+def test_critical_limit_applies_to_numbers_against_qualitative_range():
+    assert flags(['1500'], ['Negative'], ['>1000']) == ['critical_high']
+
+
+def test_number_without_range_is_normal():
+    assert flags(['3'], ['']) == ['normal']
@@ -0,0 +1,29 @@
+import instrumentation
+
+
+def test_histogram_quantile_is_bucket_upper_bound():
+    histogram = instrumentation.Histogram(instrumentation.DURATION_BUCKETS)
+    for seconds in (0.002, 0.003, 0.004, 0.2):
+        histogram.observe(seconds)
+    assert histogram.count == 4
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(1.0) == 0.25
+    assert histogram.max == 0.2
+
+
+def test_timed_and_counters_render_as_prometheus():
+    registry = instrumentation.MetricsRegistry()
+    registry.observe_duration('results_page', 'page', 0.02)
+    registry.increment('backend_errors', 2)
+    text = registry.render_prometheus()
+    assert 'lis_duration_seconds_bucket{kind="page",name="results_page",le="0.025"} 1' in text
+    assert 'lis_duration_seconds_count{kind="page",name="results_page"} 1' in text
+    assert 'lis_backend_errors_total 2' in text
+
+
+def test_slow_events_are_kept(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'SLOW_THRESHOLD_SECONDS', 0.1)
+    registry = instrumentation.MetricsRegistry()
+    registry.observe_duration('fast', 'page', 0.01)
+    registry.observe_duration('slow', 'page', 0.5)
+    assert [event['name'] for event in registry.slow_events] == ['slow']
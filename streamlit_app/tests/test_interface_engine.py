@@ -0,0 +1,139 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+import streamlit as st
+
+import audit_log
+import interface_engine
+import mock_his
+from app import LISApp
+from cache_backend import create_backend
+from shared_state import SharedStore
+
+RESULT = {
+    'resultId': 'RES000001', 'test': 'TEST000001', 'orderId': 'ORD000001', 'patient': 'PAT000001',
+    'patientName': "Asha Rao", 'patientSex': 'F', 'testCode': 'CBC', 'testName': "Complete Blood Count",
+    'category': 'hematology', 'collectionDate': '2026-10-18', 'status': 'approved',
+    'approvedAt': '2026-10-19T08:30:00', 'approvedBy': "Dr. Alice", 'interpretation': "Mild anemia",
+    'testValues': [
+        {'parameter': 'Hemoglobin', 'value': 9.8, 'unit': 'g/dL', 'referenceRange': '12-15.5', 'flag': 'low'},
+        {'parameter': 'Smear', 'value': 'Micro|cytic', 'flag': 'abnormal'},
+    ]
+}
+
+
+@pytest.fixture
+def his():
+    his = mock_his.start_mock_his()
+    yield his
+    his.stop()
+
+
+def test_hl7_message():
+    segments = interface_engine.build_oru(RESULT).rstrip('\r').split('\r')
+    assert [s[:3] for s in segments] == ['MSH', 'PID', 'ORC', 'OBR', 'OBX', 'OBX', 'NTE']
+    msh = segments[0].split('|')
+    assert msh[8] == 'ORU^R01^ORU_R01' and msh[9] == 'RES000001.1.hl7' and msh[11] == '2.5.1'
+    assert segments[1].split('|')[5] == 'Rao^Asha'
+    hemoglobin, smear = (s.split('|') for s in segments[4:6])
+    assert hemoglobin[2:9] == ['NM', '718-7^Hemoglobin [Mass/volume] in Blood^LN', '', '9.8', 'g/dL', '12-15.5', 'L']
+    assert smear[5] == 'Micro\\F\\cytic' and smear[8] == 'A'
+    assert segments[3].split('|')[25] == 'F'
+    assert interface_engine.build_oru({**RESULT, 'status': 'amended'}).split('\r')[3].split('|')[25] == 'C'
+
+
+def test_fhir_entries():
+    entries = interface_engine.fhir_entries(RESULT)
+    bundle = json.loads(interface_engine.fhir_batch_body([json.dumps(e) for e in entries]))
+    assert [e['request']['url'] for e in bundle['entry']] == [
+        'Observation/RES000001-1', 'Observation/RES000001-2', 'DiagnosticReport/RES000001'
+    ]
+    hemoglobin = entries[0]['resource']
+    assert hemoglobin['valueQuantity'] == {'value': 9.8, 'unit': 'g/dL'}
+    assert hemoglobin['interpretation'][0]['coding'][0]['code'] == 'L'
+    assert entries[1]['resource']['valueString'] == 'Micro|cytic'
+    report = entries[2]['resource']
+    assert report['status'] == 'final' and report['conclusion'] == "Mild anemia"
+    assert report['result'] == [{'reference': 'Observation/RES000001-1'}, {'reference': 'Observation/RES000001-2'}]
+
+
+def test_outbox_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    interface = interface_engine.ResultInterface(
+        interface_engine.Outbox(path), interface_engine.Sender(None, mllp='his:2575', fhir_url='http://his/fhir')
+    )
+    assert interface.export([RESULT, {**RESULT, 'resultId': 'RES000002', 'status': 'draft'}]) == 2
+    assert interface.export([RESULT]) == 0
+
+    reopened = interface_engine.Outbox(path)
+    assert reopened.counts() == {('hl7', 'pending'): 1, ('fhir', 'pending'): 1}
+    [(_, message_id, payload, parts, attempts)] = reopened.claim('fhir', 10)
+    assert (message_id, parts, attempts) == ('RES000001.1.fhir', 3, 0)
+
+
+def test_failed_sends_back_off_then_park():
+    outbox = interface_engine.Outbox('memory', backoff=60)
+    outbox.enqueue([('M1', 'RES000001', 'hl7', 'MSH|', 1)])
+    [(row_id, *_)] = outbox.claim('hl7', 10)
+    outbox.mark_failed([(row_id, 0, 'ACK AE')], max_attempts=2)
+    assert outbox.claim('hl7', 10) == [] and outbox.due() == 0
+    assert outbox.recent()[0]['error'] == 'ACK AE'
+
+    outbox.mark_failed([(row_id, 1, 'ACK AE')], max_attempts=2)
+    assert outbox.counts() == {('hl7', 'dead'): 1}
+    assert outbox.retry_dead() == 1
+    assert outbox.claim('hl7', 10)[0][4] == 0
+
+
+def test_run_once_delivers_to_the_mock_his(his):
+    outbox = interface_engine.Outbox('memory', backoff=60)
+    sender = interface_engine.Sender(outbox, mllp=his.mllp_address, fhir_url=his.fhir_url)
+    interface = interface_engine.ResultInterface(outbox, sender)
+    interface.export([RESULT, {**RESULT, 'resultId': 'RES000002'}])
+
+    async def deliver():
+        assert await sender.run_once() == (4, 0)
+        assert outbox.counts() == {('hl7', 'sent'): 2, ('fhir', 'sent'): 2}
+        assert his.stats['hl7_received'] == 2 and his.stats['fhir_entries'] == 6
+
+        his.fail_rate = 1.0
+        interface.export([{**RESULT, 'resultId': 'RES000003'}])
+        assert await sender.run_once() == (0, 2)
+        assert outbox.counts()[('hl7', 'pending')] == 1 and outbox.due() == 0
+        # Close the pooled MLLP connections the way the sender loop does on stop
+        sender.stop()
+        await sender._run()
+
+    asyncio.run(deliver())
+
+
+def test_sender_keeps_running_after_an_error(monkeypatch):
+    monkeypatch.setattr(interface_engine, 'POLL_SECONDS', 0)
+    sender = interface_engine.Sender(interface_engine.Outbox('memory'), mllp='his:2575')
+    calls = []
+
+    async def run_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        sender.stop()
+        return 0, 0
+
+    sender.run_once = run_once
+    sender._connections = asyncio.Queue()
+    asyncio.run(sender._run())
+    assert len(calls) == 2
+
+
+def test_save_is_reported_even_when_the_export_fails(monkeypatch):
+    monkeypatch.setattr(st, 'session_state', {'user_role': 'doctor', 'user_name': "Dr. Alice"})
+    app = LISApp.__new__(LISApp)
+    app.store = SharedStore(backend=create_backend('memory'))
+    app.audit_log = audit_log.AuditLog()
+    monkeypatch.setattr(app, 'order_reflex_tests', lambda results: [])
+    monkeypatch.setattr(app, 'export_results', lambda results: 1 / 0)
+    assert app.save_test_results_batch([{**RESULT, 'resultId': None}]) is True
+    assert len(app.store.results) == 1
+    assert "could not be queued" in st.session_state['save_warnings'][0]
@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+import inventory
+from cache_backend import SQLiteBackend, create_backend
+from shared_state import SharedStore
+
+
+def lot(lot_id, reagent_id, remaining, expiry, **fields):
+    return {'lotId': lot_id, 'reagentId': reagent_id, 'remaining': remaining, 'expiryDate': expiry,
+            'status': 'active', 'qcStatus': 'pass', **fields}
+
+
+def qc_run(lot_id, value, level=inventory.QC_LEVELS[0]):
+    return {'lotId': lot_id, 'testCode': 'BMP', 'level': level, 'value': value, 'target': 100.0, 'sd': 2.0,
+            'runAt': datetime.now().isoformat()}
+
+
+def test_westgard_rules():
+    assert inventory.evaluate_qc(107, 100, 2)[1:] == ('1-3s', 'fail')
+    assert inventory.evaluate_qc(105, 100, 2)[1:] == ('1-2s', 'warn')
+    assert inventory.evaluate_qc(105, 100, 2, previous_z=2.2)[1:] == ('2-2s', 'fail')
+    assert inventory.evaluate_qc(105, 100, 2, previous_z=-2.2)[1:] == ('1-2s', 'warn')
+    assert inventory.evaluate_qc(101, 100, 2)[1:] == (None, 'pass')
+
+
+def test_allocate_takes_earliest_expiry_first():
+    reagents = inventory.ReagentInventory()
+    lots = [
+        lot('L2', 'CHEM-GLU', 50, '2027-06-30'),
+        lot('L1', 'CHEM-GLU', 30, '2027-01-31'),
+        lot('L3', 'CHEM-GLU', 500, '2027-03-31', qcStatus='fail'),
+    ]
+    changes = reagents.allocate({'CHEM-GLU': 40, 'CHEM-ELEC': 5}, lots, today=date(2026, 10, 19))
+    assert changes == {'L1': {'remaining': 0, 'status': 'depleted'}, 'L2': {'remaining': 40, 'status': 'active'}}
+    assert reagents.shortfall['CHEM-ELEC'] == 5
+
+
+def test_forecast_from_steady_usage():
+    today = date(2026, 10, 19)
+    reagents = inventory.ReagentInventory()
+    for days_ago in range(28):
+        reagents.record_usage(today - timedelta(days=days_ago), {'CHEM-GLU': 10})
+    forecast = reagents.forecast([lot('L1', 'CHEM-GLU', 100, '2027-06-30')], 1, today).set_index('reagentId')
+    assert forecast.loc['CHEM-GLU', 'dailyUsage'] == 10
+    assert forecast.loc['CHEM-GLU', 'daysLeft'] == 9
+    assert forecast.loc['CHEM-GLU', 'status'] == 'order now'
+    assert forecast.loc['HEM-DIL', 'status'] == 'unused'
+    assert reagents.forecast([lot('L1', 'CHEM-GLU', 100, '2027-06-30')], 1, today) is reagents._forecast
+
+
+def test_qc_run_on_unknown_lot_is_rejected():
+    store = SharedStore(backend=create_backend('memory'))
+    with pytest.raises(ValueError, match="Unknown reagent lot"):
+        store.add_qc_run(qc_run('LOT99999', 100.0))
+    assert len(store.qc_runs) == 0
+
+
+def test_qc_usage_is_kept_on_the_run_and_replayed():
+    store = SharedStore(backend=create_backend('memory'))
+    received = store.add_reagent_lot({'reagentId': 'CHEM-GLU', 'quantity': 100, 'expiryDate': '2099-12-31'})
+    run = store.add_qc_run(qc_run(received['lotId'], 107.0))
+    assert (run['used'], run['reagentId'], run['outcome']) == (1, 'CHEM-GLU', 'fail')
+    assert store.reagent_lots.get(received['lotId'])['remaining'] == 99
+    assert store.reagent_lots.get(received['lotId'])['qcStatus'] == 'fail'
+
+    rebuilt = inventory.ReagentInventory(store.results.snapshot(), store.worklist, store.qc_runs.snapshot())
+    assert rebuilt.series.days.sum() == 1
+    assert np.allclose(rebuilt.series.days, store.inventory.series.days)
+
+
+def test_remote_qc_runs_update_usage(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    writer, reader = [SharedStore(backend=SQLiteBackend(path, poll_interval=3600)) for _ in range(2)]
+    try:
+        received = writer.add_reagent_lot({'reagentId': 'CHEM-GLU', 'quantity': 100, 'expiryDate': '2099-12-31'})
+        writer.add_qc_run(qc_run(received['lotId'], 100.0))
+        reader._invalidate(None, None)
+        assert reader.inventory.series.days.sum() == 1
+        assert np.allclose(reader.inventory.series.days, writer.inventory.series.days)
+    finally:
+        writer.backend.close()
+        reader.backend.close()
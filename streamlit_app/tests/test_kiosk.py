@@ -0,0 +1,76 @@
+import pytest
+
+import kiosk
+from backend_client import BackendError
+from benchmarks.kiosk import CentralStub
+from cache_backend import KioskBackend
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    backend = KioskBackend(str(tmp_path / 'kiosk.db'), site_id='KSK01', poll_interval=3600)
+    yield backend
+    backend.close()
+
+
+def records(backend, collection, key):
+    return {r[key]: r for r in backend.load(collection)}
+
+
+def test_pull_push_round_trip(mirror):
+    central = CentralStub()
+    central.write('worklist', 'T1', {'testId': 'T1', 'status': 'pending'})
+    sync = kiosk.KioskSync(mirror, central, batch_size=2, interval=0)
+    assert sync.sync_once() == (0, 1)
+    assert records(mirror, 'worklist', 'testId')['T1']['status'] == 'pending'
+
+    mirror.upsert('worklist', 'testId', [{'testId': 'T1', 'status': 'collected'},
+                                         {'testId': 'KSK01-T2', 'status': 'collected'},
+                                         {'testId': 'KSK01-T3', 'status': 'collected'}])
+    assert mirror.pending_count() == 3
+    assert sync.sync_once() == (3, 0)
+    assert mirror.pending_count() == 0
+    assert central.records[('worklist', 'T1')][0]['status'] == 'collected'
+    # The kiosk's own changes are not pulled back
+    assert central.sync_changes('KSK01', 1, 10)['changes'] == []
+
+
+def test_conflicts_merge_per_collection(mirror):
+    central = CentralStub()
+    central.write('worklist', 'T1', {'testId': 'T1', 'status': 'pending', 'priority': 'routine'})
+    sync = kiosk.KioskSync(mirror, central, interval=0)
+    sync.sync_once()
+
+    mirror.upsert('worklist', 'testId', [{'testId': 'T1', 'status': 'collected', 'priority': 'routine'}])
+    central.write('worklist', 'T1', {'testId': 'T1', 'status': 'in_progress', 'priority': 'stat'})
+    sync.sync_once()
+    sync.sync_once()
+
+    assert sync.stats['conflicts'] == 1
+    assert mirror.pending_count() == 0
+    assert records(mirror, 'worklist', 'testId')['T1'] == {'testId': 'T1', 'status': 'in_progress', 'priority': 'stat'}
+    assert central.records[('worklist', 'T1')][0]['status'] == 'in_progress'
+
+
+def test_offline_rounds_keep_the_outbox(mirror):
+    central = CentralStub(fail_rate=1.0)
+    sync = kiosk.KioskSync(mirror, central, interval=0)
+    mirror.upsert('patients', 'patientId', [{'patientId': 'KSK01-P1', 'patientName': "Asha Rao"}])
+    with pytest.raises(BackendError):
+        sync.sync_once()
+    status = sync.status()
+    assert status['online'] is False and status['pending'] == 1 and status['lastError']
+
+    central.fail_rate = 0.0
+    assert sync.sync_once() == (1, 0)
+    assert sync.status()['online'] is True
+
+
+def test_resolvers():
+    assert kiosk.resolve_test({'status': 'completed'}, {'status': 'processing', 'x': 1}) == {'status': 'completed', 'x': 1}
+    assert kiosk.resolve_test({'status': 'pending'}, {'status': 'processing'})['status'] == 'processing'
+    assert kiosk.resolve_result({'status': 'approved'}, {'status': 'pending_review'})['status'] == 'approved'
+    assert kiosk.resolve_result({'status': 'draft', 'version': 1}, {'status': 'draft', 'version': 2})['version'] == 2
+    assert kiosk.resolve_patient({'phone': '', 'email': 'a@b.org'}, {'phone': '123', 'email': None}) == {
+        'phone': '123', 'email': 'a@b.org'
+    }
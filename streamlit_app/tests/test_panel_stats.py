@@ -0,0 +1,37 @@
+import panel_stats
+
+
+def panel(category, cost, status='active', parameters=2):
+    return {'category': category, 'test_cost': cost, 'status': status, 'sample_type': 'Serum',
+            'test_method': 'Automated Analyzer', 'parameters': [{}] * parameters}
+
+
+def test_cost_bucket_boundaries():
+    assert panel_stats.cost_bucket(0) == "₹0-250"
+    assert panel_stats.cost_bucket(250) == "₹250-500"
+    assert panel_stats.cost_bucket(5000) == "₹2000+"
+
+
+def test_incremental_updates_match_a_rebuild():
+    panels = [panel('Chemistry', 300), panel('Hematology', 150, status='inactive'),
+              panel('Chemistry', 900, parameters=5)]
+    stats = panel_stats.PanelStatistics()
+    stats.extend(panels)
+    stats.remove(panels[1])
+    stats.status_changed('active', 'inactive')
+    panels[0]['status'] = 'inactive'
+
+    rebuilt = panel_stats.PanelStatistics([panels[0], panels[2]])
+    assert (stats.total, stats.active, stats.cost_sum, stats.parameter_sum) == \
+        (rebuilt.total, rebuilt.active, rebuilt.cost_sum, rebuilt.parameter_sum)
+    assert stats.cost_distribution() == rebuilt.cost_distribution()
+    assert stats.average_cost_by_category() == {'Chemistry': 600.0}
+
+
+def test_removed_category_is_not_most_common():
+    hematology = panel('Hematology', 100)
+    stats = panel_stats.PanelStatistics([hematology, panel('Chemistry', 100)])
+    stats.remove(hematology)
+    stats.add(panel('Chemistry', 200))
+    assert stats.most_common_category == 'Chemistry'
+    assert 'Hematology' not in stats.by_category
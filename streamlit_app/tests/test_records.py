@@ -0,0 +1,59 @@
+import pickle
+
+import pytest
+
+from cache_backend import create_backend
+from records import PanelTest, Record, compact
+from shared_state import SharedCollection, SharedStore
+
+TEST = {'testId': 'TEST000001', 'patientId': 'PAT000001', 'status': 'collected', 'priority': 'routine',
+        'parameters': [{'name': 'Hemoglobin', 'unit': 'g/dL'}]}
+PANEL = {'test_code': 'VITD', 'test_name': "Vitamin D", 'category': 'Chemistry', 'sample_type': 'Serum',
+         'test_method': 'CLIA', 'parameters': [], 'authorization_level': 'Technician', 'status': 'active'}
+
+
+def test_record_reads_like_a_dict():
+    record = Record(TEST)
+    assert record == TEST and dict(record) == TEST
+    assert list(record) == list(TEST) and len(record) == len(TEST)
+    assert record['status'] == 'collected' and record.get('missing', 'x') == 'x'
+    assert 'priority' in record and 'missing' not in record
+    assert {**record, 'status': 'completed'}['status'] == 'completed'
+    with pytest.raises(KeyError):
+        record['missing']
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_records_share_layouts_and_values():
+    first, second = Record(TEST), Record({**TEST, 'testId': 'TEST000002', 'status': ''.join(['coll', 'ected'])})
+    assert first._layout is second._layout
+    assert first['status'] is second['status']
+    assert first['parameters'] is second['parameters']
+    assert compact(first) is first
+
+
+def test_update_builds_new_records_without_touching_shared_layouts():
+    collection = SharedCollection('worklist', 'testId', [TEST, {**TEST, 'testId': 'TEST000002'}], record=compact)
+    old, other = collection.snapshot()
+    names = old._layout.names
+    [(replaced, new)] = collection.update_each({'TEST000001': {'status': 'completed', 'stabilityStatus': 'expired'}})
+    assert replaced is old and old['status'] == 'collected' and 'stabilityStatus' not in old
+    assert isinstance(new, Record) and new['status'] == 'completed' and new['stabilityStatus'] == 'expired'
+    assert old._layout.names == names and other._layout is old._layout
+    assert new._layout is not old._layout
+    assert collection.get('TEST000001') is new
+
+
+def test_panel_test_reflects_panel_edits():
+    store = SharedStore(backend=create_backend('memory'))
+    panel = store.add_panel(PANEL)
+    store.sync_worklist_with_panels(lambda p: PanelTest(p, store.panels))
+    view = store.worklist.get(f"CUSTOM_{panel['id']}")
+    assert isinstance(view, PanelTest)
+    assert (view['testCode'], view['testType'], view['isCustomPanel']) == ('VITD', 'vitd', True)
+
+    store.panels.update([panel['id']], {'test_name': "25-OH Vitamin D", 'sample_type': 'Plasma'})
+    assert (view['testName'], view['sampleType']) == ("25-OH Vitamin D", 'plasma')
+    assert pickle.loads(pickle.dumps(view))['testName'] == "25-OH Vitamin D"
+    store.remove_panel(panel['id'])
+    assert view['testName'] == "25-OH Vitamin D"
@@ -0,0 +1,67 @@
+import pytest
+
+import reference_ranges
+from reference_ranges import ReferenceRangeStore, personalize_parameters
+
+URINALYSIS = [
+    {'key': 'protein', 'name': 'Protein', 'unit': 'mg/dL', 'reference_range': 'Negative', 'format': '%.0f'},
+    {'key': 'glucose_urine', 'name': 'Glucose', 'unit': 'mg/dL', 'reference_range': 'Negative', 'format': '%.0f'}
+]
+
+
+def resolve(parameter, **patient):
+    return reference_ranges.DEFAULT_STORE.resolve_text(parameter, **patient)
+
+
+def test_age_sex_and_trimester_bands():
+    assert resolve('Hemoglobin', age=40, sex='M') == '13-17'
+    assert resolve('Hemoglobin', age=70, sex='F') == '11.5-15.5'
+    assert resolve('Hemoglobin', age=5) == '11-14'
+    assert resolve('Hemoglobin', age=30, sex='F', trimester=2) == '10.5-14'
+    assert resolve('TSH', age=30, sex='M', trimester=1) == '0.4-4'
+
+
+def test_aliases_and_missing_age():
+    assert resolve('White Blood Cells', age=30) == resolve('WBC', age=30) == '4-11'
+    assert resolve('Creatinine', sex='Female') == '0.6-1.1'
+    assert resolve('Unknown Analyte', fallback='1-2') == '1-2'
+
+
+def test_one_sided_interval_text():
+    assert resolve('HDL Cholesterol', age=40, sex='F') == '>50'
+
+
+def test_overlapping_bands_are_rejected():
+    store = ReferenceRangeStore([reference_ranges._band('x', 1, 2, 0, 10)])
+    with pytest.raises(ValueError):
+        store.add(reference_ranges._band('x', 1, 2, 5, 20))
+
+
+def test_specimens_never_share_intervals():
+    assert reference_ranges.specimen_type('Serum') == reference_ranges.specimen_type('Whole Blood') == 'blood'
+    assert reference_ranges.specimen_type('Urine') == 'urine'
+    assert resolve('glucose_urine', age=40) == ''
+    assert resolve('Glucose', age=40, specimen='urine') == ''
+    assert resolve('Glucose', age=40, specimen='Serum') == '70-100'
+    assert resolve('Glucose', age=40) == '70-100'
+    store = ReferenceRangeStore([reference_ranges._band('glucose', 0, 15, specimen='urine')])
+    assert store.resolve_text('glucose_urine') == '0-15'
+
+
+def test_urinalysis_panel_keeps_its_own_ranges():
+    for test in ({'patientAge': 40, 'patientSex': 'F', 'sampleType': 'urine'}, {'patientAge': 40}):
+        ranges = {p['key']: p['reference_range'] for p in personalize_parameters(URINALYSIS, test)}
+        assert ranges == {'protein': 'Negative', 'glucose_urine': 'Negative'}
+
+
+def test_catalog_urine_panel_without_keys_uses_sample_type():
+    parameters = [{'name': 'Glucose', 'unit': 'mg/dL', 'reference_range': 'Negative'}]
+    urine = personalize_parameters(parameters, {'patientAge': 40, 'sampleType': 'Urine'})
+    serum = personalize_parameters(parameters, {'patientAge': 40, 'sampleType': 'Serum'})
+    assert urine[0]['reference_range'] == 'Negative'
+    assert serum[0]['reference_range'] == '70-100'
+
+
+def test_sex_specific_generic_text():
+    assert reference_ranges.sex_specific_text('>40 (M), >50 (F)', 'F') == '>50'
+    assert reference_ranges.sex_specific_text('4-11', 'M') == '4-11'
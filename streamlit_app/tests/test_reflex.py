@@ -0,0 +1,71 @@
+import streamlit as st
+
+import audit_log
+import reflex
+from app import LISApp
+from cache_backend import create_backend
+from shared_state import SharedStore
+
+
+def saved(test_id, *values, status='pending_review'):
+    return {'test': test_id, 'patient': 'PAT000001', 'patientName': "Asha Rao", 'collectionDate': '2026-10-19',
+            'status': status, 'testValues': [{'parameter': p, 'value': v, 'flag': f} for p, v, f in values]}
+
+
+def entry_app(monkeypatch):
+    monkeypatch.setattr(st, 'session_state', {'user_role': 'lab_technician', 'user_name': "Sam"})
+    app = LISApp.__new__(LISApp)
+    app.store = SharedStore(backend=create_backend('memory'))
+    app.audit_log = audit_log.AuditLog()
+    return app
+
+
+def test_save_is_reported_even_when_reflex_ordering_fails(monkeypatch):
+    app = entry_app(monkeypatch)
+    monkeypatch.setattr(app, 'order_reflex_tests', lambda results: 1 / 0)
+    monkeypatch.setattr(app, 'export_results', lambda results: 0)
+    assert app.save_test_results_batch([saved('TEST000001', ('TSH', 9.0, 'high'))]) is True
+    assert len(app.store.results) == 1
+    assert "reflex tests could not be ordered" in st.session_state['save_warnings'][0]
+
+
+def ordered_codes(tests):
+    return sorted(test['testCode'] for test in tests)
+
+
+def test_rule_fires_on_its_parameter():
+    engine = reflex.ReflexEngine(reflex.REFLEX_RULES)
+    store = SharedStore(backend=create_backend('memory'))
+    [source] = store.add_tests([{'testCode': 'TFT', 'patientId': 'PAT000001', 'collectionDate': '2026-10-19'}])
+    tests = engine.reflex_tests([saved(source['testId'], ('TSH', 9.0, 'high'))], store.worklist)
+    assert ordered_codes(tests) == ['FT4']
+    assert tests[0]['reflexOf'] == source['testId'] and tests[0]['orderId'] == source['orderId']
+    assert tests[0]['reflexRule'] == 'TSH out of range → Free T4'
+
+
+def test_rules_ignore_other_parameters_and_conditions():
+    engine = reflex.ReflexEngine(reflex.REFLEX_RULES)
+    store = SharedStore(backend=create_backend('memory'))
+    [source] = store.add_tests([{'testCode': 'TFT', 'patientId': 'PAT000001', 'collectionDate': '2026-10-19'}])
+    # In range, a parameter with no rule, a rule limited to other tests, and Free T4 already reported
+    results = [
+        saved(source['testId'], ('TSH', 2.0, 'normal'), ('Sodium', 150, 'high'), ('Glucose', 180, 'high')),
+        saved(source['testId'], ('TSH', 9.0, 'high'), ('Free T4', 1.2, 'normal')),
+        saved(source['testId'], ('TSH', 9.0, 'high'), status='draft'),
+    ]
+    assert engine.reflex_tests(results, store.worklist) == []
+    assert [rule['add'] for rule, _ in engine.matches(saved('T', ('Albumin', 2.5, None)), 'ALB')] == ['LFT']
+    assert engine.matches(saved('T', ('Albumin', 2.5, None)), 'LFT') == []
+
+
+def test_no_duplicate_reflex_orders_for_a_sample():
+    engine = reflex.ReflexEngine(reflex.REFLEX_RULES)
+    store = SharedStore(backend=create_backend('memory'))
+    [source] = store.add_tests([{'testCode': 'CBC', 'patientId': 'PAT000001', 'collectionDate': '2026-10-19'}])
+    result = saved(source['testId'], ('Hemoglobin', 7.0, 'critical_low'))
+    first = engine.reflex_tests([result, result], store.worklist)
+    assert ordered_codes(first) == ['PS']
+    store.add_tests(first, new_order=False)
+    assert engine.reflex_tests([result], store.worklist) == []
+    # A fresh engine finds the order on the worklist as well
+    assert reflex.ReflexEngine(reflex.REFLEX_RULES).reflex_tests([result], store.worklist) == []
@@ -0,0 +1,46 @@
+import threading
+
+import report_renderer
+
+
+def finalized_result(result_id='RES000001'):
+    return {
+        'resultId': result_id,
+        'patientName': "Asha Rao",
+        'patient': 'PAT000001',
+        'test': 'TST000001',
+        'testName': "Fasting Blood Sugar",
+        'status': 'approved',
+        'testValues': [{'parameter': 'Glucose', 'value': '92', 'unit': 'mg/dL', 'referenceRange': '70-100',
+                        'flag': 'normal'}]
+    }
+
+
+def test_render_patient_report_escapes_values():
+    result = finalized_result()
+    result['patientName'] = "<b>Asha</b>"
+    report = report_renderer.render_patient_report(result)
+    assert "RES000001" in report
+    assert "&lt;b&gt;Asha&lt;/b&gt;" in report
+    assert "<b>Asha</b>" not in report
+
+
+def test_batches_started_together_get_separate_directories(monkeypatch, tmp_path):
+    monkeypatch.setattr(threading.Thread, 'start', lambda self: None)
+    jobs = [report_renderer.start_batch_job([finalized_result()], output_dir=str(tmp_path)) for _ in range(3)]
+    assert len({job.output_dir for job in jobs}) == 3
+
+
+def test_finished_jobs_are_evicted(monkeypatch, tmp_path):
+    monkeypatch.setattr(report_renderer, '_JOBS', {})
+    monkeypatch.setattr(report_renderer, 'MAX_FINISHED_JOBS', 2)
+    monkeypatch.setattr(threading.Thread, 'start', lambda self: None)
+    jobs = [report_renderer.start_batch_job([], output_dir=str(tmp_path)) for _ in range(4)]
+    for job in jobs:
+        job.status = 'completed'
+    running = report_renderer.start_batch_job([], output_dir=str(tmp_path))
+    latest = report_renderer.start_batch_job([], output_dir=str(tmp_path))
+    assert report_renderer.get_batch_job(jobs[0].id) is None
+    assert report_renderer.get_batch_job(jobs[-1].id) is jobs[-1]
+    assert report_renderer.get_batch_job(running.id) is running
+    assert report_renderer.get_batch_job(latest.id) is latest
@@ -0,0 +1,105 @@
+from datetime import date, datetime
+
+import pytest
+
+import report_scheduler
+from cache_backend import create_backend
+from shared_state import SharedStore
+
+PERIOD = {'dateFrom': '2026-10-01', 'dateTo': '2026-10-31'}
+
+
+@pytest.fixture
+def store():
+    store = SharedStore(backend=create_backend('memory'))
+    store.add_tests([
+        {'testCode': 'CBC', 'category': 'hematology', 'priority': 'routine', 'status': 'pending',
+         'collectionDate': '2026-10-18'},
+        {'testCode': 'BMP', 'category': 'chemistry', 'priority': 'stat', 'status': 'completed',
+         'collectionDate': '2026-10-18'},
+        {'testCode': 'LFT', 'category': 'chemistry', 'priority': 'routine', 'status': 'completed',
+         'collectionDate': '2026-10-19'},
+        {'testCode': 'TSH', 'category': 'chemistry', 'priority': 'routine', 'status': 'pending',
+         'collectionDate': '2026-09-30'},
+    ])
+    return store
+
+
+@pytest.fixture
+def service(store):
+    service = report_scheduler.ReportService(store, workers=1)
+    yield service
+    service.shutdown()
+
+
+@pytest.mark.parametrize('group_by', report_scheduler.GROUP_BY['test-volume'])
+def test_volume_for_each_grouping(store, group_by):
+    table = report_scheduler.test_volume(store, {**PERIOD, 'groupBy': group_by})['Test volume']
+    assert table['total'].sum() == 3
+    assert ('day' if group_by == 'day' else group_by) in table.columns
+
+
+def test_volume_by_category_and_day(store):
+    by_category = report_scheduler.test_volume(store, {**PERIOD, 'groupBy': 'category'})['Test volume']
+    assert dict(zip(by_category['category'], by_category['total'])) == {'chemistry': 2, 'hematology': 1}
+
+    by_day = report_scheduler.test_volume(store, PERIOD)['Test volume'].set_index('day')
+    assert by_day.loc['2026-10-18', 'chemistry'] == 1 and by_day.loc['2026-10-18', 'hematology'] == 1
+    assert by_day.loc['2026-10-19', 'total'] == 1
+
+
+def test_periods():
+    today = date(2026, 10, 19)
+    assert report_scheduler.period('daily', today) == ('2026-10-18', '2026-10-18')
+    assert report_scheduler.period('weekly', today) == ('2026-10-12', '2026-10-18')
+    assert report_scheduler.period('monthly', today) == ('2026-09-01', '2026-09-30')
+    assert report_scheduler.period('quarterly', today) == ('2026-07-01', '2026-09-30')
+    assert report_scheduler.period('quarterly', date(2026, 1, 5)) == ('2025-10-01', '2025-12-31')
+
+
+def test_next_run():
+    after = datetime(2026, 10, 19, 7, 0)
+    assert report_scheduler.next_run({'frequency': 'daily', 'time': '06:00'}, after) == datetime(2026, 10, 20, 6, 0)
+    assert report_scheduler.next_run({'frequency': 'daily', 'time': '08:30'}, after) == datetime(2026, 10, 19, 8, 30)
+    assert report_scheduler.next_run({'frequency': 'weekly', 'weekday': 0, 'time': '06:00'}, after) == \
+        datetime(2026, 10, 26, 6, 0)
+    assert report_scheduler.next_run({'frequency': 'monthly', 'day': 31, 'time': '06:00'}, after) == \
+        datetime(2026, 10, 28, 6, 0)
+    assert report_scheduler.next_run({'frequency': 'quarterly', 'day': 1, 'time': '06:00'}, after) == \
+        datetime(2027, 1, 1, 6, 0)
+
+
+def test_reports_are_cached_until_their_data_changes(store, service):
+    params = {**PERIOD, 'groupBy': 'category'}
+    first = service.run('test-volume', params)
+    assert service.run('test-volume', params) is first
+    store.add_tests([{'testCode': 'CBC', 'category': 'hematology', 'collectionDate': '2026-10-19'}])
+    second = service.run('test-volume', params)
+    assert second is not first
+    assert second.sections['Test volume']['total'].sum() == 4
+
+
+def test_scheduled_run_writes_files(store, service, tmp_path):
+    schedule = store.add_report_schedule({'reportType': 'test-volume', 'frequency': 'monthly',
+                                          'parameters': {'groupBy': 'category'}, 'format': 'csv',
+                                          'createdAt': '2026-10-01T00:00:00'})
+    scheduler = report_scheduler.ReportScheduler(service, output_dir=str(tmp_path), tick=0)
+    paths = scheduler.run_schedule(schedule, datetime(2026, 11, 1, 6, 0))
+    assert len(paths) == 1 and 'test-volume_2026-10-01_2026-10-31' in paths[0]
+    assert store.report_schedules.get(schedule['scheduleId'])['lastStatus'] == 'completed'
+
+
+def test_each_slot_runs_on_one_worker(store, service, tmp_path, monkeypatch):
+    schedule = store.add_report_schedule({'reportType': 'test-volume', 'frequency': 'daily', 'time': '06:00',
+                                          'format': 'csv', 'createdAt': '2026-10-18T07:00:00'})
+    first, second = (report_scheduler.ReportScheduler(service, output_dir=str(tmp_path), tick=0) for _ in range(2))
+    slots = [datetime(2026, 10, 19, 6, 0), datetime(2026, 10, 19, 6, 0), datetime(2026, 10, 20, 6, 0)]
+    # The second worker still sees the schedule as due from a view older than the first worker's run
+    for scheduler in (first, second):
+        monkeypatch.setattr(scheduler, 'due', lambda now=None: [(schedule, slots.pop(0))] if slots else [])
+    assert first.run_due() == 1
+    assert second.run_due() == 0
+    assert second.run_due() == 1
+    assert [name for name in store.backend._sequences if name.startswith('report-run:')] == [
+        f"report-run:{schedule['scheduleId']}"
+    ]
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+import inventory
+from benchmarks.synthetic import generate_lab
+from cache_backend import SQLiteBackend
+from panel_stats import PanelStatistics
+from shared_state import SharedCollection, SharedStore
+from surveillance import SurveillanceCube
+
+
+@pytest.fixture(scope='module')
+def lab():
+    return generate_lab(n_patients=20, m_pending=30, p_panels=10, k_results=60)
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two stores sharing one SQLite file; invalidation is driven by hand instead of the poller"""
+    path = str(tmp_path / 'cache.db')
+    stores = [SharedStore(backend=SQLiteBackend(path, poll_interval=3600)) for _ in range(2)]
+    yield stores
+    for store in stores:
+        store.backend.close()
+
+
+def test_collection_update_and_remove_keep_ids_and_positions():
+    collection = SharedCollection('items', 'id', [{'id': i, 'n': i} for i in range(5)])
+    replaced = collection.update([1, 3], {'n': 0})
+    assert [(old['n'], new['n']) for old, new in replaced] == [(1, 0), (3, 0)]
+    assert collection.get(3)['n'] == 0
+    assert collection.remove(2)['id'] == 2
+    assert collection.remove(2) is None
+    assert [item['id'] for item in collection.snapshot()] == [0, 1, 3, 4]
+    collection.update_each({4: {'n': 40}, 0: {'n': 10}})
+    assert [item['n'] for item in collection.snapshot()] == [10, 0, 0, 40]
+
+
+def test_reload_returns_what_changed():
+    collection = SharedCollection('items', 'id', [{'id': 1, 'n': 1}, {'id': 2, 'n': 2}])
+    changed = collection.reload([{'id': 1, 'n': 1}, {'id': 2, 'n': 20}, {'id': 3, 'n': 3}])
+    assert changed == [({'id': 2, 'n': 2}, {'id': 2, 'n': 20}), (None, {'id': 3, 'n': 3})]
+    assert collection.reload([{'id': 3, 'n': 3}]) == [({'id': 1, 'n': 1}, None), ({'id': 2, 'n': 20}, None)]
+    assert collection.get(1) is None
+
+
+def test_changed_since_names_the_written_ids():
+    collection = SharedCollection('items', 'id', [{'id': i, 'n': i} for i in range(3)])
+    version, changed = collection.changed_since(None)
+    assert changed is None
+    collection.update([1], {'n': 10})
+    collection.extend([{'id': 3, 'n': 3}])
+    collection.remove(0)
+    assert collection.changed_since(version) == (version + 3, {0, 1, 3})
+    assert collection.changed_since(version + 3) == (version + 3, set())
+    collection.reload([{'id': 1, 'n': 10}, {'id': 3, 'n': 30}])
+    assert collection.changed_since(version + 3)[1] == {2, 3}
+    collection.clear()
+    assert collection.changed_since(version + 3)[1] is None
+
+
+def test_remote_writes_update_derived_state_like_a_rebuild(lab, workers):
+    writer, reader = workers
+    writer.add_panels(lab['custom_test_panels'])
+    writer.add_results(lab['test_results'][:40])
+    reader._invalidate(None, None)
+
+    panel = writer.panels.snapshot()[0]
+    writer.remove_panel(panel['id'])
+    writer.set_panel_status(writer.panels.snapshot()[0]['id'], 'inactive')
+    pending = [r['resultId'] for r in writer.results.snapshot() if r['status'] not in inventory.FINAL_STATUSES]
+    writer.update_results(pending, {'status': 'approved'})
+    writer.add_results(lab['test_results'][40:])
+    for collection in ('panels', 'results'):
+        reader._invalidate(collection, None)
+
+    stats = PanelStatistics(reader.panels.snapshot())
+    assert (reader.panel_stats.total, reader.panel_stats.active, reader.panel_stats.cost_sum) == \
+        (stats.total, stats.active, stats.cost_sum)
+    assert reader.panel_stats.by_category == stats.by_category
+
+    cube = SurveillanceCube(reader.results.snapshot(), reader.worklist)
+    assert reader.surveillance.cells == cube.cells
+
+    rebuilt = inventory.ReagentInventory(reader.results.snapshot(), reader.worklist)
+    assert np.allclose(reader.inventory.series.days, rebuilt.series.days)
+
+
+def test_reload_with_nothing_changed_leaves_derived_state_alone(lab, workers):
+    writer, reader = workers
+    writer.add_results(lab['test_results'][:10])
+    reader._invalidate('results', None)
+    version = reader.surveillance.version
+    reader._invalidate('results', None)
+    assert reader.surveillance.version == version
+
+
+def test_merge_applies_only_the_named_records():
+    collection = SharedCollection('items', 'id', [{'id': 'A', 'n': 1}, {'id': 'B', 'n': 2}, {'id': 'C', 'n': 3}])
+    version = collection.version
+    changed = collection.merge({'B': {'id': 'B', 'n': 20}, 'A': None, 'D': {'id': 'D', 'n': 4},
+                                'C': {'id': 'C', 'n': 3}, 'E': None})
+    assert [(old and old['id'], new and new['n']) for old, new in changed] == [('B', 20), ('A', None), (None, 4)]
+    assert [item['id'] for item in collection.snapshot()] == ['B', 'C', 'D']
+    assert collection.get('A') is None and collection.get('D')['n'] == 4
+    assert collection.changed_since(version) == (version + 1, {'A', 'B', 'D'})
+    collection.update(['D'], {'n': 40})
+    assert collection.snapshot()[2]['n'] == 40
+    assert collection.merge({'C': {'id': 'C', 'n': 3}}) == [] and collection.version == version + 2
+
+
+def test_named_invalidation_fetches_only_those_records(lab, workers, monkeypatch):
+    writer, reader = workers
+    writer.add_results(lab['test_results'][:20])
+    reader._invalidate(None, None)
+
+    def full_reload(collection):
+        raise AssertionError(f"{collection} was reloaded in full")
+
+    monkeypatch.setattr(reader.backend, 'load', full_reload)
+    first, second = (r['resultId'] for r in writer.results.snapshot()[:2])
+    writer.update_results([first], {'status': 'amended'})
+    writer.results.remove(second)
+    added = writer.add_results(lab['test_results'][20:22])
+    reader._invalidate('results', None, [first, second] + [r['resultId'] for r in added])
+
+    assert reader.results.snapshot() == writer.results.snapshot()
+    assert reader.surveillance.cells == SurveillanceCube(reader.results.snapshot(), reader.worklist).cells
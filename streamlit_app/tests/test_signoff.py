@@ -0,0 +1,96 @@
+import streamlit as st
+
+import audit_log
+import auth
+import backend_client
+import signoff
+from app import LISApp
+from cache_backend import create_backend
+from shared_state import SharedStore
+
+
+class RecordingClient(backend_client.BackendClient):
+    def __init__(self):
+        super().__init__(base_url='http://backend.test')
+        self.calls = []
+
+    def request(self, method, path, **kwargs):
+        self.calls.append((method, path, kwargs.get('json')))
+        return {'success': True, 'data': {}}
+
+
+def queued(level, priority='routine', saved_at='2026-10-19T08:00', **fields):
+    return {'status': signoff.QUEUE_STATUS, 'authorizationLevel': level, 'priority': priority,
+            'savedAt': saved_at, 'testValues': [], **fields}
+
+
+def test_levels_and_roles():
+    assert signoff.normalize_level('Supervisor') == 'Lab Supervisor'
+    assert signoff.normalize_level(None) == 'Technician'
+    assert signoff.can_sign('doctor', auth.permissions_for('doctor'), 'Pathologist')
+    assert not signoff.can_sign('receptionist', auth.permissions_for('receptionist'), 'Technician')
+    # Without approve_results the role's level does not apply
+    assert not signoff.can_sign('manager', auth.permissions_for('manager'), 'Technician')
+    assert not signoff.can_sign('lab_technician', auth.permissions_for('lab_technician'), 'Technician')
+    granted = auth.permissions_for('manager', ('approve_results',))
+    assert signoff.can_sign('manager', granted, 'Lab Supervisor')
+    assert not signoff.can_sign('manager', granted, 'Pathologist')
+    assert signoff.role_level('nurse', auth.permissions_for('nurse', ('approve_results',))) == 'Technician'
+    assert signoff.signoff_fields({'priority': 'STAT', 'requiresAuthorization': False}) == {
+        'priority': 'stat', 'authorizationLevel': 'Technician'
+    }
+
+
+def test_queue_orders_by_priority_then_age():
+    results = [
+        queued('Technician', saved_at='2026-10-19T09:00', resultId='R1'),
+        queued('Pathologist', priority='stat', resultId='R2'),
+        queued('Technician', saved_at='2026-10-19T07:00', resultId='R3'),
+        {**queued('Technician', resultId='R4'), 'status': 'approved'},
+    ]
+    queue = signoff.SignoffQueue(results)
+    assert [r['resultId'] for r in queue.pending()] == ['R2', 'R3', 'R1']
+    assert [r['resultId'] for r in queue.pending(levels=['Technician'], limit=1)] == ['R3']
+    assert queue.counts() == {('Technician', 'routine'): 2, ('Pathologist', 'stat'): 1}
+
+
+def test_flag_summary_and_critical():
+    result = {'testValues': [{'parameter': 'Hemoglobin', 'flag': 'high'}, {'parameter': 'WBC', 'flag': 'critical_low'},
+                             {'parameter': 'MCV', 'flag': 'normal'}]}
+    assert signoff.flag_summary(result) == 'Hemoglobin ↑, WBC ↓↓'
+    assert signoff.is_critical(result)
+
+
+def test_batch_approval_sends_only_backend_ids(monkeypatch):
+    monkeypatch.setattr(st, 'session_state', {'user_role': 'doctor', 'user_name': "Dr. Alice"})
+    app = LISApp.__new__(LISApp)
+    app.store = SharedStore(backend=create_backend('memory'))
+    app.audit_log = audit_log.AuditLog()
+    app.backend = RecordingClient()
+    local, synced = app.store.add_results([
+        queued('Pathologist', patientName="Asha Rao"),
+        queued('Pathologist', patientName="Ravi Kumar", backendId='6523f0c2a1b2c3d4e5f60718'),
+    ])
+
+    approved, error = app.approve_results([local['resultId'], synced['resultId']], "Reviewed")
+    assert error is None
+    assert {r['status'] for r in approved} == {'approved'}
+    assert app.backend.calls == [('POST', '/results/batch/approve',
+                                  {'resultIds': ['6523f0c2a1b2c3d4e5f60718'], 'approvalComments': "Reviewed"})]
+
+    app.backend.calls.clear()
+    assert app.approve_results([local['resultId']]) == ([], None)
+    assert app.backend.calls == []
+
+
+def test_batch_approval_refused_without_approve_results(monkeypatch):
+    app = LISApp.__new__(LISApp)
+    app.store = SharedStore(backend=create_backend('memory'))
+    app.audit_log = audit_log.AuditLog()
+    app.backend = RecordingClient()
+    stored = app.store.add_results([queued('Technician'), queued('Lab Supervisor')])
+    for role in ('manager', 'lab_technician'):
+        monkeypatch.setattr(st, 'session_state', {'user_role': role, 'user_name': "Sam"})
+        assert app.approve_results([r['resultId'] for r in stored]) == ([], None)
+    assert {r['status'] for r in app.store.results.snapshot()} == {signoff.QUEUE_STATUS}
+    assert app.backend.calls == []
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pytest
+
+import stability
+from cache_backend import SQLiteBackend, create_backend
+from shared_state import SharedStore
+
+START = datetime(2026, 10, 19, 8, 0).timestamp()
+HOUR = 3600
+CATALOG = {'BMP': {'test_code': 'BMP', 'test_name': "Basic Metabolic Panel", 'stability_hours': 4}}
+
+
+def sample(collected=START, **fields):
+    return {'testCode': 'BMP', 'testType': 'basic_metabolic_panel', 'status': 'collected', 'priority': 'routine',
+            'collectedAt': datetime.fromtimestamp(collected).isoformat(), **fields}
+
+
+@pytest.fixture
+def store():
+    return SharedStore(backend=create_backend('memory'))
+
+
+def test_parse_stability():
+    assert stability.parse_stability("Process within 2 hours") == 2
+    assert stability.parse_stability("Stable for 7 days refrigerated") == 168
+    assert stability.parse_stability("Fasting required") is None
+
+
+def test_timer_wheel_fires_due_and_overflow_timers():
+    wheel = stability.TimerWheel(resolution=60, slots=10, now=0)
+    wheel.schedule(120, 'soon')
+    wheel.schedule(3600, 'later')
+    wheel.schedule(-600, 'overdue')
+    assert len(wheel) == 3
+    assert wheel.advance(60) == ['overdue']
+    assert wheel.advance(179) == ['soon']
+    assert wheel.advance(3599) == []
+    assert wheel.advance(3600) == ['later']
+    assert len(wheel) == 0
+
+
+def test_samples_are_flagged_then_expire(store):
+    [test] = store.add_tests([sample()])
+    monitor = stability.StabilityMonitor(store, CATALOG, now=START)
+    assert monitor.tick(START) == {stability.NEAR_EXPIRY: [], stability.EXPIRED: []}
+    assert monitor.tick(START + 3 * HOUR) == {stability.NEAR_EXPIRY: [test['testId']], stability.EXPIRED: []}
+    flagged = store.worklist.get(test['testId'])
+    assert (flagged['stabilityStatus'], flagged['priority']) == (stability.NEAR_EXPIRY, 'urgent')
+    assert monitor.tick(START + 4 * HOUR) == {stability.NEAR_EXPIRY: [], stability.EXPIRED: [test['testId']]}
+    assert store.worklist.get(test['testId'])['stabilityStatus'] == stability.EXPIRED
+
+
+def test_edited_collection_time_reschedules(store):
+    [test] = store.add_tests([sample()])
+    monitor = stability.StabilityMonitor(store, CATALOG, now=START)
+    monitor.tick(START)
+    later = datetime.fromtimestamp(START + 2 * HOUR).isoformat()
+    store.update_tests([test['testId']], {'collectedAt': later})
+    assert monitor.tick(START + 4 * HOUR)[stability.EXPIRED] == []
+    assert monitor.tick(START + 6 * HOUR)[stability.EXPIRED] == [test['testId']]
+
+
+def test_completed_or_removed_samples_cancel_their_timers(store):
+    done, removed, kept = store.add_tests([sample(), sample(), sample()])
+    monitor = stability.StabilityMonitor(store, CATALOG, now=START)
+    monitor.tick(START)
+    store.update_tests([done['testId']], {'status': 'completed'})
+    store.worklist.remove(removed['testId'])
+    assert monitor.tick(START + 4 * HOUR)[stability.EXPIRED] == [kept['testId']]
+    assert set(monitor._deadlines) == {kept['testId']}
+
+
+def test_one_monitor_flags_for_workers_sharing_a_backend(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    stores = [SharedStore(backend=SQLiteBackend(path, poll_interval=3600)) for _ in range(2)]
+    try:
+        [test] = stores[0].add_tests([sample()])
+        stores[1]._invalidate(None, None)
+        monitors = [stability.StabilityMonitor(store, CATALOG, now=START) for store in stores]
+        fired = [monitor.tick(START + 4 * HOUR)[stability.EXPIRED] for monitor in monitors]
+        assert fired == [[test['testId']], []]
+    finally:
+        for store in stores:
+            store.backend.close()
@@ -0,0 +1,45 @@
+import reflex
+import surveillance
+from app import LISApp
+
+
+def result(result_id, flag, value=9.8, status='approved', region='pune'):
+    return {'resultId': result_id, 'status': status, 'patientRegion': region, 'patientAge': 34,
+            'collectionDate': '2026-10-14', 'testValues': [{'parameter': 'Hemoglobin', 'value': value, 'flag': flag}]}
+
+
+def cell(flag, region='Pune'):
+    return (flag, region, '25-44', '2026-W42')
+
+
+def test_cells_count_finalized_values():
+    cube = surveillance.SurveillanceCube([result('R1', 'low'), result('R2', 'low'), result('R3', 'normal')])
+    assert cube.cells == {'Hemoglobin': {cell('low'): 2, cell('normal'): 1}}
+    cube.add_results([result('R4', 'low', status='pending_review'), result('R5', 'low', value='')])
+    assert cube.cells['Hemoglobin'][cell('low')] == 2
+    assert cube.values('region') == ['Pune'] and cube.values('test') == ['Hemoglobin']
+
+    prevalence = cube.prevalence('Anemia', ['region'])
+    assert prevalence.to_dict('records') == [{'region': 'Pune', 'tested': 3, 'positive': 2, 'percent': 66.7}]
+
+
+def test_amendment_moves_the_count():
+    first = result('R1', 'low')
+    cube = surveillance.SurveillanceCube([first])
+    amended = result('R1', 'normal', value=12.5, status='amended', region='Nashik')
+    cube.replace([(first, amended)])
+    assert cube.cells == {'Hemoglobin': {cell('normal', 'Nashik'): 1}}
+    assert cube.values('region') == ['Nashik'] and cube.values('flag') == ['normal']
+
+    cube.remove_results([amended])
+    assert cube.cells == {} and len(cube) == 0
+    assert cube.values('region') == [] and cube.frame().empty
+
+
+def test_every_condition_marker_is_a_reported_parameter():
+    app = LISApp.__new__(LISApp)
+    reported = {p['name'] for test in app.load_predefined_tests().values() for p in test.get('parameters', [])}
+    for test in reflex.REFLEX_TESTS.values():
+        test_type = test['test_name'].lower().replace(' ', '_')
+        reported.update(p['name'] for p in app.get_test_parameters(test_type))
+    assert {spec['test'] for spec in surveillance.CONDITIONS.values()} <= reported
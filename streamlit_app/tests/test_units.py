@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import units
+
+
+def test_parse_unit_superscripts_and_micro_signs():
+    assert units.parse_unit('10³/μL') == units.parse_unit('10⁹/L')
+    assert units.parse_unit('10³/µL') == units.parse_unit('10^3/uL')
+    scale, dimensions = units.parse_unit('mg/dL')
+    assert scale == pytest.approx(1e-2)
+    assert dimensions == (('mass', 1), ('volume', -1))
+
+
+def test_unknown_unit_symbol_raises():
+    with pytest.raises(ValueError):
+        units.parse_unit('furlongs/L')
+
+
+@pytest.mark.parametrize('parameter, from_unit, to_unit, factor', [
+    ('Glucose', 'mg/dL', 'mmol/L', 1 / 18.016),
+    ('Creatinine', 'mg/dL', 'µmol/L', 88.4),
+    ('Sodium', 'mEq/L', 'mmol/L', 1.0),
+    ('Calcium', 'mEq/L', 'mmol/L', 0.5),
+    ('WBC', '10³/μL', '10⁹/L', 1.0),
+    ('Hemoglobin', 'g/dL', 'g/L', 10.0),
+])
+def test_conversion_factors(parameter, from_unit, to_unit, factor):
+    assert units.conversion_factor(parameter, from_unit, to_unit) == pytest.approx(factor, rel=1e-3)
+
+
+def test_mass_to_amount_needs_a_molar_mass():
+    with pytest.raises(ValueError, match="Cannot convert"):
+        units.conversion_factor('Albumin', 'g/dL', 'mmol/L')
+
+
+def test_convert_column_mixed_rows():
+    converted = units.convert_column(
+        ['90', 'x', 140, 1.0],
+        ['Glucose', 'Glucose', 'Sodium', 'Sodium'],
+        ['mg/dL', 'mg/dL', 'mEq/L', 'mg/dL'],
+        ['mmol/L', 'mmol/L', 'mmol/L', 'mmol/L']
+    )
+    assert converted[0] == pytest.approx(5.0, rel=1e-3)
+    assert np.isnan(converted[1])
+    assert converted[2] == 140
+    # Sodium has a valence but no molar mass, so mg/dL cannot be converted
+    assert np.isnan(converted[3])
+
+
+def test_si_unit_and_dual_report_values():
+    assert units.si_unit('Glucose', 'mg/dL') == 'mmol/L'
+    assert units.si_unit('Sodium', 'mmol/L') is None
+    assert units.si_unit('Albumin', 'mg/dL') == 'g/L'
+    assert units.dual_report_values([
+        {'parameter': 'Glucose', 'value': 90, 'unit': 'mg/dL'},
+        {'parameter': 'Sodium', 'value': 140, 'unit': 'mmol/L'},
+        {'parameter': 'Glucose', 'value': None, 'unit': 'mg/dL'},
+    ]) == [('5.00', 'mmol/L'), ('', ''), ('', 'mmol/L')]
+    assert units.dual_report_values([]) == []
+
+
+def test_format_significant():
+    assert units.format_significant(4.99556) == '5.00'
+    assert units.format_significant(0.0123) == '0.0123'
+    assert units.format_significant(1234.5) == '1234'
+    assert units.format_significant(0) == '0'
+    assert units.format_significant(np.nan) == ''
@@ -0,0 +1,33 @@
+import worksheet
+
+URINE_PARAMETERS = [
+    {'key': 'protein', 'name': 'Protein', 'unit': 'mg/dL', 'reference_range': 'Negative', 'format': '%.0f'},
+    {'key': 'glucose_urine', 'name': 'Glucose', 'unit': 'mg/dL', 'reference_range': 'Negative', 'format': '%.0f'}
+]
+
+
+def urine_test():
+    return {'testId': 'TST000001', 'patientId': 'PAT000001', 'patientName': "Asha Rao", 'testType': 'urinalysis',
+            'testName': "Urinalysis", 'collectionDate': '2026-10-19', 'patientAge': 40, 'patientSex': 'F'}
+
+
+def test_worksheet_rows_and_results():
+    test = urine_test()
+    frame = worksheet.build_worksheet([test], lambda test_type, test: URINE_PARAMETERS)
+    assert list(frame['paramKey']) == ['protein', 'glucose_urine']
+    assert list(frame['referenceRange']) == ['Negative', 'Negative']
+
+    frame['value'] = ['30', '0']
+    results = worksheet.worksheet_to_results(frame, {test['testId']: test}, 'Tester', 'pending_review')
+    assert len(results) == 1
+    values = {v['parameter']: v for v in results[0]['testValues']}
+    assert values['Protein']['flag'] == 'abnormal'
+    assert values['Glucose']['flag'] == 'normal'
+    assert values['Glucose']['value'] == 0.0
+    assert results[0]['overallStatus'] == 'abnormal'
+
+
+def test_blank_rows_are_not_submitted():
+    test = urine_test()
+    frame = worksheet.build_worksheet([test], lambda test_type, test: URINE_PARAMETERS)
+    assert worksheet.worksheet_to_results(frame, {test['testId']: test}, 'Tester', 'pending_review') == []
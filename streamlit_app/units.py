@@ -0,0 +1,231 @@
+"""Unit registry for conventional and SI result reporting
+
+Unit strings such as 'mg/dL', 'mEq/L', '10³/μL' or 'mL/min/1.73m²' are parsed
+into a scale and a vector of base dimensions. Conversion factors are computed
+once per (parameter, from unit, to unit) and cached; converting between mass,
+amount of substance and equivalents uses the parameter's molar mass or
+valence. Whole columns are converted by factorizing the distinct unit pairs
+and multiplying by an array of factors.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from reference_ranges import parameter_key
+
+PREFIXES = {
+    'G': 1e9, 'M': 1e6, 'k': 1e3, 'd': 1e-1, 'c': 1e-2, 'm': 1e-3,
+    'u': 1e-6, 'n': 1e-9, 'p': 1e-12, 'f': 1e-15
+}
+# Base units as (scale, dimension)
+BASE_UNITS = {
+    'g': (1.0, 'mass'),
+    'mol': (1.0, 'amount'),
+    'Eq': (1.0, 'equivalents'),
+    'L': (1.0, 'volume'),
+    'U': (1.0, 'activity'),
+    'IU': (1.0, 'activity'),
+    'kat': (6e7, 'activity'),
+    's': (1.0, 'time'),
+    'sec': (1.0, 'time'),
+    'min': (60.0, 'time'),
+    'h': (3600.0, 'time'),
+    'hr': (3600.0, 'time'),
+    'm': (1.0, 'length'),
+    'cells': (1.0, 'count'),
+    'copies': (1.0, 'count'),
+}
+_ALIASES = {'l': 'L', 'eq': 'Eq', 'EQ': 'Eq', 'hour': 'h', 'hrs': 'hr'}
+_SUPERSCRIPTS = str.maketrans('⁰¹²³⁴⁵⁶⁷⁸⁹⁻', '0123456789-')
+_TOKEN_RE = re.compile(r'(\d+(?:\.\d+)?)(?:\^(-?\d+))?|([A-Za-z]+)(?:\^?(-?\d+))?|(%)')
+
+# Molar mass (g/mol) and valence per canonical parameter key
+MOLAR_MASSES = {
+    'glucose': 180.16,
+    'creatinine': 113.12,
+    'bun': 28.014,
+    'urea': 60.06,
+    'uric_acid': 168.11,
+    'total_cholesterol': 386.65,
+    'hdl': 386.65,
+    'ldl': 386.65,
+    'ldl_friedewald': 386.65,
+    'non_hdl': 386.65,
+    'vldl': 386.65,
+    'triglycerides': 885.7,
+    'total_bilirubin': 584.66,
+    'direct_bilirubin': 584.66,
+    'calcium': 40.078,
+    'magnesium': 24.305,
+    'phosphorus': 30.974,
+    'iron': 55.845,
+    'hemoglobin': 16114.5,
+}
+VALENCES = {
+    'sodium': 1, 'potassium': 1, 'chloride': 1, 'co2': 1, 'bicarbonate': 1,
+    'calcium': 2, 'magnesium': 2,
+}
+
+# Preferred SI unit per canonical parameter key
+SI_UNITS = {
+    'glucose': 'mmol/L',
+    'creatinine': 'µmol/L',
+    'bun': 'mmol/L',
+    'uric_acid': 'µmol/L',
+    'total_cholesterol': 'mmol/L',
+    'hdl': 'mmol/L',
+    'ldl': 'mmol/L',
+    'ldl_friedewald': 'mmol/L',
+    'non_hdl': 'mmol/L',
+    'vldl': 'mmol/L',
+    'triglycerides': 'mmol/L',
+    'total_bilirubin': 'µmol/L',
+    'direct_bilirubin': 'µmol/L',
+    'sodium': 'mmol/L',
+    'potassium': 'mmol/L',
+    'chloride': 'mmol/L',
+    'co2': 'mmol/L',
+    'calcium': 'mmol/L',
+    'hemoglobin': 'g/L',
+    'mchc': 'g/L',
+    'albumin': 'g/L',
+    'total_protein': 'g/L',
+    'globulin': 'g/L',
+    'hematocrit': 'L/L',
+    'wbc': '10⁹/L',
+    'rbc': '10¹²/L',
+    'platelets': '10⁹/L',
+    'alt': 'µkat/L',
+    'ast': 'µkat/L',
+    'alp': 'µkat/L',
+}
+
+
+def _atom(name):
+    """Scale and dimension of one unit symbol, e.g. 'umol' or 'mEq'"""
+    name = _ALIASES.get(name, name)
+    if name in BASE_UNITS:
+        return BASE_UNITS[name]
+    prefix, base = name[0], _ALIASES.get(name[1:], name[1:])
+    if prefix in PREFIXES and base in BASE_UNITS:
+        scale, dimension = BASE_UNITS[base]
+        return PREFIXES[prefix] * scale, dimension
+    raise ValueError(f"Unknown unit symbol: {name}")
+
+
+@lru_cache(maxsize=None)
+def parse_unit(unit):
+    """Parse a unit string into (scale, dimensions) with dimensions as sorted (name, power) pairs"""
+    text = re.sub(r'([⁰¹²³⁴⁵⁶⁷⁸⁹⁻]+)', r'^\1', (unit or '').strip()).translate(_SUPERSCRIPTS)
+    text = text.replace('μ', 'u').replace('µ', 'u').replace('×', 'x')
+    text = re.sub(r'^x\s*(?=10)', '', text)
+
+    scale = 1.0
+    dimensions = {}
+    for i, part in enumerate(text.split('/')):
+        sign = 1 if i == 0 else -1
+        for number, exponent, symbol, power, percent in _TOKEN_RE.findall(part):
+            if percent:
+                scale *= 0.01 ** sign
+            elif number:
+                value = float(number) ** (int(exponent) if exponent else 1)
+                scale *= value ** sign
+            elif symbol:
+                atom_scale, dimension = _atom(symbol)
+                power = int(power) if power else 1
+                scale *= atom_scale ** (power * sign)
+                dimensions[dimension] = dimensions.get(dimension, 0) + power * sign
+    return scale, tuple(sorted((d, p) for d, p in dimensions.items() if p))
+
+
+def _to_amount(scale, dimensions, key):
+    """Express mass and equivalents as amount of substance for a parameter"""
+    dimensions = dict(dimensions)
+    for dimension, per_mole in (('mass', MOLAR_MASSES.get(key)), ('equivalents', VALENCES.get(key))):
+        power = dimensions.pop(dimension, 0)
+        if power:
+            if per_mole is None:
+                return None
+            scale /= per_mole ** power
+            dimensions['amount'] = dimensions.get('amount', 0) + power
+    return scale, tuple(sorted((d, p) for d, p in dimensions.items() if p))
+
+
+@lru_cache(maxsize=None)
+def conversion_factor(parameter, from_unit, to_unit):
+    """Multiplier taking a parameter's value from one unit to another"""
+    if (from_unit or '') == (to_unit or ''):
+        return 1.0
+    from_scale, from_dims = parse_unit(from_unit)
+    to_scale, to_dims = parse_unit(to_unit)
+    if from_dims == to_dims:
+        return from_scale / to_scale
+
+    key = parameter_key(parameter)
+    source, target = _to_amount(from_scale, from_dims, key), _to_amount(to_scale, to_dims, key)
+    if source is None or target is None or source[1] != target[1]:
+        raise ValueError(f"Cannot convert {parameter} from {from_unit} to {to_unit}")
+    return source[0] / target[0]
+
+
+def _factor_or_nan(parameter, from_unit, to_unit):
+    try:
+        return conversion_factor(parameter, from_unit, to_unit)
+    except ValueError:
+        return np.nan
+
+
+def convert(values, parameter, from_unit, to_unit):
+    """Convert an array of one parameter's values"""
+    return np.asarray(values, dtype=float) * conversion_factor(parameter, from_unit, to_unit)
+
+
+def convert_column(values, parameters, from_units, to_units):
+    """Convert a column of mixed parameters and units in one vectorized pass
+
+    Rows whose units cannot be converted come back as NaN.
+    """
+    pairs = pd.Series(list(zip(parameters, from_units, to_units)), dtype=object)
+    codes, uniques = pd.factorize(pairs, sort=False)
+    factors = np.array([_factor_or_nan(*u) for u in uniques] + [np.nan], dtype=float)
+    numeric = pd.to_numeric(pd.Series(list(values), dtype=object), errors='coerce').to_numpy(dtype=float)
+    return numeric * factors[codes]
+
+
+def si_unit(parameter, unit):
+    """SI unit for a parameter, or None when it is already reported in SI"""
+    target = SI_UNITS.get(parameter_key(parameter))
+    if target is None or target == unit or np.isnan(_factor_or_nan(parameter, unit, target)):
+        return None
+    return target
+
+
+def format_significant(value, digits=3):
+    """Format a converted value to a sensible number of significant digits"""
+    if value is None or np.isnan(value):
+        return ''
+    if value == 0:
+        return '0'
+    decimals = max(0, digits - 1 - int(np.floor(np.log10(abs(value)))))
+    return f"{value:.{decimals}f}"
+
+
+def dual_report_values(test_values):
+    """SI value and unit for each result entry, converted as one column"""
+    if not test_values:
+        return []
+    pairs = pd.Series([(v.get('parameter'), v.get('unit')) for v in test_values], dtype=object)
+    codes, uniques = pd.factorize(pairs, sort=False)
+    targets = np.array([si_unit(parameter, unit) or '' for parameter, unit in uniques], dtype=object)[codes]
+    converted = convert_column(
+        [v.get('value') for v in test_values],
+        [v.get('parameter') for v in test_values],
+        [v.get('unit') for v in test_values],
+        targets
+    )
+    return [
+        (format_significant(value), target) if target else ('', '')
+        for value, target in zip(converted, targets)
+    ]
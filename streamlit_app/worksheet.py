@@ -0,0 +1,214 @@
+"""Bulk result entry worksheet backed by a pandas DataFrame"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from calculations import compile_graph, get_graph, is_female
+from flagging import compute_flags
+from units import convert_column, si_unit
+from reference_ranges import personalize_parameters
+
+WORKSHEET_COLUMNS = [
+    'testId', 'patientId', 'patientName', 'testName', 'paramKey', 'parameter',
+    'value', 'unit', 'referenceRange', 'criticalValues', 'format', 'flag',
+    'calculated', 'calcGraph', 'patientAge', 'patientSex', 'siUnit'
+]
+EDITABLE_COLUMNS = ['value']
+MAX_WORKSHEET_TESTS = 100
+
+
+def build_worksheet(tests, get_parameters, get_calculations=None):
+    """One row per (test, parameter), with ranges resolved for each patient
+
+    Calculated parameters follow the measured ones as read-only rows that are
+    filled in when the worksheet is flagged.
+    """
+    rows = []
+    for test in tests[:MAX_WORKSHEET_TESTS]:
+        test_name = test.get('testName', test['testType'].replace('_', ' ').title())
+        gid, graph = compile_graph(get_calculations(test) if get_calculations else None)
+        common = {
+            'testId': test['testId'],
+            'patientId': test['patientId'],
+            'patientName': test['patientName'],
+            'testName': test_name,
+            'value': '',
+            'flag': '',
+            'calcGraph': gid or '',
+            'patientAge': test.get('patientAge'),
+            'patientSex': test.get('patientSex') or ''
+        }
+        for param in personalize_parameters(get_parameters(test['testType'], test), test):
+            rows.append({
+                **common,
+                'paramKey': param['key'],
+                'parameter': param['name'],
+                'unit': param.get('unit', ''),
+                'referenceRange': param.get('reference_range', ''),
+                'criticalValues': param.get('critical_values', ''),
+                'format': param.get('format', '%.2f'),
+                'calculated': False,
+                'siUnit': si_unit(param['name'], param.get('unit', '')) or ''
+            })
+        for key in (graph.order if graph else ()):
+            formula = graph.formulas[key]
+            rows.append({
+                **common,
+                'paramKey': key,
+                'parameter': formula.name,
+                'unit': formula.unit,
+                'referenceRange': formula.reference_range,
+                'criticalValues': '',
+                'format': formula.format,
+                'calculated': True,
+                'siUnit': ''
+            })
+    return pd.DataFrame(rows, columns=WORKSHEET_COLUMNS)
+
+
+def _format(values, value_format):
+    return ['' if np.isnan(v) or np.isinf(v) else value_format % v for v in values]
+
+
+def convert_si_entries(frame, previous=None):
+    """Convert values typed in SI units to each parameter's reporting unit
+
+    With the previous version of the worksheet only edited rows are converted,
+    so values that were already converted are left alone.
+    """
+    frame = frame.copy()
+    rows = (frame['siUnit'] != '') & ~frame['calculated'].astype(bool)
+    if previous is not None:
+        rows &= frame['value'] != previous['value']
+    if not rows.any():
+        return frame
+
+    selected = frame[rows]
+    converted = convert_column(selected['value'], selected['parameter'], selected['siUnit'], selected['unit'])
+    valid = ~np.isnan(converted)
+    index = selected.index[valid]
+    frame.loc[index, 'value'] = [
+        value_format % value for value, value_format in zip(converted[valid], frame.loc[index, 'format'])
+    ]
+    return frame
+
+
+def calculate_worksheet(frame, previous=None):
+    """Fill calculated rows, one vectorized evaluation per panel
+
+    With the previous version of the worksheet, only panels with edited
+    inputs are touched and only the formulas downstream of those inputs are
+    recomputed.
+    """
+    frame = frame.copy()
+    calculated = frame['calculated'].astype(bool)
+    if previous is not None:
+        # Calculated rows are not hand-editable; restore them before recomputing
+        frame.loc[calculated, 'value'] = previous.loc[calculated, 'value']
+
+    for gid, group in frame[frame['calcGraph'] != ''].groupby('calcGraph', sort=False):
+        graph = get_graph(gid)
+        if graph is None:
+            continue
+        group_calculated = calculated[group.index]
+        measured = group[~group_calculated]
+        derived = group[group_calculated]
+
+        changed = None
+        if previous is not None:
+            edited = measured['value'] != previous.loc[measured.index, 'value']
+            changed = set(measured.loc[edited, 'paramKey'])
+            if not changed & set(graph.dependents):
+                continue
+
+        test_ids = group['testId'].unique()
+        inputs = (
+            pd.to_numeric(measured['value'], errors='coerce')
+            .groupby([measured['testId'], measured['paramKey']]).first()
+            .unstack().reindex(test_ids)
+        )
+        current = (
+            pd.to_numeric(derived['value'], errors='coerce')
+            .groupby([derived['testId'], derived['paramKey']]).first()
+            .unstack().reindex(index=test_ids, columns=list(graph.order))
+        )
+        patients = group.groupby('testId', sort=False)[['patientAge', 'patientSex']].first().reindex(test_ids)
+        results = graph.evaluate(
+            {key: inputs[key].to_numpy() for key in graph.inputs if key in inputs},
+            pd.to_numeric(patients['patientAge'], errors='coerce').to_numpy(),
+            [is_female(sex) for sex in patients['patientSex']],
+            measured.groupby('paramKey')['unit'].first().to_dict(),
+            changed,
+            {key: current[key].to_numpy() for key in graph.order}
+        )
+
+        position = pd.Series(range(len(test_ids)), index=test_ids)
+        for key, rows in derived.groupby('paramKey', sort=False):
+            if changed is not None and key not in graph.affected(changed):
+                continue
+            values = results[key][position[rows['testId']].to_numpy()]
+            frame.loc[rows.index, 'value'] = _format(values, graph.formulas[key].format)
+    return frame
+
+
+def flag_worksheet(frame, previous=None):
+    """Recompute calculated values, then the flag column in one vectorized pass"""
+    frame = calculate_worksheet(frame, previous)
+    frame['value'] = frame['value'].fillna('').astype(str).str.strip()
+    frame['flag'] = compute_flags(frame['value'], frame['referenceRange'], frame['criticalValues'])
+    return frame
+
+
+def _typed_value(value, value_format):
+    """Numeric parameters are stored as numbers, '%s' parameters as text"""
+    if value_format == '%s':
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def worksheet_to_results(frame, tests_by_id, performed_by, status):
+    """Group entered worksheet rows into one result payload per test"""
+    frame = flag_worksheet(frame)
+    entered = frame[frame['value'] != '']
+    results = []
+    for test_id, rows in entered.groupby('testId', sort=False):
+        test = tests_by_id[test_id]
+        flags = set(rows['flag'])
+        if flags & {'critical_high', 'critical_low'}:
+            overall_status = 'critical'
+        elif flags - {'normal'}:
+            overall_status = 'abnormal'
+        else:
+            overall_status = 'normal'
+
+        results.append({
+            "test": test_id,
+            "patient": test['patientId'],
+            "patientName": test['patientName'],
+            "testType": test['testType'],
+            "testName": rows['testName'].iat[0],
+            "collectionDate": test['collectionDate'],
+            "testValues": [
+                {
+                    'parameter': row.parameter,
+                    'value': _typed_value(row.value, row.format),
+                    'unit': row.unit,
+                    'flag': row.flag,
+                    'referenceRange': row.referenceRange,
+                    'calculated': bool(row.calculated)
+                }
+                for row in rows.itertuples(index=False)
+            ],
+            "overallStatus": overall_status,
+            "interpretation": "",
+            "recommendations": "",
+            "performedBy": performed_by,
+            "technicalComments": "Entered via bulk worksheet",
+            "status": status,
+            "enteredAt": datetime.now().isoformat()
+        })
+    return results